@@ -0,0 +1,258 @@
+"""Microbenchmark harness with per-machine baselines and a regression gate."""
+import hashlib
+import os
+import platform
+import statistics
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .utils import get_cache_dir, read_json, write_json_atomic
+
+# A regression must exceed both the relative threshold and this many MADs of
+# baseline noise, so that jittery metrics do not fail the gate.
+NOISE_MADS = 3.0
+
+
+@dataclass
+class BenchStats:
+    """Robust summary of repeated timings, in seconds."""
+
+    median: float
+    mad: float
+    samples: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the summary."""
+        return {"median": self.median, "mad": self.mad, "samples": self.samples}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BenchStats":
+        """Deserialize a summary."""
+        return cls(float(data["median"]), float(data["mad"]), int(data["samples"]))
+
+
+@dataclass
+class Regression:
+    """A metric that got slower than its baseline allows."""
+
+    name: str
+    baseline: BenchStats
+    current: BenchStats
+
+    @property
+    def ratio(self) -> float:
+        """Current median relative to the baseline median."""
+        if self.baseline.median <= 0:
+            return float("inf")
+        return self.current.median / self.baseline.median
+
+
+def summarize(samples: List[float]) -> BenchStats:
+    """
+    Summarize timings with the median and median absolute deviation.
+
+    Args:
+        samples: Timings in seconds.
+
+    Returns:
+        BenchStats for the samples.
+
+    Raises:
+        ValueError: If there are no samples.
+    """
+    if not samples:
+        raise ValueError("Cannot summarize an empty sample")
+    median = statistics.median(samples)
+    mad = statistics.median(abs(s - median) for s in samples)
+    return BenchStats(median=median, mad=mad, samples=len(samples))
+
+
+def run_benchmark(func: Callable[[], Any], repeat: int = 20, warmup: int = 2) -> BenchStats:
+    """
+    Time a function repeatedly.
+
+    Args:
+        func: Zero-argument function to time.
+        repeat: Number of timed runs.
+        warmup: Untimed runs first, to fill caches and import lazily loaded modules.
+
+    Returns:
+        BenchStats of the timed runs.
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def machine_fingerprint() -> Dict[str, Any]:
+    """
+    Describe the machine, so baselines are only compared on like hardware.
+
+    Returns:
+        Dict with an "id" hash and the fields it was computed from.
+    """
+    info: Dict[str, Any] = {
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count() or 0,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+    }
+    digest = hashlib.sha256(repr(sorted(info.items())).encode("utf-8")).hexdigest()[:12]
+    return {"id": digest, **info}
+
+
+def compare(
+    baseline: Dict[str, BenchStats],
+    current: Dict[str, BenchStats],
+    threshold: float = 0.25,
+) -> List[Regression]:
+    """
+    Find metrics that regressed beyond the threshold.
+
+    Metrics missing from either side are ignored.
+
+    Args:
+        baseline: Baseline stats by metric name.
+        current: Current stats by metric name.
+        threshold: Allowed relative slowdown, e.g. 0.25 for 25%.
+
+    Returns:
+        Regressions, in the order of the current metrics.
+    """
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        slowdown = now.median - before.median
+        if slowdown > before.median * threshold and slowdown > NOISE_MADS * before.mad:
+            regressions.append(Regression(name, before, now))
+    return regressions
+
+
+def format_diff(regressions: List[Regression], threshold: float) -> str:
+    """
+    Render regressions as a readable table.
+
+    Args:
+        regressions: Regressions from compare().
+        threshold: The threshold that was applied.
+
+    Returns:
+        Multi-line report.
+    """
+    lines = [f"{len(regressions)} benchmark(s) regressed by more than {threshold:.0%}:"]
+    width = max((len(r.name) for r in regressions), default=0)
+    for r in regressions:
+        lines.append(
+            f"  {r.name:<{width}}  {r.baseline.median * 1000:9.3f} ms ± {r.baseline.mad * 1000:.3f}"
+            f"  ->  {r.current.median * 1000:9.3f} ms ± {r.current.mad * 1000:.3f}"
+            f"  ({r.ratio:.2f}x)"
+        )
+    return "\n".join(lines)
+
+
+class BaselineStore:
+    """Benchmark baselines, keyed by machine fingerprint."""
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            path: Path to the JSON baseline file. If None, uses
+                $POP_BENCH_BASELINE or the cache directory.
+        """
+        env_path = os.environ.get("POP_BENCH_BASELINE")
+        self.path = path or (Path(env_path) if env_path else get_cache_dir() / "bench_baselines.json")
+
+    def load(self, fingerprint: str) -> Dict[str, BenchStats]:
+        """
+        Load the baseline for a machine.
+
+        Args:
+            fingerprint: Machine ID from machine_fingerprint().
+
+        Returns:
+            Stats by metric name; empty if there is no baseline yet.
+        """
+        data = read_json(self.path, {})
+        entry = data.get(fingerprint, {}) if isinstance(data, dict) else {}
+        metrics = {}
+        for name, stats in entry.get("metrics", {}).items():
+            try:
+                metrics[name] = BenchStats.from_dict(stats)
+            except (KeyError, TypeError, ValueError):
+                continue
+        return metrics
+
+    def save(self, machine: Dict[str, Any], metrics: Dict[str, BenchStats]) -> None:
+        """
+        Merge metrics into a machine's baseline.
+
+        Args:
+            machine: Fingerprint from machine_fingerprint().
+            metrics: Stats by metric name; existing metrics are replaced.
+        """
+        data = read_json(self.path, {})
+        if not isinstance(data, dict):
+            data = {}
+        entry = data.setdefault(machine["id"], {})
+        entry["machine"] = machine
+        entry.setdefault("metrics", {}).update({name: s.to_dict() for name, s in metrics.items()})
+        entry["updated_at"] = time.time()
+        write_json_atomic(self.path, data)
+
+
+class BenchmarkGate:
+    """Checks benchmark results against the stored baseline for this machine."""
+
+    def __init__(
+        self,
+        store: BaselineStore,
+        threshold: float = 0.25,
+        update: bool = False,
+        machine: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Initialize the gate.
+
+        Args:
+            store: Baseline store.
+            threshold: Allowed relative slowdown.
+            update: Overwrite the baseline instead of comparing against it.
+            machine: Fingerprint; defaults to machine_fingerprint().
+        """
+        self.store = store
+        self.threshold = threshold
+        self.update = update
+        self.machine = machine or machine_fingerprint()
+
+    def check(self, name: str, stats: BenchStats) -> Optional[str]:
+        """
+        Compare a metric with its baseline, recording it if there is none.
+
+        Args:
+            name: Metric name.
+            stats: Current stats.
+
+        Returns:
+            A readable diff if the metric regressed, otherwise None.
+        """
+        baseline = self.store.load(self.machine["id"])
+        if self.update or name not in baseline:
+            self.store.save(self.machine, {name: stats})
+            return None
+        regressions = compare(baseline, {name: stats}, self.threshold)
+        if regressions:
+            return format_diff(regressions, self.threshold)
+        return None
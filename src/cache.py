@@ -0,0 +1,299 @@
+"""Local cache of generated commands, keyed by query, environment, model and prompt."""
+import hashlib
+import json
+import re
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, Optional
+
+from .prompts import GEN_COMMAND_SYSTEM_PROMPT, PROMPT_LAYOUT_VERSION, STRUCTURED_COMMAND_PROMPT
+from .utils import get_cache_dir, read_json, write_json_atomic
+
+CACHE_VERSION = 1
+
+KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different phrasings share an entry.
+
+    Case, surrounding whitespace, repeated spaces and trailing punctuation
+    are ignored.
+
+    Args:
+        query: Natural language query.
+
+    Returns:
+        Normalized query.
+    """
+    query = " ".join(query.lower().split())
+    return re.sub(r"[\s.?!。？！]+$", "", query)
+
+
+def prompt_hash(prompt: str = GEN_COMMAND_SYSTEM_PROMPT) -> str:
+    """Short hash of the system prompt, so prompt changes invalidate entries."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(query: str, system_info: str, model: str, structured: bool = False) -> str:
+    """
+    Content address of a generation.
+
+    Args:
+        query: Natural language query.
+        system_info: Environment from get_system_info().
+        model: Model name.
+        structured: Whether the command was asked for as a JSON object, with
+            STRUCTURED_COMMAND_PROMPT, rather than as free text.
+
+    Returns:
+        Hex SHA-256 of the normalized query, environment, model, hash of the
+        system prompt used and message layout version.
+    """
+    prompt = STRUCTURED_COMMAND_PROMPT if structured else GEN_COMMAND_SYSTEM_PROMPT
+    material = json.dumps(
+        {
+            "v": CACHE_VERSION,
+            "query": normalize_query(query),
+            "env": system_info,
+            "model": model,
+            "prompt": prompt_hash(prompt),
+            "layout": PROMPT_LAYOUT_VERSION,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached command and what it was generated for.
+
+    from_shared marks entries that came from the team cache server. Anyone
+    who can reach the server can store entries, so such commands are never
+    executed without the user seeing and confirming them. structured marks
+    commands asked for as JSON objects, which are keyed apart from free text
+    answers since the prompt differs.
+    """
+
+    key: str
+    query: str
+    system_info: str
+    model: str
+    command: str
+    warning: Optional[str] = None
+    created_at: float = 0.0
+    from_shared: bool = False
+    structured: bool = False
+
+    @property
+    def addressed(self) -> bool:
+        """Whether the key is the content address of the query, environment and model."""
+        return self.key == cache_key(self.query, self.system_info, self.model, self.structured)
+
+    @property
+    def age(self) -> float:
+        """Seconds since the entry was generated."""
+        return max(0.0, time.time() - self.created_at)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the entry."""
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CacheEntry":
+        """
+        Deserialize an entry.
+
+        Raises:
+            ValueError: If required fields are missing.
+        """
+        try:
+            return cls(
+                key=data["key"],
+                query=data["query"],
+                system_info=data["system_info"],
+                model=data["model"],
+                command=data["command"],
+                warning=data.get("warning"),
+                created_at=float(data.get("created_at", 0.0)),
+                from_shared=data.get("from_shared") is True,
+                structured=data.get("structured") is True,
+            )
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid cache entry: {e}") from e
+
+
+class ResponseCache:
+    """Content-addressed store of generated commands, one JSON file per entry."""
+
+    def __init__(self, cache_dir: Optional[Path] = None, ttl_hours: float = 168.0) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory for entries. If None, uses the cache directory.
+            ttl_hours: Hours an entry stays fresh; 0 disables the cache.
+        """
+        self.cache_dir = cache_dir or get_cache_dir() / "responses"
+        self.ttl = ttl_hours * 3600
+
+    @property
+    def enabled(self) -> bool:
+        """Whether caching is enabled."""
+        return self.ttl > 0
+
+    def _path(self, key: str) -> Path:
+        """File for a key, sharded by its first two hex digits."""
+        if not KEY_PATTERN.match(key):
+            raise ValueError(f"Invalid cache key: {key!r}")
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Whether an entry is younger than the TTL."""
+        return entry.age <= self.ttl
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        """
+        Load an entry by key, fresh or not.
+
+        Returns:
+            The entry, or None if missing or unreadable.
+        """
+        if not KEY_PATTERN.match(key):
+            return None
+        data = read_json(self._path(key), None)
+        if not isinstance(data, dict):
+            return None
+        try:
+            entry = CacheEntry.from_dict(data)
+        except ValueError:
+            return None
+        return entry if entry.key == key else None
+
+    def get(
+        self, query: str, system_info: str, model: str, structured: bool = False
+    ) -> Optional[CacheEntry]:
+        """
+        Look up a fresh entry.
+
+        Args:
+            query: Natural language query.
+            system_info: Environment from get_system_info().
+            model: Model name.
+            structured: Whether the command would be asked for as a JSON object.
+
+        Returns:
+            The entry, or None on a miss, an expired entry or a disabled cache.
+        """
+        if not self.enabled:
+            return None
+        entry = self.load(cache_key(query, system_info, model, structured))
+        if entry is None or not self.is_fresh(entry):
+            return None
+        return entry
+
+    def put(self, entry: CacheEntry) -> None:
+        """Store an entry, replacing any previous one with the same key."""
+        if not self.enabled:
+            return
+        try:
+            write_json_atomic(self._path(entry.key), entry.to_dict())
+        except OSError:
+            # A lost entry only means the next identical query goes to the model
+            pass
+
+    def store(
+        self,
+        query: str,
+        system_info: str,
+        model: str,
+        command: str,
+        warning: Optional[str] = None,
+        structured: bool = False,
+    ) -> CacheEntry:
+        """
+        Create and store an entry for a generated command.
+
+        Returns:
+            The stored entry.
+        """
+        entry = CacheEntry(
+            key=cache_key(query, system_info, model, structured),
+            query=query,
+            system_info=system_info,
+            model=model,
+            command=command,
+            warning=warning,
+            created_at=time.time(),
+            structured=structured,
+        )
+        self.put(entry)
+        return entry
+
+    def entries(self) -> Iterator[CacheEntry]:
+        """Iterate over all readable entries."""
+        if not self.cache_dir.exists():
+            return
+        for path in sorted(self.cache_dir.glob("*/*.json")):
+            entry = self.load(path.stem)
+            if entry is not None:
+                yield entry
+
+
+def export_bundle(cache: ResponseCache, out: IO[str]) -> int:
+    """
+    Write every entry of a cache as a JSON lines bundle.
+
+    Args:
+        cache: Cache to export.
+        out: Text stream to write to.
+
+    Returns:
+        Number of entries written.
+    """
+    count = 0
+    for entry in cache.entries():
+        out.write(json.dumps(entry.to_dict(), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def import_bundle(cache: ResponseCache, lines: Iterable[str], trusted: bool = False) -> int:
+    """
+    Merge a JSON lines bundle into a cache.
+
+    Malformed lines and entries not stored under their content address are
+    skipped, and an existing entry is only replaced by a newer one. A bundle
+    can come from anyone, so unless trusted its entries are marked
+    from_shared whatever the bundle says.
+
+    Args:
+        cache: Cache to import into.
+        lines: Bundle lines.
+        trusted: Import the entries as if generated on this machine.
+
+    Returns:
+        Number of entries added or replaced.
+    """
+    count = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            entry = CacheEntry.from_dict(json.loads(line))
+        except (ValueError, AttributeError):
+            continue
+        if not entry.addressed:
+            continue
+        existing = cache.load(entry.key)
+        if existing is not None and existing.created_at >= entry.created_at:
+            continue
+        entry.from_shared = not trusted
+        cache.put(entry)
+        count += 1
+    return count
@@ -0,0 +1,263 @@
+"""Record and replay streamed responses for deterministic tests and benchmarks."""
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .client import ParallaxClient
+from .config import AppConfig
+
+CASSETTE_VERSION = 1
+
+
+def hash_messages(messages: List[Dict[str, str]]) -> str:
+    """Short, stable hash of a request's messages."""
+    payload = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class CassetteStream:
+    """One recorded response: its metadata and (offset, chunk) pairs."""
+
+    def __init__(
+        self,
+        header: Dict[str, Any],
+        chunks: List[Tuple[float, str]],
+        usage: Optional[Dict[str, int]] = None,
+        duration: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize a stream.
+
+        Args:
+            header: Metadata such as model, query and messages hash.
+            chunks: (seconds since request start, content) pairs.
+            usage: Token usage reported by the server, if any.
+            duration: Seconds from request start to end of stream.
+        """
+        self.header = header
+        self.chunks = chunks
+        self.usage = usage
+        self.duration = duration if duration is not None else (chunks[-1][0] if chunks else 0.0)
+
+    @property
+    def text(self) -> str:
+        """The full response text."""
+        return "".join(content for _, content in self.chunks)
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """Seconds until the first chunk, or None for an empty stream."""
+        return self.chunks[0][0] if self.chunks else None
+
+    def replay(self, speed: float = 1.0) -> Iterator[str]:
+        """
+        Yield the recorded chunks, optionally at recorded timing.
+
+        Args:
+            speed: 1.0 replays at real speed, 10.0 ten times faster, and 0
+                yields everything immediately.
+
+        Yields:
+            Content chunks as strings.
+        """
+        start = time.perf_counter()
+        for offset, content in self.chunks:
+            if speed > 0:
+                delay = offset / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            yield content
+
+
+class Cassette:
+    """A file of recorded streams, in request order."""
+
+    def __init__(self, streams: List[CassetteStream]) -> None:
+        """
+        Initialize a cassette.
+
+        Args:
+            streams: Recorded streams.
+        """
+        self.streams = streams
+
+    @classmethod
+    def load(cls, path: Path) -> "Cassette":
+        """
+        Load a cassette file.
+
+        The format is JSON lines: a header object starting each stream, one
+        compact [offset, content] array per chunk, and an "end" object.
+
+        Raises:
+            ValueError: If the file is missing or malformed.
+        """
+        streams: List[CassetteStream] = []
+        header: Optional[Dict[str, Any]] = None
+        chunks: List[Tuple[float, str]] = []
+
+        try:
+            lines = Path(path).read_text(encoding="utf-8").splitlines()
+        except OSError as e:
+            raise ValueError(f"Cannot read cassette {path}: {e}") from e
+
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"Invalid cassette {path} at line {number}: {e}") from e
+
+            if isinstance(item, list):
+                if header is None:
+                    raise ValueError(f"Invalid cassette {path}: chunk before header at line {number}")
+                chunks.append((float(item[0]), str(item[1])))
+            elif "end" in item:
+                if header is None:
+                    raise ValueError(f"Invalid cassette {path}: end before header at line {number}")
+                streams.append(CassetteStream(header, chunks, item.get("usage"), item["end"]))
+                header, chunks = None, []
+            else:
+                if header is not None:
+                    streams.append(CassetteStream(header, chunks))
+                header, chunks = item, []
+
+        if header is not None:
+            # Recording was interrupted before the end marker
+            streams.append(CassetteStream(header, chunks))
+        if not streams:
+            raise ValueError(f"Invalid cassette {path}: no streams")
+        return cls(streams)
+
+
+class CassetteRecorder:
+    """Appends streams to a cassette file as they complete."""
+
+    def __init__(self, path: Path) -> None:
+        """
+        Initialize the recorder.
+
+        Args:
+            path: Cassette file. Streams are appended to it.
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        chunks: Iterator[str],
+        usage: Optional[Callable[[], Optional[Dict[str, int]]]] = None,
+    ) -> Iterator[str]:
+        """
+        Pass chunks through while capturing them with their arrival offsets.
+
+        Offsets are measured from the first call to next(), i.e. from when the
+        request is sent. The stream is written in one piece when it ends, so
+        concurrent recordings (e.g. --candidates) never interleave; a stream
+        cut short by an error or Ctrl-C is still written, marked interrupted.
+
+        Args:
+            model: Model name, stored in the header.
+            messages: Request messages; only a hash and the last message are stored.
+            chunks: The live stream.
+            usage: Returns the server-reported usage once the stream has ended.
+
+        Yields:
+            The same chunks, unchanged.
+        """
+        header = {
+            "v": CASSETTE_VERSION,
+            "model": model,
+            "messages_hash": hash_messages(messages),
+            "query": messages[-1]["content"] if messages else "",
+            "recorded_at": round(time.time(), 3),
+        }
+        lines = [json.dumps(header, ensure_ascii=False)]
+        start = time.perf_counter()
+        completed = False
+        try:
+            for chunk in chunks:
+                offset = round(time.perf_counter() - start, 4)
+                lines.append(json.dumps([offset, chunk], ensure_ascii=False))
+                yield chunk
+            completed = True
+        finally:
+            end: Dict[str, Any] = {"end": round(time.perf_counter() - start, 4)}
+            if completed and usage is not None:
+                end["usage"] = usage()
+            if not completed:
+                end["interrupted"] = True
+            lines.append(json.dumps(end))
+            with self._lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+
+
+class RecordingClient(ParallaxClient):
+    """ParallaxClient that also records every response to a cassette."""
+
+    def __init__(self, config: AppConfig, path: Path) -> None:
+        """
+        Initialize the recording client.
+
+        Args:
+            config: Application configuration.
+            path: Cassette file to append to.
+        """
+        super().__init__(config)
+        self.recorder = CassetteRecorder(path)
+
+    def _stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[str]:
+        """Stream from the server while recording."""
+        yield from self.recorder.record(
+            self.config.model,
+            messages,
+            super()._stream(messages, temperature, response_format),
+            usage=lambda: self.last_usage,
+        )
+
+
+class ReplayClient(ParallaxClient):
+    """ParallaxClient that serves responses from a cassette instead of the network."""
+
+    def __init__(self, config: AppConfig, cassette: Cassette, speed: float = 1.0) -> None:
+        """
+        Initialize the replay client.
+
+        Args:
+            config: Application configuration (used for the model name only).
+            cassette: Recorded streams, served in order and cycled.
+            speed: Replay speed; see CassetteStream.replay().
+        """
+        super().__init__(config)
+        self.cassette = cassette
+        self.speed = speed
+        self._position = 0
+
+    def prewarm(self) -> None:
+        """Nothing to connect to: responses come from the cassette."""
+
+    def _stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[str]:
+        """Replay the next recorded stream."""
+        stream = self.cassette.streams[self._position % len(self.cassette.streams)]
+        self._position += 1
+        self.last_usage = None
+        yield from stream.replay(self.speed)
+        self.last_usage = stream.usage
@@ -1,10 +1,59 @@
 """OpenAI client wrapper for Parallax OpsPilot."""
-from typing import Iterator
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
-from openai import APIConnectionError, OpenAI
+import httpx
+from openai import APIConnectionError, APITimeoutError, BadRequestError, NotFoundError, OpenAI
 
+from .cache import cache_key
+from .coalesce import SingleFlight
 from .config import AppConfig
-from .prompts import GEN_COMMAND_SYSTEM_PROMPT
+from .health import HALF_OPEN, OPEN, CircuitBreaker, PrefixCacheStats
+from .models import ModelCatalog, select_model
+from .prompts import (
+    FOLLOWUP_PROMPT,
+    GEN_COMMAND_SYSTEM_PROMPT,
+    PLAN_SYSTEM_PROMPT,
+    PROMPT_LAYOUT_VERSION,
+    REPAIR_COMMAND_PROMPT,
+    STRUCTURED_COMMAND_PROMPT,
+)
+from .structured import COMMAND_RESPONSE_FORMAT, StructuredCommand, StructuredStream
+
+
+DEFAULT_TEMPERATURE = 0.1
+MAX_CANDIDATE_TEMPERATURE = 0.9
+
+# Seconds the background connection warm-up may take
+PREWARM_TIMEOUT = 5.0
+
+# Seconds a started stream may go without sending anything. Kept apart from
+# the adaptive time-to-first-token timeout, which is calibrated on short
+# requests and would cut off long generations with pauses between tokens.
+STREAM_READ_TIMEOUT = 30.0
+
+
+def candidate_temperatures(count: int) -> List[float]:
+    """
+    Spread sampling temperatures for multi-candidate generation.
+
+    The first candidate always uses the default temperature so that it matches
+    a single-candidate run.
+
+    Args:
+        count: Number of candidates.
+
+    Returns:
+        List of temperatures, one per candidate.
+    """
+    if count <= 1:
+        return [DEFAULT_TEMPERATURE]
+    step = (MAX_CANDIDATE_TEMPERATURE - DEFAULT_TEMPERATURE) / (count - 1)
+    return [round(DEFAULT_TEMPERATURE + i * step, 2) for i in range(count)]
 
 
 class ParallaxConnectionError(Exception):
@@ -15,6 +64,83 @@ class ParallaxConnectionError(Exception):
         self.message = message
 
 
+class ParallaxTimeoutError(ParallaxConnectionError):
+    """Raised when a request exceeds its total deadline."""
+
+
+class ParallaxBadRequestError(ParallaxConnectionError):
+    """Raised when the server rejects a request, e.g. an unsupported response format."""
+
+
+class ParallaxModelNotFoundError(ParallaxConnectionError):
+    """Raised when the server does not serve the requested model."""
+
+
+@contextmanager
+def closing_stream(chunks: Iterator[str]) -> Iterator[Iterator[str]]:
+    """
+    Close a chunk stream however the consumer leaves it.
+
+    Closing the generator returned by ParallaxClient closes the underlying
+    HTTP response, so the server stops generating as soon as the client
+    stops reading: on Ctrl-C, on an exception, or when breaking out early.
+
+    Args:
+        chunks: Chunk iterator, usually a ParallaxClient stream generator.
+
+    Yields:
+        The same iterator.
+    """
+    try:
+        yield chunks
+    finally:
+        _close_quietly(chunks)
+
+
+def _close_quietly(stream: Any) -> None:
+    """Close a stream or response if it supports closing, ignoring errors."""
+    close = getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        close()
+    except Exception:
+        pass
+
+
+def _abort_stream(stream: Any) -> None:
+    """
+    Close a streaming response from another thread.
+
+    Closing alone does not wake a thread blocked reading the socket, so the
+    connection's socket is shut down first where httpx exposes it.
+    """
+    response = getattr(stream, "response", None)
+    network_stream = getattr(response, "extensions", {}).get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    _close_quietly(stream)
+
+
+def _set_body_read_timeout(stream: Any, timeout: float) -> None:
+    """
+    Change the read timeout for the rest of a streaming response.
+
+    httpx takes the body's read timeout from the request when the body is
+    first read, so changing it after the headers arrived and before the
+    first chunk applies to every later read.
+    """
+    response = getattr(stream, "response", None)
+    request = getattr(response, "request", None)
+    timeouts = getattr(request, "extensions", {}).get("timeout")
+    if isinstance(timeouts, dict):
+        timeouts["read"] = timeout
+
+
 class ParallaxClient:
     """Client for interacting with Parallax inference server."""
 
@@ -30,9 +156,145 @@ class ParallaxClient:
             base_url=config.api_base,
             api_key=config.api_key,
         )
+        # Token usage reported by the server for the most recent stream
+        self.last_usage: Optional[Dict[str, int]] = None
+        # Seconds to first token of the most recent stream
+        self.last_ttft: Optional[float] = None
+        self.prefix_stats = PrefixCacheStats()
+        # Receives the model list fetched by prewarm()
+        self.catalog = ModelCatalog()
+        # Set to stop all in-flight streams, e.g. when candidates are abandoned
+        self._cancelled = threading.Event()
+        # Failover and the circuit breaker decide what to retry, so the SDK's
+        # own retries (with backoff) would only delay a fast failure
+        self.client.max_retries = 0
+        self.breaker = CircuitBreaker()
+        # Endpoint that served the most recent stream
+        self.last_endpoint: Optional[str] = None
+        # Explanation of an automatic switch to a fallback model, if any
+        self.model_notice: Optional[str] = None
+        # Returns few-shot (query, command) examples for a query, if set
+        self.example_selector: Optional[Callable[[str], List[Tuple[str, str]]]] = None
+        self.docs_selector: Optional[Callable[[str], str]] = None
+        # Shares one stream among concurrent identical generations, if set
+        self.coalescer: Optional[SingleFlight] = None
+        # Parsed answer of the most recent generate_structured_stream(), if it was valid
+        self.last_structured: Optional[StructuredCommand] = None
+        self._clients: Dict[str, OpenAI] = {config.api_base: self.client}
+        # Endpoint and thread of a connection warm-up started by prewarm()
+        self._prewarm: Optional[Tuple[str, threading.Thread]] = None
+
+    def _client_for(self, endpoint: str) -> OpenAI:
+        """Get the OpenAI client for an endpoint, creating fallbacks on first use."""
+        if endpoint not in self._clients:
+            self._clients[endpoint] = OpenAI(
+                base_url=endpoint, api_key=self.config.api_key, max_retries=0
+            )
+            if endpoint == self.config.api_base:
+                self.client = self._clients[endpoint]
+        return self._clients[endpoint]
+
+    def prewarm(self) -> None:
+        """
+        Start connecting to the first available endpoint in the background.
+
+        A GET of the model list opens the TCP connection and does the TLS
+        handshake on the client's connection pool while the caller does
+        local work; the first request then reuses the open connection
+        instead of paying for the handshake before its first token. The
+        list itself refreshes the model catalog, so callers that prewarm
+        need no separate catalog refresh (see resolve_model()). The OpenAI
+        SDK's lazily imported request machinery is loaded the same way.
+        Errors are ignored here: the real request reports them.
+        """
+        if self._prewarm is not None:
+            return
+        endpoint = next(
+            (e for e in self.endpoints if self.breaker.store.load(e).state != OPEN), None
+        )
+        if endpoint is None:
+            return
+        client = self._client_for(endpoint)
+
+        def connect() -> None:
+            try:
+                response = client.with_options(timeout=PREWARM_TIMEOUT).get(
+                    "/models", cast_to=httpx.Response
+                )
+                models = sorted(model["id"] for model in response.json()["data"])
+            except Exception:
+                models = None
+            if models is not None:
+                self.catalog.store(endpoint, models)
+            # The SDK imports its resource modules on first use, which costs
+            # as much as a handshake
+            client.chat.completions
+
+        thread = threading.Thread(target=connect, name="pop-prewarm", daemon=True)
+        self._prewarm = (endpoint, thread)
+        thread.start()
+
+    def cancel_prewarm(self) -> None:
+        """
+        Abandon a warm-up that is no longer needed, e.g. after a cache hit.
+
+        Closing the endpoint's connection pool aborts a handshake still in
+        progress; a later request on this client opens a fresh pool.
+        """
+        if self._prewarm is None:
+            return
+        endpoint, thread = self._prewarm
+        self._prewarm = None
+        if thread.is_alive():
+            _close_quietly(self._clients.pop(endpoint, None))
+
+    def _await_prewarm(self, endpoint: str, timeout: float) -> None:
+        """Let a warm-up of the endpoint finish so the request reuses its connection."""
+        if self._prewarm is not None and self._prewarm[0] == endpoint:
+            self._prewarm[1].join(timeout)
+
+    @property
+    def endpoints(self) -> List[str]:
+        """The configured endpoint followed by its fallbacks, without duplicates."""
+        return list(dict.fromkeys([self.config.api_base, *self.config.fallback_api_bases]))
+
+    def _build_messages(
+        self, query: str, system_info: str, structured: bool = False
+    ) -> List[Dict[str, str]]:
+        """
+        Build the chat messages for a command generation request.
+
+        Messages run from the most to the least stable content, so that
+        servers with prefix caching reuse the longest possible prefix: the
+        system prompt and the environment (identical for every request from
+        this machine), then few-shot examples from example_selector as
+        earlier turns, then local reference text from docs_selector and the
+        query in the last user message. See PROMPT_LAYOUT_VERSION. With
+        structured, the system prompt asks for a JSON object and the example
+        answers are given in that form.
+        """
+        system_prompt = STRUCTURED_COMMAND_PROMPT if structured else GEN_COMMAND_SYSTEM_PROMPT
+        messages = [
+            {"role": "system", "content": f"{system_prompt}\n\nEnvironment: {system_info}"}
+        ]
+        if self.example_selector is not None:
+            for example_query, example_command in self.example_selector(query):
+                if structured:
+                    example_command = StructuredCommand.from_text(example_command).to_json()
+                messages += [
+                    {"role": "user", "content": f"User request: {example_query}"},
+                    {"role": "assistant", "content": example_command},
+                ]
+
+        user_message = f"User request: {query}"
+        reference = self.docs_selector(query) if self.docs_selector is not None else ""
+        if reference:
+            user_message = f"Reference for the installed tools:\n{reference}\n\n{user_message}"
+        messages.append({"role": "user", "content": user_message})
+        return messages
 
     def generate_command_stream(
-        self, query: str, system_info: str
+        self, query: str, system_info: str, temperature: float = DEFAULT_TEMPERATURE
     ) -> Iterator[str]:
         """
         Generate shell command using streaming API.
@@ -40,6 +302,7 @@ class ParallaxClient:
         Args:
             query: Natural language query from the user.
             system_info: System information (OS and shell) from get_system_info().
+            temperature: Sampling temperature.
 
         Yields:
             Chunks of the generated command as strings.
@@ -47,29 +310,517 @@ class ParallaxClient:
         Raises:
             ParallaxConnectionError: If connection to Parallax server fails.
         """
-        # Construct user message with query and system info
-        user_message = f"Environment: {system_info}\n\nUser request: {query}"
+        messages = self._build_messages(query, system_info)
+        if self.coalescer is None:
+            yield from self._stream(messages, temperature)
+            return
+        # Keyed like the response cache; the temperature separates candidates
+        key = f"{cache_key(query, system_info, self.config.model)}:{temperature:g}"
+        yield from self.coalescer.stream(key, lambda: self._stream(messages, temperature))
+
+    def generate_structured_stream(
+        self, query: str, system_info: str, temperature: float = DEFAULT_TEMPERATURE
+    ) -> Iterator[str]:
+        """
+        Generate a shell command as a JSON object constrained by a schema.
+
+        The command is yielded as soon as its field is complete and the
+        response is closed once the rest is not needed, so no tokens are
+        spent on trailing text. When the stream ends, last_structured holds
+        the parsed answer. A server that rejects the response format gets
+        the free-form request instead, and a response that is not the
+        expected JSON is yielded raw; in both cases last_structured stays
+        None and the caller extracts the command from the text as usual.
+
+        Args:
+            query: Natural language query from the user.
+            system_info: System information (OS and shell) from get_system_info().
+            temperature: Sampling temperature.
+
+        Yields:
+            The command, then a `# WARNING:` line if it is flagged as dangerous.
+
+        Raises:
+            ParallaxConnectionError: If connection to Parallax server fails.
+        """
+        self.last_structured = None
+        messages = self._build_messages(query, system_info, structured=True)
+        stream = StructuredStream(self._stream(messages, temperature, COMMAND_RESPONSE_FORMAT))
+        try:
+            yield from stream
+        except ParallaxBadRequestError:
+            yield from self.generate_command_stream(query, system_info, temperature)
+            return
+        self.last_structured = stream.result
+
+    def repair_command_stream(
+        self, query: str, system_info: str, command: str, error: str
+    ) -> Iterator[str]:
+        """
+        Ask the model to fix a command that failed validation.
+
+        The original request and the rejected command are replayed as
+        conversation history, followed by the validation error.
+
+        Args:
+            query: The original natural language query.
+            system_info: System information (OS and shell) from get_system_info().
+            command: The command that failed validation.
+            error: Description of the validation failure.
+
+        Yields:
+            Chunks of the repaired command as strings.
+
+        Raises:
+            ParallaxConnectionError: If connection to Parallax server fails.
+        """
+        messages = self._build_messages(query, system_info) + [
+            {"role": "assistant", "content": command},
+            {"role": "user", "content": REPAIR_COMMAND_PROMPT.format(error=error)},
+        ]
+        yield from self._stream(messages, DEFAULT_TEMPERATURE)
+
+    def followup_stream(
+        self,
+        query: str,
+        system_info: str,
+        previous_query: str,
+        command: str,
+        exit_code: int,
+        output: str,
+    ) -> Iterator[str]:
+        """
+        Ask a follow-up about the last executed command and its output.
+
+        The previous request and command are replayed as conversation
+        history, followed by the execution result and the new request.
+
+        Args:
+            query: The follow-up request.
+            system_info: System information (OS and shell) from get_system_info().
+            previous_query: The request that produced the command.
+            command: The executed command.
+            exit_code: Its exit code.
+            output: Its output, already compressed to the prompt budget.
+
+        Yields:
+            Chunks of the new command as strings.
+
+        Raises:
+            ParallaxConnectionError: If connection to Parallax server fails.
+        """
+        messages = self._build_messages(previous_query, system_info) + [
+            {"role": "assistant", "content": command},
+            {
+                "role": "user",
+                "content": FOLLOWUP_PROMPT.format(
+                    exit_code=exit_code, output=output, request=query
+                ),
+            },
+        ]
+        yield from self._stream(messages, DEFAULT_TEMPERATURE)
+
+    def chat_stream(
+        self, messages: List[Dict[str, str]], temperature: float = DEFAULT_TEMPERATURE
+    ) -> Iterator[str]:
+        """
+        Stream a response for a prepared conversation.
+
+        Args:
+            messages: Chat messages, e.g. from ChatSession.build_messages().
+            temperature: Sampling temperature.
+
+        Yields:
+            Chunks of the response as strings.
+
+        Raises:
+            ParallaxConnectionError: If connection to Parallax server fails.
+        """
+        yield from self._stream(messages, temperature)
+
+    def plan_stream(self, query: str, system_info: str) -> Iterator[str]:
+        """
+        Ask the model to split a compound request into dependent steps.
 
+        Args:
+            query: Natural language query from the user.
+            system_info: System information (OS and shell) from get_system_info().
+
+        Yields:
+            Chunks of the JSON step list as strings.
+
+        Raises:
+            ParallaxConnectionError: If connection to Parallax server fails.
+        """
         messages = [
-            {"role": "system", "content": GEN_COMMAND_SYSTEM_PROMPT},
-            {"role": "user", "content": user_message},
+            {"role": "system", "content": f"{PLAN_SYSTEM_PROMPT}\n\nEnvironment: {system_info}"},
+            {"role": "user", "content": f"User request: {query}"},
         ]
+        yield from self._stream(messages, DEFAULT_TEMPERATURE)
+
+    def _stream(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[str]:
+        """
+        Stream a chat completion from the first available endpoint.
+
+        Endpoints whose circuit breaker is open are skipped without a network
+        call. An endpoint that fails before producing any output is recorded
+        as a failure and the next one is tried; once output has been yielded
+        a failure is raised, since a response cannot be resumed elsewhere. A
+        rejected request is raised at once: the next endpoint would reject it
+        too.
+
+        Args:
+            messages: Chat messages to send.
+            temperature: Sampling temperature.
+            response_format: OpenAI response_format to request, or None for free text.
+
+        Yields:
+            Content chunks as strings.
+
+        Raises:
+            ParallaxTimeoutError: If the request exceeds its deadline.
+            ParallaxConnectionError: If no endpoint could serve the request.
+        """
+        errors: List[ParallaxConnectionError] = []
+        for endpoint in self.endpoints:
+            if not self.breaker.allow(endpoint):
+                health = self.breaker.store.load(endpoint)
+                retry = (
+                    "a probe request is in progress"
+                    if health.state == HALF_OPEN
+                    else f"retrying in {health.retry_in():.0f}s"
+                )
+                errors.append(
+                    ParallaxConnectionError(
+                        f"{endpoint}: unavailable after {health.failures} consecutive failures "
+                        f"({health.last_error}); {retry}"
+                    )
+                )
+                continue
+
+            started = False
+            try:
+                try:
+                    with closing_stream(
+                        self._stream_from(endpoint, messages, temperature, response_format)
+                    ) as chunks:
+                        for chunk in chunks:
+                            started = True
+                            yield chunk
+                except ParallaxModelNotFoundError:
+                    if not self._switch_to_fallback_model(endpoint):
+                        raise
+                    with closing_stream(
+                        self._stream_from(endpoint, messages, temperature, response_format)
+                    ) as chunks:
+                        for chunk in chunks:
+                            started = True
+                            yield chunk
+                return
+            except ParallaxConnectionError as e:
+                if started or isinstance(e, ParallaxBadRequestError):
+                    raise
+                errors.append(e)
+
+        if len(errors) == 1:
+            raise errors[0]
+        raise ParallaxConnectionError(
+            "No Parallax endpoint is available:\n" + "\n".join(e.message for e in errors)
+        )
+
+    def _stream_from(
+        self,
+        endpoint: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[str]:
+        """
+        Stream a chat completion from one endpoint and yield its content deltas.
+
+        The HTTP response is always closed when the generator finishes, is
+        closed early, or raises. config.request_deadline bounds the whole
+        request: a watchdog closes the response once it passes, which also
+        unblocks a read from a server that has stalled mid-stream. Connecting
+        and the wait for the first token are bounded by the endpoint's
+        adaptive timeout, derived from its observed time to first token,
+        including the wait for headers from servers that hold them back until
+        the first token; later reads only by STREAM_READ_TIMEOUT.
+
+        Args:
+            endpoint: API base URL.
+            messages: Chat messages to send.
+            temperature: Sampling temperature.
+            response_format: OpenAI response_format to request, or None for free text.
+
+        Yields:
+            Content chunks as strings.
+
+        Raises:
+            ParallaxBadRequestError: If the server rejects the request.
+            ParallaxTimeoutError: If the request exceeds a timeout.
+            ParallaxConnectionError: If connection to the endpoint fails.
+        """
+        self.last_usage = None
+        self.last_ttft = None
+        self.last_endpoint = endpoint
+        deadline = self.config.request_deadline
+        first_token_timeout = self.breaker.timeout(endpoint, deadline)
+        read_timeout = min(deadline, max(first_token_timeout, STREAM_READ_TIMEOUT))
+        start = time.monotonic()
+        self._await_prewarm(endpoint, first_token_timeout)
+        timed_out = threading.Event()
+        no_first_token = threading.Event()
+        stream = None
+        watchdog = None
+        first_token_watchdog = None
+        first_token = True
+        # Kept locally as well, since concurrent streams share the attributes
+        ttft: Optional[float] = None
+        usage: Dict[str, int] = {}
+
+        def expire() -> None:
+            timed_out.set()
+            _abort_stream(stream)
+
+        def expire_first_token() -> None:
+            if ttft is None:
+                no_first_token.set()
+                _abort_stream(stream)
+
+        # Servers without structured output support reject the parameter, so
+        # it is only sent when asked for
+        extra: Dict[str, Any] = {}
+        if response_format is not None:
+            extra["response_format"] = response_format
 
         try:
-            stream = self.client.chat.completions.create(
+            stream = self._client_for(endpoint).chat.completions.create(
                 model=self.config.model,
                 messages=messages,
                 stream=True,
-                temperature=0.1,
+                temperature=temperature,
+                stream_options={"include_usage": True},
+                # Servers may hold the headers back until the first token, so
+                # the wait for them is bounded like the wait for the token
+                timeout=httpx.Timeout(
+                    deadline, connect=first_token_timeout, read=first_token_timeout
+                ),
+                **extra,
+            )
+            _set_body_read_timeout(stream, read_timeout)
+            elapsed = time.monotonic() - start
+            watchdog = threading.Timer(max(0.0, deadline - elapsed), expire)
+            watchdog.daemon = True
+            watchdog.start()
+            first_token_watchdog = threading.Timer(
+                max(0.0, first_token_timeout - elapsed), expire_first_token
             )
+            first_token_watchdog.daemon = True
+            first_token_watchdog.start()
 
             for chunk in stream:
+                if timed_out.is_set() or no_first_token.is_set() or self._cancelled.is_set():
+                    break
+                if first_token:
+                    first_token_watchdog.cancel()
+                    ttft = self.last_ttft = time.monotonic() - start
+                    self.breaker.record_success(endpoint, ttft)
+                    first_token = False
+                # The usage chunk arrives last, with an empty choices list
+                if getattr(chunk, "usage", None) is not None:
+                    usage = {
+                        "prompt_tokens": chunk.usage.prompt_tokens,
+                        "completion_tokens": chunk.usage.completion_tokens,
+                        "total_tokens": chunk.usage.total_tokens,
+                    }
+                    # Prefix caching servers report the prompt tokens they reused
+                    details = getattr(chunk.usage, "prompt_tokens_details", None)
+                    cached = getattr(details, "cached_tokens", None)
+                    if isinstance(cached, int):
+                        usage["cached_tokens"] = cached
+                    self.last_usage = usage
+                if not chunk.choices:
+                    continue
                 if chunk.choices[0].delta.content is not None:
                     yield chunk.choices[0].delta.content
 
+        except BadRequestError as e:
+            raise ParallaxBadRequestError(f"{endpoint} rejected the request: {e.message}") from e
+        except NotFoundError as e:
+            raise ParallaxModelNotFoundError(
+                f"{endpoint} does not serve model '{self.config.model}'. "
+                "Run 'pop configure' to pick one of the served models."
+            ) from e
+        except APITimeoutError as e:
+            raise self._first_token_error(endpoint, first_token_timeout) from e
         except APIConnectionError as e:
+            if timed_out.is_set():
+                raise self._timeout_error(endpoint) from e
+            if no_first_token.is_set():
+                raise self._first_token_error(endpoint, first_token_timeout) from e
+            self.breaker.record_failure(endpoint, "connection failed")
             raise ParallaxConnectionError(
-                f"Failed to connect to Parallax server at {self.config.api_base}. "
+                f"Failed to connect to Parallax server at {endpoint}. "
                 "Is Parallax running? Please check if the server is started and accessible."
             ) from e
+        except httpx.TimeoutException as e:
+            self.breaker.record_failure(endpoint, "read timeout")
+            raise ParallaxTimeoutError(
+                f"{endpoint} sent nothing for {read_timeout:.1f}s; the request was cancelled."
+            ) from e
+        except Exception as e:
+            # Reads fail with transport errors once a watchdog closes the response
+            if timed_out.is_set():
+                raise self._timeout_error(endpoint) from e
+            if no_first_token.is_set():
+                raise self._first_token_error(endpoint, first_token_timeout) from e
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if first_token_watchdog is not None:
+                first_token_watchdog.cancel()
+            _close_quietly(stream)
+            if ttft is not None:
+                self.prefix_stats.record(
+                    PROMPT_LAYOUT_VERSION,
+                    self.config.model,
+                    ttft,
+                    usage.get("prompt_tokens"),
+                    usage.get("cached_tokens"),
+                )
+
+        if timed_out.is_set():
+            raise self._timeout_error(endpoint)
+        if no_first_token.is_set():
+            raise self._first_token_error(endpoint, first_token_timeout)
+
+    def _switch_to_fallback_model(self, endpoint: str) -> bool:
+        """
+        Refresh the endpoint's model list and switch to a served fallback.
+
+        Called when the server rejects the configured model, so the network
+        round trip to refresh the catalog is already justified.
+
+        Returns:
+            True if the client now uses a different, served model.
+        """
+        try:
+            served = self.catalog.refresh(endpoint, self.config.api_key)
+        except Exception:
+            return False
+        model, notice = select_model(self.config.model, self.config.fallback_models, served)
+        if model == self.config.model:
+            return False
+        self.config = self.config.model_copy(update={"model": model})
+        self.model_notice = notice
+        return True
+
+    def probe(self, endpoint: str) -> float:
+        """
+        Measure an endpoint's time to first token with a minimal request.
+
+        The stream is closed after the first token. The result is recorded in
+        the endpoint's health state even if its breaker is open, so a
+        successful probe closes the breaker.
+
+        Args:
+            endpoint: API base URL.
+
+        Returns:
+            Seconds to first token.
+
+        Raises:
+            ParallaxConnectionError: If the probe fails.
+        """
+        start = time.monotonic()
+        messages = [{"role": "user", "content": "Reply with: ok"}]
+        with closing_stream(self._stream_from(endpoint, messages, 0.0)) as chunks:
+            next(chunks, None)
+        return time.monotonic() - start
+
+    def _first_token_error(self, endpoint: str, timeout: float) -> ParallaxTimeoutError:
+        """Build the error for an endpoint that did not start answering in time."""
+        self.breaker.record_failure(endpoint, "timeout")
+        return ParallaxTimeoutError(
+            f"{endpoint} did not respond within {timeout:.1f}s "
+            "(timeout adapted to its observed latency)."
+        )
+
+    def _timeout_error(self, endpoint: str) -> ParallaxTimeoutError:
+        """Build the error for a request that exceeded its deadline."""
+        self.breaker.record_failure(endpoint, "deadline exceeded")
+        return ParallaxTimeoutError(
+            f"Request to {endpoint} exceeded the "
+            f"{self.config.request_deadline:g}s deadline and was cancelled."
+        )
+
+    def generate_command(
+        self, query: str, system_info: str, temperature: float = DEFAULT_TEMPERATURE
+    ) -> str:
+        """
+        Generate a shell command and return the full raw response.
+
+        Args:
+            query: Natural language query from the user.
+            system_info: System information (OS and shell) from get_system_info().
+            temperature: Sampling temperature.
+
+        Returns:
+            The raw model output.
+
+        Raises:
+            ParallaxConnectionError: If connection to Parallax server fails.
+        """
+        with closing_stream(self.generate_command_stream(query, system_info, temperature)) as chunks:
+            return "".join(chunks)
+
+    def generate_candidates(
+        self, query: str, system_info: str, count: int
+    ) -> List[str]:
+        """
+        Generate several candidates concurrently with varied temperatures.
+
+        Failed requests are dropped as long as at least one candidate succeeds.
+
+        Args:
+            query: Natural language query from the user.
+            system_info: System information (OS and shell) from get_system_info().
+            count: Number of concurrent requests.
+
+        Returns:
+            Raw model outputs, in temperature order.
+
+        Raises:
+            ParallaxConnectionError: If every request fails to connect.
+        """
+        temperatures = candidate_temperatures(count)
+        results: List[str] = []
+        error: Optional[ParallaxConnectionError] = None
+        self._cancelled.clear()
+
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            futures = [
+                pool.submit(self.generate_command, query, system_info, temperature)
+                for temperature in temperatures
+            ]
+            try:
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except ParallaxConnectionError as e:
+                        error = e
+            except BaseException:
+                # Ctrl-C: stop the other streams instead of waiting them out
+                self._cancelled.set()
+                raise
 
+        if not results and error is not None:
+            raise error
+        return results
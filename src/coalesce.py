@@ -0,0 +1,171 @@
+"""Coalescing of identical in-flight streams (singleflight)."""
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .utils import get_cache_dir, read_json, update_json_atomic
+
+
+class _Flight:
+    """One upstream stream and the chunks it has produced so far."""
+
+    def __init__(self) -> None:
+        """Initialize an empty flight."""
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        # Set when every subscriber has left, so the upstream stops
+        self.cancelled = False
+        self.condition = threading.Condition()
+
+
+class SingleFlight:
+    """
+    Share one upstream stream among concurrent identical requests.
+
+    The first request for a key starts the upstream stream on a pump thread;
+    requests for the same key that arrive while it runs subscribe to it
+    instead of starting their own. Every subscriber receives all chunks from
+    the start, whenever it joined. Abandoning a stream only unsubscribes:
+    the upstream is closed once no subscriber is left, so cancelling the
+    request that started it does not cut off the others. A finished flight
+    is forgotten; repeating a request later is the response cache's job.
+    """
+
+    def __init__(self) -> None:
+        """Initialize with no flights."""
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        # Streams started upstream, and requests that joined one instead
+        self.upstream = 0
+        self.coalesced = 0
+
+    def stream(self, key: str, start: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Stream the response for a key, joining an identical request in flight.
+
+        Args:
+            key: Identity of the request, e.g. from cache_key().
+            start: Starts the upstream stream; only called if no flight exists.
+
+        Yields:
+            Chunks of the shared response.
+
+        Raises:
+            Exception: Whatever the upstream stream raised, in every subscriber.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.upstream += 1
+            else:
+                self.coalesced += 1
+            flight.subscribers += 1
+        if leader:
+            threading.Thread(
+                target=self._pump, args=(key, flight, start), name="pop-singleflight", daemon=True
+            ).start()
+
+        index = 0
+        try:
+            while True:
+                with flight.condition:
+                    while index >= len(flight.chunks) and not flight.done:
+                        flight.condition.wait()
+                    pending = flight.chunks[index:]
+                    index = len(flight.chunks)
+                    finished = flight.done
+                yield from pending
+                if finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            with self._lock:
+                flight.subscribers -= 1
+                if flight.subscribers == 0 and not flight.done:
+                    flight.cancelled = True
+                    # A new request must not join a stream that is being torn down
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+
+    def _pump(self, key: str, flight: _Flight, start: Callable[[], Iterator[str]]) -> None:
+        """Read the upstream stream into the flight until it ends or nobody listens."""
+        chunks: Optional[Iterator[str]] = None
+        try:
+            chunks = start()
+            for chunk in chunks:
+                if flight.cancelled:
+                    break
+                with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            # Closing a generator stream closes its HTTP response
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+
+class CoalesceStats:
+    """
+    Running totals of upstream streams started and requests that shared one.
+
+    Concurrent invocations update the totals one after another (see
+    update_json_atomic()).
+    """
+
+    def __init__(self, stats_path: Optional[Path] = None) -> None:
+        """
+        Initialize the stats store.
+
+        Args:
+            stats_path: Path to the JSON stats file. If None, uses the cache directory.
+        """
+        self.stats_path = stats_path or get_cache_dir() / "coalesce_stats.json"
+
+    def load(self) -> Dict[str, int]:
+        """
+        Load the totals.
+
+        Returns:
+            Counters "upstream" and "coalesced"; zero if nothing was recorded.
+        """
+        data = read_json(self.stats_path, {})
+        if not isinstance(data, dict):
+            data = {}
+        return {name: int(data.get(name, 0)) for name in ("upstream", "coalesced")}
+
+    def record(self, flights: SingleFlight) -> None:
+        """
+        Add the counters of a run.
+
+        Args:
+            flights: The run's coalescer.
+        """
+        if not flights.upstream and not flights.coalesced:
+            return
+
+        def add(data: Any) -> Dict[str, int]:
+            data = data if isinstance(data, dict) else {}
+            return {
+                "upstream": int(data.get("upstream", 0)) + flights.upstream,
+                "coalesced": int(data.get("coalesced", 0)) + flights.coalesced,
+            }
+
+        try:
+            update_json_atomic(self.stats_path, add)
+        except OSError:
+            # Recorded after the batch's results are out; only pop stats misses them
+            pass
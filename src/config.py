@@ -1,6 +1,6 @@
 """Configuration management for Parallax OpsPilot."""
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import yaml
 from pydantic import BaseModel, Field, field_validator
@@ -21,6 +21,84 @@ class AppConfig(BaseModel):
         default="gradient/Llama-3-8B-Instruct",
         description="Model name to use for inference",
     )
+    fallback_models: List[str] = Field(
+        default_factory=list,
+        description="Models to switch to, in order, when the configured model is not served",
+    )
+    fallback_api_bases: List[str] = Field(
+        default_factory=list,
+        description="Alternate server URLs, tried in order when api_base is unavailable",
+    )
+    lint_budget_ms: int = Field(
+        default=50,
+        ge=0,
+        description="Time budget for the pre-execution cost linter (0 disables it)",
+    )
+    repair_attempts: int = Field(
+        default=1,
+        ge=0,
+        description="Repair round trips for commands that fail validation (0 disables repair)",
+    )
+    repair_timeout: float = Field(
+        default=20.0,
+        gt=0,
+        description="Total time budget in seconds for repairing one command",
+    )
+    request_deadline: float = Field(
+        default=120.0,
+        gt=0,
+        description="Hard limit in seconds for one request, including streaming the response",
+    )
+    chat_history_tokens: int = Field(
+        default=2048,
+        gt=0,
+        description="Token budget for conversation history in pop chat",
+    )
+    cache_ttl_hours: float = Field(
+        default=168.0,
+        ge=0,
+        description="Hours a cached command stays fresh (0 disables the response cache)",
+    )
+    fewshot_examples: int = Field(
+        default=3,
+        ge=0,
+        le=10,
+        description="Relevant examples from history and packs added to each request (0 disables)",
+    )
+    fewshot_token_budget: int = Field(
+        default=400,
+        ge=0,
+        description="Token budget for the few-shot examples of one request",
+    )
+    shell_history_matches: int = Field(
+        default=3,
+        ge=0,
+        le=10,
+        description="Matching commands from shell history offered before asking the model (0 disables)",
+    )
+    structured_output: bool = Field(
+        default=False,
+        description="Ask for a JSON {command, dangerous, warning} answer instead of free text",
+    )
+    docs_token_budget: int = Field(
+        default=300,
+        ge=0,
+        description="Token budget for man page and --help excerpts (0 disables)",
+    )
+    feedback_token_budget: int = Field(
+        default=1500,
+        ge=0,
+        description="Token budget for command output sent by gen --follow-up (0 disables capture)",
+    )
+    shared_cache_url: Optional[str] = Field(
+        default=None,
+        description="Team cache server (pop cache-server) consulted after the local cache",
+    )
+    shared_cache_timeout: float = Field(
+        default=0.3,
+        gt=0,
+        description="Timeout in seconds for shared cache lookups",
+    )
 
     @field_validator("api_base")
     @classmethod
@@ -32,6 +110,20 @@ class AppConfig(BaseModel):
             raise ValueError("api_base must end with /v1")
         return v
 
+    @field_validator("fallback_api_bases")
+    @classmethod
+    def validate_fallback_api_bases(cls, v: List[str]) -> List[str]:
+        """Validate each fallback URL like api_base."""
+        return [cls.validate_api_base(url) for url in v]
+
+    @field_validator("shared_cache_url")
+    @classmethod
+    def validate_shared_cache_url(cls, v: Optional[str]) -> Optional[str]:
+        """Validate the shared cache URL format."""
+        if v is not None and not v.startswith(("http://", "https://")):
+            raise ValueError("shared_cache_url must start with http:// or https://")
+        return v
+
 
 class ConfigManager:
     """Manages configuration loading and saving."""
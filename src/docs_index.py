@@ -0,0 +1,477 @@
+"""Local index of man pages and --help output for the binaries on $PATH."""
+import os
+import re
+import shutil
+import signal
+import stat
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .fewshot import tokenize
+from .session import estimate_tokens
+from .utils import get_cache_dir, read_json, write_json_atomic
+
+# Bump when the stored format changes; older indexes are rebuilt
+INDEX_VERSION = 1
+
+# Seconds a man page or --help run may take
+EXTRACT_TIMEOUT = 3.0
+
+# Characters read from man or --help output
+MAX_OUTPUT = 256 * 1024
+
+# Stored option snippets per binary, and characters per snippet
+MAX_OPTIONS = 200
+MAX_SNIPPET = 400
+
+# Binaries mentioned in one query that get reference text
+MAX_TOOLS = 3
+
+# Never started with --help: some of these act before parsing arguments
+NEVER_RUN = frozenset(
+    "halt init poweroff reboot shutdown telinit kexec sulogin systemd "
+    "mkfs mke2fs wipefs fdisk sfdisk parted".split()
+)
+
+# Binaries here come from the system or a package manager; anything else on
+# $PATH, such as the user's own scripts, is only run with help_anywhere
+SYSTEM_BIN_DIRS = frozenset(
+    "/bin /sbin /usr/bin /usr/sbin /usr/local/bin /usr/local/sbin "
+    "/opt/homebrew/bin /opt/homebrew/sbin".split()
+)
+
+# Binary names that are also everyday words in requests ("which files...",
+# "make a backup"); they only count as a mention when written as a command
+COMMON_WORDS = frozenset(
+    "at column expand false file fold free groups host id info install join last "
+    "less link look make more nice open paste print read script see size split sum "
+    "sync test time top tree true type units users view wait watch which who yes".split()
+)
+
+MAN = "man"
+HELP = "help"
+
+OVERSTRIKE_PATTERN = re.compile(r".\x08")
+ANSI_PATTERN = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+OPTION_PATTERN = re.compile(r"^(\s*)-{1,2}[A-Za-z0-9?#]")
+USAGE_PATTERN = re.compile(r"^\s*usage:", re.IGNORECASE)
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_][\w.+-]*")
+# A word in backticks or quotes, or followed by an option: `top`, "watch -n 5"
+COMMAND_PATTERN = re.compile(
+    r"[`'\"]([A-Za-z0-9_][\w.+-]*)[`'\"\s]|([A-Za-z0-9_][\w.+-]*)\s+-{1,2}[A-Za-z]"
+)
+
+
+@dataclass
+class ToolDoc:
+    """Reference text extracted for one binary."""
+
+    name: str
+    path: str
+    mtime: float
+    source: Optional[str] = None
+    usage: str = ""
+    options: List[str] = field(default_factory=list)
+
+
+@dataclass
+class RefreshReport:
+    """What a refresh of the index did."""
+
+    indexed: int = 0
+    unchanged: int = 0
+    empty: int = 0
+    removed: int = 0
+    seconds: float = 0.0
+
+
+def scan_path(path_env: Optional[str] = None) -> Dict[str, str]:
+    """
+    Find the executables on a search path.
+
+    Args:
+        path_env: Search path. If None, uses $PATH.
+
+    Returns:
+        Binary name -> path; the first directory wins, as in the shell.
+    """
+    binaries: Dict[str, str] = {}
+    search = os.environ.get("PATH", "") if path_env is None else path_env
+    for directory in search.split(os.pathsep):
+        if not directory:
+            continue
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name in binaries:
+                continue
+            try:
+                if entry.is_file() and os.access(entry.path, os.X_OK):
+                    binaries[entry.name] = entry.path
+            except OSError:
+                continue
+    return binaries
+
+
+def _clean(text: str) -> str:
+    """Strip terminal formatting from man or --help output."""
+    return ANSI_PATTERN.sub("", OVERSTRIKE_PATTERN.sub("", text))
+
+
+def parse_doc(text: str) -> Tuple[str, List[str]]:
+    """
+    Pull the usage line and the option descriptions out of reference text.
+
+    An option starts at a line beginning with a dash; deeper-indented lines
+    after it, as in man pages and most --help layouts, belong to it.
+
+    Args:
+        text: Man page or --help output.
+
+    Returns:
+        (usage line, option snippets), each collapsed to single spaces.
+    """
+    lines = _clean(text).splitlines()
+    usage = ""
+    for index, line in enumerate(lines):
+        if USAGE_PATTERN.match(line):
+            usage = line.strip()
+            break
+        if line.strip() == "SYNOPSIS":
+            following = [rest.strip() for rest in lines[index + 1 : index + 3] if rest.strip()]
+            usage = following[0] if following else ""
+            break
+
+    options: List[str] = []
+    current: List[str] = []
+    indent = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        line_indent = len(line) - len(line.lstrip())
+        starts_option = OPTION_PATTERN.match(line)
+        if starts_option and (not current or line_indent <= indent + 4):
+            if current:
+                options.append(" ".join(" ".join(current).split())[:MAX_SNIPPET])
+            current, indent = [line], line_indent
+        elif current and line_indent > indent:
+            current.append(line)
+        elif current:
+            options.append(" ".join(" ".join(current).split())[:MAX_SNIPPET])
+            current = []
+        if len(options) >= MAX_OPTIONS:
+            break
+    if current and len(options) < MAX_OPTIONS:
+        options.append(" ".join(" ".join(current).split())[:MAX_SNIPPET])
+    return usage[:MAX_SNIPPET], options
+
+
+def _run_capture(argv: List[str], env: Dict[str, str], cwd: str) -> str:
+    """
+    Run a process and return what it printed, or "" on failure.
+
+    The process gets no stdin and its own session, so a timeout kills
+    everything it started.
+    """
+    try:
+        process = subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            env=env,
+            cwd=cwd,
+            start_new_session=True,
+        )
+    except OSError:
+        return ""
+    try:
+        output, _ = process.communicate(timeout=EXTRACT_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        process.communicate()
+        return ""
+    return output[:MAX_OUTPUT].decode("utf-8", errors="replace")
+
+
+def _may_run_help(name: str, path: str, info: os.stat_result, help_anywhere: bool) -> bool:
+    """Whether a binary may be started with --help."""
+    if name in NEVER_RUN or info.st_mode & (stat.S_ISUID | stat.S_ISGID):
+        return False
+    if help_anywhere:
+        return True
+    # A system directory may still link to a script in the home directory
+    home = os.path.expanduser("~")
+    return os.path.dirname(path) in SYSTEM_BIN_DIRS and not os.path.realpath(path).startswith(
+        home + os.sep
+    )
+
+
+def extract_doc(
+    name: str, path: str, use_man: bool = True, help_anywhere: bool = False
+) -> ToolDoc:
+    """
+    Extract the reference text for one binary.
+
+    The man page is tried first. Only without one is the binary itself run
+    with --help: in an empty temporary directory, with no stdin, a short
+    timeout and a minimal environment, and never for setuid/setgid binaries
+    or the NEVER_RUN list. Unless help_anywhere is set, only binaries in
+    SYSTEM_BIN_DIRS are run, so the user's own scripts are never started.
+
+    Args:
+        name: Binary name.
+        path: Path of the binary.
+        use_man: Look for a man page.
+        help_anywhere: Also run --help for binaries outside SYSTEM_BIN_DIRS.
+
+    Returns:
+        The document; source is None if nothing useful was found.
+    """
+    try:
+        info = os.stat(path)
+    except OSError:
+        return ToolDoc(name, path, 0.0)
+    doc = ToolDoc(name, path, info.st_mtime)
+    env = {
+        "PATH": os.environ.get("PATH", os.defpath),
+        "LC_ALL": "C",
+        "MANPAGER": "cat",
+        "PAGER": "cat",
+        "MANWIDTH": "100",
+        "GROFF_NO_SGR": "1",
+        "TERM": "dumb",
+    }
+    with tempfile.TemporaryDirectory(prefix="pop-docs-") as cwd:
+        env["HOME"] = cwd
+        attempts: List[Tuple[str, List[str]]] = []
+        man = shutil.which(MAN) if use_man else None
+        if man:
+            attempts.append((MAN, [man, name]))
+        if _may_run_help(name, path, info, help_anywhere):
+            attempts.append((HELP, [path, "--help"]))
+        for source, argv in attempts:
+            usage, options = parse_doc(_run_capture(argv, env, cwd))
+            if options:
+                doc.source, doc.usage, doc.options = source, usage, options
+                break
+    return doc
+
+
+def _extract(item: Tuple[str, str, bool, bool]) -> ToolDoc:
+    """Process pool entry point for extract_doc."""
+    return extract_doc(*item)
+
+
+class DocsIndex:
+    """
+    Extracted reference text, one JSON file per binary plus a manifest.
+
+    The manifest maps each binary to the path and mtime it was extracted
+    from, so a refresh only re-extracts binaries that were added, replaced
+    or moved, and a lookup only reads the files of the binaries a query
+    names.
+    """
+
+    def __init__(self, directory: Optional[Path] = None) -> None:
+        """
+        Initialize the index.
+
+        Args:
+            directory: Index directory. If None, uses the cache directory.
+        """
+        self.directory = directory or get_cache_dir() / "docs"
+        self.manifest_path = self.directory / "manifest.json"
+        self._manifest: Optional[Dict[str, Dict]] = None
+
+    def manifest(self) -> Dict[str, Dict]:
+        """Binary name -> {"path", "mtime", "source"} of the indexed binaries."""
+        if self._manifest is None:
+            data = read_json(self.manifest_path, {})
+            if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+                data = {}
+            binaries = data.get("binaries")
+            self._manifest = binaries if isinstance(binaries, dict) else {}
+        return self._manifest
+
+    def _doc_path(self, name: str) -> Path:
+        """File holding the document of one binary."""
+        return self.directory / "tools" / f"{name}.json"
+
+    def load(self, name: str) -> Optional[ToolDoc]:
+        """Load the document of one binary, or None if it is missing or corrupt."""
+        data = read_json(self._doc_path(name), None)
+        if not isinstance(data, dict):
+            return None
+        try:
+            return ToolDoc(**data)
+        except TypeError:
+            return None
+
+    def stale(self, binaries: Dict[str, str]) -> List[str]:
+        """
+        Binaries that are new or changed since they were indexed.
+
+        Args:
+            binaries: Binary name -> path, as from scan_path.
+
+        Returns:
+            Names, sorted.
+        """
+        manifest = self.manifest()
+        stale = []
+        for name, path in binaries.items():
+            known = manifest.get(name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                continue
+            if not known or known.get("path") != path or known.get("mtime") != mtime:
+                stale.append(name)
+        return sorted(stale)
+
+    def refresh(
+        self,
+        binaries: Dict[str, str],
+        workers: Optional[int] = None,
+        use_man: bool = True,
+        on_done: Optional[Callable[[ToolDoc], None]] = None,
+        help_anywhere: bool = False,
+    ) -> RefreshReport:
+        """
+        Bring the index up to date with a set of binaries.
+
+        Stale binaries are extracted in a process pool. The manifest is saved
+        even if the refresh is interrupted, so finished work is kept.
+
+        Args:
+            binaries: Binary name -> path, as from scan_path.
+            workers: Worker processes. If None, one per CPU.
+            use_man: Look for man pages.
+            on_done: Called with each extracted document.
+            help_anywhere: Also run --help for binaries outside SYSTEM_BIN_DIRS.
+
+        Returns:
+            What changed.
+        """
+        start = time.perf_counter()
+        manifest = self.manifest()
+        report = RefreshReport()
+        for name in [name for name in manifest if name not in binaries]:
+            del manifest[name]
+            self._doc_path(name).unlink(missing_ok=True)
+            report.removed += 1
+
+        stale = self.stale(binaries)
+        report.unchanged = len(binaries) - len(stale)
+        try:
+            if stale:
+                items = [(name, binaries[name], use_man, help_anywhere) for name in stale]
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    for doc in pool.map(_extract, items, chunksize=8):
+                        self._store(doc, report)
+                        if on_done is not None:
+                            on_done(doc)
+        finally:
+            write_json_atomic(
+                self.manifest_path, {"version": INDEX_VERSION, "binaries": manifest}
+            )
+        report.seconds = time.perf_counter() - start
+        return report
+
+    def _store(self, doc: ToolDoc, report: RefreshReport) -> None:
+        """Save one extracted document and record it in the manifest."""
+        self.manifest()[doc.name] = {"path": doc.path, "mtime": doc.mtime, "source": doc.source}
+        if doc.source is None:
+            # Remembered as empty so it is not retried until the binary changes
+            self._doc_path(doc.name).unlink(missing_ok=True)
+            report.empty += 1
+        else:
+            write_json_atomic(self._doc_path(doc.name), asdict(doc))
+            report.indexed += 1
+
+    def mentioned(self, query: str) -> List[str]:
+        """
+        Indexed binaries with reference text that a query names, in order.
+
+        Names in COMMON_WORDS only count when written as a command: in
+        backticks or quotes, or followed by an option.
+        """
+        manifest = self.manifest()
+        commands = {word for match in COMMAND_PATTERN.findall(query) for word in match if word}
+        names: List[str] = []
+        for word in WORD_PATTERN.findall(query):
+            for candidate in (word, word.lower()):
+                entry = manifest.get(candidate)
+                if not entry or not entry.get("source") or candidate in names:
+                    continue
+                if candidate in COMMON_WORDS and word not in commands:
+                    continue
+                names.append(candidate)
+                break
+        return names[:MAX_TOOLS]
+
+    def lookup(self, query: str, budget_tokens: int) -> str:
+        """
+        Reference text for the binaries a query names, within a token budget.
+
+        For each binary the option snippets sharing the most terms with the
+        query are kept; binaries with no matching snippet are left out.
+
+        Args:
+            query: Natural language query.
+            budget_tokens: Token budget for the result.
+
+        Returns:
+            Reference lines, or "" if nothing relevant is indexed.
+        """
+        if budget_tokens <= 0:
+            return ""
+        names = self.mentioned(query)
+        terms = set(tokenize(query)) - {name.lower() for name in names}
+        lines: List[str] = []
+        used = 0
+        for name in names:
+            doc = self.load(name)
+            if doc is None:
+                continue
+            scored = [
+                (len(terms.intersection(tokenize(option))), index, option)
+                for index, option in enumerate(doc.options)
+            ]
+            matches = sorted(
+                (item for item in scored if item[0] > 0), key=lambda item: (-item[0], item[1])
+            )
+            if not matches:
+                continue
+            header = f"{name} ({'man page' if doc.source == MAN else '--help'})"
+            if doc.usage:
+                header += f": {doc.usage}"
+            for text in [header] + [f"  {option}" for _, _, option in matches]:
+                cost = estimate_tokens(text) + 1
+                if used + cost > budget_tokens:
+                    break
+                lines.append(text)
+                used += cost
+        # A header without any option under it is not worth its tokens
+        return "\n".join(_drop_bare_headers(lines))
+
+
+def _drop_bare_headers(lines: Iterable[str]) -> List[str]:
+    """Remove tool headers that ended up with no option lines."""
+    lines = list(lines)
+    return [
+        line
+        for index, line in enumerate(lines)
+        if line.startswith("  ") or (index + 1 < len(lines) and lines[index + 1].startswith("  "))
+    ]
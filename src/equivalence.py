@@ -0,0 +1,508 @@
+"""Execution-based equivalence of shell commands in sandboxed fixture directories."""
+import hashlib
+import os
+import random
+import re
+import shlex
+import shutil
+import signal
+import stat
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .docs_index import NEVER_RUN
+from .linter import split_commands, unwrap_command
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Seconds a command may run, and CPU seconds it may use
+RUN_TIMEOUT = 5.0
+CPU_SECONDS = 5
+
+# Largest file a command may write, and its address space
+MAX_FILE_BYTES = 16 * 1024 * 1024
+MAX_MEMORY_BYTES = 2 * 1024 * 1024 * 1024
+
+# Output characters compared
+MAX_OUTPUT = 64 * 1024
+
+# Files larger than this are compared by size and mtime instead of content
+MAX_HASHED_BYTES = 1024 * 1024
+
+# Every fixture file gets this mtime (plus its index in minutes), so listings are stable
+FIXTURE_EPOCH = 1_700_000_000
+
+# Exit codes of a shell that could not find or run the command
+NOT_RUNNABLE = frozenset({126, 127})
+
+# Programs never run, in addition to those docs_index never starts
+BLOCKED_PROGRAMS = NEVER_RUN | frozenset(
+    "sudo su doas kill pkill killall dd mount umount systemctl service launchctl "
+    "crontab passwd useradd userdel usermod chroot ssh scp sftp".split()
+)
+
+# Absolute paths a command may read outside its fixture
+ALLOWED_ABSOLUTE = ("/dev/null", "/dev/zero", "/dev/urandom", "/dev/std", "/proc/")
+
+# Verdict statuses
+EQUIVALENT = "equivalent"
+DIFFERENT = "different"
+UNSAFE = "unsafe"
+UNCHECKED = "unchecked"
+
+NO_SANDBOX = (
+    "bubblewrap (bwrap) is not installed or cannot create namespaces here, "
+    "so commands cannot be isolated"
+)
+
+# Options that isolate a command; the fixture is bound writable after them
+SANDBOX_OPTIONS = (
+    "--ro-bind", "/", "/", "--dev", "/dev", "--proc", "/proc", "--tmpfs", "/tmp",
+    "--unshare-all", "--die-with-parent",
+)
+
+
+@dataclass
+class Verdict:
+    """Whether a command behaves like an accepted one in the fixture."""
+
+    status: str
+    detail: str = ""
+
+    @property
+    def equivalent(self) -> bool:
+        """Whether the command matched an accepted command."""
+        return self.status == EQUIVALENT
+
+
+@dataclass
+class Execution:
+    """What a command printed and changed in its fixture."""
+
+    exit_code: Optional[int]
+    # None when the output differs between runs, e.g. a process list
+    output: Optional[List[str]]
+    effects: Dict[str, str]
+
+    @property
+    def runnable(self) -> bool:
+        """Whether the command ran to completion with its programs available."""
+        return self.exit_code is not None and self.exit_code not in NOT_RUNNABLE
+
+
+def confinement_error(command: str) -> Optional[str]:
+    """
+    Check that a command stays inside its working directory.
+
+    This is a static, conservative check: any absolute path outside a few
+    device and /proc paths, any home or parent directory reference, and
+    privileged or process-killing programs are refused.
+
+    Args:
+        command: Shell command line.
+
+    Returns:
+        Why the command is refused, or None if it may run.
+    """
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    try:
+        tokens = list(lexer)
+    except ValueError:
+        return "cannot be tokenized"
+    for token in tokens:
+        if token.startswith("/") and not token.startswith(ALLOWED_ABSOLUTE):
+            return f"uses the absolute path {token}"
+        if token.startswith("~") or "$HOME" in token or "${HOME}" in token:
+            return f"uses the home directory ({token})"
+        if ".." in re.split(r"[/=]", token):
+            return f"leaves the working directory ({token})"
+    for argv in split_commands(command):
+        unwrapped, _ = unwrap_command(argv)
+        for program in argv[:1] + unwrapped[:1]:
+            if os.path.basename(program) in BLOCKED_PROGRAMS:
+                return f"runs {os.path.basename(program)}"
+    return None
+
+
+def build_fixture(root: Path, seed: int = 0) -> None:
+    """
+    Create a small project-like directory tree.
+
+    The tree has source files, logs, temporary files, hidden files, an
+    executable script and sparse files larger than 100 MB, so common
+    requests have something to act on. The same seed always produces the
+    same names, contents, sizes and mtimes.
+
+    Args:
+        root: Empty directory to fill.
+        seed: Varies line counts and contents.
+    """
+    rng = random.Random(seed)
+
+    def lines(prefix: str, low: int, high: int) -> str:
+        count = rng.randint(low, high)
+        return "".join(f"{prefix} {i} {rng.randint(0, 999)}\n" for i in range(count))
+
+    files = {
+        "README.md": "# Demo\n" + lines("line", 3, 10),
+        "notes.txt": lines("note", 5, 20),
+        ".env": "DEBUG=1\nPORT=3000\n",
+        "src/main.py": "import sys\n" + lines("# main", 10, 60),
+        "src/pkg/__init__.py": "",
+        "src/pkg/util.py": lines("# util", 5, 40),
+        "src/pkg/test_util.py": lines("# test", 5, 30),
+        "src/app.js": lines("// app", 5, 30),
+        "logs/app.log": lines("INFO request", 20, 80) + "ERROR failed\n" * rng.randint(1, 5),
+        "logs/app.log.1": lines("INFO old", 20, 80),
+        "data/users.csv": "id,name\n" + "".join(f"{i},u{i}\n" for i in range(rng.randint(5, 50))),
+        "data/config.json": '{"name": "demo", "port": 3000}\n',
+        "build.tmp": lines("tmp", 1, 5),
+        "cache/a.tmp": lines("tmp", 1, 5),
+        "cache/b.tmp": lines("tmp", 1, 5),
+        "docs/guide.md": lines("guide", 5, 20),
+        ".hidden/secret.txt": "hidden\n",
+        "run.sh": "#!/bin/sh\necho running\n",
+    }
+    for relative, content in files.items():
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+    (root / "run.sh").chmod(0o755)
+    (root / "empty").mkdir()
+    # Sparse: large to find and du, without using the space
+    for relative, megabytes in (("data/large.py", 120), ("data/dump.bin", 200)):
+        with open(root / relative, "wb") as f:
+            f.truncate(megabytes * 1024 * 1024)
+
+    # Changing a file's mtime does not change its directory's, so order does not matter
+    for index, path in enumerate(sorted(root.rglob("*"))):
+        os.utime(path, (FIXTURE_EPOCH + index * 60,) * 2)
+    for path in [root, *root.rglob("*")]:
+        if path.is_dir():
+            os.utime(path, (FIXTURE_EPOCH,) * 2)
+
+
+def snapshot(root: Path) -> Dict[str, Tuple[str, int, str]]:
+    """
+    Describe every entry under a directory.
+
+    Returns:
+        Relative path -> (kind, mode bits, content digest or size and mtime).
+    """
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            path = os.path.join(dirpath, name)
+            relative = os.path.relpath(path, root)
+            info = os.lstat(path)
+            if os.path.islink(path):
+                entries[relative] = ("link", 0, os.readlink(path))
+            elif name in dirnames:
+                entries[relative] = ("dir", info.st_mode & 0o777, "")
+            elif not stat.S_ISREG(info.st_mode):
+                # Reading a FIFO would block
+                entries[relative] = ("special", info.st_mode & 0o777, "")
+            elif info.st_size <= MAX_HASHED_BYTES:
+                with open(path, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+                entries[relative] = ("file", info.st_mode & 0o777, digest)
+            else:
+                stamp = f"{info.st_size}@{info.st_mtime}"
+                entries[relative] = ("file", info.st_mode & 0o777, stamp)
+    return entries
+
+
+def _side_effects(before: Dict, after: Dict) -> Dict[str, str]:
+    """What changed between two snapshots, keyed by relative path."""
+    effects = {}
+    for path in before.keys() | after.keys():
+        if path not in after:
+            effects[path] = "deleted"
+        elif path not in before:
+            effects[path] = f"created {after[path]}"
+        elif before[path] != after[path]:
+            effects[path] = f"modified {after[path]}"
+    return effects
+
+
+def _normalize_output(text: str, root: Path) -> List[str]:
+    """Lines of output without the fixture path or formatting, in a stable order."""
+    text = text[:MAX_OUTPUT].replace(str(root), ".")
+    normalized = []
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        # "./src/main.py" and "src/main.py" name the same file
+        line = re.sub(r"(^|\s)\./(?=\S)", r"\1", line)
+        if line:
+            normalized.append(line)
+    # Equivalent commands often list the same things in a different order
+    return sorted(normalized)
+
+
+def _limit_resources() -> None:
+    """Apply resource limits in the child before it executes the command."""
+    if resource is None:
+        return
+    for limit, value in (
+        (resource.RLIMIT_CPU, CPU_SECONDS),
+        (resource.RLIMIT_FSIZE, MAX_FILE_BYTES),
+        (resource.RLIMIT_AS, MAX_MEMORY_BYTES),
+        (resource.RLIMIT_CORE, 0),
+    ):
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+
+
+@lru_cache(maxsize=None)
+def _sandbox_works(bwrap: str) -> bool:
+    """
+    Whether a bubblewrap binary can set up the sandbox on this machine.
+
+    In containers and most CI bwrap is often installed but not allowed to
+    create namespaces; it then fails before running anything, for every
+    command alike, so only a trial run tells whether it is usable.
+    """
+    try:
+        result = subprocess.run(
+            [bwrap, *SANDBOX_OPTIONS, "true"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=RUN_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
+
+
+def _bwrap() -> Optional[str]:
+    """Path of a working bubblewrap binary, or None."""
+    bwrap = shutil.which("bwrap")
+    return bwrap if bwrap is not None and _sandbox_works(bwrap) else None
+
+
+def sandbox_available() -> bool:
+    """Whether bubblewrap can isolate executed commands on this machine."""
+    return _bwrap() is not None
+
+
+def _sandbox_argv(shell: str, command: str, cwd: Path, unsandboxed: bool = False) -> List[str]:
+    """
+    The argv that runs a command inside bubblewrap.
+
+    Bubblewrap makes everything but the fixture read-only and unshares the
+    network. confinement_error() is a lexical check that variables, command
+    substitution or an interpreter easily get around, so it is no substitute:
+    without bubblewrap commands only run if unsandboxed is explicitly set.
+
+    Raises:
+        RuntimeError: If bubblewrap is not usable and unsandboxed is not set.
+    """
+    bwrap = _bwrap()
+    if bwrap is None:
+        if not unsandboxed:
+            raise RuntimeError(NO_SANDBOX)
+        return [shell, "-c", command]
+    return [
+        bwrap, *SANDBOX_OPTIONS, "--bind", str(cwd), str(cwd), "--chdir", str(cwd),
+        shell, "-c", command,
+    ]
+
+
+def run_in_fixture(
+    command: str, seed: int = 0, timeout: float = RUN_TIMEOUT, unsandboxed: bool = False
+) -> Execution:
+    """
+    Run a command in a fresh fixture and record what it did.
+
+    The command runs with no stdin, a minimal environment, its own session,
+    resource limits and a timeout that kills everything it started.
+
+    Args:
+        command: Shell command line; must pass confinement_error().
+        seed: Fixture seed.
+        timeout: Seconds before the command is killed.
+        unsandboxed: Run on the host if bubblewrap is not usable.
+
+    Returns:
+        The execution; exit_code is None if it timed out.
+
+    Raises:
+        RuntimeError: If bubblewrap is not usable and unsandboxed is not set,
+            or if it failed to set up the sandbox for this command.
+    """
+    shell = shutil.which("bash") or "/bin/sh"
+    with tempfile.TemporaryDirectory(prefix="pop-equiv-") as directory:
+        root = Path(directory) / "work"
+        home = Path(directory) / "home"
+        root.mkdir()
+        home.mkdir()
+        build_fixture(root, seed)
+        before = snapshot(root)
+        env = {
+            "PATH": os.environ.get("PATH", os.defpath),
+            "HOME": str(home),
+            "LC_ALL": "C",
+            "TZ": "UTC",
+            "TERM": "dumb",
+            "TMPDIR": str(home),
+        }
+        argv = _sandbox_argv(shell, command, root, unsandboxed)
+        process = subprocess.Popen(
+            argv,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            cwd=root,
+            start_new_session=True,
+            preexec_fn=_limit_resources if resource is not None else None,
+        )
+        try:
+            output, errors = process.communicate(timeout=timeout)
+            exit_code: Optional[int] = process.returncode
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            output, errors = process.communicate()
+            exit_code = None
+        # bwrap reports its own setup failures as "bwrap: ..." with status 1;
+        # the command's status would otherwise hide that it never ran
+        message = errors.decode("utf-8", errors="replace").strip()
+        if os.path.basename(argv[0]) == "bwrap" and exit_code == 1 and message.startswith("bwrap:"):
+            raise RuntimeError(f"bubblewrap could not set up the sandbox ({message})")
+        text = output.decode("utf-8", errors="replace")
+        effects = _side_effects(before, snapshot(root))
+        return Execution(exit_code, _normalize_output(text, root), effects)
+
+
+def _same_behavior(generated: Execution, expected: Execution) -> Optional[str]:
+    """How two executions differ, or None if they behave the same."""
+    if (generated.exit_code == 0) != (expected.exit_code == 0):
+        return f"exit code {generated.exit_code}, expected {expected.exit_code}"
+    if generated.effects != expected.effects:
+        changed = sorted(
+            path
+            for path in generated.effects.keys() | expected.effects.keys()
+            if generated.effects.get(path) != expected.effects.get(path)
+        )
+        return f"different side effects on {', '.join(changed[:3])}"
+    if expected.output is not None and generated.output != expected.output:
+        return "different output"
+    return None
+
+
+def compare(
+    generated: str,
+    expected: Sequence[str],
+    seed: int = 0,
+    timeout: float = RUN_TIMEOUT,
+    unsandboxed: bool = False,
+) -> Verdict:
+    """
+    Check whether a command behaves like any of the accepted commands.
+
+    Each command runs in its own fresh fixture built from the same seed.
+    Commands are equivalent when they succeed or fail alike, print the same
+    lines (in any order) and leave the fixture in the same state. Accepted
+    commands run twice; if their output changes between runs (process
+    lists, clocks) only the exit status and side effects are compared.
+
+    Args:
+        generated: Command to judge.
+        expected: Accepted commands.
+        seed: Fixture seed.
+        timeout: Seconds each command may run.
+        unsandboxed: Run commands on the host if bubblewrap is not usable.
+
+    Returns:
+        UNSAFE if the command was refused, UNCHECKED if nothing can be run
+        (no usable sandbox, or no accepted command could run: refused,
+        missing programs or timed out), else EQUIVALENT or DIFFERENT.
+    """
+    refused = confinement_error(generated)
+    if refused:
+        return Verdict(UNSAFE, refused)
+    if not unsandboxed and not sandbox_available():
+        return Verdict(UNCHECKED, NO_SANDBOX)
+    try:
+        return _compare_runs(generated, expected, seed, timeout, unsandboxed)
+    except RuntimeError as e:
+        return Verdict(UNCHECKED, str(e))
+
+
+def _compare_runs(
+    generated: str, expected: Sequence[str], seed: int, timeout: float, unsandboxed: bool
+) -> Verdict:
+    """Run the commands for compare() and judge the generated one."""
+    references = []
+    for command in expected:
+        if confinement_error(command) is None:
+            execution = run_in_fixture(command, seed, timeout, unsandboxed)
+            if execution.runnable:
+                if run_in_fixture(command, seed, timeout, unsandboxed).output != execution.output:
+                    execution.output = None
+                references.append(execution)
+    if not references:
+        return Verdict(UNCHECKED, "no accepted command can run in the fixture")
+
+    execution = run_in_fixture(generated, seed, timeout, unsandboxed)
+    if execution.exit_code is None:
+        return Verdict(DIFFERENT, f"timed out after {timeout:g}s")
+    differences = []
+    for reference in references:
+        difference = _same_behavior(execution, reference)
+        if difference is None:
+            return Verdict(EQUIVALENT)
+        differences.append(difference)
+    return Verdict(DIFFERENT, differences[0])
+
+
+def _compare(item: Tuple[str, Sequence[str], int, float, bool]) -> Verdict:
+    """Process pool entry point for compare."""
+    return compare(*item)
+
+
+def compare_many(
+    pairs: Sequence[Tuple[str, Sequence[str]]],
+    workers: Optional[int] = None,
+    seed: int = 0,
+    timeout: float = RUN_TIMEOUT,
+    unsandboxed: bool = False,
+) -> List[Verdict]:
+    """
+    Judge many commands, sharded across a process pool.
+
+    Args:
+        pairs: (generated command, accepted commands) to judge.
+        workers: Worker processes. If None, one per CPU.
+        seed: Fixture seed.
+        timeout: Seconds each command may run.
+        unsandboxed: Run commands on the host if bubblewrap is not usable.
+
+    Returns:
+        Verdicts in the order of pairs.
+    """
+    if not pairs:
+        return []
+    items = [
+        (generated, list(expected), seed, timeout, unsandboxed) for generated, expected in pairs
+    ]
+    workers = workers or os.cpu_count() or 1
+    # Several cases per task keep the pool overhead small for large datasets
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_compare, items, chunksize=chunksize))
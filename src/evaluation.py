@@ -0,0 +1,478 @@
+"""Accuracy and latency evaluation of models and endpoints on command datasets."""
+import json
+import re
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .client import ParallaxClient, ParallaxConnectionError, closing_stream
+from .config import AppConfig
+from .equivalence import UNCHECKED, compare_many
+
+# The dataset shipped with the repository
+DEFAULT_DATASET = Path(__file__).parent.parent / "docs" / "TEST_CASES.md"
+
+CASE_HEADING_PATTERN = re.compile(r"^## (.+)$", re.MULTILINE)
+INPUT_PATTERN = re.compile(r'^\*\*Input\*\*:\s*"([^"]+)"', re.MULTILINE)
+EXPECTED_PATTERN = re.compile(r"^\*\*Expected\*\*:(.*)$", re.MULTILINE)
+WARNING_LINE_PATTERN = re.compile(r"^[ \t]*#[ \t]*WARNING\b.*$\n?", re.IGNORECASE | re.MULTILINE)
+
+# Share of the expected command's words the answer must contain when the
+# leading command matches but the text does not
+MIN_WORD_OVERLAP = 0.7
+
+# Extracts (command, warning or None) from a raw model answer
+Extractor = Callable[[str], Tuple[str, Optional[str]]]
+
+
+@dataclass
+class EvalCase:
+    """A request and the commands accepted as correct answers."""
+
+    name: str
+    query: str
+    expected: List[str]
+    # Whether a correct answer must carry a # WARNING: comment
+    dangerous: bool = False
+
+
+def normalize_command(command: str) -> str:
+    """Collapse whitespace so formatting differences do not count."""
+    return " ".join(command.split())
+
+
+def matches_expected(actual: str, expected: str) -> bool:
+    """
+    Check an answer against one expected command.
+
+    The answer passes if it equals or contains the expected command, or if
+    it starts with the same program and shares most of its words; the same
+    rules the automated test runner uses.
+
+    Args:
+        actual: Command from the model.
+        expected: Accepted command.
+
+    Returns:
+        True if the answer is close enough.
+    """
+    actual = normalize_command(actual)
+    expected = normalize_command(expected)
+    if not expected:
+        return False
+    if actual == expected or expected in actual:
+        return True
+    expected_parts = expected.split()
+    actual_parts = actual.split()
+    if actual_parts and expected_parts[0] == actual_parts[0]:
+        overlap = len(set(expected_parts) & set(actual_parts))
+        return overlap >= len(expected_parts) * MIN_WORD_OVERLAP
+    return False
+
+
+def check_answer(case: EvalCase, command: str, warning: Optional[str]) -> bool:
+    """Whether an answer matches any accepted command and is flagged if it must be."""
+    if case.dangerous and warning is None:
+        return False
+    return any(matches_expected(command, expected) for expected in case.expected)
+
+
+def _expected_alternatives(line: str) -> Tuple[List[str], bool]:
+    """Split an **Expected** line into its commands and whether they carry warnings."""
+    alternatives = []
+    dangerous = False
+    for raw in re.findall(r"`([^`]+)`", line):
+        text = raw.replace("\\n", "\n")
+        if WARNING_LINE_PATTERN.search(text):
+            dangerous = True
+            text = WARNING_LINE_PATTERN.sub("", text)
+        if text.strip():
+            alternatives.append(text.strip())
+    return alternatives, dangerous
+
+
+def load_markdown_cases(text: str) -> List[EvalCase]:
+    """
+    Parse cases in the TEST_CASES.md format.
+
+    Each case is a `## ` heading followed by an **Input** line with the
+    quoted request and an **Expected** line with one or more accepted
+    commands in backticks.
+
+    Args:
+        text: Markdown text.
+
+    Returns:
+        Cases in file order; sections without both lines are skipped.
+    """
+    cases = []
+    headings = list(CASE_HEADING_PATTERN.finditer(text))
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(text)
+        section = text[heading.end() : end]
+        query = INPUT_PATTERN.search(section)
+        expected_line = EXPECTED_PATTERN.search(section)
+        if not query or not expected_line:
+            continue
+        expected, dangerous = _expected_alternatives(expected_line.group(1))
+        if expected:
+            name = heading.group(1).strip()
+            cases.append(EvalCase(name, query.group(1).strip(), expected, dangerous))
+    return cases
+
+
+def load_jsonl_cases(text: str) -> List[EvalCase]:
+    """
+    Parse cases from JSON lines.
+
+    Each line is an object with "query", "expected" (a command or a list of
+    accepted commands) and optionally "name" and "dangerous".
+
+    Args:
+        text: JSONL text.
+
+    Returns:
+        Cases in file order.
+
+    Raises:
+        ValueError: If a line is not a valid case.
+    """
+    cases = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            expected = data["expected"]
+            if isinstance(expected, str):
+                expected = [expected]
+            cases.append(
+                EvalCase(
+                    str(data.get("name") or f"Line {number}"),
+                    str(data["query"]),
+                    [str(command) for command in expected],
+                    bool(data.get("dangerous", False)),
+                )
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Line {number}: not a valid case ({e})") from e
+    return cases
+
+
+def load_dataset(path: Path) -> List[EvalCase]:
+    """
+    Load cases from a .jsonl file or a TEST_CASES.md style markdown file.
+
+    Args:
+        path: Dataset file.
+
+    Returns:
+        The cases, named after the file so datasets can be told apart.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If a JSONL line is not a valid case.
+    """
+    text = path.read_text(encoding="utf-8")
+    cases = load_jsonl_cases(text) if path.suffix == ".jsonl" else load_markdown_cases(text)
+    for case in cases:
+        case.name = f"{path.stem}: {case.name}"
+    return cases
+
+
+@dataclass(frozen=True)
+class Target:
+    """A model served by an endpoint."""
+
+    model: str
+    endpoint: str
+
+
+@dataclass
+class CaseResult:
+    """The outcome and timings of one case on one target."""
+
+    case: str
+    command: str
+    passed: bool
+    ttft: Optional[float]
+    latency: float
+    completion_tokens: Optional[int] = None
+    error: Optional[str] = None
+    warning: Optional[str] = None
+    # Status from execution checking, if the answer was run
+    verdict: Optional[str] = None
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Decode speed after the first token, if the server reported usage."""
+        if self.completion_tokens is None or self.ttft is None or self.latency <= self.ttft:
+            return None
+        return self.completion_tokens / (self.latency - self.ttft)
+
+
+def _median(values: Sequence[Optional[float]]) -> Optional[float]:
+    """Median of the known values, or None."""
+    known = [value for value in values if value is not None]
+    return statistics.median(known) if known else None
+
+
+@dataclass
+class TargetReport:
+    """Results of every case on one target."""
+
+    target: Target
+    results: List[CaseResult] = field(default_factory=list)
+    # Set by mark_pareto_frontier()
+    pareto: bool = False
+
+    @property
+    def pass_rate(self) -> float:
+        """Share of cases answered correctly; failed requests count as wrong."""
+        return sum(r.passed for r in self.results) / len(self.results) if self.results else 0.0
+
+    @property
+    def errors(self) -> int:
+        """Number of requests that failed."""
+        return sum(r.error is not None for r in self.results)
+
+    @property
+    def ttft(self) -> Optional[float]:
+        """Median seconds to first token."""
+        return _median([r.ttft for r in self.results if r.error is None])
+
+    @property
+    def latency(self) -> Optional[float]:
+        """Median seconds for a complete answer."""
+        return _median([r.latency for r in self.results if r.error is None])
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Median decode speed."""
+        return _median([r.tokens_per_second for r in self.results if r.error is None])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the report, with times in milliseconds."""
+
+        def ms(seconds: Optional[float]) -> Optional[float]:
+            return round(seconds * 1000, 1) if seconds is not None else None
+
+        return {
+            "model": self.target.model,
+            "endpoint": self.target.endpoint,
+            "pass_rate": round(self.pass_rate, 4),
+            "ttft_ms": ms(self.ttft),
+            "tokens_per_second": (
+                round(self.tokens_per_second, 1) if self.tokens_per_second is not None else None
+            ),
+            "latency_ms": ms(self.latency),
+            "errors": self.errors,
+            "pareto": self.pareto,
+            "cases": [
+                {
+                    "case": r.case,
+                    "command": r.command,
+                    "passed": r.passed,
+                    "ttft_ms": ms(r.ttft),
+                    "latency_ms": ms(r.latency),
+                    "completion_tokens": r.completion_tokens,
+                    "error": r.error,
+                    "verdict": r.verdict,
+                }
+                for r in self.results
+            ],
+        }
+
+
+def mark_pareto_frontier(reports: Sequence[TargetReport]) -> None:
+    """
+    Mark the reports no other report beats on both accuracy and latency.
+
+    A report is dominated if another has at least its pass rate and at most
+    its median latency, and is strictly better on one of them. Reports
+    without a successful request are never on the frontier.
+
+    Args:
+        reports: Reports to mark in place.
+    """
+    measured = [report for report in reports if report.latency is not None]
+    for report in reports:
+        report.pareto = report.latency is not None and not any(
+            other.pass_rate >= report.pass_rate
+            and other.latency <= report.latency
+            and (other.pass_rate > report.pass_rate or other.latency < report.latency)
+            for other in measured
+        )
+
+
+def evaluate_case(
+    client: ParallaxClient, case: EvalCase, system_info: str, extract: Extractor
+) -> CaseResult:
+    """
+    Ask for one case and time the answer.
+
+    Args:
+        client: Client configured for the target, without failover.
+        case: Case to run.
+        system_info: System information sent with the request.
+        extract: Turns the raw answer into (command, warning).
+
+    Returns:
+        The result; connection failures are recorded, not raised.
+    """
+    start = time.perf_counter()
+    ttft: Optional[float] = None
+    chunks: List[str] = []
+    try:
+        with closing_stream(client.generate_command_stream(case.query, system_info)) as stream:
+            for chunk in stream:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                chunks.append(chunk)
+    except ParallaxConnectionError as e:
+        return CaseResult(case.name, "", False, None, time.perf_counter() - start, error=e.message)
+    latency = time.perf_counter() - start
+    command, warning = extract("".join(chunks))
+    usage = client.last_usage or {}
+    return CaseResult(
+        case.name,
+        command,
+        check_answer(case, command, warning),
+        ttft,
+        latency,
+        usage.get("completion_tokens"),
+        warning=warning,
+    )
+
+
+def evaluate_target(
+    config: AppConfig,
+    target: Target,
+    cases: Sequence[EvalCase],
+    system_info: str,
+    extract: Extractor,
+    on_result: Optional[Callable[[Target, CaseResult], None]] = None,
+) -> TargetReport:
+    """
+    Run every case on one target, one request at a time.
+
+    Requests go to the target only: fallback endpoints and models are
+    disabled so every measurement belongs to the target it is reported for.
+    Local additions to the prompt (few-shot examples, docs) are not used.
+
+    Args:
+        config: Base configuration; model and endpoint are replaced.
+        target: Model and endpoint to evaluate.
+        cases: Cases to run.
+        system_info: System information sent with each request.
+        extract: Turns a raw answer into (command, warning).
+        on_result: Called after each case, e.g. to show progress.
+
+    Returns:
+        The target's report.
+    """
+    client = ParallaxClient(
+        config.model_copy(
+            update={
+                "model": target.model,
+                "api_base": target.endpoint,
+                "fallback_api_bases": [],
+                "fallback_models": [],
+            }
+        )
+    )
+    report = TargetReport(target)
+    for case in cases:
+        result = evaluate_case(client, case, system_info, extract)
+        report.results.append(result)
+        if on_result is not None:
+            on_result(target, result)
+    return report
+
+
+def apply_execution_checks(
+    reports: Sequence[TargetReport],
+    cases: Sequence[EvalCase],
+    workers: Optional[int] = None,
+    unsandboxed: bool = False,
+) -> None:
+    """
+    Re-judge answers by running them in sandboxed fixtures.
+
+    Every answer is compared with its case's accepted commands by what it
+    prints and changes, in one process pool for all targets. Answers whose
+    case cannot be checked this way keep their text-matching result.
+
+    Args:
+        reports: Reports whose results are updated in place.
+        cases: The cases the reports were run with.
+        workers: Worker processes. If None, one per CPU.
+        unsandboxed: Run answers on the host if bubblewrap is not usable.
+    """
+    by_name = {case.name: case for case in cases}
+    pending = [
+        (result, by_name[result.case])
+        for report in reports
+        for result in report.results
+        if result.error is None and result.command and result.case in by_name
+    ]
+    verdicts = compare_many(
+        [(result.command, case.expected) for result, case in pending],
+        workers,
+        unsandboxed=unsandboxed,
+    )
+    for (result, case), verdict in zip(pending, verdicts):
+        result.verdict = verdict.status
+        if verdict.status != UNCHECKED:
+            flagged = not case.dangerous or result.warning is not None
+            result.passed = verdict.equivalent and flagged
+
+
+def run_matrix(
+    config: AppConfig,
+    targets: Sequence[Target],
+    cases: Sequence[EvalCase],
+    system_info: str,
+    extract: Extractor,
+    concurrency: int = 4,
+    on_result: Optional[Callable[[Target, CaseResult], None]] = None,
+    execute: bool = False,
+    workers: Optional[int] = None,
+    unsandboxed: bool = False,
+) -> List[TargetReport]:
+    """
+    Evaluate several targets concurrently and mark the Pareto frontier.
+
+    Targets run in parallel, each sending its cases one at a time, so a
+    target's latency is not inflated by its own concurrent requests. Targets
+    sharing an endpoint still compete for it; lower concurrency for
+    measurements that must not interfere.
+
+    Args:
+        config: Base configuration.
+        targets: Model and endpoint combinations.
+        cases: Cases to run on every target.
+        system_info: System information sent with each request.
+        extract: Turns a raw answer into (command, warning).
+        concurrency: Targets evaluated at once.
+        on_result: Called after each case, from worker threads.
+        execute: Judge answers by running them; see apply_execution_checks().
+        workers: Processes for execution checking.
+        unsandboxed: Execute on the host if bubblewrap is not usable.
+
+    Returns:
+        Reports in target order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(targets) or 1))) as pool:
+        futures = [
+            pool.submit(evaluate_target, config, target, cases, system_info, extract, on_result)
+            for target in targets
+        ]
+        reports = [future.result() for future in futures]
+    if execute:
+        apply_execution_checks(reports, cases, workers, unsandboxed)
+    mark_pareto_frontier(reports)
+    return reports
@@ -0,0 +1,228 @@
+"""Run one command across an inventory of hosts: local, SSH and container backends."""
+import os
+import signal
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, List, Optional
+
+LOCAL = "local"
+SSH = "ssh"
+CONTAINER = "container"
+
+# Seconds SSH may take to connect before the host counts as unreachable
+SSH_CONNECT_TIMEOUT = 10
+
+# Receives (host name, output line) as lines arrive
+LineHandler = Callable[[str, str], None]
+
+
+@dataclass
+class Target:
+    """One host of an inventory."""
+
+    name: str
+    backend: str = LOCAL
+    address: str = ""
+    port: Optional[int] = None
+
+    def argv(self, command: str) -> List[str]:
+        """
+        Command line that runs a shell command on this target.
+
+        Args:
+            command: Shell command.
+
+        Returns:
+            Argument vector for subprocess.
+        """
+        if self.backend == SSH:
+            argv = ["ssh", "-o", "BatchMode=yes", "-o", f"ConnectTimeout={SSH_CONNECT_TIMEOUT}"]
+            if self.port is not None:
+                argv += ["-p", str(self.port)]
+            return argv + [self.address, command]
+        if self.backend == CONTAINER:
+            runtime, _, container = self.address.partition("/")
+            return [runtime, "exec", container, "sh", "-c", command]
+        return ["/bin/sh", "-c", command]
+
+
+def parse_target(spec: str) -> Target:
+    """
+    Parse one inventory entry.
+
+    Accepted forms:
+        local                      this machine
+        local:NAME                 this machine, labelled NAME (simulated host)
+        ssh://[user@]host[:port]   SSH
+        [user@]host                SSH
+        docker://NAME              container via docker exec (also podman://)
+
+    Args:
+        spec: Inventory entry.
+
+    Returns:
+        The target.
+
+    Raises:
+        ValueError: If the entry is empty or malformed.
+    """
+    spec = spec.strip()
+    if not spec:
+        raise ValueError("Empty inventory entry")
+    if spec == LOCAL or spec.startswith("local:"):
+        return Target(name=spec.partition(":")[2] or LOCAL)
+    for runtime in ("docker", "podman"):
+        prefix = f"{runtime}://"
+        if spec.startswith(prefix):
+            container = spec[len(prefix) :]
+            if not container:
+                raise ValueError(f"Missing container name in {spec!r}")
+            return Target(name=container, backend=CONTAINER, address=f"{runtime}/{container}")
+    address = spec[len("ssh://") :] if spec.startswith("ssh://") else spec
+    if not address or any(c.isspace() for c in address) or address.startswith("-"):
+        raise ValueError(f"Invalid host {spec!r}")
+    port = None
+    host, sep, port_text = address.rpartition(":")
+    if sep and port_text.isdigit() and ":" not in host:
+        address, port = host, int(port_text)
+    return Target(name=address.rpartition("@")[2], backend=SSH, address=address, port=port)
+
+
+def load_inventory(path: Path) -> List[Target]:
+    """
+    Load an inventory file: one entry per line, # starts a comment.
+
+    Raises:
+        ValueError: If an entry is malformed or the inventory is empty.
+        OSError: If the file cannot be read.
+    """
+    targets = []
+    for number, line in enumerate(path.read_text(encoding="utf-8").splitlines(), start=1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        try:
+            targets.append(parse_target(line))
+        except ValueError as e:
+            raise ValueError(f"{path}:{number}: {e}") from e
+    if not targets:
+        raise ValueError(f"{path}: no hosts in inventory")
+    return targets
+
+
+@dataclass
+class HostResult:
+    """Outcome of running the command on one host."""
+
+    host: str
+    exit_code: Optional[int] = None
+    duration: float = 0.0
+    timed_out: bool = False
+    error: Optional[str] = None
+    output: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        """Whether the command exited with status 0."""
+        return self.exit_code == 0
+
+
+def run_on_target(
+    target: Target,
+    command: str,
+    timeout: float,
+    on_line: Optional[LineHandler] = None,
+    max_lines: int = 1000,
+) -> HostResult:
+    """
+    Run a command on one target, streaming its output line by line.
+
+    The process runs in its own session so a timeout kills everything it
+    started, not just the backend process.
+
+    Args:
+        target: Where to run.
+        command: Shell command.
+        timeout: Seconds before the process is killed.
+        on_line: Called with (host, line) for every output line.
+        max_lines: Output lines kept in the result.
+
+    Returns:
+        The host's result; it never raises for a failing host.
+    """
+    result = HostResult(host=target.name)
+    env = {**os.environ, "POP_TARGET": target.name}
+    start = time.perf_counter()
+    try:
+        process = subprocess.Popen(
+            target.argv(command),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            env=env,
+            start_new_session=True,
+        )
+    except OSError as e:
+        result.error = str(e)
+        return result
+
+    def kill() -> None:
+        result.timed_out = True
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    timer = threading.Timer(timeout, kill)
+    timer.daemon = True
+    timer.start()
+    try:
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            if len(result.output) < max_lines:
+                result.output.append(line)
+            if on_line is not None:
+                on_line(target.name, line)
+        process.wait()
+    finally:
+        timer.cancel()
+        process.stdout.close()
+    result.duration = time.perf_counter() - start
+    if result.timed_out:
+        result.error = f"timed out after {timeout:g}s"
+    else:
+        result.exit_code = process.returncode
+    return result
+
+
+@dataclass
+class Fleet:
+    """An inventory and the limits for running commands across it."""
+
+    targets: List[Target]
+    concurrency: int = 10
+    timeout: float = 30.0
+
+    def run(self, command: str, on_line: Optional[LineHandler] = None) -> List[HostResult]:
+        """
+        Run a command on every target with bounded concurrency.
+
+        Args:
+            command: Shell command.
+            on_line: Called with (host, line) for every output line.
+
+        Returns:
+            Results in inventory order.
+        """
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            futures = [
+                pool.submit(run_on_target, target, command, self.timeout, on_line)
+                for target in self.targets
+            ]
+            return [future.result() for future in futures]
@@ -0,0 +1,200 @@
+"""Capture of the last execution and token-budgeted compression of its output."""
+import re
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Deque, List, Optional
+
+from .session import estimate_tokens
+from .utils import get_cache_dir, read_json, write_json_atomic
+
+# Characters of output kept from the start and from the end of a run
+HEAD_BYTES = 64 * 1024
+TAIL_BYTES = 192 * 1024
+
+# Lines that usually explain a failure
+ERROR_PATTERN = re.compile(
+    r"error|fail|fatal|exception|traceback|denied|not found|no such|panic|"
+    r"cannot|can't|refused|timed? ?out|killed|segmentation|错误|失败",
+    re.IGNORECASE,
+)
+
+# Error lines kept when the output has to be cut
+MAX_ERROR_LINES = 40
+
+
+class OutputBuffer:
+    """
+    Bounded capture of a stream: the first HEAD_BYTES and the last TAIL_BYTES.
+
+    Memory stays constant however much a command prints; the middle is
+    dropped and counted.
+    """
+
+    def __init__(self, head_bytes: int = HEAD_BYTES, tail_bytes: int = TAIL_BYTES) -> None:
+        """
+        Initialize the buffer.
+
+        Args:
+            head_bytes: Characters kept from the start.
+            tail_bytes: Characters kept from the end.
+        """
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self._head: List[str] = []
+        self._head_size = 0
+        self._tail: Deque[str] = deque()
+        self._tail_size = 0
+        self.dropped = 0
+
+    def feed(self, text: str) -> None:
+        """Add captured text."""
+        if self._head_size < self.head_bytes:
+            take = text[: self.head_bytes - self._head_size]
+            self._head.append(take)
+            self._head_size += len(take)
+            text = text[len(take) :]
+        if not text:
+            return
+        self._tail.append(text)
+        self._tail_size += len(text)
+        while self._tail_size > self.tail_bytes:
+            excess = self._tail_size - self.tail_bytes
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                self._tail_size -= len(first)
+                self.dropped += len(first)
+            else:
+                self._tail[0] = first[excess:]
+                self._tail_size -= excess
+                self.dropped += excess
+
+    @property
+    def text(self) -> str:
+        """The captured text, with a marker where the middle was dropped."""
+        head = "".join(self._head)
+        tail = "".join(self._tail)
+        if self.dropped:
+            return f"{head}\n[... {self.dropped} characters not captured ...]\n{tail}"
+        return head + tail
+
+
+def dedupe_lines(lines: List[str]) -> List[str]:
+    """
+    Collapse runs of identical lines into one line and a repeat count.
+
+    Args:
+        lines: Output lines.
+
+    Returns:
+        Lines with runs of three or more replaced by the line and a marker.
+    """
+    result: List[str] = []
+    index = 0
+    while index < len(lines):
+        end = index
+        while end + 1 < len(lines) and lines[end + 1] == lines[index]:
+            end += 1
+        count = end - index + 1
+        if count >= 3:
+            result += [lines[index], f"[... previous line repeated {count - 1} more times ...]"]
+        else:
+            result += lines[index : end + 1]
+        index = end + 1
+    return result
+
+
+def compress_output(text: str, budget_tokens: int) -> str:
+    """
+    Shrink command output to fit a prompt token budget.
+
+    Repeated lines are collapsed first. If that is not enough, a head and a
+    tail window are kept together with the error-looking lines from the
+    middle, and the windows shrink until the result fits.
+
+    Args:
+        text: Captured output.
+        budget_tokens: Token budget for the result.
+
+    Returns:
+        The output, unchanged if it already fits.
+    """
+    lines = dedupe_lines(text.splitlines())
+    joined = "\n".join(lines)
+    # Every character costs at least a quarter token, so skip measuring hopeless cases
+    if len(joined) <= budget_tokens * 4 and estimate_tokens(joined) <= budget_tokens:
+        return joined
+
+    error_indices = [i for i, line in enumerate(lines) if ERROR_PATTERN.search(line)]
+    # Each kept line costs at least a quarter token for its newline
+    window = max(1, min(len(lines) // 4, budget_tokens * 4))
+    while True:
+        head, tail = lines[:window], lines[-window:]
+        omitted = max(0, len(lines) - 2 * window)
+        errors = [
+            f"{i + 1}: {lines[i]}" for i in error_indices if window <= i < len(lines) - window
+        ][:MAX_ERROR_LINES]
+        parts = head + [f"[... {omitted} lines omitted ...]"]
+        if errors:
+            parts += ["[error lines from the omitted part]"] + errors
+        parts += tail
+        result = "\n".join(parts)
+        if window == 1 or (
+            len(result) <= budget_tokens * 4 and estimate_tokens(result) <= budget_tokens
+        ):
+            break
+        window = max(1, window // 2)
+
+    # Very long lines can still exceed the budget: cut characters from the middle
+    limit = budget_tokens * 4
+    if estimate_tokens(result) > budget_tokens and len(result) > limit:
+        half = limit // 2
+        result = f"{result[:half]}\n[... output cut ...]\n{result[-half:]}"
+    return result
+
+
+@dataclass
+class LastRun:
+    """The most recent command pop executed and what it printed."""
+
+    query: str
+    command: str
+    exit_code: int
+    output: str
+    dropped: int = 0
+    timestamp: float = 0.0
+
+
+class LastRunStore:
+    """The last execution, persisted in the cache directory for follow-ups."""
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            path: Path to the JSON file. If None, uses the cache directory.
+        """
+        self.path = path or get_cache_dir() / "last_run.json"
+
+    def save(self, run: LastRun) -> None:
+        """Persist a run, replacing the previous one."""
+        if not run.timestamp:
+            run.timestamp = time.time()
+        try:
+            write_json_atomic(self.path, asdict(run))
+        except OSError:
+            # The command has already run; only gen --follow-up loses its context
+            pass
+
+    def load(self) -> Optional[LastRun]:
+        """Load the last run, or None if there is none."""
+        data = read_json(self.path, None)
+        if not isinstance(data, dict):
+            return None
+        try:
+            return LastRun(**data)
+        except TypeError:
+            return None
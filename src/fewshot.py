@@ -0,0 +1,313 @@
+"""Few-shot examples retrieved per query from a local BM25 inverted index."""
+import heapq
+import json
+import math
+import os
+import re
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .cache import normalize_query
+from .session import estimate_tokens
+from .utils import get_cache_dir
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Index size from which terms in over half the examples stop seeding candidates
+PRUNE_MIN_EXAMPLES = 500
+
+# Accepted examples kept in the history file
+MAX_EXAMPLES = 5000
+
+# Examples the history file may grow beyond MAX_EXAMPLES before it is
+# trimmed, so the rewrite happens once per TRIM_SLACK acceptances
+TRIM_SLACK = 1000
+
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9_.+-]*")
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+
+STOPWORDS = frozenset(
+    "a an and are all any as at be by for from in into is it its me my of on or "
+    "please show that the this to with".split()
+)
+
+# Shipped with pop: common requests whose answer is easy to get subtly wrong
+CURATED_EXAMPLES: List[Tuple[str, str]] = [
+    ("find files larger than 100MB", "find . -type f -size +100M"),
+    (
+        "show the 10 largest directories here",
+        "du -sh -- */ 2>/dev/null | sort -rh | head -n 10",
+    ),
+    ("which process is listening on port 8080", "lsof -nP -iTCP:8080 -sTCP:LISTEN"),
+    ("show open ports", "ss -tulpn"),
+    ("follow the nginx error log", "tail -F /var/log/nginx/error.log"),
+    (
+        "count lines in all python files",
+        "find . -name '*.py' -print0 | xargs -0 wc -l | tail -n 1",
+    ),
+    ("top 5 processes by memory", "ps aux --sort=-%mem | head -n 6"),
+    ("restart the docker service", "sudo systemctl restart docker"),
+    (
+        "delete merged git branches",
+        "git branch --merged | grep -vE '^\\*|main|master' | xargs -r git branch -d",
+    ),
+    (
+        "show pods that are not running",
+        "kubectl get pods -A --field-selector=status.phase!=Running",
+    ),
+    ("显示系统内存使用情况", "free -h"),
+    ("显示磁盘空间", "df -h"),
+    ("查找最近一天修改过的文件", "find . -type f -mtime -1"),
+    ("查看端口占用", "ss -tulpn"),
+]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into index terms.
+
+    Latin text is split into lowercase words without stopwords; CJK runs,
+    which have no spaces, become overlapping character bigrams.
+
+    Args:
+        text: Query or document text.
+
+    Returns:
+        Terms, with repetitions.
+    """
+    text = text.lower()
+    terms = [word for word in WORD_PATTERN.findall(text) if word not in STOPWORDS]
+    for run in CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+@dataclass
+class Example:
+    """A request and the command that answered it."""
+
+    query: str
+    command: str
+    source: str = "history"
+
+
+class FewShotIndex:
+    """
+    In-memory BM25 inverted index over examples.
+
+    Adding an example updates the postings in place, so the index never
+    needs rebuilding; IDF is computed from the current postings at query time.
+    Terms that occur in most examples only rescore the candidates found by
+    rarer terms instead of walking their long posting lists.
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty index."""
+        self.examples: List[Example] = []
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self._seen: Set[Tuple[str, str]] = set()
+        self._norms: Optional[List[float]] = None
+
+    def __len__(self) -> int:
+        """Number of indexed examples."""
+        return len(self.examples)
+
+    def add(self, example: Example) -> bool:
+        """
+        Index an example.
+
+        Args:
+            example: Example to add.
+
+        Returns:
+            False if the same query and command were already indexed.
+        """
+        identity = (normalize_query(example.query), example.command.strip())
+        if identity in self._seen or not identity[0] or not identity[1]:
+            return False
+        self._seen.add(identity)
+        doc_id = len(self.examples)
+        terms = tokenize(example.query)
+        self.examples.append(example)
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+        self._norms = None
+        for term in terms:
+            postings = self._postings[term]
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        return True
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[Example, float]]:
+        """
+        Rank examples by BM25 relevance to a query.
+
+        Args:
+            query: Natural language query.
+            k: Maximum number of results.
+
+        Returns:
+            (example, score) pairs, best first; only examples sharing a term.
+        """
+        if not self.examples or k <= 0:
+            return []
+        count = len(self.examples)
+        norms = self._length_norms()
+        matched = [p for p in map(self._postings.get, set(tokenize(query))) if p]
+        cutoff = count // 2 if count >= PRUNE_MIN_EXAMPLES else count
+        rare = [postings for postings in matched if len(postings) <= cutoff]
+        common = [postings for postings in matched if len(postings) > cutoff]
+
+        scores: Dict[int, float] = defaultdict(float)
+        for postings in rare or common:
+            idf = self._idf(count, postings)
+            for doc_id, tf in postings.items():
+                scores[doc_id] += idf * tf * (K1 + 1) / (tf + norms[doc_id])
+        if rare:
+            for postings in common:
+                idf = self._idf(count, postings)
+                for doc_id in list(scores):
+                    tf = postings.get(doc_id)
+                    if tf:
+                        scores[doc_id] += idf * tf * (K1 + 1) / (tf + norms[doc_id])
+        # Ties go to the example indexed first: newer history before packs
+        best = heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.examples[doc_id], score) for doc_id, score in best]
+
+    @staticmethod
+    def _idf(count: int, postings: Dict[int, int]) -> float:
+        """BM25 inverse document frequency of a term."""
+        return math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+
+    def _length_norms(self) -> List[float]:
+        """Per-example length normalization, recomputed after adds."""
+        if self._norms is None:
+            average = self._total_length / len(self.examples) or 1.0
+            self._norms = [K1 * (1 - B + B * length / average) for length in self._lengths]
+        return self._norms
+
+
+def select_examples(
+    index: FewShotIndex, query: str, k: int, budget_tokens: int
+) -> List[Example]:
+    """
+    Pick the most relevant examples that fit a token budget.
+
+    Args:
+        index: Example index.
+        query: Natural language query.
+        k: Maximum number of examples.
+        budget_tokens: Token budget for all examples together.
+
+    Returns:
+        Examples, best first. An exact match of the query itself is skipped,
+        since repeating it would only echo the previous answer.
+    """
+    selected: List[Example] = []
+    used = 0
+    normalized = normalize_query(query)
+    for example, _ in index.search(query, 2 * k + 1):
+        if normalize_query(example.query) == normalized:
+            continue
+        cost = estimate_tokens(example.query) + estimate_tokens(example.command) + 8
+        if used + cost > budget_tokens:
+            continue
+        selected.append(example)
+        used += cost
+        if len(selected) == k:
+            break
+    return selected
+
+
+class ExampleStore:
+    """
+    Accepted examples on disk, plus curated packs.
+
+    Accepted examples are appended to a JSON lines file, so recording one
+    is a single write; the file is trimmed to the newest MAX_EXAMPLES when
+    the index is built, which bounds both the file and the build time. Packs are JSON lines files of {"query", "command"}
+    objects in the packs directory.
+    """
+
+    def __init__(self, path: Optional[Path] = None, packs_dir: Optional[Path] = None) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            path: JSON lines file of accepted examples. If None, uses the cache directory.
+            packs_dir: Directory of curated packs. If None, uses the cache directory.
+        """
+        self.path = path or get_cache_dir() / "examples.jsonl"
+        self.packs_dir = packs_dir or get_cache_dir() / "example_packs"
+
+    def record(self, query: str, command: str) -> None:
+        """Append an accepted example."""
+        line = json.dumps(asdict(Example(query, command)), ensure_ascii=False)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError:
+            # A lost example only makes later prompts less tailored to this user
+            pass
+
+    def _read(self, path: Path, source: str) -> Iterable[Example]:
+        """Examples from a JSON lines file, skipping malformed lines."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return []
+        examples = []
+        for line in lines:
+            try:
+                data = json.loads(line)
+                examples.append(Example(str(data["query"]), str(data["command"]), source))
+            except (ValueError, KeyError, TypeError):
+                continue
+        return examples
+
+    def _rewrite(self, examples: List[Example]) -> None:
+        """Replace the history file with the given examples, atomically."""
+        lines = "".join(
+            json.dumps(asdict(Example(e.query, e.command)), ensure_ascii=False) + "\n"
+            for e in examples
+        )
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_text(lines, encoding="utf-8")
+            # An example appended by another process since the read is lost;
+            # trimming is rare and examples are only hints
+            os.replace(tmp_path, self.path)
+        except OSError:
+            tmp_path.unlink(missing_ok=True)
+
+    def build_index(self) -> FewShotIndex:
+        """
+        Index accepted examples, newest first, then packs and the curated set.
+
+        Returns:
+            The index.
+        """
+        index = FewShotIndex()
+        history = list(self._read(self.path, "history"))
+        if len(history) > MAX_EXAMPLES + TRIM_SLACK:
+            history = history[-MAX_EXAMPLES:]
+            self._rewrite(history)
+        for example in reversed(history[-MAX_EXAMPLES:]):
+            index.add(example)
+        if self.packs_dir.is_dir():
+            for pack in sorted(self.packs_dir.glob("*.jsonl")):
+                for example in self._read(pack, pack.stem):
+                    index.add(example)
+        for query, command in CURATED_EXAMPLES:
+            index.add(Example(query, command, "curated"))
+        return index
@@ -0,0 +1,343 @@
+"""Per-endpoint health tracking: rolling latency, circuit breaker, adaptive timeouts."""
+import statistics
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .utils import get_cache_dir, read_json, update_json_atomic
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Consecutive failures that open the breaker
+FAILURE_THRESHOLD = 3
+
+# Seconds an open breaker waits before letting one probe request through;
+# also how long a probe that never reports back blocks the next one
+RESET_TIMEOUT = 30.0
+
+# Latency samples kept per endpoint
+WINDOW = 50
+
+# Samples needed before the timeout adapts to observed latency
+MIN_SAMPLES = 5
+
+# Adaptive timeout: p99 time to first token times this factor, within bounds
+P99_FACTOR = 3.0
+MIN_TIMEOUT = 3.0
+
+
+@dataclass
+class EndpointHealth:
+    """Health state of one API endpoint."""
+
+    state: str = CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    last_error: str = ""
+    latencies: List[float] = field(default_factory=list)
+    # When the half-open breaker let its probe request through
+    probe_started: float = 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Latency quantile over the rolling window.
+
+        Args:
+            q: Quantile between 0 and 1.
+
+        Returns:
+            Seconds, or None without samples.
+        """
+        if not self.latencies:
+            return None
+        if len(self.latencies) == 1:
+            return self.latencies[0]
+        cuts = statistics.quantiles(self.latencies, n=100, method="inclusive")
+        return cuts[min(98, max(0, round(q * 100) - 1))]
+
+    def timeout(self, ceiling: float) -> float:
+        """
+        Time-to-first-token timeout adapted to this endpoint.
+
+        Until enough samples exist the ceiling is used as is.
+
+        Args:
+            ceiling: Upper bound, normally the request deadline.
+
+        Returns:
+            Timeout in seconds.
+        """
+        p99 = self.quantile(0.99)
+        if p99 is None or len(self.latencies) < MIN_SAMPLES:
+            return ceiling
+        return min(ceiling, max(MIN_TIMEOUT, p99 * P99_FACTOR))
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """Seconds until an open breaker lets a probe through."""
+        now = time.time() if now is None else now
+        return max(0.0, self.opened_at + RESET_TIMEOUT - now)
+
+
+class HealthStore:
+    """Endpoint health persisted in the cache directory, shared across invocations."""
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            path: Path to the JSON state file. If None, uses the cache directory.
+        """
+        self.path = path or get_cache_dir() / "endpoint_health.json"
+
+    def load_all(self) -> Dict[str, EndpointHealth]:
+        """Load the state of every known endpoint."""
+        data = read_json(self.path, {})
+        if not isinstance(data, dict):
+            return {}
+        result = {}
+        for endpoint, raw in data.items():
+            try:
+                result[endpoint] = EndpointHealth(**raw)
+            except TypeError:
+                continue
+        return result
+
+    def load(self, endpoint: str) -> EndpointHealth:
+        """Load the state of one endpoint; unknown endpoints are healthy."""
+        return self.load_all().get(endpoint, EndpointHealth())
+
+    def save(self, endpoint: str, health: EndpointHealth) -> None:
+        """Persist the state of one endpoint, replacing what was stored."""
+
+        def replace(data: Any) -> Dict[str, Any]:
+            data = data if isinstance(data, dict) else {}
+            data[endpoint] = asdict(health)
+            return data
+
+        self._write(replace)
+
+    def update(self, endpoint: str, change: Callable[[EndpointHealth], None]) -> EndpointHealth:
+        """
+        Modify the state of one endpoint in place and persist it.
+
+        Concurrent updates, from this process or other invocations, are
+        applied one after another (see update_json_atomic()), so requests
+        running in parallel do not lose each other's failures or latency
+        samples, and only one of them can claim a half-open probe.
+
+        Args:
+            endpoint: API base URL.
+            change: Modifies the endpoint's current state.
+
+        Returns:
+            The new state.
+        """
+        updated = EndpointHealth()
+
+        def apply(data: Any) -> Dict[str, Any]:
+            nonlocal updated
+            data = data if isinstance(data, dict) else {}
+            try:
+                updated = EndpointHealth(**data.get(endpoint, {}))
+            except TypeError:
+                updated = EndpointHealth()
+            change(updated)
+            data[endpoint] = asdict(updated)
+            return data
+
+        self._write(apply)
+        return updated
+
+    def _write(self, update: Callable[[Any], Dict[str, Any]]) -> None:
+        """Apply an update to the state file."""
+        try:
+            update_json_atomic(self.path, update)
+        except OSError:
+            # Without a writable cache directory every invocation starts with
+            # closed breakers and the default timeout
+            pass
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker per endpoint.
+
+    A closed breaker lets requests through. After FAILURE_THRESHOLD
+    consecutive failures it opens and requests fail fast. Once RESET_TIMEOUT
+    has passed it becomes half-open and lets a single probe request through:
+    success closes it, failure opens it again, and other requests are
+    rejected until then. A probe that never reports back, e.g. because its
+    process was killed, stops blocking after another RESET_TIMEOUT.
+    """
+
+    def __init__(self, store: Optional[HealthStore] = None) -> None:
+        """
+        Initialize the breaker.
+
+        Args:
+            store: Health store. If None, uses the default location.
+        """
+        self.store = store or HealthStore()
+
+    def allow(self, endpoint: str) -> bool:
+        """
+        Whether a request to the endpoint may be attempted now.
+
+        Args:
+            endpoint: API base URL.
+
+        Returns:
+            False if the breaker is open and the reset timeout has not passed,
+            or if it is half-open and another request is the probe.
+        """
+        health = self.store.load(endpoint)
+        if health.state == CLOSED:
+            return True
+        if not self._probe_due(health):
+            return False
+        claimed = False
+
+        def claim(health: EndpointHealth) -> None:
+            nonlocal claimed
+            # Checked again under the store's lock, which other invocations
+            # take too: of several concurrent requests only the first
+            # becomes the probe
+            if self._probe_due(health):
+                health.state = HALF_OPEN
+                health.probe_started = time.time()
+                claimed = True
+
+        self.store.update(endpoint, claim)
+        return claimed
+
+    @staticmethod
+    def _probe_due(health: EndpointHealth) -> bool:
+        """Whether a breaker that is not closed may let a probe request through now."""
+        now = time.time()
+        if health.state == OPEN:
+            return health.retry_in(now) == 0
+        return health.state == HALF_OPEN and now - health.probe_started >= RESET_TIMEOUT
+
+    def record_success(self, endpoint: str, latency: float) -> None:
+        """
+        Record a request that produced its first token.
+
+        Args:
+            endpoint: API base URL.
+            latency: Seconds to first token.
+        """
+
+        def succeed(health: EndpointHealth) -> None:
+            health.state = CLOSED
+            health.failures = 0
+            health.probe_started = 0.0
+            health.latencies = (health.latencies + [round(latency, 4)])[-WINDOW:]
+
+        self.store.update(endpoint, succeed)
+
+    def record_failure(self, endpoint: str, error: str) -> None:
+        """
+        Record a failed request.
+
+        Args:
+            endpoint: API base URL.
+            error: Short description of the failure.
+        """
+
+        def fail(health: EndpointHealth) -> None:
+            health.failures += 1
+            health.last_error = error
+            health.probe_started = 0.0
+            if health.state == HALF_OPEN or health.failures >= FAILURE_THRESHOLD:
+                health.state = OPEN
+                health.opened_at = time.time()
+
+        self.store.update(endpoint, fail)
+
+    def timeout(self, endpoint: str, ceiling: float) -> float:
+        """Adaptive time-to-first-token timeout for the endpoint."""
+        return self.store.load(endpoint).timeout(ceiling)
+
+
+class PrefixCacheStats:
+    """
+    Per-layout, per-model totals of server prefix cache hits and time to first token.
+
+    Totals are kept separately for each prompt layout version, so the effect
+    of a layout change on prefix reuse and latency can be compared on the
+    same cluster. Concurrent invocations update them one after another (see
+    update_json_atomic()).
+    """
+
+    def __init__(self, stats_path: Optional[Path] = None) -> None:
+        """
+        Initialize the stats store.
+
+        Args:
+            stats_path: Path to the JSON stats file. If None, uses the cache directory.
+        """
+        self.stats_path = stats_path or get_cache_dir() / "prefix_cache_stats.json"
+
+    def load(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Load the totals.
+
+        Returns:
+            Mapping of layout version to model to counters: requests, ttft_total,
+            reported (requests whose usage included cached tokens), prefix_hits,
+            prompt_tokens and cached_tokens.
+        """
+        data = read_json(self.stats_path, {})
+        return data if isinstance(data, dict) else {}
+
+    def record(
+        self,
+        layout: int,
+        model: str,
+        ttft: float,
+        prompt_tokens: Optional[int] = None,
+        cached_tokens: Optional[int] = None,
+    ) -> None:
+        """
+        Record one request that produced its first token.
+
+        Args:
+            layout: Prompt layout version the request was built with.
+            model: Model that served the request.
+            ttft: Seconds to first token.
+            prompt_tokens: Prompt tokens reported by the server, if any.
+            cached_tokens: Prompt tokens served from the prefix cache, if reported.
+        """
+
+        def add(data: Any) -> Dict[str, Any]:
+            data = data if isinstance(data, dict) else {}
+            counters = data.setdefault(str(layout), {}).setdefault(
+                model,
+                {
+                    "requests": 0,
+                    "ttft_total": 0.0,
+                    "reported": 0,
+                    "prefix_hits": 0,
+                    "prompt_tokens": 0,
+                    "cached_tokens": 0,
+                },
+            )
+            counters["requests"] += 1
+            counters["ttft_total"] = round(counters["ttft_total"] + ttft, 4)
+            if cached_tokens is not None:
+                # Servers that do not report cached tokens would dilute the hit rate
+                counters["reported"] += 1
+                counters["prefix_hits"] += int(cached_tokens > 0)
+                counters["prompt_tokens"] += prompt_tokens or 0
+                counters["cached_tokens"] += cached_tokens
+            return data
+
+        try:
+            update_json_atomic(self.stats_path, add)
+        except OSError:
+            # Recorded as the stream closes; a lost sample only skews pop stats
+            pass
@@ -0,0 +1,120 @@
+"""Local history of queries, ranked by frequency and recency."""
+import json
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .cache import normalize_query
+from .utils import get_cache_dir
+
+# Half-life in days of a query's weight in the ranking
+RECENCY_HALF_LIFE_DAYS = 7.0
+
+
+@dataclass
+class HistoryEntry:
+    """One query as it was asked."""
+
+    query: str
+    system_info: str
+    model: str
+    timestamp: float
+
+
+@dataclass
+class RankedQuery:
+    """A distinct query with its usage."""
+
+    query: str
+    count: int
+    last_used: float
+    score: float
+
+
+class QueryHistory:
+    """Append-only log of generation queries, trimmed to a maximum length."""
+
+    def __init__(self, path: Optional[Path] = None, max_entries: int = 1000) -> None:
+        """
+        Initialize the history.
+
+        Args:
+            path: JSON lines file. If None, uses the cache directory.
+            max_entries: Entries kept when the log is trimmed.
+        """
+        self.path = path or get_cache_dir() / "history.jsonl"
+        self.max_entries = max_entries
+
+    def record(self, query: str, system_info: str, model: str) -> None:
+        """
+        Append a query to the history.
+
+        The log is rewritten to the newest max_entries lines once it grows
+        past twice that, so appends stay cheap.
+        """
+        entry = HistoryEntry(query, system_info, model, time.time())
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(entry), ensure_ascii=False) + "\n")
+            entries = self.load()
+            if len(entries) > 2 * self.max_entries:
+                kept = entries[-self.max_entries :]
+                tmp = self.path.with_suffix(".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for item in kept:
+                        f.write(json.dumps(asdict(item), ensure_ascii=False) + "\n")
+                tmp.replace(self.path)
+        except OSError:
+            # A lost entry only weakens the ranking pop cache warm uses
+            pass
+
+    def load(self) -> List[HistoryEntry]:
+        """Load all entries, oldest first, skipping unreadable lines."""
+        if not self.path.exists():
+            return []
+        entries = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entries.append(HistoryEntry(**json.loads(line)))
+                    except (ValueError, TypeError):
+                        continue
+        except OSError:
+            return []
+        return entries
+
+    def ranked(self, limit: int = 20, now: Optional[float] = None) -> List[RankedQuery]:
+        """
+        Rank distinct queries by recency-weighted frequency.
+
+        Each use contributes a weight that halves every
+        RECENCY_HALF_LIFE_DAYS, so a query asked often recently outranks one
+        asked often long ago.
+
+        Args:
+            limit: Maximum number of queries.
+            now: Reference time, for testing.
+
+        Returns:
+            Queries, best first; each keeps its most recent phrasing.
+        """
+        now = time.time() if now is None else now
+        ranked: Dict[str, RankedQuery] = {}
+        for entry in self.load():
+            key = normalize_query(entry.query)
+            if not key:
+                continue
+            age_days = max(0.0, now - entry.timestamp) / 86400
+            weight = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+            item = ranked.get(key)
+            if item is None:
+                ranked[key] = RankedQuery(entry.query, 1, entry.timestamp, weight)
+            else:
+                item.count += 1
+                item.score += weight
+                if entry.timestamp >= item.last_used:
+                    item.query, item.last_used = entry.query, entry.timestamp
+        return sorted(ranked.values(), key=lambda q: (-q.score, -q.last_used))[:limit]
@@ -0,0 +1,605 @@
+"""Static cost analysis for generated shell commands."""
+import os
+import re
+import shlex
+import shutil
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# Sampling limits for scope estimation
+SCAN_ENTRY_LIMIT = 20000
+LARGE_TREE_FILES = 10000
+LARGE_TREE_BYTES = 1024**3
+
+# Paths that are always expensive to walk, regardless of the sample
+BROAD_PATHS = ("/", "/usr", "/var", "/home", "/Users", "/opt", "/System", "/Library")
+
+# Prefixes that run the following command unchanged
+WRAPPERS = ("sudo", "time", "env", "nohup", "command", "exec", "xargs")
+PRIORITY_WRAPPERS = ("nice", "ionice")
+
+ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+
+SEPARATORS = ("|", "||", "&", "&&", ";", ";;", "(", ")", "|&", "\n")
+REDIRECTS = (">", ">>", "<", "<<", "<<<", ">&", "<&", "&>", "&>>", ">|")
+
+# Characters that start an operator outside quotes, and the operators, longest first
+OPERATOR_CHARS = "|&;()<>"
+OPERATORS = sorted(set(SEPARATORS + REDIRECTS) - {"\n"}, key=len, reverse=True)
+
+
+@dataclass
+class ScopeEstimate:
+    """Sampled size of a directory tree."""
+
+    path: str
+    files: int = 0
+    dirs: int = 0
+    bytes: int = 0
+    truncated: bool = False
+    # A system path such as /usr that is assumed large without sampling
+    broad: bool = False
+
+    @property
+    def is_large(self) -> bool:
+        """Whether the tree is big enough to make a full walk expensive."""
+        return (
+            self.truncated
+            or self.files >= LARGE_TREE_FILES
+            or self.bytes >= LARGE_TREE_BYTES
+        )
+
+    def describe(self) -> str:
+        """Human-readable summary, e.g. '>= 20000 files, 3.1 GB'."""
+        if self.broad:
+            return "a broad system path"
+        prefix = ">= " if self.truncated else ""
+        return f"{prefix}{self.files} files, {_format_bytes(self.bytes)}"
+
+
+@dataclass
+class Token:
+    """A word or operator of a command line, with its span in the line."""
+
+    # Word with quotes and escapes removed, or the operator itself
+    text: str
+    start: int
+    end: int
+    operator: bool = False
+    # Whether any part of the word was quoted or escaped, as in \; or ")"
+    quoted: bool = False
+
+
+@dataclass
+class SimpleCommand:
+    """Words of one simple command and its span in the line, redirections included."""
+
+    words: List[Token] = field(default_factory=list)
+    start: int = 0
+    end: int = 0
+
+
+@dataclass
+class CostWarning:
+    """A potentially expensive part of a command, with a cheaper variant."""
+
+    command: str
+    message: str
+    suggestion: Optional[str] = None
+    scope: Optional[ScopeEstimate] = None
+
+
+def _format_bytes(size: int) -> str:
+    """Format a byte count with a binary unit."""
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def estimate_scope(path: str, deadline: float, limit: int = SCAN_ENTRY_LIMIT) -> ScopeEstimate:
+    """
+    Sample a directory tree with os.scandir, bounded by entry count and time.
+
+    Symlinks are not followed. If the walk stops early, the estimate is marked
+    truncated and the counts are lower bounds.
+
+    Args:
+        path: Directory (or file) to sample.
+        deadline: time.monotonic() value after which sampling stops.
+        limit: Maximum number of entries to visit.
+
+    Returns:
+        ScopeEstimate for the path.
+    """
+    estimate = ScopeEstimate(path=path)
+    pending = [path]
+    visited = 0
+
+    while pending:
+        if visited >= limit or time.monotonic() >= deadline:
+            estimate.truncated = True
+            break
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    # Large flat directories can take longer than the whole budget
+                    if time.monotonic() >= deadline:
+                        estimate.truncated = True
+                        return estimate
+                    visited += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            estimate.dirs += 1
+                            pending.append(entry.path)
+                        else:
+                            estimate.files += 1
+                            estimate.bytes += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+                    if visited >= limit:
+                        estimate.truncated = True
+                        return estimate
+        except NotADirectoryError:
+            try:
+                estimate.files += 1
+                estimate.bytes += os.stat(current).st_size
+            except OSError:
+                pass
+        except OSError:
+            continue
+
+    return estimate
+
+
+def tokenize(command: str) -> List[Token]:
+    """
+    Split a command line into words and operators the way the shell does.
+
+    Unlike shlex, quoted and escaped text stays a word: the \\; ending
+    find -exec is not a list separator and a quoted ")" is not a
+    parenthesis. Comments are dropped and unquoted newlines are separators.
+    Expansions are not performed.
+
+    Args:
+        command: Shell command line.
+
+    Returns:
+        Tokens in order.
+
+    Raises:
+        ValueError: If a quote is not closed or the line ends in a backslash.
+    """
+    tokens: List[Token] = []
+    index = 0
+    length = len(command)
+    while index < length:
+        char = command[index]
+        if char in " \t\r" or command.startswith("\\\n", index):
+            index += 1 if char != "\\" else 2
+            continue
+        if char == "#":
+            end = command.find("\n", index)
+            index = length if end < 0 else end
+            continue
+        if char == "\n":
+            tokens.append(Token(char, index, index + 1, operator=True))
+            index += 1
+            continue
+        if char in OPERATOR_CHARS:
+            operator = next(op for op in OPERATORS if command.startswith(op, index))
+            tokens.append(Token(operator, index, index + len(operator), operator=True))
+            index += len(operator)
+            continue
+
+        start = index
+        text: List[str] = []
+        quoted = False
+        while index < length and command[index] not in " \t\r\n" + OPERATOR_CHARS:
+            char = command[index]
+            if char == "\\":
+                if index + 1 >= length:
+                    raise ValueError("No escaped character")
+                quoted = True
+                if command[index + 1] != "\n":
+                    text.append(command[index + 1])
+                index += 2
+            elif char == "'":
+                end = command.find("'", index + 1)
+                if end < 0:
+                    raise ValueError("No closing quotation")
+                quoted = True
+                text.append(command[index + 1 : end])
+                index = end + 1
+            elif char == '"':
+                quoted = True
+                index += 1
+                while True:
+                    if index >= length:
+                        raise ValueError("No closing quotation")
+                    char = command[index]
+                    if char == '"':
+                        index += 1
+                        break
+                    if char == "\\" and command[index + 1 : index + 2] in ("$", "`", '"', "\\"):
+                        text.append(command[index + 1])
+                        index += 2
+                    elif command.startswith("\\\n", index):
+                        index += 2
+                    else:
+                        text.append(char)
+                        index += 1
+            else:
+                text.append(char)
+                index += 1
+        tokens.append(Token("".join(text), start, index, quoted=quoted))
+    return tokens
+
+
+def simple_commands(command: str) -> List[SimpleCommand]:
+    """
+    Split a command line into simple commands.
+
+    Pipelines, lists and subshells are split on their operators; redirections
+    and their targets are left out of the words but inside the span.
+
+    Args:
+        command: Shell command line.
+
+    Returns:
+        Simple commands in order. Empty if the line cannot be tokenized.
+    """
+    try:
+        tokens = tokenize(command)
+    except ValueError:
+        return []
+
+    commands: List[SimpleCommand] = []
+    current: Optional[SimpleCommand] = None
+    skip_next = False
+    for token in tokens:
+        if token.operator and token.text in SEPARATORS:
+            if current is not None and current.words:
+                commands.append(current)
+            current = None
+            skip_next = False
+            continue
+        if current is None:
+            current = SimpleCommand(start=token.start)
+        current.end = token.end
+        if skip_next:
+            skip_next = False
+        elif token.operator:
+            # A file descriptor number before the operator, as in "2>/dev/null"
+            words = current.words
+            if words and words[-1].end == token.start and words[-1].text.isdigit():
+                words.pop()
+            skip_next = True
+        else:
+            current.words.append(token)
+    if current is not None and current.words:
+        commands.append(current)
+    return commands
+
+
+def split_commands(command: str) -> List[List[str]]:
+    """
+    Tokenize a command line into simple commands.
+
+    Args:
+        command: Shell command line.
+
+    Returns:
+        List of argv-style token lists, without redirections. Empty if the
+        line cannot be tokenized.
+    """
+    return [[word.text for word in simple.words] for simple in simple_commands(command)]
+
+
+def unwrap_command(argv: List[str]) -> Tuple[List[str], bool]:
+    """
+    Strip env assignments and wrapper commands such as sudo or nice.
+
+    Args:
+        argv: Tokens of one simple command.
+
+    Returns:
+        Tuple of (remaining tokens starting at the real command, whether a
+        nice/ionice wrapper was present).
+    """
+    niced = False
+    index = 0
+    while index < len(argv):
+        token = argv[index]
+        name = os.path.basename(token)
+        if ASSIGNMENT.match(token):
+            index += 1
+        elif name in PRIORITY_WRAPPERS:
+            niced = True
+            index += 1
+            # Skip the wrapper's own options, e.g. "nice -n 19" or "ionice -c3"
+            while index < len(argv) and argv[index].startswith("-"):
+                index += 1
+                if index < len(argv) and argv[index].isdigit():
+                    index += 1
+        elif name in WRAPPERS:
+            index += 1
+            while index < len(argv) and (
+                argv[index].startswith("-") or ASSIGNMENT.match(argv[index]) or argv[index].isdigit()
+            ):
+                index += 1
+        else:
+            break
+    return argv[index:], niced
+
+
+def _has_flag(args: List[str], *flags: str) -> bool:
+    """Check for long options (with or without '=value') or exact short flags."""
+    for arg in args:
+        for flag in flags:
+            if arg == flag or (flag.startswith("--") and arg.startswith(flag + "=")):
+                return True
+    return False
+
+
+def _has_short_flag(args: List[str], letter: str) -> bool:
+    """Check for a single-letter flag, including combined forms like '-rn'."""
+    return any(
+        arg.startswith("-") and not arg.startswith("--") and letter in arg[1:]
+        for arg in args
+    )
+
+
+def _operands(args: List[str]) -> List[str]:
+    """Return non-option arguments."""
+    return [arg for arg in args if not arg.startswith("-")]
+
+
+def _priority_prefix() -> str:
+    """Wrapper that lowers CPU and, where available, I/O priority."""
+    if shutil.which("ionice"):
+        return "nice -n 19 ionice -c3"
+    return "nice -n 19"
+
+
+class CostLinter:
+    """Flags commands that may walk large trees and suggests cheaper variants."""
+
+    def __init__(self, budget: float = 0.05, cwd: Optional[str] = None) -> None:
+        """
+        Initialize the linter.
+
+        Args:
+            budget: Total time budget in seconds for the whole analysis.
+            cwd: Directory relative paths are resolved against. Defaults to os.getcwd().
+        """
+        self.budget = budget
+        self.cwd = cwd or os.getcwd()
+        self._deadline = 0.0
+        self._scopes: Dict[str, ScopeEstimate] = {}
+        # Command line, simple command and its real command's words being checked;
+        # suggestions are cut from the original text to keep quoting, redirections
+        # and wrappers such as sudo as written
+        self._line = ""
+        self._simple = SimpleCommand()
+        self._words: List[Token] = []
+
+    def lint(self, command: str) -> List[CostWarning]:
+        """
+        Analyze a command line.
+
+        Args:
+            command: Shell command line, as extracted from the model output.
+
+        Returns:
+            List of warnings, empty if nothing looks expensive.
+        """
+        self._deadline = time.monotonic() + self.budget
+        self._scopes = {}
+        self._line = command
+        warnings: List[CostWarning] = []
+
+        for simple in simple_commands(command):
+            tokens = [word.text for word in simple.words]
+            argv, niced = unwrap_command(tokens)
+            if not argv:
+                continue
+            self._simple = simple
+            self._words = simple.words[len(tokens) - len(argv) :]
+            name = os.path.basename(argv[0])
+            checker = getattr(self, f"_check_{name}", None)
+            if checker is None and name in ("chmod", "chown", "chgrp"):
+                checker = self._check_recursive_change
+            if checker is None:
+                continue
+            warning = checker(argv, niced)
+            if warning is not None:
+                warnings.append(warning)
+
+        return warnings
+
+    def _resolve(self, path: str) -> str:
+        """Absolute, normalized form of a path, so "/usr/" and "//" match BROAD_PATHS."""
+        resolved = os.path.normpath(os.path.join(self.cwd, os.path.expanduser(path)))
+        # POSIX lets normpath keep exactly two leading slashes
+        return "/" + resolved.lstrip("/") if resolved.startswith("//") else resolved
+
+    def _scope(self, path: str) -> ScopeEstimate:
+        """Sample a path once per lint run, within the remaining budget."""
+        resolved = self._resolve(path)
+        if resolved not in self._scopes:
+            if resolved in BROAD_PATHS:
+                # Never worth sampling: the answer is always "large"
+                self._scopes[resolved] = ScopeEstimate(path=path, truncated=True, broad=True)
+            else:
+                self._scopes[resolved] = estimate_scope(resolved, self._deadline)
+                self._scopes[resolved].path = path
+        return self._scopes[resolved]
+
+    def _largest_scope(self, paths: List[str]) -> Optional[ScopeEstimate]:
+        """Return the first large scope among paths, if any."""
+        for path in paths:
+            scope = self._scope(path)
+            if scope.is_large:
+                return scope
+        return None
+
+    def _suggest(self, argv: List[str], niced: bool, extra: List[str], position: int) -> str:
+        """Build a cheaper variant by inserting options and a priority wrapper."""
+        line, simple = self._line, self._simple
+        head = self._words[0].start
+        insert_at = self._words[position - 1].end
+        suggestion = line[simple.start : head]
+        if not niced:
+            suggestion += f"{_priority_prefix()} "
+        suggestion += line[head:insert_at]
+        if extra:
+            suggestion += " " + shlex.join(extra)
+        return suggestion + line[insert_at : simple.end]
+
+    def _replace(self, replacement: str) -> str:
+        """Swap the real command for another, keeping wrappers and trailing redirections."""
+        line, simple = self._line, self._simple
+        return (
+            line[simple.start : self._words[0].start]
+            + replacement
+            + line[self._words[-1].end : simple.end]
+        )
+
+    def _check_find(self, argv: List[str], niced: bool) -> Optional[CostWarning]:
+        """find without depth limits on a large tree."""
+        args = argv[1:]
+        # Starting points are the leading arguments before the expression
+        split = next(
+            (i for i, arg in enumerate(args) if arg.startswith(("-", "(", "!"))),
+            len(args),
+        )
+        paths = args[:split] or ["."]
+        scope = self._largest_scope(paths)
+        if scope is None:
+            return None
+
+        extra: List[str] = []
+        hints: List[str] = []
+        broad = any(self._resolve(path) in BROAD_PATHS for path in paths)
+        if not _has_flag(args, "-xdev", "-mount") and broad:
+            extra.append("-xdev")
+            hints.append("-xdev keeps it on one filesystem")
+        if not _has_flag(args, "-maxdepth"):
+            extra.extend(["-maxdepth", "3"])
+            hints.append("-maxdepth bounds the walk")
+        if ";" in args:
+            hints.append("'-exec ... +' batches files instead of forking per file")
+        if not extra and niced:
+            return None
+
+        return CostWarning(
+            command="find",
+            message=f"find walks {scope.path} ({scope.describe()})"
+            + (f"; {', '.join(hints)}" if hints else ""),
+            suggestion=self._suggest(argv, niced, extra, 1 + split),
+            scope=scope,
+        )
+
+    def _check_du(self, argv: List[str], niced: bool) -> Optional[CostWarning]:
+        """du over a large tree without a depth limit."""
+        args = argv[1:]
+        paths = _operands(args) or ["."]
+        scope = self._largest_scope(paths)
+        if scope is None:
+            return None
+        # Combined short flags count too; adding -d to "du -sh" is an error in GNU du
+        limited = (
+            _has_flag(args, "--summarize", "--max-depth")
+            or _has_short_flag(args, "s")
+            or _has_short_flag(args, "d")
+        )
+        if limited and niced:
+            return None
+        extra = [] if limited else ["-d", "1"]
+        return CostWarning(
+            command="du",
+            message=f"du scans every file under {scope.path} ({scope.describe()})",
+            suggestion=self._suggest(argv, niced, extra, 1),
+            scope=scope,
+        )
+
+    def _check_grep(self, argv: List[str], niced: bool) -> Optional[CostWarning]:
+        """Recursive grep without include/exclude filters."""
+        args = argv[1:]
+        recursive = _has_flag(args, "--recursive", "--dereference-recursive") or any(
+            _has_short_flag(args, letter) for letter in ("r", "R")
+        )
+        if not recursive:
+            return None
+        if _has_flag(args, "--include", "--exclude", "--exclude-dir"):
+            return None
+        # First operand is the pattern unless given with -e
+        operands = _operands(args)
+        if not _has_flag(args, "-e", "--regexp", "-f", "--file") and operands:
+            operands = operands[1:]
+        scope = self._largest_scope(operands or ["."])
+        if scope is None:
+            return None
+        return CostWarning(
+            command="grep",
+            message=f"recursive grep reads every file under {scope.path} ({scope.describe()})",
+            suggestion=self._suggest(
+                argv, niced, ["--exclude-dir=.git", "--exclude-dir=node_modules"], 1
+            ),
+            scope=scope,
+        )
+
+    def _check_ls(self, argv: List[str], niced: bool) -> Optional[CostWarning]:
+        """Recursive listing of a large tree."""
+        args = argv[1:]
+        if not (_has_short_flag(args, "R") or _has_flag(args, "--recursive")):
+            return None
+        scope = self._largest_scope(_operands(args) or ["."])
+        if scope is None:
+            return None
+        return CostWarning(
+            command="ls",
+            message=f"ls -R lists every entry under {scope.path} ({scope.describe()})",
+            suggestion=self._replace(f"find {shlex.quote(scope.path)} -maxdepth 2"),
+            scope=scope,
+        )
+
+    def _check_recursive_change(self, argv: List[str], niced: bool) -> Optional[CostWarning]:
+        """chmod/chown/chgrp -R on a large tree."""
+        args = argv[1:]
+        if not (_has_short_flag(args, "R") or _has_flag(args, "--recursive")):
+            return None
+        # First operand is the mode or owner
+        scope = self._largest_scope(_operands(args)[1:])
+        if scope is None:
+            return None
+        name = os.path.basename(argv[0])
+        return CostWarning(
+            command=name,
+            message=f"{name} -R rewrites metadata for every file under {scope.path} "
+            f"({scope.describe()})",
+            suggestion=None if niced else self._suggest(argv, niced, [], 1),
+            scope=scope,
+        )
+
+
+def lint_command(
+    command: str, budget: float = 0.05, cwd: Optional[str] = None
+) -> List[CostWarning]:
+    """
+    Flag expensive patterns in a command within a latency budget.
+
+    Args:
+        command: Shell command line.
+        budget: Time budget in seconds.
+        cwd: Directory relative paths are resolved against.
+
+    Returns:
+        List of CostWarning objects.
+    """
+    return CostLinter(budget=budget, cwd=cwd).lint(command)
@@ -1,22 +1,73 @@
 """Main entry point for Parallax OpsPilot CLI."""
+import codecs
+import contextlib
+import json
+import os
 import re
+import select
 import subprocess
-from typing import Annotated
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Annotated, Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+import httpx
 import pyperclip
 import typer
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
+from rich.text import Text
 
-from .client import ParallaxClient, ParallaxConnectionError
+from .cache import CacheEntry, ResponseCache, export_bundle, import_bundle
+from .cassette import Cassette, RecordingClient, ReplayClient
+from .client import ParallaxClient, ParallaxConnectionError, closing_stream
+from .coalesce import CoalesceStats, SingleFlight
 from .config import AppConfig, ConfigManager
-from .utils import get_system_info
+from .history import QueryHistory
+from .docs_index import DocsIndex, scan_path
+from .equivalence import sandbox_available
+from .evaluation import DEFAULT_DATASET, CaseResult, Target, load_dataset, run_matrix
+from .executor import Fleet, HostResult, load_inventory
+from .feedback import LastRun, LastRunStore, OutputBuffer, compress_output
+from .fewshot import ExampleStore, FewShotIndex, select_examples
+from .health import PrefixCacheStats
+from .linter import lint_command
+from .models import ModelCatalog, resolve_model
+from .plan import (
+    FAILED,
+    OK,
+    SKIPPED,
+    PlanError,
+    PlanStep,
+    execute_plan,
+    generate_commands,
+    parse_plan,
+)
+from .prewarm import Prewarmer, is_idle
+from .prompts import PROMPT_LAYOUT_VERSION
+from .session import SessionStore
+from .shared_cache import CacheServer, SharedCacheClient, TieredCache
+from .shell_history import ShellHistoryIndex
+from .stream import StreamProcessor
+from .utils import get_cache_dir, get_shell_path, get_system_info
+from .validation import (
+    RankedCandidate,
+    RepairStats,
+    ValidationResult,
+    rank_candidates,
+    validate_command,
+)
 
 # Initialize Typer app and Rich console
 app = typer.Typer(
     name="pop",
     help="Parallax OpsPilot - Terminal-based AI copilot for DevOps engineers",
 )
+cache_app = typer.Typer(help="Manage the local response cache")
+app.add_typer(cache_app, name="cache")
 console = Console()
 
 # Global config manager instance
@@ -61,20 +112,31 @@ def configure() -> None:
         type=str,
     )
 
+    # Offer the models the server serves, from the cache or a quick fetch
+    served = _served_models(api_base, current_config.api_key)
+    if served:
+        console.print("[bold]Models served by this endpoint:[/bold]")
+        for index, name in enumerate(served, 1):
+            marker = " [dim](current)[/dim]" if name == current_config.model else ""
+            console.print(f"  {index}. {name}{marker}")
+
     # Prompt for model_name with current value as default
     # Note: Using 'model' field from config, but prompt shows as 'model_name'
     model_name = typer.prompt(
-        "Model Name",
+        "Model Name" + (" (number or name)" if served else ""),
         default=current_config.model,
         type=str,
     )
+    if served and model_name.isdigit() and 1 <= int(model_name) <= len(served):
+        model_name = served[int(model_name) - 1]
+    elif served and model_name not in served:
+        console.print(f"[yellow]⚠ {model_name} is not in the served list.[/yellow]")
 
     # Create updated configuration
     try:
+        # Keep the existing API key and any settings not prompted for
         updated_config = AppConfig(
-            api_base=api_base,
-            api_key=current_config.api_key,  # Keep existing API key
-            model=model_name,
+            **{**dict(current_config), "api_base": api_base, "model": model_name}
         )
         config_manager.save(updated_config)
 
@@ -85,6 +147,775 @@ def configure() -> None:
         raise typer.Exit(code=1)
 
 
+def _served_models(api_base: str, api_key: str) -> Optional[List[str]]:
+    """Models served by an endpoint: cached if fresh, else fetched; None if unknown."""
+    catalog = ModelCatalog()
+    served = catalog.cached(api_base)
+    if served is not None:
+        return served
+    try:
+        return catalog.refresh(api_base, api_key)
+    except Exception:
+        return catalog.cached(api_base, allow_stale=True)
+
+
+@app.command()
+def stats() -> None:
+    """Show repair rates per model, requests saved, and prefix cache reuse per prompt layout."""
+    data = RepairStats().load()
+    if not data:
+        console.print("[dim]No commands validated yet.[/dim]")
+    else:
+        table = Table(title="Command Validation")
+        table.add_column("Model", style="cyan")
+        table.add_column("Validated", justify="right")
+        table.add_column("Needed repair", justify="right")
+        table.add_column("Repaired", justify="right")
+        table.add_column("Repair rate", justify="right")
+        table.add_column("Attempts", justify="right")
+
+        for model, counters in sorted(data.items()):
+            validated = counters.get("validated", 0)
+            needed = counters.get("needed_repair", 0)
+            rate = f"{needed / validated * 100:.1f}%" if validated else "-"
+            table.add_row(
+                model,
+                str(validated),
+                str(needed),
+                str(counters.get("repaired", 0)),
+                rate,
+                str(counters.get("attempts", 0)),
+            )
+
+        console.print(table)
+
+    coalescing = CoalesceStats().load()
+    requests = coalescing["upstream"] + coalescing["coalesced"]
+    if requests:
+        console.print(
+            f"Coalescing: {coalescing['coalesced']} of {requests} generations shared an "
+            f"identical request in flight ({coalescing['coalesced'] / requests * 100:.1f}% "
+            "of upstream calls saved)"
+        )
+
+    prefix = PrefixCacheStats().load()
+    if prefix:
+        table = Table(title="Prompt Prefix Cache")
+        table.add_column("Layout", style="cyan")
+        table.add_column("Model", style="cyan")
+        table.add_column("Requests", justify="right")
+        table.add_column("Mean TTFT", justify="right")
+        table.add_column("Prefix hits", justify="right")
+        table.add_column("Cached prompt tokens", justify="right")
+
+        for layout, models in sorted(prefix.items()):
+            for model, counters in sorted(models.items()):
+                requests = counters.get("requests", 0)
+                reported = counters.get("reported", 0)
+                prompt_tokens = counters.get("prompt_tokens", 0)
+                table.add_row(
+                    f"v{layout}" + (" (current)" if layout == str(PROMPT_LAYOUT_VERSION) else ""),
+                    model,
+                    str(requests),
+                    f"{counters.get('ttft_total', 0) / requests * 1000:.0f}ms" if requests else "-",
+                    # Servers that do not report cached tokens have no hit rate
+                    f"{counters.get('prefix_hits', 0) / reported * 100:.1f}%" if reported else "-",
+                    f"{counters.get('cached_tokens', 0) / prompt_tokens * 100:.1f}%"
+                    if prompt_tokens
+                    else "-",
+                )
+
+        console.print(table)
+
+
+@app.command()
+def doctor(
+    probes: Annotated[
+        int,
+        typer.Option(
+            "--probes",
+            min=0,
+            max=20,
+            help="Calibration requests per endpoint (0 only shows the stored state)",
+        ),
+    ] = 3,
+) -> None:
+    """
+    Check endpoint health and calibrate adaptive timeouts.
+
+    Each configured endpoint is probed with minimal requests whose time to
+    first token feeds the latency statistics used for adaptive timeouts. A
+    successful probe also closes an open circuit breaker.
+
+    Args:
+        probes: Number of probe requests per endpoint.
+    """
+    try:
+        config = config_manager.get()
+        client = ParallaxClient(config)
+    except ValueError as e:
+        console.print(f"[bold red]Configuration Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    console.print(f"[bold]Model:[/bold] {config.model}")
+    console.print(f"[bold]Request deadline:[/bold] {config.request_deadline:g}s")
+    if probes:
+        try:
+            served = ModelCatalog().refresh(config.api_base, config.api_key)
+        except Exception:
+            served = None
+        if served is not None:
+            if config.model in served:
+                console.print(f"[green]✓[/green] {config.model} is served by {config.api_base}")
+            else:
+                console.print(
+                    f"[red]✗[/red] {config.model} is not served by {config.api_base}. "
+                    f"Served: {', '.join(served) or 'none'}"
+                )
+
+    reachable = 0
+    for endpoint in client.endpoints:
+        for attempt in range(probes):
+            try:
+                latency = client.probe(endpoint)
+            except ParallaxConnectionError as e:
+                console.print(f"[red]✗[/red] {endpoint} probe {attempt + 1}: {e.message}")
+                break
+            console.print(
+                f"[green]✓[/green] {endpoint} probe {attempt + 1}: "
+                f"first token in {latency * 1000:.0f} ms"
+            )
+        else:
+            if probes:
+                reachable += 1
+
+    states = client.breaker.store.load_all()
+    table = Table(title="Endpoint Health")
+    table.add_column("Endpoint", style="cyan")
+    table.add_column("Breaker")
+    table.add_column("Failures", justify="right")
+    table.add_column("Samples", justify="right")
+    table.add_column("p50", justify="right")
+    table.add_column("p99", justify="right")
+    table.add_column("Timeout", justify="right")
+    table.add_column("Last error", style="dim")
+
+    state_styles = {"closed": "green", "half_open": "yellow", "open": "red"}
+    for endpoint in client.endpoints:
+        health = states.get(endpoint)
+        if health is None:
+            table.add_row(endpoint, "[dim]unknown[/dim]", "-", "0", "-", "-", "-", "")
+            continue
+        p50 = health.quantile(0.5)
+        p99 = health.quantile(0.99)
+        style = state_styles.get(health.state, "white")
+        table.add_row(
+            endpoint,
+            f"[{style}]{health.state}[/{style}]",
+            str(health.failures),
+            str(len(health.latencies)),
+            f"{p50 * 1000:.0f} ms" if p50 is not None else "-",
+            f"{p99 * 1000:.0f} ms" if p99 is not None else "-",
+            f"{health.timeout(config.request_deadline):.1f}s",
+            health.last_error if health.failures else "",
+        )
+    console.print(table)
+
+    if probes and not reachable:
+        raise typer.Exit(code=1)
+
+
+@cache_app.command("warm")
+def cache_warm(
+    limit: Annotated[
+        int,
+        typer.Option(
+            "--limit", min=1, max=500, help="Number of top queries from history to keep warm"
+        ),
+    ] = 20,
+    concurrency: Annotated[
+        int,
+        typer.Option("--concurrency", min=1, max=4, help="Requests in flight at once"),
+    ] = 1,
+    idle: Annotated[
+        bool,
+        typer.Option("--idle", help="Only work while the machine is idle; stop when it gets busy"),
+    ] = False,
+    dry_run: Annotated[
+        bool,
+        typer.Option("--dry-run", help="List the queries that would be regenerated"),
+    ] = False,
+) -> None:
+    """
+    Regenerate missing or stale cache entries for the most used queries.
+
+    Queries are ranked from the local history by frequency and recency and
+    looked up under the current environment and model, so entries are
+    reissued after an OS, shell or model change. The job runs at low
+    priority and low concurrency; --idle defers the remaining queries as
+    soon as the load average rises, which makes it suitable for cron.
+
+    Args:
+        limit: Number of top queries to consider.
+        concurrency: Concurrent requests.
+        idle: Only work while the machine is idle.
+        dry_run: Only list the queries.
+    """
+    try:
+        config = config_manager.get()
+        client = _create_client(config)
+    except ValueError as e:
+        console.print(f"[bold red]Configuration Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    if client.model_notice:
+        config = client.config
+        console.print(f"[yellow]⚠ {client.model_notice}[/yellow]")
+
+    cache = _response_cache(config)
+    if not cache.enabled:
+        console.print("[dim]The response cache is disabled (cache_ttl_hours is 0).[/dim]")
+        return
+    system_info = get_system_info()
+    shell = get_shell_path()
+
+    def generate(query: str) -> Tuple[str, Optional[str]]:
+        return _generate_valid(client, query, system_info, shell)
+
+    prewarmer = Prewarmer(
+        cache,
+        QueryHistory(),
+        system_info,
+        config.model,
+        generate,
+        concurrency=concurrency,
+        idle_check=is_idle if idle else None,
+    )
+
+    if dry_run:
+        todo, fresh = prewarmer.plan(limit)
+        for query in todo:
+            console.print(f"  {query}")
+        console.print(f"[dim]{len(todo)} to regenerate, {len(fresh)} fresh.[/dim]")
+        return
+
+    with contextlib.suppress(OSError, AttributeError):
+        # Stay out of the way of interactive work
+        os.nice(10)
+
+    def report_progress(query: str, error: Optional[str]) -> None:
+        if error is None:
+            console.print(f"[green]✓[/green] {query}")
+        else:
+            console.print(f"[red]✗[/red] {query} [dim]({error})[/dim]")
+
+    report = prewarmer.run(limit, on_done=report_progress)
+    console.print(
+        f"[bold]Warmed {len(report.warmed)}[/bold], {len(report.fresh)} already fresh, "
+        f"{len(report.failed)} failed"
+        + (f", {len(report.deferred)} deferred (machine busy)" if report.deferred else "")
+        + "."
+    )
+    if report.failed and not report.warmed and not report.fresh:
+        raise typer.Exit(code=1)
+
+
+@cache_app.command("export")
+def cache_export(
+    path: Annotated[Path, typer.Argument(help="Bundle file to write (JSON lines)")],
+    shared: Annotated[
+        bool, typer.Option("--shared", help="Export the team cache server instead")
+    ] = False,
+) -> None:
+    """
+    Export cached commands as a bundle.
+
+    Args:
+        path: Bundle file to write.
+        shared: Export from the configured cache server.
+    """
+    try:
+        if shared:
+            bundle = _shared_cache_client().export_bundle()
+            path.write_text(bundle, encoding="utf-8")
+            count = len(bundle.splitlines())
+        else:
+            with open(path, "w", encoding="utf-8") as f:
+                count = export_bundle(ResponseCache(), f)
+    except (OSError, httpx.HTTPError) as e:
+        console.print(f"[bold red]Export failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    console.print(f"[green]✓[/green] Exported {count} entries to {path}")
+
+
+@cache_app.command("import")
+def cache_import(
+    path: Annotated[Path, typer.Argument(help="Bundle file to read (JSON lines)")],
+    shared: Annotated[
+        bool, typer.Option("--shared", help="Import into the team cache server instead")
+    ] = False,
+    trust: Annotated[
+        bool,
+        typer.Option(
+            "--trust",
+            help="Treat the commands as generated here, so --exec and plan --yes run them",
+        ),
+    ] = False,
+) -> None:
+    """
+    Import a bundle of cached commands; existing newer entries are kept.
+
+    Imported commands are treated like team cache hits and shown for
+    confirmation before they run, unless --trust is given.
+
+    Args:
+        path: Bundle file to read.
+        shared: Import into the configured cache server.
+        trust: Import the entries as trusted.
+    """
+    try:
+        if shared:
+            count = _shared_cache_client().import_bundle(path.read_text(encoding="utf-8"))
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                count = import_bundle(ResponseCache(), f, trusted=trust)
+    except (OSError, httpx.HTTPError) as e:
+        console.print(f"[bold red]Import failed:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    console.print(f"[green]✓[/green] Imported {count} entries from {path}")
+
+
+@app.command("cache-server")
+def cache_server(
+    host: Annotated[
+        str, typer.Option("--host", help="Interface to listen on; use 0.0.0.0 for the LAN")
+    ] = "127.0.0.1",
+    port: Annotated[
+        int, typer.Option("--port", min=0, max=65535, help="Port to listen on")
+    ] = 8765,
+    directory: Annotated[
+        Optional[Path],
+        typer.Option("--dir", help="Directory for entries (default: the cache directory)"),
+    ] = None,
+    seed: Annotated[
+        Optional[Path],
+        typer.Option("--import", help="Bundle to load before serving"),
+    ] = None,
+) -> None:
+    """
+    Serve a team-shared command cache over plain HTTP.
+
+    Clients set shared_cache_url to this server's address. Entries are
+    content-addressed by query, environment, model and prompt hash, so
+    machines only share answers for identical setups. There is no
+    authentication: run it on a trusted network. Clients never execute a
+    command from this server without showing it and asking first.
+
+    Args:
+        host: Interface to listen on.
+        port: Port to listen on.
+        directory: Directory for entries.
+        seed: Bundle to import first.
+    """
+    directory = directory or get_cache_dir() / "shared-responses"
+    try:
+        server = CacheServer(directory, host, port)
+    except OSError as e:
+        console.print(f"[bold red]Cannot listen on {host}:{port}:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    if seed is not None:
+        try:
+            with open(seed, "r", encoding="utf-8") as f:
+                count = import_bundle(server.store, f)
+        except (OSError, ValueError) as e:
+            server.httpd.server_close()
+            console.print(f"[bold red]Import failed:[/bold red] {e}")
+            raise typer.Exit(code=1)
+        console.print(f"Imported {count} entries from {seed}")
+    console.print(f"[bold]Serving cache[/bold] {directory} at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+@app.command("index-docs")
+def index_docs(
+    workers: Annotated[
+        Optional[int],
+        typer.Option("--workers", min=1, max=64, help="Extraction processes (default: one per CPU)"),
+    ] = None,
+    full: Annotated[
+        bool, typer.Option("--full", help="Re-extract every binary, not just changed ones")
+    ] = False,
+    no_man: Annotated[
+        bool, typer.Option("--no-man", help="Skip man pages and only use --help output")
+    ] = False,
+    help_anywhere: Annotated[
+        bool,
+        typer.Option(
+            "--help-anywhere",
+            help="Also run --help for binaries outside system directories, e.g. your own scripts",
+        ),
+    ] = False,
+) -> None:
+    """
+    Index man pages and --help output of the binaries on $PATH.
+
+    Generation then adds the flag descriptions relevant to a request for the
+    tools it names, so the model sees the options of the installed versions
+    (GNU or BSD) instead of guessing. Only binaries added or changed since
+    the last run are extracted, so running this from cron is cheap.
+    Binaries without a man page are run with --help only if they are in a
+    system directory, unless --help-anywhere is given.
+
+    Args:
+        workers: Extraction processes.
+        full: Re-extract everything.
+        no_man: Skip man pages.
+        help_anywhere: Run --help for binaries anywhere on $PATH.
+    """
+    index = DocsIndex()
+    binaries = scan_path()
+    if full:
+        index.manifest().clear()
+    pending = len(index.stale(binaries))
+    console.print(f"[dim]Extracting {pending} of {len(binaries)} binaries...[/dim]")
+    try:
+        report = index.refresh(
+            binaries, workers=workers, use_man=not no_man, help_anywhere=help_anywhere
+        )
+    except KeyboardInterrupt:
+        console.print("[yellow]Interrupted; extracted binaries were kept.[/yellow]")
+        raise typer.Exit(code=130)
+    console.print(
+        f"Indexed {report.indexed}, without docs {report.empty}, unchanged {report.unchanged}, "
+        f"removed {report.removed} in {report.seconds:.1f}s"
+    )
+    if not config_manager.get().docs_token_budget:
+        console.print("[dim]docs_token_budget is 0, so generation does not use the index.[/dim]")
+
+
+def _generate_valid(
+    client: ParallaxClient, query: str, system_info: str, shell: str
+) -> Tuple[str, Optional[str]]:
+    """
+    Generate a command without any UI and validate it.
+
+    Returns:
+        Tuple of (command, warning or None).
+
+    Raises:
+        ParallaxConnectionError: If the request fails.
+        ValueError: If the command does not validate.
+    """
+    processor = StreamProcessor()
+    with closing_stream(client.generate_command_stream(query, system_info)) as chunks:
+        for chunk in chunks:
+            processor.feed(chunk)
+    processor.finish()
+    command, warning = _extract_command(processor.text)
+    validation = validate_command(command, shell)
+    if not validation.ok:
+        raise ValueError(validation.describe() or "No command generated.")
+    return validation.command, warning
+
+
+@app.command()
+def batch(
+    source: Annotated[
+        Path, typer.Argument(help="File with one query per line, or - for stdin", allow_dash=True)
+    ],
+    concurrency: Annotated[
+        int, typer.Option("--concurrency", min=1, max=16, help="Requests in flight at once")
+    ] = 4,
+    no_cache: Annotated[
+        bool, typer.Option("--no-cache", help="Always ask the model, ignoring cached commands")
+    ] = False,
+) -> None:
+    """
+    Generate commands for many queries and print one JSON record per line.
+
+    Records are printed in input order and nothing is executed. Identical
+    queries in flight at the same time share one request to the server, so
+    duplicate lines cost a single generation; the summary on stderr says how
+    many requests were saved.
+
+    Args:
+        source: Query file, or - for stdin.
+        concurrency: Concurrent requests.
+        no_cache: Skip the response cache.
+    """
+    errors = Console(stderr=True)
+    try:
+        config = config_manager.get()
+        client = _create_client(config, prewarm=True)
+    except ValueError as e:
+        errors.print(f"[bold red]Configuration Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    if client.model_notice:
+        config = client.config
+
+    text = sys.stdin.read() if str(source) == "-" else source.read_text(encoding="utf-8")
+    queries = [line.strip() for line in text.splitlines() if line.strip()]
+    if not queries:
+        errors.print("[dim]No queries.[/dim]")
+        return
+
+    client.coalescer = SingleFlight()
+    cache = None if no_cache else _response_cache(config)
+    if cache is not None and not cache.enabled:
+        cache = None
+    system_info = get_system_info()
+    shell = get_shell_path()
+
+    def run(query: str) -> Dict[str, Any]:
+        record: Dict[str, Any] = {"query": query}
+        cached = cache.get(query, system_info, config.model) if cache else None
+        if cached is not None:
+            record.update(command=cached.command, warning=cached.warning, cached=True)
+            return record
+        try:
+            command, warning = _generate_valid(client, query, system_info, shell)
+        except (ParallaxConnectionError, ValueError) as e:
+            record["error"] = getattr(e, "message", None) or str(e)
+            return record
+        if cache is not None:
+            cache.store(query, system_info, config.model, command, warning)
+        record.update(command=command, warning=warning, cached=False)
+        return record
+
+    client.prewarm()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        records = list(pool.map(run, queries))
+    for record in records:
+        _emit_json(record)
+
+    CoalesceStats().record(client.coalescer)
+    failed = sum("error" in record for record in records)
+    cached = sum(bool(record.get("cached")) for record in records)
+    errors.print(
+        f"[dim]{len(queries)} queries: {client.coalescer.upstream} sent to the server, "
+        f"{client.coalescer.coalesced} shared an identical request in flight, "
+        f"{cached} from cache, {failed} failed.[/dim]"
+    )
+    if failed:
+        raise typer.Exit(code=1)
+
+
+@app.command("bench-models")
+def bench_models(
+    models: Annotated[
+        Optional[List[str]],
+        typer.Option("--model", "-m", help="Model to evaluate (repeatable; default: configured)"),
+    ] = None,
+    endpoints: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            "--endpoint", "-e", help="Endpoint to evaluate (repeatable; default: configured)"
+        ),
+    ] = None,
+    datasets: Annotated[
+        Optional[List[Path]],
+        typer.Option(
+            "--dataset", "-d", exists=True, dir_okay=False,
+            help="Extra cases, TEST_CASES.md style or JSONL (repeatable)",
+        ),
+    ] = None,
+    no_builtin: Annotated[
+        bool, typer.Option("--no-builtin", help="Skip the bundled docs/TEST_CASES.md cases")
+    ] = False,
+    concurrency: Annotated[
+        int, typer.Option("--concurrency", min=1, max=32, help="Targets evaluated at once")
+    ] = 4,
+    execute: Annotated[
+        bool,
+        typer.Option(
+            "--execute", help="Judge answers by running them in sandboxed fixture directories"
+        ),
+    ] = False,
+    workers: Annotated[
+        Optional[int],
+        typer.Option(
+            "--workers", min=1, max=64, help="Processes for --execute (default: one per CPU)"
+        ),
+    ] = None,
+    unsafe_no_sandbox: Annotated[
+        bool,
+        typer.Option(
+            "--unsafe-no-sandbox",
+            help="Let --execute run model output directly on this machine without bubblewrap",
+        ),
+    ] = False,
+    as_json: Annotated[
+        bool, typer.Option("--json", help="Print the results as JSON instead of a table")
+    ] = False,
+    output: Annotated[
+        Optional[Path], typer.Option("--output", "-o", help="Also write the JSON results here")
+    ] = None,
+) -> None:
+    """
+    Compare models and endpoints on accuracy and latency.
+
+    Every model is run on every endpoint with the bundled test cases and any
+    extra datasets. Each target reports its pass rate, median time to first
+    token, decode speed and total latency; targets on the Pareto frontier,
+    where no other target is both at least as accurate and at least as fast,
+    are highlighted.
+
+    Answers are matched against the accepted commands as text by default.
+    With --execute each answer and its accepted commands run in identical
+    throwaway directory trees, and the answer passes only if it prints the
+    same and changes the same files. Commands that would leave the
+    directory are refused, not run. Execution requires bubblewrap (bwrap)
+    for isolation; where it is missing or cannot run, answers are not executed unless
+    --unsafe-no-sandbox is given.
+
+    Args:
+        models: Models to evaluate.
+        endpoints: Endpoints to evaluate.
+        datasets: Extra dataset files.
+        no_builtin: Skip the bundled cases.
+        concurrency: Targets evaluated at once.
+        execute: Judge answers by execution.
+        workers: Processes for execution checking.
+        unsafe_no_sandbox: Execute without bubblewrap.
+        as_json: Print JSON instead of a table.
+        output: File for the JSON results.
+    """
+    try:
+        config = config_manager.get()
+    except ValueError as e:
+        console.print(f"[bold red]Configuration Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    paths = list(datasets or [])
+    if not no_builtin and DEFAULT_DATASET.is_file():
+        paths.insert(0, DEFAULT_DATASET)
+    cases = []
+    for path in paths:
+        try:
+            cases += load_dataset(path)
+        except (OSError, ValueError) as e:
+            console.print(f"[bold red]Cannot load {path}:[/bold red] {e}")
+            raise typer.Exit(code=1)
+    if not cases:
+        console.print("[bold red]No test cases to run.[/bold red] Pass --dataset.")
+        raise typer.Exit(code=1)
+
+    targets = [
+        Target(model, endpoint.rstrip("/"))
+        for model in dict.fromkeys(models or [config.model])
+        for endpoint in dict.fromkeys(endpoints or [config.api_base])
+    ]
+
+    if execute and not sandbox_available():
+        errors = Console(stderr=True)
+        if unsafe_no_sandbox:
+            errors.print(
+                "[bold yellow]Warning:[/bold yellow] bubblewrap (bwrap) is not usable here; "
+                "model-generated commands will run directly on this machine."
+            )
+        else:
+            errors.print(
+                "[bold yellow]Warning:[/bold yellow] bubblewrap (bwrap) is not installed or "
+                "cannot create namespaces here, so answers cannot be executed in isolation; "
+                "judging them as text instead. Install bubblewrap, or pass "
+                "--unsafe-no-sandbox to run them unisolated."
+            )
+            execute = False
+
+    def progress(target: Target, result: CaseResult) -> None:
+        if result.error:
+            mark = "[red]✗[/red]"
+        elif execute:
+            # Judged after all answers are in
+            mark = "·"
+        else:
+            mark = "[green]✓[/green]" if result.passed else "[red]✗[/red]"
+        detail = result.error or result.command
+        console.print(
+            f"{mark} [dim]{target.model} @ {target.endpoint}: {result.case}: {detail}[/dim]"
+        )
+
+    if not as_json:
+        console.print(f"[dim]Running {len(cases)} cases on {len(targets)} targets...[/dim]")
+        if execute:
+            console.print("[dim]Answers are judged by execution once all targets finish.[/dim]")
+    try:
+        reports = run_matrix(
+            config,
+            targets,
+            cases,
+            get_system_info(),
+            _extract_command,
+            concurrency=concurrency,
+            on_result=None if as_json else progress,
+            execute=execute,
+            workers=workers,
+            unsandboxed=unsafe_no_sandbox,
+        )
+    except KeyboardInterrupt:
+        console.print("[yellow]Interrupted.[/yellow]")
+        raise typer.Exit(code=130)
+
+    record = {"cases": len(cases), "targets": [report.to_dict() for report in reports]}
+    if output is not None:
+        output.write_text(json.dumps(record, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    if as_json:
+        _emit_json(record)
+        return
+
+    def ms(seconds: Optional[float]) -> str:
+        return f"{seconds * 1000:.0f} ms" if seconds is not None else "-"
+
+    table = Table(title="Model Benchmark", caption="★ Pareto frontier: accuracy versus latency")
+    table.add_column("", width=1)
+    table.add_column("Model", style="cyan")
+    table.add_column("Endpoint")
+    table.add_column("Pass rate", justify="right")
+    table.add_column("TTFT", justify="right")
+    table.add_column("Tokens/s", justify="right")
+    table.add_column("Latency", justify="right")
+    table.add_column("Errors", justify="right")
+    for report in sorted(reports, key=lambda r: (-r.pass_rate, r.latency or float("inf"))):
+        speed = report.tokens_per_second
+        table.add_row(
+            "★" if report.pareto else "",
+            report.target.model,
+            report.target.endpoint,
+            f"{report.pass_rate * 100:.0f}%",
+            ms(report.ttft),
+            f"{speed:.1f}" if speed is not None else "-",
+            ms(report.latency),
+            str(report.errors) if report.errors else "",
+            style="bold green" if report.pareto else None,
+        )
+    console.print(table)
+    if output is not None:
+        console.print(f"[dim]Results written to {output}[/dim]")
+
+
+def _shared_cache_client() -> SharedCacheClient:
+    """Client for the configured cache server; exits if none is configured."""
+    config = config_manager.get()
+    if not config.shared_cache_url:
+        console.print("[bold red]No shared_cache_url configured.[/bold red]")
+        raise typer.Exit(code=1)
+    return SharedCacheClient(config.shared_cache_url, config.shared_cache_timeout)
+
+
+def _response_cache(config: AppConfig) -> ResponseCache:
+    """The local response cache, tiered over the team cache server if one is configured."""
+    if config.shared_cache_url:
+        return TieredCache(
+            SharedCacheClient(config.shared_cache_url, config.shared_cache_timeout),
+            ttl_hours=config.cache_ttl_hours,
+        )
+    return ResponseCache(ttl_hours=config.cache_ttl_hours)
+
+
 def _strip_markdown_code_blocks(text: str) -> str:
     """
     Clean and extract the actual command from LLM output.
@@ -160,9 +991,114 @@ def _strip_markdown_code_blocks(text: str) -> str:
     return result
 
 
+WARNING_PATTERN = re.compile(r"^[ \t]*#[ \t]*WARNING:?[ \t]*(.*)$", re.IGNORECASE | re.MULTILINE)
+
+
+def _extract_command(text: str) -> Tuple[str, Optional[str]]:
+    """
+    Extract the command and the model's danger warning from LLM output.
+
+    Args:
+        text: Raw text from LLM.
+
+    Returns:
+        Tuple of (clean command without the warning comment, warning text or
+        None if the model did not flag the command as dangerous).
+    """
+    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL | re.IGNORECASE)
+    match = WARNING_PATTERN.search(text)
+    warning = match.group(1).strip() if match else None
+    command = _strip_markdown_code_blocks(WARNING_PATTERN.sub("", text))
+    return command, warning
+
+
 @app.command()
 def gen(
     query: Annotated[str, typer.Argument(help="Natural language query for command generation")],
+    candidates: Annotated[
+        int,
+        typer.Option(
+            "--candidates",
+            "-n",
+            min=1,
+            max=8,
+            help="Generate N candidates concurrently, validate and rank them locally",
+        ),
+    ] = 1,
+    json_output: Annotated[
+        bool,
+        typer.Option(
+            "--json",
+            help="Skip rendering and the prompt; print one JSON record per run (NDJSON)",
+        ),
+    ] = False,
+    execute: Annotated[
+        bool, typer.Option("--exec", help="Execute the command without prompting")
+    ] = False,
+    copy: Annotated[
+        bool, typer.Option("--copy", help="Copy the command to the clipboard without prompting")
+    ] = False,
+    allow_dangerous: Annotated[
+        bool,
+        typer.Option(
+            "--allow-dangerous",
+            help="Let --exec run commands that are flagged dangerous or fail validation",
+        ),
+    ] = False,
+    record: Annotated[
+        Optional[Path],
+        typer.Option("--record", help="Append every streamed response to this cassette file"),
+    ] = None,
+    replay: Annotated[
+        Optional[Path],
+        typer.Option("--replay", help="Serve responses from this cassette instead of the server"),
+    ] = None,
+    replay_speed: Annotated[
+        float,
+        typer.Option(
+            "--replay-speed",
+            min=0,
+            help="Replay speed for --replay: 1 is real time, 0 is instant",
+        ),
+    ] = 1.0,
+    show_reasoning: Annotated[
+        bool,
+        typer.Option("--show-reasoning", help="Print the model's reasoning after the answer"),
+    ] = False,
+    no_cache: Annotated[
+        bool,
+        typer.Option("--no-cache", help="Always ask the model, ignoring cached commands"),
+    ] = False,
+    from_history: Annotated[
+        bool,
+        typer.Option(
+            "--from-history",
+            help="Use a shell history command that covers the request instead of asking the model",
+        ),
+    ] = False,
+    follow_up: Annotated[
+        bool,
+        typer.Option(
+            "--follow-up",
+            "-f",
+            help="Send the last executed command and its output along with this query",
+        ),
+    ] = False,
+    hosts: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--hosts",
+            help="Inventory file: [E]xecute runs the command on every host listed",
+        ),
+    ] = None,
+    fleet_concurrency: Annotated[
+        int,
+        typer.Option("--fleet-concurrency", min=1, max=200, help="Hosts to run on at once"),
+    ] = 10,
+    host_timeout: Annotated[
+        float,
+        typer.Option("--host-timeout", min=0.1, help="Seconds before a host's run is killed"),
+    ] = 30.0,
 ) -> None:
     """
     Generate shell commands from natural language queries.
@@ -174,58 +1110,183 @@ def gen(
     4. Parse and extract code blocks
     5. Prompt user for action (Execute/Copy/Abort)
 
+    With --candidates N, N requests are sent concurrently with varied
+    temperatures and the locally validated best candidate is shown first.
+
+    --exec and --copy act without prompting. --json disables rendering
+    entirely and prints a single-line JSON record with the command, the
+    model's warning, validation results, timings and token usage, for use
+    from scripts and CI.
+
+    --record saves each response with its chunk timings to a cassette, and
+    --replay feeds a cassette back instead of calling the server.
+
+    Commands executed by pop have their output captured in a bounded
+    buffer. --follow-up sends the last command, its exit code and its
+    output, compressed to feedback_token_budget, with the new query, e.g.
+    `pop gen -f "why did that fail?"`.
+
+    With --hosts, [E]xecute fans the command out over an inventory of
+    local, SSH (user@host) and container (docker://name) targets, streams
+    host-prefixed output and ends with a table of exit codes and timings.
+
+    A single-candidate run is answered from the local response cache when
+    the same query was answered for the same environment and model within
+    cache_ttl_hours; --no-cache always asks the model. Every query is added
+    to the local history that `pop cache warm` works from.
+
+    Commands from ~/.bash_history and ~/.zsh_history that match the request
+    are listed before the model answers and offered as alternatives with
+    [N]ext; --from-history uses the best one directly when it covers every
+    word of the request.
+
     Args:
         query: Natural language description of the desired command.
+        candidates: Number of candidates to generate.
+        json_output: Print a JSON record instead of rendering.
+        execute: Execute without prompting.
+        copy: Copy to the clipboard without prompting.
+        allow_dangerous: Allow --exec for flagged or invalid commands.
+        record: Cassette file to record responses to.
+        replay: Cassette file to replay responses from.
+        replay_speed: Replay speed multiplier.
+        show_reasoning: Print the model's reasoning after the answer.
+        no_cache: Bypass the response cache.
+        from_history: Answer from shell history when a command covers the request.
+        follow_up: Include the last execution in the request.
+        hosts: Inventory file to execute on.
+        fleet_concurrency: Hosts to run on at once.
+        host_timeout: Per-host timeout in seconds.
     """
+    if execute and copy:
+        raise typer.BadParameter("--exec and --copy cannot be combined.")
+    if record and replay:
+        raise typer.BadParameter("--record and --replay cannot be combined.")
+    if follow_up and candidates > 1:
+        raise typer.BadParameter("--follow-up and --candidates cannot be combined.")
+    preset_action = "E" if execute else "C" if copy else None
+
     # Load config and initialize client
     try:
         config = config_manager.get()
-        client = ParallaxClient(config)
-    except ValueError as e:
-        console.print(f"[bold red]Configuration Error:[/bold red] {e}")
+        client = _create_client(config, record, replay, replay_speed, prewarm=True)
+        fleet = (
+            Fleet(load_inventory(hosts), fleet_concurrency, host_timeout)
+            if hosts is not None
+            else None
+        )
+    except (ValueError, OSError) as e:
+        if json_output:
+            _emit_json({"query": query, "error": f"Configuration Error: {e}"})
+        else:
+            console.print(f"[bold red]Configuration Error:[/bold red] {e}")
         raise typer.Exit(code=1)
 
+    # Connect while the local work below runs; a cache hit cancels it
+    client.prewarm()
+    if client.model_notice:
+        config = client.config
+        if not json_output:
+            console.print(f"[yellow]⚠ {client.model_notice}[/yellow]")
+
+    last_run = None
+    if follow_up:
+        last_run = LastRunStore().load()
+        if last_run is None:
+            message = "Nothing to follow up on: no command has been executed yet."
+            if json_output:
+                _emit_json({"query": query, "error": message})
+            else:
+                console.print(f"[bold red]{message}[/bold red]")
+            raise typer.Exit(code=1)
+        if not json_output:
+            console.print(
+                f"[dim]Following up on `{last_run.command}` (exit {last_run.exit_code})[/dim]"
+            )
+
     # Get system info
     system_info = get_system_info()
+    if last_run is None:
+        QueryHistory().record(query, system_info, config.model)
+    # Cassette runs must reach the client and follow-ups depend on the last
+    # run, so neither uses the cache
+    cache = (
+        None
+        if no_cache or record or replay or candidates > 1 or last_run is not None
+        else _response_cache(config)
+    )
 
-    # Stream the response
-    accumulated_command = ""
-    first_chunk = True
-    in_reasoning_tag = False
-    reasoning_buffer = ""
+    if json_output:
+        _gen_json(
+            client,
+            config,
+            query,
+            system_info,
+            candidates,
+            preset_action,
+            allow_dangerous,
+            cache,
+            fleet,
+            last_run,
+        )
+        return
 
-    try:
-        with console.status("[bold yellow]Thinking...", spinner="dots"):
-            for chunk in client.generate_command_stream(query, system_info):
-                accumulated_command += chunk
-                
-                # Check if we're entering a reasoning tag
-                chunk_lower = chunk.lower()
-                if "<think>" in chunk_lower or "<think>" in chunk_lower:
-                    in_reasoning_tag = True
-                    reasoning_buffer = ""
-                    continue
-                
-                # Check if we're exiting a reasoning tag
-                if in_reasoning_tag:
-                    reasoning_buffer += chunk
-                    if "</think>" in chunk_lower or "</think>" in chunk_lower or "</think>" in chunk_lower:
-                        in_reasoning_tag = False
-                        reasoning_buffer = ""
-                    continue
-                
-                # Only print chunks that are not in reasoning tags
-                if not in_reasoning_tag:
-                    if first_chunk:
-                        # Clear the status spinner and start printing
-                        console.print()  # New line after spinner
-                        first_chunk = False
-                    
-                    # Print chunk in real-time with yellow color
-                    console.print(chunk, style="yellow", end="")
+    if candidates > 1:
+        ranked = _generate_ranked_candidates(client, query, system_info, candidates)
+        if not ranked[0].validation.ok:
+            # Even the best candidate failed validation: repair it
+            ranked[0].validation = _validate_and_repair(
+                client, config, query, system_info, ranked[0].command
+            )
+        _choose_and_act(ranked, config, preset_action, allow_dangerous, fleet, query)
+        return
 
-        console.print()  # New line after streaming
+    structured = config.structured_output and last_run is None
+    cached = cache.get(query, system_info, config.model, structured) if cache else None
+    if cached is not None:
+        validation = validate_command(_cached_text(cached), get_shell_path())
+        if validation.ok:
+            client.cancel_prewarm()
+            console.print(
+                f"[dim]Cached {_format_age(cached.age)} ago; use --no-cache to regenerate.[/dim]"
+            )
+            action = preset_action
+            if cached.from_shared and action == "E":
+                # Anyone who can reach the team cache server can store commands
+                console.print("[yellow]From the team cache; confirm before it runs.[/yellow]")
+                action = None
+            _choose_and_act(
+                [RankedCandidate(validation)], config, action, allow_dangerous, fleet, query
+            )
+            return
+
+    # Shell history answers before the model does; cassettes and follow-ups skip it
+    from_shell: List[RankedCandidate] = []
+    if not (record or replay or last_run is not None):
+        from_shell = _shell_history_candidates(config, query, strong_only=from_history)
+    if from_history:
+        if from_shell:
+            client.cancel_prewarm()
+            console.print(
+                "[dim]From your shell history; drop --from-history to ask the model.[/dim]"
+            )
+            _choose_and_act(from_shell, config, preset_action, allow_dangerous, fleet, query)
+            return
+        console.print("[dim]No shell history command covers the request; asking the model.[/dim]")
+    elif from_shell:
+        console.print("[dim]From your shell history ([N]ext to pick one):[/dim]")
+        for candidate in from_shell:
+            console.print(Text(f"  {candidate.command}", style="cyan"))
 
+    # Stream the response
+    try:
+        if last_run is not None:
+            stream = _followup_stream(client, config, query, system_info, last_run)
+        elif structured:
+            stream = client.generate_structured_stream(query, system_info)
+        else:
+            stream = client.generate_command_stream(query, system_info)
+        accumulated_command = _render_stream(stream, show_reasoning)
     except ParallaxConnectionError as e:
         console.print(f"[bold red]Connection Error:[/bold red] {e.message}")
         raise typer.Exit(code=1)
@@ -234,52 +1295,936 @@ def gen(
         console.print("[bold red]No command generated.[/bold red]")
         raise typer.Exit(code=1)
 
-    # Post-processing: strip markdown code blocks
-    clean_command = _strip_markdown_code_blocks(accumulated_command)
+    # Post-processing: strip markdown code blocks, unless the answer was parsed JSON
+    parsed = client.last_structured if structured else None
+    clean_command = parsed.text if parsed else _strip_markdown_code_blocks(accumulated_command)
 
     if not clean_command:
         console.print("[bold red]Generated command is empty after processing.[/bold red]")
         raise typer.Exit(code=1)
 
-    # Show the final clean command in a panel
-    console.print()
-    console.print(
-        Panel(
-            clean_command,
-            title="[bold green]Generated Command[/bold green]",
-            border_style="green",
+    validation = _validate_and_repair(client, config, query, system_info, clean_command)
+    if cache is not None and validation.ok:
+        if client.model_notice:
+            config = client.config
+        command, warning = _extract_command(validation.command)
+        cache.store(query, system_info, config.model, command, warning, structured)
+    ranked = [RankedCandidate(validation)]
+    ranked += [c for c in from_shell if c.command != validation.command]
+    _choose_and_act(ranked, config, preset_action, allow_dangerous, fleet, query)
+
+
+def _shell_history_candidates(
+    config: AppConfig, query: str, strong_only: bool = False
+) -> List[RankedCandidate]:
+    """
+    Valid commands from the user's shell history that match a query, best first.
+
+    Args:
+        config: Application configuration.
+        query: Natural language query.
+        strong_only: Only return the best match, and only if it covers the whole query.
+
+    Returns:
+        Candidates whose votes are the number of times the command was run.
+    """
+    if config.shell_history_matches <= 0:
+        return []
+    index = ShellHistoryIndex()
+    index.refresh()
+    matches = [m for m in index.search(query, config.shell_history_matches) if m.relevant]
+    if strong_only:
+        matches = [m for m in matches[:1] if m.strong]
+    shell = get_shell_path()
+    candidates = []
+    for match in matches:
+        validation = validate_command(match.command, shell)
+        if validation.ok:
+            candidates.append(RankedCandidate(validation, votes=match.count, source="history"))
+    return candidates
+
+
+def _followup_stream(
+    client: ParallaxClient,
+    config: AppConfig,
+    query: str,
+    system_info: str,
+    last_run: LastRun,
+) -> Iterator[str]:
+    """Stream a follow-up request with the last run's output compressed to the budget."""
+    budget = config.feedback_token_budget
+    output = compress_output(last_run.output, budget) if budget else "(output not captured)"
+    return client.followup_stream(
+        query, system_info, last_run.query, last_run.command, last_run.exit_code, output
+    )
+
+
+def _cached_text(entry: CacheEntry) -> str:
+    """Command text of a cache entry, with the model's warning comment restored."""
+    if entry.warning:
+        return f"# WARNING: {entry.warning}\n{entry.command}"
+    return entry.command
+
+
+def _format_age(seconds: float) -> str:
+    """Format an age as a short human-readable duration."""
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 86400:
+        return f"{seconds / 3600:.0f}h"
+    return f"{seconds / 86400:.0f}d"
+
+
+def _create_client(
+    config: AppConfig,
+    record: Optional[Path] = None,
+    replay: Optional[Path] = None,
+    replay_speed: float = 1.0,
+    prewarm: bool = False,
+) -> ParallaxClient:
+    """
+    Create the client for a run, recording or replaying if requested.
+
+    The configured model is checked against the cached model catalog, with
+    no network call, and replaced by a served fallback model if needed; the
+    client's model_notice explains any switch. A stale catalog is refreshed
+    in the background, unless prewarm says the caller will call
+    client.prewarm(), whose warm-up request fetches the same list.
+
+    Raises:
+        ValueError: If the configuration or the replay cassette is invalid.
+    """
+    if replay is not None:
+        return ReplayClient(config, Cassette.load(replay), speed=replay_speed)
+
+    model, notice = resolve_model(
+        config.api_base,
+        config.api_key,
+        config.model,
+        config.fallback_models,
+        refresh=not prewarm,
+    )
+    if model != config.model:
+        config = config.model_copy(update={"model": model})
+    client = RecordingClient(config, record) if record is not None else ParallaxClient(config)
+    client.model_notice = notice
+    # Recordings must not depend on local example history or docs
+    if record is None and config.fewshot_examples > 0:
+        client.example_selector = _example_selector(config)
+    if record is None and config.docs_token_budget > 0:
+        docs = DocsIndex()
+        client.docs_selector = lambda query: docs.lookup(query, config.docs_token_budget)
+    return client
+
+
+def _example_selector(config: AppConfig) -> Callable[[str], List[Tuple[str, str]]]:
+    """
+    Build the callable the client uses to pick few-shot examples.
+
+    The index is built on first use, so runs that never reach the model
+    (cache hits, replays) never read the example files.
+    """
+    index: List[FewShotIndex] = []
+
+    def select(query: str) -> List[Tuple[str, str]]:
+        if not index:
+            index.append(ExampleStore().build_index())
+        examples = select_examples(
+            index[0], query, config.fewshot_examples, config.fewshot_token_budget
         )
+        return [(example.query, example.command) for example in examples]
+
+    return select
+
+
+def _emit_json(record: Dict[str, Any]) -> None:
+    """Print a record as a single JSON line."""
+    typer.echo(json.dumps(record, ensure_ascii=False))
+
+
+def _gen_json(
+    client: ParallaxClient,
+    config: AppConfig,
+    query: str,
+    system_info: str,
+    candidates: int,
+    action: Optional[str],
+    allow_dangerous: bool,
+    cache: Optional[ResponseCache] = None,
+    fleet: Optional[Fleet] = None,
+    last_run: Optional[LastRun] = None,
+) -> None:
+    """
+    Non-interactive generation that prints one JSON record and nothing else.
+
+    Args:
+        client: Parallax client.
+        config: Application configuration.
+        query: Natural language query.
+        system_info: System information from get_system_info().
+        candidates: Number of candidates to generate.
+        action: "E" to execute, "C" to copy, or None to only report.
+        allow_dangerous: Allow executing flagged or invalid commands.
+        cache: Response cache to answer from and fill, or None.
+        fleet: Hosts to execute on instead of this machine, or None.
+        last_run: Execution to follow up on, or None.
+    """
+    record: Dict[str, Any] = {
+        "query": query,
+        "model": config.model,
+        "prompt_layout": PROMPT_LAYOUT_VERSION,
+    }
+    if last_run is not None:
+        record["follow_up"] = {"command": last_run.command, "exit_code": last_run.exit_code}
+    start = time.perf_counter()
+    ttft_ms: Optional[float] = None
+    usage: Optional[Dict[str, int]] = None
+    structured = config.structured_output and last_run is None and candidates == 1
+    cached = cache.get(query, system_info, config.model, structured) if cache else None
+    if cached is not None and cached.from_shared and action == "E":
+        # Nobody confirms what runs here, and the team cache server takes
+        # entries from anyone who can reach it: ask the model instead
+        cached = None
+
+    try:
+        if cached is not None:
+            client.cancel_prewarm()
+            outputs = [_cached_text(cached)]
+        elif candidates > 1:
+            outputs = client.generate_candidates(query, system_info, candidates)
+        else:
+            processor = StreamProcessor()
+            if last_run is not None:
+                stream = _followup_stream(client, config, query, system_info, last_run)
+            elif structured:
+                stream = client.generate_structured_stream(query, system_info)
+            else:
+                stream = client.generate_command_stream(query, system_info)
+            with closing_stream(stream) as chunks:
+                for chunk in chunks:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                    processor.feed(chunk)
+            processor.finish()
+            parsed = client.last_structured if structured else None
+            outputs = [parsed.text if parsed else processor.text]
+            usage = client.last_usage
+    except ParallaxConnectionError as e:
+        record["error"] = e.message
+        _emit_json(record)
+        raise typer.Exit(code=1)
+    generation_ms = (time.perf_counter() - start) * 1000
+
+    extracted = [_extract_command(output) for output in outputs]
+    warnings = {command: warning for command, warning in extracted if warning}
+    ranked = rank_candidates([command for command, _ in extracted], get_shell_path())
+    if not ranked:
+        record["error"] = "No command generated."
+        _emit_json(record)
+        raise typer.Exit(code=1)
+
+    validation = ranked[0].validation
+    warning = warnings.get(validation.command)
+    if not validation.ok:
+        validation = _validate_and_repair(
+            client, config, query, system_info, validation.command, quiet=True
+        )
+
+    if client.model_notice:
+        # The client may have switched to a fallback model during the request
+        config = client.config
+    if cache is not None and cached is None and validation.ok:
+        cache.store(query, system_info, config.model, validation.command, warning, structured)
+    record.update(
+        {
+            "model": config.model,
+            "model_notice": client.model_notice,
+            "cached": cached is not None,
+            "command": validation.command,
+            "warning": warning,
+            "dangerous": warning is not None,
+            "valid": validation.ok,
+            "validation_error": validation.describe() or None,
+            "repairs": validation.repairs,
+            "cost_warnings": [
+                w.message
+                for w in lint_command(validation.command, budget=config.lint_budget_ms / 1000)
+            ]
+            if config.lint_budget_ms > 0
+            else [],
+            "timings": {
+                "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+                "generation_ms": round(generation_ms, 1),
+                "total_ms": round((time.perf_counter() - start) * 1000, 1),
+            },
+            "usage": usage,
+        }
     )
+    if candidates > 1:
+        record["candidates"] = [
+            {"command": c.command, "valid": c.validation.ok, "votes": c.votes} for c in ranked
+        ]
+
+    if action == "C":
+        try:
+            pyperclip.copy(validation.command)
+            record["copied"] = True
+        except Exception as e:
+            record["copied"] = False
+            record["error"] = f"Error copying to clipboard: {e}"
+    elif action == "E":
+        if not allow_dangerous and (warning is not None or not validation.ok):
+            record["error"] = "Refusing to execute a flagged or invalid command without --allow-dangerous."
+            _emit_json(record)
+            raise typer.Exit(code=2)
+        if fleet is not None:
+            results = fleet.run(validation.command)
+            record["hosts"] = [
+                {
+                    "host": r.host,
+                    "exit_code": r.exit_code,
+                    "duration_ms": round(r.duration * 1000, 1),
+                    "timed_out": r.timed_out,
+                    "error": r.error,
+                    "output": "\n".join(r.output),
+                }
+                for r in results
+            ]
+            _emit_json(record)
+            raise typer.Exit(code=0 if all(r.ok for r in results) else 1)
+        try:
+            process = subprocess.Popen(
+                validation.command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError as e:
+            record["error"] = f"Error executing command: {e}"
+            _emit_json(record)
+            raise typer.Exit(code=1)
+        # Bounded like the interactive path, since the record holds all output
+        stdout, stderr, combined = OutputBuffer(), OutputBuffer(), OutputBuffer()
+
+        def capture(buffer: OutputBuffer) -> Callable[[str], None]:
+            def feed(text: str) -> None:
+                buffer.feed(text)
+                combined.feed(text)
+
+            return feed
+
+        returncode = _pump_process(process, capture(stdout), capture(stderr))
+        record.update({"exit_code": returncode, "stdout": stdout.text, "stderr": stderr.text})
+        if config.feedback_token_budget > 0:
+            LastRunStore().save(
+                LastRun(query, validation.command, returncode, combined.text, combined.dropped)
+            )
+        _emit_json(record)
+        raise typer.Exit(code=returncode)
+
+    _emit_json(record)
 
-    # User interaction
-    console.print()
-    action = typer.prompt(
-        "[E]xecute, [C]opy, [A]bort?",
-        default="A",
-        type=str,
-    ).upper()
 
-    if action == "E":
-        # Execute the command
-        console.print("\n[bold yellow]Executing command...[/bold yellow]\n")
+@app.command()
+def plan(
+    query: Annotated[str, typer.Argument(help="Compound request to split into steps")],
+    parallel: Annotated[
+        int,
+        typer.Option(
+            "--parallel", "-p", min=1, max=8, help="Steps generated and run at the same time"
+        ),
+    ] = 4,
+    yes: Annotated[
+        bool, typer.Option("--yes", "-y", help="Run the plan without asking for confirmation")
+    ] = False,
+    allow_dangerous: Annotated[
+        bool,
+        typer.Option(
+            "--allow-dangerous",
+            help="Let --yes run plans with flagged or invalid commands",
+        ),
+    ] = False,
+) -> None:
+    """
+    Split a compound request into steps and run independent steps in parallel.
+
+    The model returns a step list with dependencies. Every step's command is
+    generated concurrently and validated, the whole plan is shown and
+    confirmed once, and then each step runs as soon as the steps it depends
+    on have succeeded. Outputs are shown per step, labelled, in plan order.
+
+    Args:
+        query: Natural language compound request.
+        parallel: Maximum concurrent requests and commands.
+        yes: Skip the confirmation.
+        allow_dangerous: Allow --yes for flagged or invalid commands.
+    """
+    try:
+        config = config_manager.get()
+        client = _create_client(config)
+    except ValueError as e:
+        console.print(f"[bold red]Configuration Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+    if client.model_notice:
+        config = client.config
+        console.print(f"[yellow]⚠ {client.model_notice}[/yellow]")
+
+    system_info = get_system_info()
+    QueryHistory().record(query, system_info, config.model)
+    cache = _response_cache(config)
+    shell = get_shell_path()
+
+    try:
+        with console.status("[bold yellow]Planning...", spinner="dots"):
+            processor = StreamProcessor()
+            with closing_stream(client.plan_stream(query, system_info)) as chunks:
+                for chunk in chunks:
+                    processor.feed(chunk)
+            processor.finish()
         try:
-            result = subprocess.run(
-                clean_command,
-                shell=True,
-                check=False,  # Don't raise on non-zero exit
+            steps = parse_plan(processor.text)
+        except PlanError as e:
+            console.print(
+                f"[yellow]⚠ Could not use the plan ({e}); running it as one step.[/yellow]"
             )
-            console.print(f"\n[bold]Exit code:[/bold] {result.returncode}")
-        except Exception as e:
-            console.print(f"[bold red]Error executing command:[/bold red] {e}")
+            steps = [PlanStep(id="step1", task=query)]
+
+        def generate(task: str) -> Tuple[str, Optional[str]]:
+            cached = cache.get(task, system_info, config.model)
+            # With --yes nobody reviews the plan, so team cache entries are not used
+            if cached is not None and not (yes and cached.from_shared):
+                return cached.command, cached.warning
+            command, warning = _extract_command(client.generate_command(task, system_info))
+            if not command:
+                raise ValueError("No command generated.")
+            if validate_command(command, shell).ok:
+                cache.store(task, system_info, config.model, command, warning)
+            return command, warning
+
+        with console.status(
+            f"[bold yellow]Generating {len(steps)} commands...", spinner="dots"
+        ):
+            generate_commands(steps, generate, parallel)
+    except ParallaxConnectionError as e:
+        console.print(f"[bold red]Connection Error:[/bold red] {e.message}")
+        raise typer.Exit(code=1)
+
+    validations = {
+        step.id: validate_command(step.command, shell) for step in steps if step.command
+    }
+    table = Table(title="Plan")
+    table.add_column("Step", style="cyan")
+    table.add_column("Task")
+    table.add_column("Command", style="yellow")
+    table.add_column("After", style="dim")
+    flagged = False
+    for step in steps:
+        notes = []
+        if step.error:
+            notes.append(f"[red]✗ {step.error}[/red]")
+        elif not validations[step.id].ok:
+            notes.append(f"[red]✗ {validations[step.id].describe()}[/red]")
+        if step.warning:
+            notes.append(f"[bold red]⚠ {step.warning}[/bold red]")
+        flagged = flagged or bool(notes)
+        table.add_row(
+            step.id,
+            step.task,
+            "\n".join([step.command or "-", *notes]),
+            ", ".join(step.depends_on) or "-",
+        )
+    console.print(table)
+
+    runnable = [step for step in steps if step.command]
+    if not runnable:
+        console.print("[bold red]No commands generated.[/bold red]")
+        raise typer.Exit(code=1)
+    if yes:
+        if flagged and not allow_dangerous:
+            console.print(
+                "[bold red]Refusing to run a plan with flagged or invalid commands "
+                "without --allow-dangerous.[/bold red]"
+            )
+            raise typer.Exit(code=2)
+    elif not typer.confirm(f"Run {len(runnable)} commands?", default=False):
+        console.print("[dim]Aborted.[/dim]")
+        return
+
+    def report_step(step: PlanStep) -> None:
+        if step.state == SKIPPED:
+            console.print(f"[dim]- {step.id}: skipped[/dim]")
+        else:
+            mark = "[green]✓[/green]" if step.state == OK else "[red]✗[/red]"
+            console.print(f"{mark} {step.id} [dim]({step.duration:.1f}s)[/dim]")
+
+    start = time.perf_counter()
+    ok = execute_plan(steps, parallelism=parallel, on_done=report_step)
+    elapsed = time.perf_counter() - start
+
+    for step in steps:
+        if step.state == SKIPPED:
+            continue
+        style = "green" if step.state == OK else "red"
+        console.print(
+            Panel(
+                step.output.rstrip() or "[dim](no output)[/dim]",
+                title=f"{step.id}: {step.command}",
+                subtitle=f"exit {step.exit_code}",
+                border_style=style,
+            )
+        )
+    failed = sum(1 for step in steps if step.state == FAILED)
+    skipped = sum(1 for step in steps if step.state == SKIPPED)
+    console.print(
+        f"[bold]{len(steps) - failed - skipped}/{len(steps)} steps succeeded[/bold] "
+        f"in {elapsed:.1f}s" + (f", {skipped} skipped" if skipped else "")
+    )
+    if not ok:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def chat(
+    resume: Annotated[
+        Optional[str],
+        typer.Option(
+            "--resume",
+            "-r",
+            help="Resume a saved session by ID, or 'last' for the most recent one",
+        ),
+    ] = None,
+    list_sessions: Annotated[
+        bool, typer.Option("--list", "-l", help="List saved sessions and exit")
+    ] = False,
+) -> None:
+    """
+    Start an interactive session for generating and refining commands.
+
+    One client (and its connection) is reused for the whole session, and the
+    conversation is kept so follow-ups like "only .log files" refine the last
+    command. History is compacted to the chat_history_tokens budget and the
+    session is saved after every turn.
+
+    In the session, type /run to execute the last command, /copy to copy it,
+    and /exit (or Ctrl-D) to leave.
+    """
+    store = SessionStore()
+
+    if list_sessions:
+        sessions = store.list()
+        if not sessions:
+            console.print("[dim]No saved sessions.[/dim]")
+            return
+        table = Table(title="Saved Sessions")
+        table.add_column("ID", style="cyan")
+        table.add_column("Model")
+        table.add_column("Turns", justify="right")
+        table.add_column("Last command", style="yellow", max_width=50)
+        for session in sessions:
+            table.add_row(
+                session.session_id,
+                session.model,
+                str(len(session.turns) // 2),
+                session.last_command or "",
+            )
+        console.print(table)
+        return
+
+    # Load config and initialize the client once for the whole session
+    try:
+        config = config_manager.get()
+        client = _create_client(config)
+    except ValueError as e:
+        console.print(f"[bold red]Configuration Error:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    if client.model_notice:
+        console.print(f"[yellow]⚠ {client.model_notice}[/yellow]")
+        config = client.config
+
+    if resume:
+        try:
+            session = store.load(resume)
+        except ValueError as e:
+            console.print(f"[bold red]Error:[/bold red] {e}")
             raise typer.Exit(code=1)
-    elif action == "C":
-        # Copy to clipboard
+        console.print(
+            f"[dim]Resumed session {session.session_id} "
+            f"({len(session.turns) // 2} turns).[/dim]"
+        )
+    else:
+        session = store.new(get_system_info(), config.model)
+        console.print(f"[dim]Session {session.session_id}. /run, /copy, /exit[/dim]")
+
+    while True:
         try:
-            pyperclip.copy(clean_command)
-            console.print("[bold green]✓ Command copied to clipboard![/bold green]")
-        except Exception as e:
-            console.print(f"[bold red]Error copying to clipboard:[/bold red] {e}")
-            console.print(f"[dim]Command: {clean_command}[/dim]")
+            query = typer.prompt("pop", prompt_suffix="> ").strip()
+        except typer.Abort:
+            console.print()
+            break
+
+        if query in ("/exit", "/quit"):
+            break
+        if query in ("/run", "/copy"):
+            command = session.last_command
+            if command is None:
+                console.print("[dim]No command yet.[/dim]")
+            elif query == "/run":
+                _execute_command(command)
+            else:
+                _copy_command(command)
+            continue
+        if not query:
+            continue
+
+        try:
+            raw_output = _render_stream(client.chat_stream(session.build_messages(query)))
+        except ParallaxConnectionError as e:
+            console.print(f"[bold red]Connection Error:[/bold red] {e.message}")
+            continue
+
+        clean_command = _strip_markdown_code_blocks(raw_output)
+        if not clean_command:
+            console.print("[bold red]No command generated.[/bold red]")
+            continue
+
+        session.add_exchange(query, clean_command)
+        session.compact(config.chat_history_tokens)
+        store.save(session)
+
+        validation = validate_command(clean_command, get_shell_path())
+        _show_command(RankedCandidate(validation), 0, 1, config)
+
+    if session.turns:
+        store.save(session)
+        console.print(f"[dim]Session saved. Resume with: pop chat --resume {session.session_id}[/dim]")
+
+
+def _render_stream(chunks: Iterator[str], show_reasoning: bool = False) -> str:
+    """
+    Show a streamed response live, hiding reasoning tags.
+
+    A spinner is shown until the first visible chunk arrives. Reasoning is
+    not kept in memory; with show_reasoning it is spilled to a temporary file,
+    printed once the stream ends and then deleted.
+
+    Args:
+        chunks: Content chunks from the client.
+        show_reasoning: Print the model's reasoning after the answer.
+
+    Returns:
+        The response without reasoning, for extraction.
+
+    Raises:
+        ParallaxConnectionError: If the connection fails while streaming.
+    """
+    processor = StreamProcessor(spill_reasoning=show_reasoning)
+    first_chunk = True
+
+    try:
+        with closing_stream(chunks) as chunks, console.status(
+            "[bold yellow]Thinking...", spinner="dots"
+        ):
+            for chunk in chunks:
+                visible = processor.feed(chunk)
+                if not visible:
+                    continue
+                if first_chunk:
+                    # Clear the status spinner and start printing
+                    console.print()  # New line after spinner
+                    first_chunk = False
+
+                # Print chunk in real-time with yellow color
+                console.print(visible, style="yellow", end="")
+
+        visible = processor.finish()
+        if visible:
+            console.print(visible, style="yellow", end="")
+
+        console.print()  # New line after streaming
+        if show_reasoning:
+            _show_reasoning(processor)
+        return processor.text
+    finally:
+        processor.close()
+
+
+def _show_reasoning(processor: StreamProcessor) -> None:
+    """Print reasoning spilled to disk by a StreamProcessor, in blocks."""
+    if processor.reasoning_path is None:
+        console.print("[dim]No reasoning in this response.[/dim]")
+        return
+    console.rule(f"[dim]Reasoning ({processor.reasoning_chars} chars)[/dim]")
+    with open(processor.reasoning_path, "r", encoding="utf-8") as f:
+        for block in iter(lambda: f.read(8192), ""):
+            console.print(block, style="dim", end="", markup=False, highlight=False)
+    console.print()
+    console.rule()
+
+
+def _execute_command(command: str) -> int:
+    """
+    Run a command in the user's shell, streaming its output.
+
+    Args:
+        command: The command to run.
+
+    Returns:
+        The command's exit code.
+    """
+    console.print("\n[bold yellow]Executing command...[/bold yellow]\n")
+    try:
+        result = subprocess.run(
+            command,
+            shell=True,
+            check=False,  # Don't raise on non-zero exit
+        )
+        console.print(f"\n[bold]Exit code:[/bold] {result.returncode}")
+        return result.returncode
+    except Exception as e:
+        console.print(f"[bold red]Error executing command:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+
+def _pump_process(
+    process: "subprocess.Popen[bytes]",
+    on_stdout: Callable[[str], None],
+    on_stderr: Callable[[str], None],
+) -> int:
+    """
+    Hand a process's output to callbacks as it arrives, until the process exits.
+
+    Reading stops once the shell has exited and its pipes are drained rather
+    than at EOF: a background job started by the command (`svc &`) inherits
+    the pipes and may hold them open indefinitely. The callbacks are never
+    called concurrently.
+
+    Args:
+        process: Process started with stdout and stderr pipes.
+        on_stdout: Receives decoded stdout text.
+        on_stderr: Receives decoded stderr text.
+
+    Returns:
+        The process's exit code.
+    """
+    lock = threading.Lock()
+    exited = threading.Event()
+
+    def pump(source: Any, sink: Callable[[str], None]) -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        fd = source.fileno()
+        while True:
+            ready, _, _ = select.select([fd], [], [], 0 if exited.is_set() else 0.05)
+            if not ready:
+                if exited.is_set():
+                    break
+                continue
+            data = os.read(fd, 65536)
+            if not data:
+                break
+            with lock:
+                sink(decoder.decode(data))
+        with lock:
+            sink(decoder.decode(b"", final=True))
+        source.close()
+
+    pumps = [
+        threading.Thread(target=pump, args=(process.stdout, on_stdout), daemon=True),
+        threading.Thread(target=pump, args=(process.stderr, on_stderr), daemon=True),
+    ]
+    for thread in pumps:
+        thread.start()
+    returncode = process.wait()
+    exited.set()
+    for thread in pumps:
+        thread.join()
+    return returncode
+
+
+def _execute_captured(command: str, query: str) -> int:
+    """
+    Run a command, showing its output live and keeping it for follow-ups.
+
+    stdout and stderr are passed through as they arrive and also captured
+    into a bounded OutputBuffer, saved with the exit code as the last run.
+
+    Args:
+        command: The command to run.
+        query: The request that produced the command.
+
+    Returns:
+        The command's exit code.
+    """
+    console.print("\n[bold yellow]Executing command...[/bold yellow]\n")
+    try:
+        process = subprocess.Popen(
+            command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except Exception as e:
+        console.print(f"[bold red]Error executing command:[/bold red] {e}")
+        raise typer.Exit(code=1)
+
+    buffer = OutputBuffer()
+
+    def echo(sink: Any) -> Callable[[str], None]:
+        def write(text: str) -> None:
+            buffer.feed(text)
+            sink.write(text)
+            sink.flush()
+
+        return write
+
+    returncode = _pump_process(process, echo(sys.stdout), echo(sys.stderr))
+
+    LastRunStore().save(LastRun(query, command, returncode, buffer.text, buffer.dropped))
+    console.print(f"\n[bold]Exit code:[/bold] {returncode}")
+    if returncode:
+        console.print('[dim]Ask about it: pop gen -f "why did that fail?"[/dim]')
+    return returncode
+
+
+def _execute_fleet(command: str, fleet: Fleet) -> int:
+    """
+    Run a command on every host of a fleet, streaming host-prefixed output.
+
+    Args:
+        command: The command to run.
+        fleet: Hosts and limits.
+
+    Returns:
+        0 if every host succeeded, 1 otherwise.
+    """
+    width = max(len(target.name) for target in fleet.targets)
+
+    def show_line(host: str, line: str) -> None:
+        console.print(
+            Text.assemble((f"{host:<{width}} | ", "cyan"), line), highlight=False, soft_wrap=True
+        )
+
+    console.print(
+        f"\n[bold yellow]Executing on {len(fleet.targets)} hosts "
+        f"({fleet.concurrency} at a time)...[/bold yellow]\n"
+    )
+    results = fleet.run(command, on_line=show_line)
+    _show_fleet_summary(results)
+    return 0 if all(result.ok for result in results) else 1
+
+
+def _show_fleet_summary(results: List[HostResult]) -> None:
+    """Print a table of exit codes and timings per host."""
+    table = Table(title="Fleet Summary")
+    table.add_column("Host", style="cyan")
+    table.add_column("Exit", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("Status")
+    for result in results:
+        if result.ok:
+            status = "[green]✓ ok[/green]"
+        elif result.error:
+            status = f"[red]✗ {result.error}[/red]"
+        else:
+            status = "[red]✗ failed[/red]"
+        table.add_row(
+            result.host,
+            "-" if result.exit_code is None else str(result.exit_code),
+            f"{result.duration:.2f}s",
+            status,
+        )
+    console.print(table)
+    failed = sum(1 for result in results if not result.ok)
+    console.print(f"[bold]{len(results) - failed}/{len(results)} hosts succeeded[/bold]")
+
+
+def _copy_command(command: str) -> None:
+    """
+    Copy a command to the clipboard, printing it if that fails.
+
+    Args:
+        command: The command to copy.
+    """
+    try:
+        pyperclip.copy(command)
+        console.print("[bold green]✓ Command copied to clipboard![/bold green]")
+    except Exception as e:
+        console.print(f"[bold red]Error copying to clipboard:[/bold red] {e}")
+        console.print(f"[dim]Command: {command}[/dim]")
+
+
+def _choose_and_act(
+    ranked: List[RankedCandidate],
+    config: AppConfig,
+    preset_action: Optional[str] = None,
+    allow_dangerous: bool = False,
+    fleet: Optional[Fleet] = None,
+    query: str = "",
+) -> None:
+    """
+    Show the ranked commands and run the action the user picks.
+
+    The best candidate is shown first; [N]ext cycles through the alternatives.
+
+    Args:
+        ranked: Candidates, best first.
+        config: Application configuration.
+        preset_action: "E" or "C" to act on the best candidate without prompting.
+        allow_dangerous: Allow a preset "E" for flagged or invalid commands.
+        fleet: Hosts to execute on instead of this machine, or None.
+        query: The request, recorded with the captured output for follow-ups.
+    """
+
+    def execute(command: str) -> int:
+        if fleet is not None:
+            return _execute_fleet(command, fleet)
+        if config.feedback_token_budget > 0:
+            return _execute_captured(command, query)
+        return _execute_command(command)
+
+    execute_label = "[E]xecute" if fleet is None else f"[E]xecute on {len(fleet.targets)} hosts"
+    index = 0
+    while True:
+        candidate = ranked[index]
+        clean_command = candidate.command
+        _show_command(candidate, index, len(ranked), config)
+
+        if preset_action is not None:
+            action = preset_action
+            break
+
+        # User interaction
+        console.print()
+        choices = f"{execute_label}, [C]opy, [A]bort?"
+        if len(ranked) > 1:
+            choices = f"{execute_label}, [C]opy, [N]ext, [A]bort?"
+        action = typer.prompt(
+            choices,
+            default="A",
+            type=str,
+        ).upper()
+
+        if action == "N" and len(ranked) > 1:
+            index = (index + 1) % len(ranked)
+            continue
+        break
+
+    if action == "E" and preset_action is not None:
+        # No human in the loop: only run commands that are neither flagged nor invalid
+        if not allow_dangerous and (
+            WARNING_PATTERN.search(clean_command) or not candidate.validation.ok
+        ):
+            console.print(
+                "[bold red]Refusing to execute a flagged or invalid command "
+                "without --allow-dangerous.[/bold red]"
+            )
+            raise typer.Exit(code=2)
+        exit_code = execute(clean_command)
+        if exit_code:
+            raise typer.Exit(code=exit_code)
+        _remember_example(config, query, candidate)
+    elif action == "E":
+        if execute(clean_command) == 0:
+            _remember_example(config, query, candidate)
+    elif action == "C":
+        _copy_command(clean_command)
+        _remember_example(config, query, candidate)
     elif action == "A":
         console.print("[dim]Aborted.[/dim]")
     else:
@@ -287,6 +2232,176 @@ def gen(
         raise typer.Exit(code=1)
 
 
+def _remember_example(config: AppConfig, query: str, candidate: RankedCandidate) -> None:
+    """Keep an accepted command as a few-shot example for similar requests."""
+    if not query or config.fewshot_examples <= 0:
+        return
+    if WARNING_PATTERN.search(candidate.command) or not candidate.validation.ok:
+        return
+    ExampleStore().record(query, candidate.command)
+
+
+def _validate_and_repair(
+    client: ParallaxClient,
+    config: AppConfig,
+    query: str,
+    system_info: str,
+    command: str,
+    quiet: bool = False,
+) -> ValidationResult:
+    """
+    Validate a command and, if it fails, ask the model to repair it.
+
+    Repair round trips are bounded by config.repair_attempts and
+    config.repair_timeout. The outcome is recorded in RepairStats so that
+    repair rates can be compared across models.
+
+    Args:
+        client: Parallax client.
+        config: Application configuration.
+        query: The original natural language query.
+        system_info: System information from get_system_info().
+        command: The extracted command.
+        quiet: Render nothing (for --json).
+
+    Returns:
+        Validation result of the first valid command, or of the original
+        command if no repair succeeded.
+    """
+    shell = get_shell_path()
+    original = validate_command(command, shell)
+    latest = original
+    attempts = 0
+    deadline = time.monotonic() + config.repair_timeout
+
+    while (
+        not latest.ok
+        and attempts < config.repair_attempts
+        and time.monotonic() < deadline
+    ):
+        attempts += 1
+        if not quiet:
+            console.print(
+                f"[yellow]⚠ {latest.describe()}[/yellow] "
+                f"[dim](repair {attempts}/{config.repair_attempts})[/dim]"
+            )
+        processor = StreamProcessor()
+        timed_out = False
+        status = (
+            contextlib.nullcontext()
+            if quiet
+            else console.status("[bold yellow]Repairing...", spinner="dots")
+        )
+        try:
+            with status, closing_stream(
+                client.repair_command_stream(query, system_info, latest.command, latest.describe())
+            ) as chunks:
+                for chunk in chunks:
+                    processor.feed(chunk)
+                    if time.monotonic() >= deadline:
+                        timed_out = True
+                        break
+        except ParallaxConnectionError as e:
+            if not quiet:
+                console.print(f"[bold red]Connection Error:[/bold red] {e.message}")
+            break
+
+        processor.finish()
+        repaired_command = _strip_markdown_code_blocks(processor.text)
+        if timed_out or not repaired_command:
+            break
+        latest = validate_command(repaired_command, shell)
+
+    RepairStats().record(
+        config.model,
+        needed_repair=not original.ok,
+        repaired=not original.ok and latest.ok,
+        attempts=attempts,
+    )
+    if latest.ok:
+        latest.repairs = attempts
+        return latest
+    original.repairs = attempts
+    return original
+
+
+def _generate_ranked_candidates(
+    client: ParallaxClient, query: str, system_info: str, count: int
+) -> List[RankedCandidate]:
+    """
+    Generate candidates concurrently, then validate and rank them locally.
+
+    Args:
+        client: Parallax client.
+        query: Natural language query.
+        system_info: System information from get_system_info().
+        count: Number of candidates to request.
+
+    Returns:
+        Ranked candidates, best first.
+    """
+    try:
+        with console.status(
+            f"[bold yellow]Generating {count} candidates...", spinner="dots"
+        ):
+            outputs = client.generate_candidates(query, system_info, count)
+    except ParallaxConnectionError as e:
+        console.print(f"[bold red]Connection Error:[/bold red] {e.message}")
+        raise typer.Exit(code=1)
+
+    commands = [_strip_markdown_code_blocks(output) for output in outputs]
+    ranked = rank_candidates(commands, get_shell_path())
+    if not ranked:
+        console.print("[bold red]No command generated.[/bold red]")
+        raise typer.Exit(code=1)
+    return ranked
+
+
+def _show_command(
+    candidate: RankedCandidate, index: int, total: int, config: AppConfig
+) -> None:
+    """
+    Show a generated command in a panel, followed by any cost warnings.
+
+    Args:
+        candidate: The command with its validation result.
+        index: Position of the candidate in the ranking.
+        total: Number of ranked candidates.
+        config: Application configuration.
+    """
+    title = "[bold green]Generated Command[/bold green]"
+    subtitle = None
+    problems = candidate.validation.describe()
+    if total > 1:
+        title = f"[bold green]Generated Command ({index + 1}/{total})[/bold green]"
+        subtitle = f"[green]✓ valid[/green] · {candidate.votes} vote(s)"
+    if candidate.source == "history":
+        title = "[bold cyan]From Shell History[/bold cyan]"
+        if total > 1:
+            title = f"[bold cyan]From Shell History ({index + 1}/{total})[/bold cyan]"
+        subtitle = f"[cyan]run {candidate.votes} time(s)[/cyan]"
+    if problems:
+        subtitle = f"[red]{problems}[/red]"
+
+    # Show the final clean command in a panel
+    console.print()
+    console.print(
+        Panel(
+            candidate.command,
+            title=title,
+            subtitle=subtitle,
+            border_style="green" if candidate.validation.ok else "yellow",
+        )
+    )
+
+    # Flag expensive patterns before offering to execute
+    if config.lint_budget_ms > 0:
+        for warning in lint_command(candidate.command, budget=config.lint_budget_ms / 1000):
+            console.print(f"[bold yellow]⚠ Cost:[/bold yellow] {warning.message}")
+            if warning.suggestion:
+                console.print(f"  [dim]Cheaper:[/dim] {warning.suggestion}")
+
+
 def main() -> None:
     """Entry point for the CLI application."""
     app()
@@ -0,0 +1,180 @@
+"""Discovery of served models with a TTL cache and fallback selection."""
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from openai import OpenAI
+
+from .utils import get_cache_dir, read_json, write_json_atomic
+
+# Seconds before the cached model list is refreshed
+MODEL_CACHE_TTL = 600.0
+
+# Timeout in seconds for fetching the model list
+FETCH_TIMEOUT = 5.0
+
+
+def fetch_models(api_base: str, api_key: str, timeout: float = FETCH_TIMEOUT) -> List[str]:
+    """
+    Query an endpoint's /models list.
+
+    Args:
+        api_base: Server base URL.
+        api_key: API key.
+        timeout: Request timeout in seconds.
+
+    Returns:
+        Model IDs, sorted.
+
+    Raises:
+        OpenAIError: If the request fails.
+    """
+    client = OpenAI(base_url=api_base, api_key=api_key, timeout=timeout, max_retries=0)
+    return sorted(model.id for model in client.models.list())
+
+
+class ModelCatalog:
+    """Models served by each endpoint, cached on disk with a TTL."""
+
+    def __init__(self, path: Optional[Path] = None, ttl: float = MODEL_CACHE_TTL) -> None:
+        """
+        Initialize the catalog.
+
+        Args:
+            path: Path to the JSON cache file. If None, uses the cache directory.
+            ttl: Seconds before a cached list counts as stale.
+        """
+        self.path = path or get_cache_dir() / "models.json"
+        self.ttl = ttl
+
+    def _entry(self, api_base: str) -> Optional[Dict]:
+        """Raw cache entry for an endpoint."""
+        data = read_json(self.path, {})
+        entry = data.get(api_base) if isinstance(data, dict) else None
+        if not isinstance(entry, dict) or not isinstance(entry.get("models"), list):
+            return None
+        return entry
+
+    def cached(self, api_base: str, allow_stale: bool = False) -> Optional[List[str]]:
+        """
+        Cached model list for an endpoint, without any network call.
+
+        Args:
+            api_base: Server base URL.
+            allow_stale: Return the list even if the TTL has passed.
+
+        Returns:
+            Model IDs, or None if nothing (fresh enough) is cached.
+        """
+        entry = self._entry(api_base)
+        if entry is None:
+            return None
+        if not allow_stale and self.is_stale(api_base):
+            return None
+        return entry["models"]
+
+    def is_stale(self, api_base: str) -> bool:
+        """Whether the endpoint's list is missing or older than the TTL."""
+        entry = self._entry(api_base)
+        return entry is None or time.time() - entry.get("fetched_at", 0) > self.ttl
+
+    def store(self, api_base: str, models: List[str]) -> None:
+        """Cache a model list for an endpoint."""
+        data = read_json(self.path, {})
+        if not isinstance(data, dict):
+            data = {}
+        data[api_base] = {"fetched_at": time.time(), "models": models}
+        try:
+            write_json_atomic(self.path, data)
+        except OSError:
+            pass
+
+    def refresh(self, api_base: str, api_key: str) -> List[str]:
+        """
+        Fetch and cache an endpoint's model list.
+
+        Raises:
+            OpenAIError: If the request fails.
+        """
+        models = fetch_models(api_base, api_key)
+        self.store(api_base, models)
+        return models
+
+    def refresh_in_background(self, api_base: str, api_key: str) -> threading.Thread:
+        """
+        Refresh a stale list without blocking the caller.
+
+        Failures are ignored; the stale list stays in place.
+
+        Returns:
+            The started daemon thread.
+        """
+
+        def run() -> None:
+            try:
+                self.refresh(api_base, api_key)
+            except Exception:
+                # Best-effort: the next invocation simply tries again
+                pass
+
+        thread = threading.Thread(target=run, name="pop-model-refresh", daemon=True)
+        thread.start()
+        return thread
+
+
+def select_model(
+    model: str, fallbacks: List[str], served: Optional[List[str]]
+) -> Tuple[str, Optional[str]]:
+    """
+    Pick the model to request, given what the endpoint is known to serve.
+
+    Args:
+        model: Configured model.
+        fallbacks: Configured fallback models, in order of preference.
+        served: Models the endpoint serves, or None if unknown.
+
+    Returns:
+        Tuple of (model to use, notice explaining a switch or a problem, or
+        None if the configured model is fine or nothing is known).
+    """
+    if not served or model in served:
+        return model, None
+    for fallback in fallbacks:
+        if fallback in served:
+            return fallback, f"Model '{model}' is not served; using fallback '{fallback}'."
+    return model, f"Model '{model}' is not in the served list: {', '.join(served)}"
+
+
+def resolve_model(
+    api_base: str,
+    api_key: str,
+    model: str,
+    fallbacks: List[str],
+    catalog: Optional[ModelCatalog] = None,
+    refresh: bool = True,
+) -> Tuple[str, Optional[str]]:
+    """
+    Validate the configured model against the cached catalog.
+
+    This is the fast path: it never waits on the network. A stale cache is
+    still used, and refreshed in the background for the next invocation
+    unless the caller refreshes it another way.
+
+    Args:
+        api_base: Server base URL.
+        api_key: API key.
+        model: Configured model.
+        fallbacks: Configured fallback models.
+        catalog: Model catalog. If None, uses the default location.
+        refresh: Refresh a stale list in the background. Pass False when a
+            ParallaxClient.prewarm() will fetch the list anyway.
+
+    Returns:
+        Same as select_model().
+    """
+    catalog = catalog or ModelCatalog()
+    served = catalog.cached(api_base, allow_stale=True)
+    if refresh and catalog.is_stale(api_base):
+        catalog.refresh_in_background(api_base, api_key)
+    return select_model(model, fallbacks, served)
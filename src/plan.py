@@ -0,0 +1,231 @@
+"""Plan mode: compound requests as a DAG of single-command steps."""
+import json
+import re
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Upper bound on steps accepted from the model
+MAX_STEPS = 12
+
+# Step states
+PENDING = "pending"
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Generate a (command, warning) pair for a task; raises on failure
+Generator = Callable[[str], Tuple[str, Optional[str]]]
+
+# Run a command and return (exit code, combined output)
+Runner = Callable[[str], Tuple[int, str]]
+
+
+class PlanError(ValueError):
+    """The model's plan is malformed, inconsistent or cyclic."""
+
+
+@dataclass
+class PlanStep:
+    """One task of a plan and, once generated and run, its command and result."""
+
+    id: str
+    task: str
+    depends_on: List[str] = field(default_factory=list)
+    command: str = ""
+    warning: Optional[str] = None
+    error: Optional[str] = None
+    state: str = PENDING
+    exit_code: Optional[int] = None
+    output: str = ""
+    duration: float = 0.0
+
+
+def parse_plan(text: str) -> List[PlanStep]:
+    """
+    Parse the model's JSON step list.
+
+    Reasoning tags and text around the JSON are ignored. A bare list of
+    steps is accepted as well as {"steps": [...]}.
+
+    Args:
+        text: Raw model output.
+
+    Returns:
+        Steps in the model's order.
+
+    Raises:
+        PlanError: If there is no valid step list, an id is duplicated, a
+            dependency is unknown, or the dependencies form a cycle.
+    """
+    text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL | re.IGNORECASE)
+    match = re.search(r"[\[{].*[\]}]", text, flags=re.DOTALL)
+    if not match:
+        raise PlanError("No JSON step list in the response.")
+    try:
+        data = json.loads(match.group(0))
+    except ValueError as e:
+        raise PlanError(f"Invalid JSON: {e}") from e
+    raw_steps = data.get("steps") if isinstance(data, dict) else data
+    if not isinstance(raw_steps, list) or not raw_steps:
+        raise PlanError("The plan has no steps.")
+    if len(raw_steps) > MAX_STEPS:
+        raise PlanError(f"The plan has {len(raw_steps)} steps; at most {MAX_STEPS} are allowed.")
+
+    steps: List[PlanStep] = []
+    for index, raw in enumerate(raw_steps, start=1):
+        if isinstance(raw, str):
+            raw = {"task": raw}
+        if not isinstance(raw, dict) or not str(raw.get("task", "")).strip():
+            raise PlanError(f"Step {index} has no task.")
+        depends_on = raw.get("depends_on") or []
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        steps.append(
+            PlanStep(
+                id=str(raw.get("id") or f"step{index}"),
+                task=str(raw["task"]).strip(),
+                depends_on=[str(dep) for dep in depends_on],
+            )
+        )
+
+    ids = [step.id for step in steps]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise PlanError(f"Duplicate step ids: {', '.join(duplicates)}")
+    for step in steps:
+        unknown = [dep for dep in step.depends_on if dep not in ids]
+        if unknown:
+            raise PlanError(f"Step '{step.id}' depends on unknown steps: {', '.join(unknown)}")
+    levels(steps)
+    return steps
+
+
+def levels(steps: List[PlanStep]) -> List[List[PlanStep]]:
+    """
+    Group steps into waves that can run concurrently.
+
+    Args:
+        steps: Steps with valid dependencies.
+
+    Returns:
+        Waves in execution order; every step comes after all its dependencies.
+
+    Raises:
+        PlanError: If the dependencies form a cycle.
+    """
+    remaining = {step.id: set(step.depends_on) for step in steps}
+    by_id = {step.id: step for step in steps}
+    waves: List[List[PlanStep]] = []
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise PlanError(f"Cyclic dependencies between: {', '.join(sorted(remaining))}")
+        waves.append([by_id[step_id] for step_id in ready])
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return waves
+
+
+def generate_commands(steps: List[PlanStep], generate: Generator, parallelism: int = 4) -> None:
+    """
+    Generate the command for every step concurrently.
+
+    Generation does not depend on other steps' results, so all steps are
+    generated at once regardless of the DAG. A failure is stored in the
+    step's error instead of raised.
+
+    Args:
+        steps: Steps to fill in.
+        generate: Produces a (command, warning) pair for a task.
+        parallelism: Maximum concurrent requests.
+    """
+
+    def fill(step: PlanStep) -> None:
+        try:
+            step.command, step.warning = generate(step.task)
+        except Exception as e:
+            step.error = str(e) or type(e).__name__
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        list(pool.map(fill, steps))
+
+
+def run_shell(command: str) -> Tuple[int, str]:
+    """Run a command in the shell and capture stdout and stderr together."""
+    result = subprocess.run(
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        check=False,
+    )
+    return result.returncode, result.stdout
+
+
+def execute_plan(
+    steps: List[PlanStep],
+    run: Runner = run_shell,
+    parallelism: int = 4,
+    on_done: Optional[Callable[[PlanStep], None]] = None,
+) -> bool:
+    """
+    Run the steps' commands, each as soon as its dependencies succeeded.
+
+    A step whose dependency failed or was skipped is skipped. At most
+    parallelism commands run at the same time.
+
+    Args:
+        steps: Steps with generated commands.
+        run: Runs one command.
+        parallelism: Maximum concurrent commands.
+        on_done: Called with each step as it finishes or is skipped.
+
+    Returns:
+        Whether every step succeeded.
+
+    Raises:
+        PlanError: If the dependencies form a cycle.
+    """
+    levels(steps)
+    limit = max(1, parallelism)
+    by_id: Dict[str, PlanStep] = {step.id: step for step in steps}
+    pending = [step for step in steps if step.state == PENDING]
+    running: Dict[Future, PlanStep] = {}
+
+    def timed_run(step: PlanStep) -> Tuple[int, str, float]:
+        start = time.perf_counter()
+        exit_code, output = run(step.command)
+        return exit_code, output, time.perf_counter() - start
+
+    def finish(step: PlanStep, state: str) -> None:
+        step.state = state
+        if on_done is not None:
+            on_done(step)
+
+    with ThreadPoolExecutor(max_workers=limit) as pool:
+        while pending or running:
+            for step in list(pending):
+                dep_states = [by_id[dep].state for dep in step.depends_on]
+                if any(state in (FAILED, SKIPPED) for state in dep_states) or not step.command:
+                    pending.remove(step)
+                    finish(step, SKIPPED)
+                elif all(state == OK for state in dep_states) and len(running) < limit:
+                    pending.remove(step)
+                    running[pool.submit(timed_run, step)] = step
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    step.exit_code, step.output, step.duration = future.result()
+                except Exception as e:
+                    step.exit_code, step.output = None, str(e)
+                finish(step, OK if step.exit_code == 0 else FAILED)
+    return all(step.state == OK for step in steps)
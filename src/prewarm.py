@@ -0,0 +1,147 @@
+"""Regenerate missing or stale cache entries for the most used queries."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from .cache import ResponseCache, cache_key
+from .history import QueryHistory
+
+# Generate a (command, warning) pair for a query; raises on failure
+Generator = Callable[[str], Tuple[str, Optional[str]]]
+
+# Per-CPU one-minute load average below which the machine counts as idle
+IDLE_LOAD = 0.3
+
+
+def is_idle(max_load: float = IDLE_LOAD) -> bool:
+    """
+    Whether the machine is idle enough for background work.
+
+    Args:
+        max_load: Maximum one-minute load average per CPU.
+
+    Returns:
+        True if idle, or if the platform has no load average.
+    """
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return True
+    return load / (os.cpu_count() or 1) <= max_load
+
+
+class _Deferred(Exception):
+    """Raised when the machine stopped being idle before a query started."""
+
+
+@dataclass
+class WarmReport:
+    """Outcome of a prewarm run."""
+
+    warmed: List[str] = field(default_factory=list)
+    fresh: List[str] = field(default_factory=list)
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    deferred: List[str] = field(default_factory=list)
+
+
+class Prewarmer:
+    """
+    Keeps the cache warm for the queries that matter most.
+
+    Candidates are the top queries from the history, ranked by frequency
+    and recency. Each is looked up under the current environment and model,
+    so after an OS, shell or model change every entry is missing and gets
+    reissued.
+    """
+
+    def __init__(
+        self,
+        cache: ResponseCache,
+        history: QueryHistory,
+        system_info: str,
+        model: str,
+        generate: Generator,
+        concurrency: int = 1,
+        idle_check: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        """
+        Initialize the prewarmer.
+
+        Args:
+            cache: Response cache to fill.
+            history: Query history to rank.
+            system_info: Current environment from get_system_info().
+            model: Current model.
+            generate: Produces a validated (command, warning) for a query.
+            concurrency: Requests in flight at once; keep it low.
+            idle_check: If given, work stops as soon as it returns False.
+        """
+        self.cache = cache
+        self.history = history
+        self.system_info = system_info
+        self.model = model
+        self.generate = generate
+        self.concurrency = max(1, concurrency)
+        self.idle_check = idle_check
+
+    def plan(self, limit: int) -> Tuple[List[str], List[str]]:
+        """
+        Split the top queries into those needing work and those already fresh.
+
+        Args:
+            limit: Number of top queries to consider.
+
+        Returns:
+            Tuple of (queries to regenerate, queries with a fresh entry).
+        """
+        todo, fresh = [], []
+        for ranked in self.history.ranked(limit):
+            entry = self.cache.load(cache_key(ranked.query, self.system_info, self.model))
+            if entry is not None and self.cache.is_fresh(entry):
+                fresh.append(ranked.query)
+            else:
+                todo.append(ranked.query)
+        return todo, fresh
+
+    def _warm(self, query: str) -> Optional[str]:
+        """Regenerate one entry; returns an error message on failure."""
+        if self.idle_check is not None and not self.idle_check():
+            raise _Deferred()
+        try:
+            command, warning = self.generate(query)
+        except Exception as e:
+            return str(e) or type(e).__name__
+        self.cache.store(query, self.system_info, self.model, command, warning)
+        return None
+
+    def run(
+        self, limit: int, on_done: Optional[Callable[[str, Optional[str]], None]] = None
+    ) -> WarmReport:
+        """
+        Regenerate missing and stale entries among the top queries.
+
+        Args:
+            limit: Number of top queries to consider.
+            on_done: Called with (query, error or None) as each finishes.
+
+        Returns:
+            What was warmed, already fresh, failed or deferred for lack of idle time.
+        """
+        todo, fresh = self.plan(limit)
+        report = WarmReport(fresh=fresh)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = [(query, pool.submit(self._warm, query)) for query in todo]
+            for query, future in futures:
+                try:
+                    error = future.result()
+                except _Deferred:
+                    report.deferred.append(query)
+                    continue
+                if error is None:
+                    report.warmed.append(query)
+                else:
+                    report.failed.append((query, error))
+                if on_done is not None:
+                    on_done(query, error)
+        return report
@@ -0,0 +1,272 @@
+"""Persistent chat sessions with token-budgeted history."""
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .prompts import CHAT_SYSTEM_PROMPT_SUFFIX, GEN_COMMAND_SYSTEM_PROMPT
+from .utils import get_cache_dir, read_json, write_json_atomic
+
+# Compact down to this fraction of the budget, so that compaction (which
+# changes the cached prefix) happens rarely rather than on every turn.
+COMPACT_TARGET_RATIO = 0.5
+
+# Number of dropped exchanges listed in the summary of earlier requests
+SUMMARY_MAX_ITEMS = 10
+
+# Longest request text kept in a summary line
+SUMMARY_REQUEST_CHARS = 60
+
+# Identifiers made by SessionStore.new(); they are also file names, so
+# anything else is refused rather than joined onto the sessions directory
+SESSION_ID_PATTERN = re.compile(r"\d{8}-\d{6}-[0-9a-f]{4}")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the token count of a text.
+
+    CJK characters are counted as one token each and everything else as one
+    token per four characters, which is close enough for budgeting.
+
+    Args:
+        text: Text to measure.
+
+    Returns:
+        Estimated token count.
+    """
+    wide = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+class ChatSession:
+    """A conversation whose message layout keeps a stable, cacheable prefix."""
+
+    def __init__(
+        self,
+        session_id: str,
+        system_info: str,
+        model: str,
+        turns: Optional[List[Dict[str, str]]] = None,
+        summary: Optional[List[str]] = None,
+        created_at: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize a session.
+
+        Args:
+            session_id: Identifier, also used as the file name.
+            system_info: Environment captured when the session started.
+            model: Model the session was started with.
+            turns: Alternating user/assistant messages.
+            summary: One line per exchange dropped by compaction.
+            created_at: Creation time as a UNIX timestamp.
+        """
+        self.session_id = session_id
+        self.system_info = system_info
+        self.model = model
+        self.turns: List[Dict[str, str]] = turns or []
+        self.summary: List[str] = summary or []
+        self.created_at = created_at or time.time()
+
+    @property
+    def prefix(self) -> List[Dict[str, str]]:
+        """
+        Messages that never change for the lifetime of the session.
+
+        The environment is captured once at session start, so this prefix is
+        byte-identical across turns and the server's prefix cache can reuse it.
+        """
+        return [
+            {
+                "role": "system",
+                "content": f"{GEN_COMMAND_SYSTEM_PROMPT}\n\n{CHAT_SYSTEM_PROMPT_SUFFIX}\n\n"
+                f"Environment: {self.system_info}",
+            }
+        ]
+
+    def _summary_messages(self) -> List[Dict[str, str]]:
+        """Render the summary of compacted exchanges as a message pair."""
+        if not self.summary:
+            return []
+        lines = "\n".join(f"- {item}" for item in self.summary[-SUMMARY_MAX_ITEMS:])
+        return [
+            {"role": "user", "content": f"Earlier requests in this session:\n{lines}"},
+            {"role": "assistant", "content": "Noted."},
+        ]
+
+    def build_messages(self, query: str) -> List[Dict[str, str]]:
+        """
+        Build the messages for the next request.
+
+        Layout: stable prefix, summary of compacted turns, recent turns, and
+        finally the new request.
+
+        Args:
+            query: The user's next message.
+
+        Returns:
+            Chat messages to send.
+        """
+        return (
+            self.prefix
+            + self._summary_messages()
+            + self.turns
+            + [{"role": "user", "content": f"User request: {query}"}]
+        )
+
+    def add_exchange(self, query: str, command: str) -> None:
+        """
+        Append a completed exchange.
+
+        Only the extracted command is stored as the assistant turn; reasoning
+        and markdown are dropped to keep the history small.
+
+        Args:
+            query: The user's message.
+            command: The command extracted from the model's answer.
+        """
+        self.turns.append({"role": "user", "content": f"User request: {query}"})
+        self.turns.append({"role": "assistant", "content": command})
+
+    def history_tokens(self) -> int:
+        """Estimate the tokens used by the summary and recent turns."""
+        messages = self._summary_messages() + self.turns
+        return sum(estimate_tokens(m["content"]) for m in messages)
+
+    def compact(self, budget: int) -> bool:
+        """
+        Drop the oldest exchanges once the history exceeds the budget.
+
+        Dropped exchanges are summarized as "request → command" lines, and the
+        oldest summary lines go too if that is still not enough. The latest
+        exchange is always kept verbatim so it can be refined. The history
+        is compacted down to half the budget so that the message prefix stays
+        stable for several turns afterwards.
+
+        Args:
+            budget: Token budget for the summary plus recent turns.
+
+        Returns:
+            True if any exchange was dropped.
+        """
+        if self.history_tokens() <= budget:
+            return False
+
+        target = int(budget * COMPACT_TARGET_RATIO)
+        compacted = False
+        while self.history_tokens() > target:
+            if len(self.turns) > 2:
+                user, assistant = self.turns[0], self.turns[1]
+                self.turns = self.turns[2:]
+                request = user["content"].removeprefix("User request: ")
+                if len(request) > SUMMARY_REQUEST_CHARS:
+                    request = request[: SUMMARY_REQUEST_CHARS - 1] + "…"
+                self.summary.append(f"{request} → {assistant['content']}")
+                self.summary = self.summary[-SUMMARY_MAX_ITEMS:]
+            elif self.summary:
+                self.summary.pop(0)
+            else:
+                break
+            compacted = True
+        return compacted
+
+    @property
+    def last_command(self) -> Optional[str]:
+        """The most recent command, if any."""
+        for message in reversed(self.turns):
+            if message["role"] == "assistant":
+                return message["content"]
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the session."""
+        return {
+            "session_id": self.session_id,
+            "system_info": self.system_info,
+            "model": self.model,
+            "created_at": self.created_at,
+            "updated_at": time.time(),
+            "summary": self.summary,
+            "turns": self.turns,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChatSession":
+        """Deserialize a session."""
+        return cls(
+            session_id=data["session_id"],
+            system_info=data["system_info"],
+            model=data.get("model", ""),
+            turns=data.get("turns", []),
+            summary=data.get("summary", []),
+            created_at=data.get("created_at"),
+        )
+
+
+class SessionStore:
+    """Saves and loads chat sessions as JSON files."""
+
+    def __init__(self, sessions_dir: Optional[Path] = None) -> None:
+        """
+        Initialize the store.
+
+        Args:
+            sessions_dir: Directory for session files. If None, uses the cache directory.
+        """
+        self.sessions_dir = sessions_dir or get_cache_dir() / "sessions"
+
+    def new(self, system_info: str, model: str) -> ChatSession:
+        """Create a session with a fresh, sortable identifier."""
+        session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(2)}"
+        return ChatSession(session_id, system_info, model)
+
+    def save(self, session: ChatSession) -> None:
+        """Persist a session."""
+        write_json_atomic(self.sessions_dir / f"{session.session_id}.json", session.to_dict())
+
+    def load(self, session_id: str) -> ChatSession:
+        """
+        Load a session by ID, or the most recent one for 'last'.
+
+        Raises:
+            ValueError: If the ID is malformed, or the session does not exist
+                or cannot be read.
+        """
+        if session_id == "last":
+            sessions = self.list()
+            if not sessions:
+                raise ValueError("No saved sessions.")
+            return sessions[0]
+
+        if not SESSION_ID_PATTERN.fullmatch(session_id):
+            raise ValueError(
+                f"Session not found: {session_id} (IDs look like 20250101-093000-1a2b)"
+            )
+        data = read_json(self.sessions_dir / f"{session_id}.json", None)
+        if not isinstance(data, dict):
+            raise ValueError(f"Session not found: {session_id}")
+        if data.get("session_id") != session_id:
+            # Saving would write to the file named by the stored ID
+            raise ValueError(f"Invalid session file for {session_id}: ID does not match")
+        try:
+            return ChatSession.from_dict(data)
+        except KeyError as e:
+            raise ValueError(f"Invalid session file for {session_id}: missing {e}") from e
+
+    def list(self) -> List[ChatSession]:
+        """List saved sessions, most recently modified first."""
+        if not self.sessions_dir.exists():
+            return []
+        paths = sorted(
+            self.sessions_dir.glob("*.json"),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+        sessions = []
+        for path in paths:
+            data = read_json(path, None)
+            if isinstance(data, dict) and data.get("session_id") == path.stem:
+                sessions.append(ChatSession.from_dict(data))
+        return sessions
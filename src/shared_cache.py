@@ -0,0 +1,333 @@
+"""Team-shared response cache: an HTTP server and the tiered client cache."""
+import atexit
+import io
+import json
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+from .cache import KEY_PATTERN, CacheEntry, ResponseCache, export_bundle, import_bundle
+
+# Timeout in seconds for shared cache lookups; a miss is cheaper than waiting
+SHARED_TIMEOUT = 0.3
+
+# Largest entry the server accepts, in bytes
+MAX_ENTRY_BYTES = 64 * 1024
+
+# Largest bundle the server accepts, in bytes
+MAX_BUNDLE_BYTES = 64 * 1024 * 1024
+
+# Clients whose pending writes are flushed at exit by a single handler
+_clients: "weakref.WeakSet[SharedCacheClient]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_clients() -> None:
+    """Give every live client's pending writes a chance to finish."""
+    for client in list(_clients):
+        client.flush()
+
+
+class CacheServer:
+    """
+    Content-addressed store of cache entries served over plain HTTP.
+
+    Routes:
+        GET  /v1/entries/<key>  one entry, or 404
+        PUT  /v1/entries/<key>  store an entry under its content address, the path
+        GET  /v1/bundle         every entry as a JSON lines bundle
+        POST /v1/bundle         merge a JSON lines bundle
+        GET  /v1/health         entry count
+
+    There is no authentication; run it on a trusted network only. Clients
+    mark entries from the server and never execute them unconfirmed.
+    """
+
+    def __init__(self, cache_dir: Path, host: str = "127.0.0.1", port: int = 8765) -> None:
+        """
+        Initialize the server.
+
+        Args:
+            cache_dir: Directory for entries.
+            host: Interface to bind.
+            port: Port to bind; 0 picks a free one.
+        """
+        self.store = ResponseCache(cache_dir)
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL for clients."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self) -> None:
+        """Serve until interrupted."""
+        self.httpd.serve_forever(poll_interval=0.1)
+
+    def start(self) -> "CacheServer":
+        """Serve from a background thread, for tests and embedding."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def shutdown(self) -> None:
+        """Stop serving and release the socket."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def _make_handler(server: CacheServer) -> type:
+    """Build a request handler bound to a CacheServer."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+        def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, status: int, payload: object) -> None:
+            self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+        def _read_body(self, limit: int) -> Optional[bytes]:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._send_json(400, {"error": "Invalid Content-Length"})
+                self.close_connection = True
+                return None
+            if length > limit:
+                self._send_json(413, {"error": "Request too large"})
+                self.close_connection = True
+                return None
+            return self.rfile.read(length)
+
+        def _entry_key(self) -> Optional[str]:
+            prefix = "/v1/entries/"
+            if not self.path.startswith(prefix):
+                return None
+            key = self.path[len(prefix) :]
+            return key if KEY_PATTERN.match(key) else None
+
+        def do_GET(self) -> None:
+            if self.path == "/v1/health":
+                self._send_json(200, {"entries": sum(1 for _ in server.store.entries())})
+            elif self.path == "/v1/bundle":
+                out = io.StringIO()
+                export_bundle(server.store, out)
+                self._send(200, out.getvalue().encode("utf-8"), "application/x-ndjson")
+            else:
+                key = self._entry_key()
+                entry = server.store.load(key) if key else None
+                if entry is None:
+                    self._send_json(404, {"error": "Not found"})
+                else:
+                    self._send_json(200, entry.to_dict())
+
+        def do_PUT(self) -> None:
+            key = self._entry_key()
+            if key is None:
+                self._send_json(404, {"error": "Not found"})
+                return
+            body = self._read_body(MAX_ENTRY_BYTES)
+            if body is None:
+                return
+            try:
+                entry = CacheEntry.from_dict(json.loads(body))
+            except (ValueError, AttributeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            if entry.key != key or not entry.addressed:
+                self._send_json(
+                    400, {"error": "Entry key is not the content address of its query"}
+                )
+                return
+            with server.lock:
+                server.store.put(entry)
+            self._send_json(200, {"stored": key})
+
+        def do_POST(self) -> None:
+            if self.path != "/v1/bundle":
+                self._send_json(404, {"error": "Not found"})
+                return
+            body = self._read_body(MAX_BUNDLE_BYTES)
+            if body is None:
+                return
+            with server.lock:
+                count = import_bundle(
+                    server.store, body.decode("utf-8", errors="replace").splitlines()
+                )
+            self._send_json(200, {"imported": count})
+
+    return Handler
+
+
+class SharedCacheClient:
+    """Client for a CacheServer; lookups fail fast and writes never block."""
+
+    def __init__(self, url: str, timeout: float = SHARED_TIMEOUT) -> None:
+        """
+        Initialize the client.
+
+        Args:
+            url: Server base URL.
+            timeout: Timeout in seconds for lookups and writes.
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        # One pooled client for every request: httpx.get() and friends build
+        # a new client, SSL context included, on each call, which costs more
+        # CPU than a lookup and serializes bursts of background writes
+        self._http = httpx.Client(timeout=timeout)
+        self._pending: List[threading.Thread] = []
+        self._pending_lock = threading.Lock()
+        _clients.add(self)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Look up an entry.
+
+        Returns:
+            The entry, or None on a miss, a timeout or any other error.
+        """
+        try:
+            response = self._http.get(f"{self.url}/v1/entries/{key}")
+            if response.status_code != 200:
+                return None
+            entry = CacheEntry.from_dict(response.json())
+        except (httpx.HTTPError, ValueError):
+            return None
+        return entry if entry.key == key else None
+
+    def put(self, entry: CacheEntry) -> bool:
+        """
+        Store an entry.
+
+        Returns:
+            Whether the server accepted it.
+        """
+        try:
+            response = self._http.put(f"{self.url}/v1/entries/{entry.key}", json=entry.to_dict())
+        except httpx.HTTPError:
+            return False
+        return response.status_code == 200
+
+    def put_async(self, entry: CacheEntry) -> threading.Thread:
+        """
+        Store an entry from a background thread.
+
+        Pending writes get up to one timeout to finish when the process exits.
+
+        Returns:
+            The started daemon thread.
+        """
+        thread = threading.Thread(
+            target=self.put, args=(entry,), name="pop-cache-write", daemon=True
+        )
+        thread.start()
+        with self._pending_lock:
+            self._pending = [t for t in self._pending if t.is_alive()] + [thread]
+        return thread
+
+    def flush(self) -> None:
+        """Wait briefly for pending background writes."""
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        for thread in pending:
+            thread.join(self.timeout)
+
+    def export_bundle(self) -> str:
+        """
+        Download every entry as a JSON lines bundle.
+
+        Raises:
+            httpx.HTTPError: If the request fails.
+        """
+        response = self._http.get(f"{self.url}/v1/bundle", timeout=max(self.timeout, 30.0))
+        response.raise_for_status()
+        return response.text
+
+    def import_bundle(self, bundle: str) -> int:
+        """
+        Upload a JSON lines bundle.
+
+        Returns:
+            Number of entries the server added or replaced.
+
+        Raises:
+            httpx.HTTPError: If the request fails.
+        """
+        response = self._http.post(
+            f"{self.url}/v1/bundle",
+            content=bundle.encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"},
+            timeout=max(self.timeout, 30.0),
+        )
+        response.raise_for_status()
+        return int(response.json().get("imported", 0))
+
+
+class TieredCache(ResponseCache):
+    """
+    Local cache backed by a shared one.
+
+    Lookups try the local tier first and fall back to the shared tier,
+    copying hits locally. Shared hits are marked from_shared, in the local
+    copy too, since the server accepts entries from anyone who can reach
+    it. Writes go to the local tier and are written through to the shared
+    tier in the background.
+    """
+
+    def __init__(
+        self,
+        shared: SharedCacheClient,
+        cache_dir: Optional[Path] = None,
+        ttl_hours: float = 168.0,
+    ) -> None:
+        """
+        Initialize the cache.
+
+        Args:
+            shared: Shared tier.
+            cache_dir: Directory for the local tier. If None, uses the cache directory.
+            ttl_hours: Hours an entry stays fresh; 0 disables both tiers.
+        """
+        super().__init__(cache_dir, ttl_hours)
+        self.shared = shared
+
+    def load(self, key: str) -> Optional[CacheEntry]:
+        """Load an entry from the local tier, or from the shared tier on a local miss."""
+        entry = super().load(key)
+        if entry is not None and self.is_fresh(entry):
+            return entry
+        remote = self.shared.get(key)
+        if remote is None or (entry is not None and remote.created_at <= entry.created_at):
+            return entry
+        remote.from_shared = True
+        super().put(remote)
+        return remote
+
+    def put(self, entry: CacheEntry) -> None:
+        """Store an entry locally and write it through to the shared tier."""
+        if not self.enabled:
+            return
+        super().put(entry)
+        self.shared.put_async(entry)
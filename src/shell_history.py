@@ -0,0 +1,322 @@
+"""Incremental index of the user's bash and zsh history for instant answers."""
+import bisect
+import heapq
+import itertools
+import math
+import os
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .fewshot import tokenize
+from .utils import get_cache_dir, read_json, write_json_atomic
+
+# Bump when the stored format changes; older indexes are rebuilt
+INDEX_VERSION = 1
+
+# Distinct commands kept; the least recently used are dropped beyond this
+MAX_COMMANDS = 50000
+
+# Commands longer than this are pasted scripts, not answers
+MAX_COMMAND_LENGTH = 500
+
+# Share of the query's words a command must contain to be offered
+MIN_COVERAGE = 0.6
+
+# Query words that say nothing about the command
+QUESTION_WORDS = frozenset("how do does i can what which where get use using".split())
+
+# zsh extended history: ": <start>:<elapsed>;<command>"
+ZSH_EXTENDED_PATTERN = re.compile(rb"^: (\d+):\d+;")
+# bash with HISTTIMEFORMAT: "#<epoch>" before each command
+BASH_TIMESTAMP_PATTERN = re.compile(rb"^#(\d{9,11})$")
+
+WORD_CHARACTERS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789_")
+
+# zsh writes bytes >= 0x83 as 0x83 followed by the byte xor 0x20
+ZSH_META = 0x83
+
+
+@dataclass
+class HistoryMatch:
+    """A command from shell history that answers a query."""
+
+    command: str
+    score: float
+    coverage: float
+    matched: int
+    count: int
+    last_used: float
+
+    @property
+    def relevant(self) -> bool:
+        """Whether the command contains most of the query's meaningful words."""
+        return self.coverage >= MIN_COVERAGE
+
+    @property
+    def strong(self) -> bool:
+        """Whether the command covers every meaningful word of a multi-word query."""
+        return self.coverage >= 1.0 and self.matched >= 2
+
+
+def unmetafy(data: bytes) -> bytes:
+    """Undo zsh's escaping of special bytes in its history file."""
+    if ZSH_META not in data:
+        return data
+    result = bytearray()
+    escaped = False
+    for byte in data:
+        if escaped:
+            result.append(byte ^ 0x20)
+            escaped = False
+        elif byte == ZSH_META:
+            escaped = True
+        else:
+            result.append(byte)
+    return bytes(result)
+
+
+def parse_history(data: bytes, zsh: bool = False) -> Tuple[List[Tuple[str, Optional[float]]], int]:
+    """
+    Parse the complete entries at the start of history file data.
+
+    Plain bash, bash with timestamps and zsh extended history are accepted,
+    including zsh multi-line commands continued with a trailing backslash.
+
+    Args:
+        data: Bytes read from the file, from an entry boundary.
+        zsh: Undo zsh metafication.
+
+    Returns:
+        ((command, timestamp or None) entries, bytes consumed). An entry
+        still being written, without its final newline or continuation, is
+        not consumed so the next read picks it up whole.
+    """
+    entries: List[Tuple[str, Optional[float]]] = []
+    consumed = 0
+    position = 0
+    timestamp: Optional[float] = None
+    pending: List[bytes] = []
+    while True:
+        end = data.find(b"\n", position)
+        if end < 0:
+            break
+        line = data[position:end]
+        position = end + 1
+        if pending:
+            pending.append(line)
+        else:
+            stamp = BASH_TIMESTAMP_PATTERN.match(line)
+            if stamp:
+                timestamp = float(stamp.group(1))
+                continue
+            extended = ZSH_EXTENDED_PATTERN.match(line)
+            if extended:
+                timestamp = float(extended.group(1))
+                line = line[extended.end() :]
+            pending = [line]
+        if line.endswith(b"\\"):
+            continue
+        raw = b"\n".join(pending)
+        text = (unmetafy(raw) if zsh else raw).decode("utf-8", errors="replace").strip()
+        if text:
+            entries.append((text, timestamp))
+        pending, timestamp = [], None
+        consumed = position
+    return entries, consumed
+
+
+def history_files() -> List[Path]:
+    """The shell history files that exist: $HISTFILE, then bash and zsh defaults."""
+    candidates = [os.environ.get("HISTFILE", "")]
+    candidates += [str(Path.home() / ".bash_history"), str(Path.home() / ".zsh_history")]
+    paths: List[Path] = []
+    for candidate in candidates:
+        if candidate and Path(candidate).is_file() and Path(candidate) not in paths:
+            paths.append(Path(candidate))
+    return paths
+
+
+def _stem(term: str) -> str:
+    """Fold simple plurals so "files" matches "file"."""
+    return term[:-1] if len(term) > 3 and term.endswith("s") and not term.endswith("ss") else term
+
+
+def _is_answer(command: str) -> bool:
+    """Whether a history entry could answer a question."""
+    words = command.split()
+    return 1 < len(words) and len(command) <= MAX_COMMAND_LENGTH and words[0] != "pop"
+
+
+class ShellHistoryIndex:
+    """
+    Distinct commands from shell history with use counts and last use.
+
+    Each history file is read from the offset where the last refresh
+    stopped, so keeping the index current costs only the new lines. A file
+    that was rewritten (new inode or shorter than the offset, as when zsh
+    trims its history) causes a full rebuild.
+    """
+
+    def __init__(self, paths: Optional[Sequence[Path]] = None, path: Optional[Path] = None) -> None:
+        """
+        Initialize the index.
+
+        Args:
+            paths: History files. If None, uses history_files().
+            path: JSON file for the index. If None, uses the cache directory.
+        """
+        self.paths = list(paths) if paths is not None else history_files()
+        self.path = path or get_cache_dir() / "shell_history.json"
+        data = read_json(self.path, {})
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            data = {}
+        self.files: Dict[str, Dict] = data.get("files", {})
+        self.commands: Dict[str, List[float]] = data.get("commands", {})
+        self._blob: Optional[Tuple[List[str], str, List[int]]] = None
+
+    def refresh(self) -> int:
+        """
+        Index new history entries.
+
+        Returns:
+            Number of entries read.
+        """
+        stats = {}
+        for path in self.paths:
+            try:
+                stats[str(path)] = os.stat(path)
+            except OSError:
+                continue
+        rebuilt = False
+        for name, info in stats.items():
+            known = self.files.get(name)
+            if known and (known["inode"] != info.st_ino or known["offset"] > info.st_size):
+                # A rewritten file cannot be diffed: start over from every file
+                self.files, self.commands, rebuilt = {}, {}, True
+                break
+
+        read = 0
+        now = time.time()
+        for name, info in stats.items():
+            known = self.files.get(name, {"inode": info.st_ino, "offset": 0})
+            if known["offset"] == info.st_size:
+                self.files[name] = known
+                continue
+            try:
+                with open(name, "rb") as f:
+                    f.seek(known["offset"])
+                    data = f.read()
+            except OSError:
+                continue
+            entries, consumed = parse_history(data, zsh="zsh" in Path(name).name)
+            for command, timestamp in entries:
+                if not _is_answer(command):
+                    continue
+                stats_entry = self.commands.setdefault(command, [0, 0.0])
+                stats_entry[0] += 1
+                stats_entry[1] = max(stats_entry[1], timestamp or now)
+            read += len(entries)
+            self.files[name] = {"inode": info.st_ino, "offset": known["offset"] + consumed}
+
+        if read or rebuilt or set(self.files) != set(stats):
+            self._blob = None
+            self.files = {name: self.files[name] for name in self.files if name in stats}
+            if len(self.commands) > MAX_COMMANDS:
+                newest = sorted(self.commands.items(), key=lambda item: -item[1][1])
+                self.commands = dict(newest[:MAX_COMMANDS])
+            try:
+                write_json_atomic(
+                    self.path,
+                    {"version": INDEX_VERSION, "files": self.files, "commands": self.commands},
+                )
+            except OSError:
+                # The in-memory index still answers this run
+                pass
+        return read
+
+    def _searchable(self) -> Tuple[List[str], str, List[int]]:
+        """
+        The commands as one lowercase text, built once per refresh.
+
+        Returns:
+            (commands, their lowercase text joined by newlines, start offsets).
+        """
+        if self._blob is None:
+            commands = list(self.commands)
+            starts = [0, *itertools.accumulate(len(command) + 1 for command in commands)][:-1]
+            joined = "\n".join(commands)
+            text = joined.lower()
+            if len(text) != len(joined):
+                # A few characters change length when lowercased: keep those commands as is
+                text = "\n".join(
+                    command.lower() if len(command.lower()) == len(command) else command
+                    for command in commands
+                )
+            self._blob = (commands, text, starts)
+        return self._blob
+
+    def search(self, query: str, limit: int = 3) -> List[HistoryMatch]:
+        """
+        Rank history commands by how well they match a query.
+
+        Query words are matched as whole words of each command and weighted
+        by how rare they are in the history; frequent and recent commands
+        win ties. Each word is one regular expression scan over all
+        commands, so no per-command work is done for non-matching ones.
+
+        Args:
+            query: Natural language query.
+            limit: Maximum number of matches.
+
+        Returns:
+            Matches, best first.
+        """
+        terms = list(dict.fromkeys(_stem(t) for t in tokenize(query) if t not in QUESTION_WORDS))
+        if not terms or limit <= 0:
+            return []
+        commands, text, starts = self._searchable()
+        postings: Dict[str, Set[int]] = {}
+        for term in terms:
+            # The pattern starts with a literal, which the regex engine scans for quickly
+            pattern = re.compile(rf"{re.escape(term)}s?(?![a-z0-9_])")
+            postings[term] = {
+                bisect.bisect_right(starts, match.start()) - 1
+                for match in pattern.finditer(text)
+                if match.start() == 0 or text[match.start() - 1] not in WORD_CHARACTERS
+            }
+
+        # Coverage ranks first, so only the best-covered commands need scoring
+        hits = Counter(itertools.chain.from_iterable(postings.values()))
+        if not hits:
+            return []
+        cutoff = heapq.nlargest(limit, hits.values())[-1]
+        total = max(len(commands), 1)
+        weights = {
+            term: math.log(1 + (total - len(ids) + 0.5) / (len(ids) + 0.5))
+            for term, ids in postings.items()
+        }
+        now = time.time()
+        matches = []
+        for index, matched_count in hits.items():
+            if matched_count < cutoff:
+                continue
+            count, last_used = self.commands[commands[index]]
+            # Small boosts: enough to order equally relevant commands
+            days = max(0.0, now - last_used) / 86400
+            score = sum(weights[term] for term in terms if index in postings[term])
+            score += 0.1 * math.log1p(count) + 0.1 * 0.5 ** (days / 30)
+            matches.append(
+                HistoryMatch(
+                    commands[index],
+                    score,
+                    matched_count / len(terms),
+                    matched_count,
+                    int(count),
+                    last_used,
+                )
+            )
+        return heapq.nsmallest(limit, matches, key=lambda match: (-match.coverage, -match.score))
@@ -0,0 +1,195 @@
+"""Bounded-memory processing of streamed responses with reasoning blocks."""
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Optional, TextIO
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+
+# Characters of the raw stream kept for diagnostics and as the extraction
+# fallback when a reasoning block is never closed
+DEFAULT_TAIL_CHARS = 4096
+
+
+class StreamProcessor:
+    """
+    Split a streamed response into reasoning and answer as it arrives.
+
+    Only the end of the answer (text outside <think> blocks) and a tail
+    window of the raw stream, each capped at tail_chars, are kept in memory.
+    Reasoning is counted and, optionally, written to a temporary file instead
+    of being accumulated, so memory stays flat however long the model thinks,
+    including when the opening tag is missing and reasoning first looks like
+    answer text. Tags split across chunk boundaries are handled by holding
+    back at most a tag's length of text.
+    """
+
+    def __init__(self, spill_reasoning: bool = False, tail_chars: int = DEFAULT_TAIL_CHARS) -> None:
+        """
+        Initialize the processor.
+
+        Args:
+            spill_reasoning: Write reasoning text to a temporary file.
+            tail_chars: Size of the raw tail window and of the kept answer text.
+        """
+        self.spill_reasoning = spill_reasoning
+        self.tail_chars = tail_chars
+        self.in_reasoning = False
+        self.reasoning_chars = 0
+        self.reasoning_path: Optional[Path] = None
+        self._content: List[str] = []
+        self._content_chars = 0
+        # Answer characters dropped to keep _content bounded
+        self._dropped_chars = 0
+        self._tail = ""
+        self._pending = ""
+        self._seen_open = False
+        self._spill: Optional[TextIO] = None
+
+    def feed(self, chunk: str) -> str:
+        """
+        Process one chunk.
+
+        Args:
+            chunk: Raw content chunk.
+
+        Returns:
+            The part of the chunk that is answer text, for live display.
+        """
+        self._tail += chunk
+        if len(self._tail) > 2 * self.tail_chars:
+            self._tail = self._tail[-self.tail_chars :]
+
+        data = self._pending + chunk
+        self._pending = ""
+        visible: List[str] = []
+
+        while data:
+            lowered = data.lower()
+            if self.in_reasoning:
+                index = lowered.find(CLOSE_TAG)
+                if index < 0:
+                    keep = _partial_tag_length(lowered, CLOSE_TAG)
+                    self._add_reasoning(data[: len(data) - keep])
+                    self._pending = data[len(data) - keep :]
+                    break
+                self._add_reasoning(data[:index])
+                data = data[index + len(CLOSE_TAG) :]
+                self.in_reasoning = False
+                continue
+
+            open_index = lowered.find(OPEN_TAG)
+            close_index = lowered.find(CLOSE_TAG)
+            if close_index >= 0 and (open_index < 0 or close_index < open_index) and not self._seen_open:
+                # Chat templates that put <think> in the prompt make the model
+                # start reasoning straight away and emit only the closing tag,
+                # so everything up to it was reasoning, including text already
+                # dropped from the bounded answer
+                self.reasoning_chars += self._dropped_chars
+                self._add_reasoning("".join(self._content) + data[:close_index])
+                self._content = []
+                self._content_chars = 0
+                self._dropped_chars = 0
+                data = data[close_index + len(CLOSE_TAG) :]
+                continue
+            if open_index >= 0:
+                self._add_content(data[:open_index], visible)
+                data = data[open_index + len(OPEN_TAG) :]
+                self.in_reasoning = True
+                self._seen_open = True
+                continue
+
+            keep = max(_partial_tag_length(lowered, OPEN_TAG), _partial_tag_length(lowered, CLOSE_TAG))
+            self._add_content(data[: len(data) - keep], visible)
+            self._pending = data[len(data) - keep :]
+            break
+
+        return "".join(visible)
+
+    def finish(self) -> str:
+        """
+        Flush text held back at the end of the stream and close the spill file.
+
+        Returns:
+            Remaining answer text, for live display.
+        """
+        visible: List[str] = []
+        if self._pending:
+            if self.in_reasoning:
+                self._add_reasoning(self._pending)
+            else:
+                self._add_content(self._pending, visible)
+            self._pending = ""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        return "".join(visible)
+
+    def close(self) -> None:
+        """Close and delete the spill file, once the reasoning has been shown."""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self.reasoning_path is not None:
+            try:
+                os.unlink(self.reasoning_path)
+            except OSError:
+                pass
+            self.reasoning_path = None
+
+    @property
+    def text(self) -> str:
+        """
+        The answer text for extraction.
+
+        Only the last tail_chars characters of a longer answer are kept; the
+        command is extracted from the end of the response. If the stream ended
+        inside an unclosed reasoning block, the tail window is returned
+        instead, since the model may have written the command there before
+        being cut off.
+        """
+        content = "".join(self._content)
+        if self.in_reasoning and not content.strip():
+            return self.tail
+        return content
+
+    @property
+    def tail(self) -> str:
+        """The last tail_chars characters of the raw stream."""
+        return self._tail[-self.tail_chars :]
+
+    def _add_content(self, text: str, visible: List[str]) -> None:
+        """Keep answer text and pass it on for display."""
+        if not text:
+            return
+        visible.append(text)
+        self._content.append(text)
+        self._content_chars += len(text)
+        if self._content_chars > 2 * self.tail_chars:
+            content = "".join(self._content)
+            self._dropped_chars += len(content) - self.tail_chars
+            self._content = [content[-self.tail_chars :]]
+            self._content_chars = self.tail_chars
+
+    def _add_reasoning(self, text: str) -> None:
+        """Count reasoning text and spill it if requested."""
+        if not text:
+            return
+        self.reasoning_chars += len(text)
+        if not self.spill_reasoning:
+            return
+        if self._spill is None:
+            self._spill = tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", prefix="pop-reasoning-", suffix=".txt", delete=False
+            )
+            self.reasoning_path = Path(self._spill.name)
+        self._spill.write(text)
+
+
+def _partial_tag_length(lowered: str, tag: str) -> int:
+    """Length of the longest proper prefix of tag that the text ends with."""
+    for length in range(min(len(tag) - 1, len(lowered)), 0, -1):
+        if lowered.endswith(tag[:length]):
+            return length
+    return 0
@@ -0,0 +1,288 @@
+"""Structured command output: the JSON schema and an incremental parser for it."""
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+from .stream import StreamProcessor
+
+# Field order matters: the command comes first so it can be shown first
+COMMAND_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "command": {"type": "string"},
+        "dangerous": {"type": "boolean"},
+        "warning": {"type": "string"},
+    },
+    "required": ["command", "dangerous", "warning"],
+    "additionalProperties": False,
+}
+
+COMMAND_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {"name": "shell_command", "strict": True, "schema": COMMAND_SCHEMA},
+}
+
+DEFAULT_WARNING = "This command may be destructive"
+
+# Parser states
+BEFORE = "before"
+KEY_OR_END = "key_or_end"
+KEY = "key"
+COLON = "colon"
+VALUE = "value"
+STRING = "string"
+SCALAR = "scalar"
+NESTED = "nested"
+DONE = "done"
+
+
+class StructuredOutputError(ValueError):
+    """Raised when streamed output is not the expected JSON object."""
+
+
+class IncrementalObjectParser:
+    """
+    Parse the top-level fields of a JSON object while it streams in.
+
+    Each field is available in values as soon as its value is complete, long
+    before the object is. Text before the opening brace, such as a code
+    fence, is skipped; nested values are collected whole.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the parser."""
+        self.values: Dict[str, Any] = {}
+        self.state = BEFORE
+        self._buffer: List[str] = []
+        self._key = ""
+        self._escaped = False
+        self._depth = 0
+        self._in_string = False
+
+    @property
+    def done(self) -> bool:
+        """Whether the object has been closed."""
+        return self.state == DONE
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Parse more text.
+
+        Args:
+            text: Next piece of the stream.
+
+        Returns:
+            Keys whose values were completed by this text, in order.
+
+        Raises:
+            StructuredOutputError: If the text cannot continue a JSON object.
+        """
+        completed: List[str] = []
+        for char in text:
+            if self.state == DONE:
+                break
+            self._step(char, completed)
+        return completed
+
+    def _step(self, char: str, completed: List[str]) -> None:
+        """Advance the state machine by one character."""
+        state = self.state
+        if state == BEFORE:
+            if char == "{":
+                self.state = KEY_OR_END
+        elif state in (KEY, STRING):
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                text = self._decode_string("".join(self._buffer))
+                self._buffer = []
+                if state == KEY:
+                    self._key, self.state = text, COLON
+                else:
+                    self._complete(text, completed)
+                return
+            self._buffer.append(char)
+        elif char.isspace() and state in (KEY_OR_END, COLON, VALUE):
+            return
+        elif state == KEY_OR_END:
+            if char == '"':
+                self.state = KEY
+            elif char == "}":
+                self.state = DONE
+            elif char != ",":
+                raise StructuredOutputError(f"Expected a key, got {char!r}")
+        elif state == COLON:
+            if char != ":":
+                raise StructuredOutputError(f"Expected ':' after {self._key!r}, got {char!r}")
+            self.state = VALUE
+        elif state == VALUE:
+            if char == '"':
+                self.state = STRING
+            elif char in "{[":
+                self._buffer, self._depth, self.state = [char], 1, NESTED
+            else:
+                self._buffer, self.state = [char], SCALAR
+        elif state == SCALAR:
+            if char in ",}" or char.isspace():
+                self._complete(self._decode_json("".join(self._buffer)), completed)
+                self._buffer = []
+                self._step(char, completed)
+            else:
+                self._buffer.append(char)
+        elif state == NESTED:
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete(self._decode_json("".join(self._buffer)), completed)
+                    self._buffer = []
+
+    def _complete(self, value: Any, completed: List[str]) -> None:
+        """Store a finished value and expect the next key."""
+        self.values[self._key] = value
+        completed.append(self._key)
+        self.state = KEY_OR_END
+
+    @staticmethod
+    def _decode_string(raw: str) -> str:
+        """Decode the contents of a JSON string, tolerating raw control characters."""
+        return IncrementalObjectParser._decode_json(f'"{raw}"')
+
+    @staticmethod
+    def _decode_json(raw: str) -> Any:
+        """Decode a complete JSON value."""
+        try:
+            return json.loads(raw, strict=False)
+        except ValueError as e:
+            raise StructuredOutputError(f"Invalid JSON value {raw[:40]!r}") from e
+
+
+@dataclass
+class StructuredCommand:
+    """A command and its danger flag, as returned in structured mode."""
+
+    command: str
+    dangerous: bool = False
+    warning: str = ""
+
+    @property
+    def text(self) -> str:
+        """The command in the free-form layout, with a `# WARNING:` line if flagged."""
+        if self.dangerous:
+            return f"# WARNING: {self.warning.strip() or DEFAULT_WARNING}\n{self.command}"
+        return self.command
+
+    @classmethod
+    def from_text(cls, text: str) -> "StructuredCommand":
+        """
+        Build from the free-form layout, e.g. to show the model examples.
+
+        Args:
+            text: A command, optionally preceded by a `# WARNING:` line.
+
+        Returns:
+            The command, flagged if the text had a warning line.
+        """
+        first, _, rest = text.partition("\n")
+        if first.lstrip().upper().startswith("# WARNING") and rest.strip():
+            warning = first.split(":", 1)[1].strip() if ":" in first else ""
+            return cls(rest.strip(), True, warning)
+        return cls(text.strip())
+
+    def to_json(self) -> str:
+        """The command as the JSON object the schema describes."""
+        return json.dumps(
+            {"command": self.command, "dangerous": self.dangerous, "warning": self.warning},
+            ensure_ascii=False,
+        )
+
+
+class StructuredStream:
+    """
+    Turn a streamed JSON response into display text, stopping early.
+
+    Iterating yields the command as soon as its field is complete, then a
+    warning line if the command is flagged. The underlying stream is closed
+    once nothing more is needed: when the object closes, or as soon as the
+    command is known to be safe. If the response is not the expected JSON,
+    the raw answer is yielded instead so the free-form extraction can handle
+    it, and result stays None.
+    """
+
+    def __init__(self, chunks: Iterator[str]) -> None:
+        """
+        Initialize the stream.
+
+        Args:
+            chunks: Raw content chunks from the client.
+        """
+        self.chunks = chunks
+        self.result: Optional[StructuredCommand] = None
+
+    def __iter__(self) -> Iterator[str]:
+        """Yield display text; see the class docstring."""
+        processor = StreamProcessor()
+        parser = IncrementalObjectParser()
+        shown = False
+        # Cleared when the answer turns out not to be the expected object, e.g.
+        # `awk '{print $2}'` from a server that ignored the response format;
+        # the rest is then only collected, since the whole text is needed
+        parsing = True
+        try:
+            for chunk in self.chunks:
+                text = processor.feed(chunk)
+                if not parsing:
+                    continue
+                try:
+                    for key in parser.feed(text):
+                        if key == "command" and isinstance(parser.values[key], str):
+                            shown = True
+                            yield parser.values[key]
+                except StructuredOutputError:
+                    if shown:
+                        break
+                    parsing = False
+                    continue
+                # Only an object that produced a command may end the stream early
+                if shown and (parser.done or parser.values.get("dangerous") is False):
+                    break
+                if parser.done:
+                    parsing = False
+            else:
+                text = processor.finish()
+                if parsing:
+                    try:
+                        parser.feed(text)
+                    except StructuredOutputError:
+                        pass
+        finally:
+            close = getattr(self.chunks, "close", None)
+            if close is not None:
+                close()
+
+        values = parser.values
+        command = values.get("command")
+        if not isinstance(command, str) or not command.strip():
+            # Not what the schema asked for: hand the raw answer to the fallback
+            if not shown:
+                yield processor.text
+            return
+        warning = values.get("warning") if isinstance(values.get("warning"), str) else ""
+        self.result = StructuredCommand(command.strip(), values.get("dangerous") is True, warning)
+        if not shown:
+            yield command
+        if self.result.dangerous:
+            yield f"\n# WARNING: {warning.strip() or DEFAULT_WARNING}"
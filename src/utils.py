@@ -1,7 +1,20 @@
 """Utility functions for Parallax OpsPilot."""
+import json
 import os
 import platform
+import tempfile
+import threading
 from pathlib import Path
+from typing import Any, Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# One lock per file updated with update_json_atomic()
+_update_locks: Dict[Path, threading.Lock] = {}
+_update_locks_guard = threading.Lock()
 
 
 def get_system_info() -> str:
@@ -49,9 +62,22 @@ def get_system_info() -> str:
         os_name = system
 
     # Detect shell
+    shell_path = get_shell_path()
+
+    return f"{os_name} {shell_path}"
+
+
+def get_shell_path() -> str:
+    """
+    Get the path of the user's shell.
+
+    Returns:
+        $SHELL if set, otherwise the platform's usual default shell.
+    """
     shell_path = os.environ.get("SHELL", "")
     if not shell_path:
         # Fallback: try to detect from common locations
+        system = platform.system()
         if system == "Darwin":
             # macOS typically uses zsh by default
             shell_path = "/bin/zsh"
@@ -60,6 +86,89 @@ def get_system_info() -> str:
             shell_path = "/bin/bash"
         else:
             shell_path = "/bin/sh"
+    return shell_path
 
-    return f"{os_name} {shell_path}"
 
+def get_cache_dir() -> Path:
+    """
+    Get the directory for caches and local state.
+
+    Returns:
+        $POP_CACHE_DIR if set, otherwise ~/.cache/pop. The directory is not
+        created here; writers create it on demand.
+    """
+    override = os.environ.get("POP_CACHE_DIR")
+    if override:
+        return Path(override)
+    return Path.home() / ".cache" / "pop"
+
+
+def read_json(path: Path, default: Any) -> Any:
+    """
+    Read a JSON file, falling back to a default when missing or corrupt.
+
+    Args:
+        path: File to read.
+        default: Value returned if the file cannot be read or parsed.
+
+    Returns:
+        Parsed JSON data or the default.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json_atomic(path: Path, data: Any) -> None:
+    """
+    Write JSON so that concurrent readers never see a partial file.
+
+    Args:
+        path: Destination file. Parent directories are created.
+        data: JSON-serializable data.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def update_json_atomic(path: Path, update: Callable[[Any], Any]) -> None:
+    """
+    Read, modify and atomically rewrite a JSON file.
+
+    Threads of this process updating the same file take turns, so
+    concurrent updates, e.g. from pop batch workers, are not lost. Separate
+    processes take turns too, through an advisory lock on a ".lock" file
+    next to the data (the data file itself is replaced on every write, so
+    it cannot carry the lock). Where fcntl is unavailable, i.e. on Windows,
+    two invocations writing at the same moment can still drop one update.
+
+    Args:
+        path: File to update.
+        update: Called with the current data, or None if the file is missing
+            or corrupt; returns the data to write.
+
+    Raises:
+        OSError: If the file cannot be written.
+    """
+    with _update_locks_guard:
+        lock = _update_locks.setdefault(path, threading.Lock())
+    with lock:
+        if fcntl is None:
+            write_json_atomic(path, update(read_json(path, None)))
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.parent / f".{path.name}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            write_json_atomic(path, update(read_json(path, None)))
@@ -0,0 +1,356 @@
+"""Local validation and ranking of generated shell commands."""
+import os
+import shutil
+import subprocess
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .linter import split_commands, tokenize, unwrap_command
+from .utils import get_cache_dir, read_json, update_json_atomic
+
+# Shell builtins and reserved words that never resolve to a binary on $PATH
+BASH_BUILTINS = frozenset(
+    {
+        "!", "[", "[[", "]]", "{", "}", ".", ":", "alias", "bg", "bind", "break",
+        "builtin", "caller", "case", "cd", "command", "compgen", "complete",
+        "compopt", "continue", "coproc", "declare", "dirs", "disown", "do", "done",
+        "echo", "elif", "else", "enable", "esac", "eval", "exec", "exit", "export",
+        "false", "fc", "fg", "fi", "for", "function", "getopts", "hash", "help",
+        "history", "if", "in", "jobs", "kill", "let", "local", "logout", "mapfile",
+        "popd", "printf", "pushd", "pwd", "read", "readarray", "readonly", "return",
+        "select", "set", "shift", "shopt", "source", "suspend", "test", "then",
+        "time", "times", "trap", "true", "type", "typeset", "ulimit", "umask",
+        "unalias", "unset", "until", "wait", "while",
+    }
+)
+ZSH_BUILTINS = frozenset(
+    {
+        "autoload", "bindkey", "bye", "cap", "chdir", "clone", "compadd",
+        "comparguments", "compcall", "compctl", "compdescribe", "compfiles",
+        "compgroups", "compquote", "comptags", "comptry", "compvalues", "echotc",
+        "echoti", "emulate", "end", "float", "foreach", "functions", "getcap",
+        "getln", "integer", "limit", "nocorrect", "noglob", "print", "pushln", "r",
+        "rehash", "repeat", "sched", "setcap", "setopt", "unfunction", "unhash",
+        "unlimit", "unsetopt", "vared", "whence", "where", "which", "zcompile",
+        "zformat", "zle", "zmodload", "zparseopts", "zprof", "zpty", "zregexparse",
+        "zsocket", "zstyle", "ztcp",
+    }
+)
+SHELL_BUILTINS = BASH_BUILTINS | ZSH_BUILTINS
+
+# Reserved words that may precede the real command in a simple command
+LEADING_KEYWORDS = frozenset({"!", "if", "then", "else", "elif", "do", "while", "until", "{", "time"})
+
+# Compound constructs and the word that closes them
+BLOCK_OPENERS = {
+    "if": "fi",
+    "case": "esac",
+    "for": "done",
+    "select": "done",
+    "while": "done",
+    "until": "done",
+    "{": "}",
+    "[[": "]]",
+    "[": "]",
+}
+BLOCK_CLOSERS = frozenset(BLOCK_OPENERS.values())
+
+# Openers after which the next word is again in command position
+OPENERS_BEFORE_COMMAND = frozenset({"if", "while", "until", "{"})
+KEYWORDS_BEFORE_COMMAND = frozenset({"then", "do", "else", "elif", "!", "time"})
+
+
+
+@dataclass
+class ValidationResult:
+    """Outcome of validating a single command."""
+
+    command: str
+    syntax_ok: bool = True
+    syntax_error: str = ""
+    missing_binaries: List[str] = field(default_factory=list)
+    repairs: int = 0
+
+    @property
+    def ok(self) -> bool:
+        """Whether the command parsed and all its binaries were found."""
+        return self.syntax_ok and not self.missing_binaries
+
+    def describe(self) -> str:
+        """One-line summary of the problems found, empty if none."""
+        problems = []
+        if not self.syntax_ok:
+            problems.append(f"syntax error: {self.syntax_error}")
+        if self.missing_binaries:
+            problems.append(f"not found: {', '.join(self.missing_binaries)}")
+        return "; ".join(problems)
+
+
+@dataclass
+class RankedCandidate:
+    """A validated candidate with its agreement count."""
+
+    validation: ValidationResult
+    votes: int = 1
+    # "model", or "history" for a command from the user's shell history
+    source: str = "model"
+
+    @property
+    def command(self) -> str:
+        """The candidate command."""
+        return self.validation.command
+
+
+def check_syntax(command: str, shell: str, timeout: float = 2.0) -> Optional[str]:
+    """
+    Parse a command with the shell's no-exec mode.
+
+    Args:
+        command: Shell command line.
+        shell: Path or name of the target shell (bash, zsh, sh, fish).
+        timeout: Seconds to wait for the shell.
+
+    Returns:
+        Error message if the command does not parse, None if it does or if the
+        shell is not available to check with.
+    """
+    shell_path = shutil.which(shell)
+    if shell_path is None:
+        return None
+
+    if os.path.basename(shell_path) == "fish":
+        args = [shell_path, "--no-execute", "-c", command]
+    else:
+        args = [shell_path, "-n", "-c", command]
+
+    try:
+        result = subprocess.run(
+            args,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            stdin=subprocess.DEVNULL,
+            check=False,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+
+    if result.returncode != 0:
+        return result.stderr.strip() or f"{os.path.basename(shell_path)} exited with {result.returncode}"
+    return None
+
+
+def check_structure(command: str) -> Optional[str]:
+    """
+    Check quoting and balanced constructs without running a shell.
+
+    Catches unterminated quotes, unbalanced parentheses and backticks, and
+    unclosed if/case/loop/brace/test blocks. Heredoc bodies are not parsed,
+    so commands containing one are left to the shell's own check.
+
+    Args:
+        command: Shell command line.
+
+    Returns:
+        Error message, or None if no structural problem was found.
+    """
+    # Quoted text such as grep ")" must not count as an operator or keyword
+    try:
+        tokens = tokenize(command)
+    except ValueError as e:
+        if "quotation" in str(e):
+            return "unterminated quote"
+        return "trailing backslash"
+
+    if (command.count("`") - command.count("\\`")) % 2:
+        return "unterminated backtick"
+    if any(token.operator and token.text == "<<" for token in tokens):
+        return None
+
+    stack: List[str] = []
+    at_command = True
+    for token in tokens:
+        if token.operator:
+            if token.text == "(":
+                stack.append(")")
+            elif token.text == ")":
+                if stack and stack[-1] == ")":
+                    stack.pop()
+                elif not (stack and stack[-1] == "esac"):
+                    # A bare ')' is only valid as a case pattern terminator
+                    return "unexpected ')'"
+            at_command = True
+            continue
+        if token.quoted:
+            at_command = False
+            continue
+        word = token.text
+        if word in ("]]", "]") and stack and stack[-1] == word:
+            stack.pop()
+            at_command = False
+        elif not at_command:
+            continue
+        elif word in BLOCK_OPENERS:
+            stack.append(BLOCK_OPENERS[word])
+            at_command = word in OPENERS_BEFORE_COMMAND
+        elif word in BLOCK_CLOSERS:
+            if not stack or stack[-1] != word:
+                return f"unexpected '{word}'"
+            stack.pop()
+            at_command = False
+        elif word in KEYWORDS_BEFORE_COMMAND:
+            at_command = True
+        else:
+            at_command = False
+
+    if stack:
+        return f"missing '{stack[-1]}'"
+    return None
+
+
+def find_missing_binaries(command: str) -> List[str]:
+    """
+    List head binaries of a command that cannot be found.
+
+    Builtins, reserved words, variable expansions and assignments are skipped.
+
+    Args:
+        command: Shell command line.
+
+    Returns:
+        Names of missing binaries, in order of first appearance.
+    """
+    missing: List[str] = []
+    for argv in split_commands(command):
+        while argv and argv[0] in LEADING_KEYWORDS:
+            argv = argv[1:]
+        argv, _ = unwrap_command(argv)
+        if not argv:
+            continue
+        name = argv[0]
+        if name in SHELL_BUILTINS or "$" in name or "`" in name or name in missing:
+            continue
+        if "/" in name:
+            if not os.access(os.path.expanduser(name), os.X_OK):
+                missing.append(name)
+        elif shutil.which(name) is None:
+            missing.append(name)
+    return missing
+
+
+def validate_command(command: str, shell: str) -> ValidationResult:
+    """
+    Validate a command's quoting, syntax and binaries.
+
+    The structural check runs first since it needs no subprocess; the shell's
+    no-exec mode then catches anything the structural check does not model.
+
+    Args:
+        command: Shell command line.
+        shell: Target shell for the syntax check.
+
+    Returns:
+        ValidationResult for the command.
+    """
+    result = ValidationResult(command=command)
+    error = check_structure(command) or check_syntax(command, shell)
+    if error is not None:
+        result.syntax_ok = False
+        result.syntax_error = error
+    result.missing_binaries = find_missing_binaries(command)
+    return result
+
+
+def rank_candidates(commands: List[str], shell: str) -> List[RankedCandidate]:
+    """
+    Validate and rank candidate commands, best first.
+
+    Duplicates are merged and counted as votes. Candidates are ordered by
+    syntax validity, binary availability, agreement between candidates, and
+    finally by length (shorter first).
+
+    Args:
+        commands: Extracted candidate commands.
+        shell: Target shell for the syntax check.
+
+    Returns:
+        Ranked list of unique candidates.
+    """
+    votes = Counter(" ".join(command.split()) for command in commands if command.strip())
+    seen = set()
+    ranked: List[RankedCandidate] = []
+    for command in commands:
+        key = " ".join(command.split())
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        ranked.append(RankedCandidate(validate_command(command, shell), votes[key]))
+
+    ranked.sort(
+        key=lambda c: (
+            not c.validation.syntax_ok,
+            bool(c.validation.missing_binaries),
+            -c.votes,
+            len(c.command),
+        )
+    )
+    return ranked
+
+
+class RepairStats:
+    """
+    Per-model counters of how often generated commands needed repair.
+
+    Concurrent invocations update the counters one after another (see
+    update_json_atomic()).
+    """
+
+    def __init__(self, stats_path: Optional[Path] = None) -> None:
+        """
+        Initialize the stats store.
+
+        Args:
+            stats_path: Path to the JSON stats file. If None, uses the cache directory.
+        """
+        self.stats_path = stats_path or get_cache_dir() / "repair_stats.json"
+
+    def load(self) -> Dict[str, Dict[str, int]]:
+        """
+        Load counters for all models.
+
+        Returns:
+            Mapping of model name to counters: validated, needed_repair,
+            repaired and attempts.
+        """
+        data = read_json(self.stats_path, {})
+        return data if isinstance(data, dict) else {}
+
+    def record(self, model: str, needed_repair: bool, repaired: bool, attempts: int) -> None:
+        """
+        Record the outcome of validating one generated command.
+
+        Args:
+            model: Model that generated the command.
+            needed_repair: Whether the first command failed validation.
+            repaired: Whether a repair round trip produced a valid command.
+            attempts: Number of repair round trips made.
+        """
+
+        def add(data: Any) -> Dict[str, Dict[str, int]]:
+            data = data if isinstance(data, dict) else {}
+            counters = data.setdefault(
+                model, {"validated": 0, "needed_repair": 0, "repaired": 0, "attempts": 0}
+            )
+            counters["validated"] += 1
+            counters["needed_repair"] += int(needed_repair)
+            counters["repaired"] += int(repaired)
+            counters["attempts"] += attempts
+            return data
+
+        try:
+            update_json_atomic(self.stats_path, add)
+        except OSError:
+            # The command is already validated; only the repair rate in pop stats is off
+            pass
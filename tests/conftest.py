@@ -1,8 +1,214 @@
 """Pytest configuration and fixtures."""
+import json
+import os
 import pytest
 import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path, monkeypatch):
+    """Keep caches and local state written by tests out of the real home."""
+    cache_dir = tmp_path / "pop-cache"
+    monkeypatch.setenv("POP_CACHE_DIR", str(cache_dir))
+    # Shell history is read from the home directory
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    monkeypatch.delenv("HISTFILE", raising=False)
+    return cache_dir
+
+
+@pytest.fixture(scope="session")
+def bench_settings():
+    """Benchmark knobs from the environment: repeat count, threshold and update mode."""
+    return {
+        "repeat": int(os.environ.get("POP_BENCH_REPEAT", "20")),
+        "threshold": float(os.environ.get("POP_BENCH_THRESHOLD", "0.25")),
+        "update": os.environ.get("POP_BENCH_UPDATE", "") not in ("", "0"),
+    }
+
+
+@pytest.fixture(scope="session")
+def bench_gate(bench_settings):
+    """
+    Regression gate for benchmarks.
+
+    Session-scoped, so the baseline store is resolved before per-test cache
+    isolation applies and baselines persist between runs.
+    """
+    from src.bench import BaselineStore, BenchmarkGate
+
+    return BenchmarkGate(
+        BaselineStore(),
+        threshold=bench_settings["threshold"],
+        update=bench_settings["update"],
+    )
+
+
+@pytest.fixture
+def run_bench(bench_gate, bench_settings):
+    """Time a function and fail with a readable diff if it regressed."""
+    from src.bench import run_benchmark
+
+    def run(name, func, repeat=None):
+        stats = run_benchmark(func, repeat=repeat or bench_settings["repeat"])
+        diff = bench_gate.check(name, stats)
+        if diff:
+            pytest.fail(diff, pytrace=False)
+        return stats
+
+    return run
+
+
+class MockParallaxServer:
+    """
+    Minimal OpenAI-compatible server that streams tokens slowly.
+
+    Records how many chunks it sent and when the client went away, so tests
+    can check that generation stops once the client stops reading.
+    """
+
+    def __init__(self, tokens=200, delay=0.02):
+        """
+        Initialize the server state.
+
+        Args:
+            tokens: Content chunks to stream per request.
+            delay: Seconds between chunks.
+        """
+        self.tokens = tokens
+        self.delay = delay
+        # Served models; when set, requests for other models get a 404
+        self.models = []
+        # Seconds each new connection stalls before it is served, like a TLS handshake
+        self.connect_delay = 0.0
+        # Seconds between the response headers and the first chunk
+        self.first_token_delay = 0.0
+        # Seconds the response headers are held back, like a server that only
+        # answers once the first token is ready
+        self.header_delay = 0.0
+        # Content chunks to stream instead of numbered tokens
+        self.script = None
+        # When False, requests with a response_format are rejected like an older server
+        self.response_formats = True
+        # Prompt tokens reported as served from the prefix cache; None omits the field
+        self.cached_tokens = None
+        self.last_request = None
+        self.connections = 0
+        self.sent = 0
+        self.requests = 0
+        self.disconnected = threading.Event()
+        self.finished = threading.Event()
+        self.httpd = None
+
+    @property
+    def api_base(self):
+        """Base URL to configure the client with."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def chunk(self, content=None, usage=None):
+        """Encode one SSE event."""
+        payload = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "mock-model",
+            "choices": [] if content is None else [
+                {"index": 0, "delta": {"content": content}, "finish_reason": None}
+            ],
+        }
+        if usage is not None:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def _make_handler(server):
+    """Build a request handler bound to a MockParallaxServer."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            server.connections += 1
+            time.sleep(server.connect_delay)
+            super().setup()
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                data = [{"id": m, "object": "model", "created": 0, "owned_by": "mock"}
+                        for m in server.models]
+                self.send_json(200, {"object": "list", "data": data})
+            else:
+                self.send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            server.requests += 1
+            server.last_request = request
+            if "response_format" in request and not server.response_formats:
+                self.send_json(400, {"error": {"message": "response_format is not supported"}})
+                return
+            if server.models and request.get("model") not in server.models:
+                self.send_json(
+                    404, {"error": {"message": f"model {request.get('model')} not found"}}
+                )
+                return
+            time.sleep(server.header_delay)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            contents = server.script or [f"tok{i} " for i in range(server.tokens)]
+            try:
+                time.sleep(server.first_token_delay)
+                for content in contents:
+                    self.wfile.write(server.chunk(content))
+                    self.wfile.flush()
+                    server.sent += 1
+                    time.sleep(server.delay)
+                usage = {"prompt_tokens": 10, "completion_tokens": len(contents),
+                         "total_tokens": 10 + len(contents)}
+                if server.cached_tokens is not None:
+                    usage["prompt_tokens_details"] = {"cached_tokens": server.cached_tokens}
+                self.wfile.write(server.chunk(usage=usage))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                server.finished.set()
+            except (BrokenPipeError, ConnectionResetError):
+                server.disconnected.set()
+
+    return Handler
+
+
+@pytest.fixture
+def mock_parallax_server():
+    """Run a MockParallaxServer on a free local port for the duration of a test."""
+    server = MockParallaxServer()
+    server.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(server))
+    server.httpd.daemon_threads = True
+    thread = threading.Thread(
+        target=server.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 """Simplified automated test runner that works without extra dependencies."""
+import json
 import os
 import re
 import subprocess
@@ -111,7 +112,7 @@ def run_test_case(test_case: TestCase, timeout: int = 60) -> Tuple[bool, str]:
         env["PATH"] = f"{os.path.expanduser('~/.local/bin')}:{env.get('PATH', '')}"
 
         # Run pop gen command
-        cmd = ["pop", "gen", test_case.input_query]
+        cmd = ["pop", "gen", test_case.input_query, "--json"]
 
         process = subprocess.Popen(
             cmd,
@@ -131,6 +132,15 @@ def run_test_case(test_case: TestCase, timeout: int = 60) -> Tuple[bool, str]:
             return False, "Timeout"
 
         output = stdout
+
+        # Preferred: the machine-readable record printed by `pop gen --json`
+        try:
+            record = json.loads(output.strip().splitlines()[-1])
+            test_case.actual_output = record.get("command") or ""
+            return True, test_case.actual_output
+        except (ValueError, IndexError, AttributeError):
+            pass
+
         extracted_command = ""
 
         # Strategy 1: Extract from Panel (between │ markers)
@@ -0,0 +1,205 @@
+"""Tests for the benchmark harness, and the benchmarks themselves.
+
+The benchmarks are marked ``benchmark`` and deselected by default. Run them
+with ``pytest -m benchmark``. The first run on a machine records a baseline;
+later runs fail with a diff if a metric regresses. Knobs:
+
+- POP_BENCH_REPEAT: timed runs per benchmark (default 20)
+- POP_BENCH_THRESHOLD: allowed relative slowdown (default 0.25)
+- POP_BENCH_UPDATE=1: overwrite the baseline with the current results
+- POP_BENCH_BASELINE: baseline file (default: the pop cache directory)
+"""
+import io
+import subprocess
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from rich.console import Console
+
+from src.bench import (
+    BaselineStore,
+    BenchmarkGate,
+    BenchStats,
+    compare,
+    format_diff,
+    machine_fingerprint,
+    summarize,
+)
+from src.cassette import Cassette
+from src.client import ParallaxClient, closing_stream
+from src.config import AppConfig, ConfigManager
+from src.main import _extract_command, _render_stream
+
+PROJECT_DIR = Path(__file__).parent.parent
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+
+
+class TestSummarize:
+    """Test robust statistics."""
+
+    def test_median_and_mad(self):
+        """Test that an outlier moves neither the median nor the MAD much."""
+        stats = summarize([1.0, 2.0, 3.0, 4.0, 100.0])
+        assert stats.median == 3.0
+        assert stats.mad == 1.0
+        assert stats.samples == 5
+
+    def test_empty(self):
+        """Test that an empty sample is rejected."""
+        with pytest.raises(ValueError):
+            summarize([])
+
+
+class TestCompare:
+    """Test regression detection."""
+
+    def test_regression_beyond_threshold(self):
+        """Test that a large slowdown is reported."""
+        regressions = compare(
+            {"parse": BenchStats(1.0, 0.01, 20)}, {"parse": BenchStats(1.5, 0.01, 20)}, 0.25
+        )
+        assert [r.name for r in regressions] == ["parse"]
+        assert regressions[0].ratio == 1.5
+
+    def test_within_threshold(self):
+        """Test that a small slowdown passes."""
+        assert not compare(
+            {"parse": BenchStats(1.0, 0.01, 20)}, {"parse": BenchStats(1.1, 0.01, 20)}, 0.25
+        )
+
+    def test_within_noise(self):
+        """Test that a slowdown inside the baseline's noise passes."""
+        assert not compare(
+            {"parse": BenchStats(1.0, 0.3, 20)}, {"parse": BenchStats(1.5, 0.3, 20)}, 0.25
+        )
+
+    def test_new_metric_is_ignored(self):
+        """Test that metrics without a baseline never fail."""
+        assert not compare({}, {"parse": BenchStats(1.0, 0.0, 1)})
+
+    def test_format_diff(self):
+        """Test the readable report."""
+        regressions = compare({"render": BenchStats(0.002, 0.0, 5)}, {"render": BenchStats(0.004, 0.0, 5)})
+        report = format_diff(regressions, 0.25)
+        assert "1 benchmark(s) regressed by more than 25%" in report
+        assert "render" in report
+        assert "2.00x" in report
+
+
+class TestBaselineStore:
+    """Test per-machine baselines."""
+
+    def test_round_trip_per_machine(self, tmp_path):
+        """Test that baselines are kept separately per fingerprint."""
+        store = BaselineStore(tmp_path / "baselines.json")
+        store.save({"id": "a"}, {"parse": BenchStats(1.0, 0.1, 10)})
+        store.save({"id": "b"}, {"parse": BenchStats(2.0, 0.2, 10)})
+        assert store.load("a")["parse"].median == 1.0
+        assert store.load("b")["parse"].median == 2.0
+        assert store.load("c") == {}
+
+    def test_env_override(self, tmp_path, monkeypatch):
+        """Test that POP_BENCH_BASELINE selects the file."""
+        monkeypatch.setenv("POP_BENCH_BASELINE", str(tmp_path / "ci.json"))
+        assert BaselineStore().path == tmp_path / "ci.json"
+
+    def test_fingerprint_is_stable(self):
+        """Test that the fingerprint does not change between calls."""
+        assert machine_fingerprint()["id"] == machine_fingerprint()["id"]
+
+
+class TestBenchmarkGate:
+    """Test the gate's record-then-compare flow."""
+
+    def test_records_then_compares(self, tmp_path):
+        """Test that the first result becomes the baseline and later ones are checked."""
+        gate = BenchmarkGate(BaselineStore(tmp_path / "b.json"), machine={"id": "m"})
+        assert gate.check("parse", BenchStats(1.0, 0.0, 5)) is None
+        assert gate.check("parse", BenchStats(1.1, 0.0, 5)) is None
+        assert "parse" in gate.check("parse", BenchStats(2.0, 0.0, 5))
+
+    def test_update_mode(self, tmp_path):
+        """Test that update mode replaces the baseline instead of failing."""
+        store = BaselineStore(tmp_path / "b.json")
+        BenchmarkGate(store, machine={"id": "m"}).check("parse", BenchStats(1.0, 0.0, 5))
+        gate = BenchmarkGate(store, update=True, machine={"id": "m"})
+        assert gate.check("parse", BenchStats(2.0, 0.0, 5)) is None
+        assert store.load("m")["parse"].median == 2.0
+
+
+@pytest.mark.benchmark
+class TestBenchmarks:
+    """Microbenchmarks of the CLI's local hot paths."""
+
+    @pytest.fixture
+    def library_outputs(self):
+        """Raw outputs from the cassette library."""
+        return [
+            stream.text
+            for path in sorted(CASSETTE_DIR.glob("*.jsonl"))
+            for stream in Cassette.load(path).streams
+        ]
+
+    def test_startup(self, run_bench, bench_settings):
+        """Time importing the CLI in a fresh interpreter."""
+        run_bench(
+            "startup",
+            lambda: subprocess.run(
+                [sys.executable, "-c", "import src.main"], cwd=PROJECT_DIR, check=True
+            ),
+            repeat=max(3, bench_settings["repeat"] // 4),
+        )
+
+    def test_config_load(self, run_bench, tmp_path):
+        """Time loading and validating the configuration file."""
+        config_path = tmp_path / "config.yaml"
+        ConfigManager(config_path=config_path).save(
+            AppConfig(api_base="http://localhost:3001/v1", model="bench-model")
+        )
+        # A fresh manager each run, since load() caches the parsed config
+        run_bench("config_load", lambda: ConfigManager(config_path=config_path).load())
+
+    def test_parse_extract(self, run_bench, library_outputs):
+        """Time command extraction over the cassette library."""
+        run_bench(
+            "parse_extract", lambda: [_extract_command(text) for text in library_outputs]
+        )
+
+    def test_render(self, run_bench):
+        """Time rendering recorded streams to a terminal."""
+        streams = [
+            stream
+            for path in sorted(CASSETTE_DIR.glob("*.jsonl"))
+            for stream in Cassette.load(path).streams
+        ]
+        sink = Console(file=io.StringIO(), force_terminal=True, width=100)
+
+        def render():
+            for stream in streams:
+                _render_stream(stream.replay(speed=0))
+
+        with patch("src.main.console", sink):
+            run_bench("render", render)
+
+    def test_ttft_prewarm(self, run_bench, mock_parallax_server):
+        """Time from start to first token, with and without connecting during local work."""
+        mock_parallax_server.tokens = 1
+        mock_parallax_server.delay = 0
+        mock_parallax_server.connect_delay = 0.05
+
+        def first_token(prewarm):
+            client = ParallaxClient(
+                AppConfig(api_base=mock_parallax_server.api_base, model="mock-model")
+            )
+            if prewarm:
+                client.prewarm()
+            time.sleep(0.05)  # config, history and cache lookups
+            with closing_stream(client.generate_command_stream("q", "sys")) as chunks:
+                next(chunks)
+
+        cold = run_bench("ttft_cold", lambda: first_token(False), repeat=5)
+        warm = run_bench("ttft_prewarmed", lambda: first_token(True), repeat=5)
+        assert warm.median < cold.median - 0.03
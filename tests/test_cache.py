@@ -0,0 +1,214 @@
+"""Tests for the response cache and the prewarm job."""
+import io
+import json
+import time
+
+import pytest
+
+from src.cache import (
+    CacheEntry,
+    ResponseCache,
+    cache_key,
+    export_bundle,
+    import_bundle,
+    normalize_query,
+)
+from src.history import QueryHistory
+from src.prewarm import Prewarmer
+
+ENV = "OS: Linux 6.1, Shell: /bin/bash"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """Cache in a temporary directory."""
+    return ResponseCache(tmp_path / "responses", ttl_hours=1)
+
+
+class TestCacheKey:
+    """Test what identifies a cache entry."""
+
+    def test_normalization(self):
+        """Test that case, spacing and trailing punctuation are ignored."""
+        assert normalize_query("  List   FILES? ") == "list files"
+        assert cache_key("List files?", ENV, "m") == cache_key("list files", ENV, "m")
+
+    def test_environment_and_model_change_key(self):
+        """Test that a different OS, shell or model gives a different entry."""
+        key = cache_key("list files", ENV, "m")
+        assert cache_key("list files", "OS: Linux 6.8, Shell: /bin/bash", "m") != key
+        assert cache_key("list files", ENV, "other") != key
+
+    def test_output_mode_changes_key(self):
+        """Test that JSON answers to the structured prompt are keyed apart from free text."""
+        assert cache_key("list files", ENV, "m", structured=True) != cache_key(
+            "list files", ENV, "m"
+        )
+
+    def test_prompt_layout_changes_key(self, monkeypatch):
+        """Test that answers to a differently laid out prompt are not reused."""
+        key = cache_key("list files", ENV, "m")
+        monkeypatch.setattr("src.cache.PROMPT_LAYOUT_VERSION", 999)
+        assert cache_key("list files", ENV, "m") != key
+
+
+class TestResponseCache:
+    """Test storing and looking up commands."""
+
+    def test_round_trip(self, cache):
+        """Test that a stored command is found again."""
+        cache.store("find big files", ENV, "m", "find . -size +100M", "slow on large trees")
+        entry = cache.get("Find big files", ENV, "m")
+        assert entry.command == "find . -size +100M"
+        assert entry.warning == "slow on large trees"
+        assert cache.get("find big files", ENV, "other") is None
+
+    def test_structured_entries_are_separate(self, cache):
+        """Test that a free text answer is not served for a structured request."""
+        cache.store("list files", ENV, "m", "ls")
+        assert cache.get("list files", ENV, "m", structured=True) is None
+        entry = cache.store("list files", ENV, "m", "ls -la", structured=True)
+        assert cache.load(entry.key).addressed
+        assert cache.get("list files", ENV, "m", structured=True).command == "ls -la"
+        assert cache.get("list files", ENV, "m").command == "ls"
+
+    def test_expired_entry_is_a_miss(self, cache):
+        """Test that entries older than the TTL are not served."""
+        entry = cache.store("list files", ENV, "m", "ls")
+        entry.created_at = time.time() - 7200
+        cache.put(entry)
+        assert cache.get("list files", ENV, "m") is None
+        assert cache.load(entry.key) is not None
+
+    def test_disabled(self, tmp_path):
+        """Test that a zero TTL disables the cache."""
+        cache = ResponseCache(tmp_path, ttl_hours=0)
+        cache.store("list files", ENV, "m", "ls")
+        assert cache.get("list files", ENV, "m") is None
+        assert list(cache.entries()) == []
+
+    def test_corrupt_entry(self, cache):
+        """Test that an unreadable entry is a miss."""
+        entry = cache.store("list files", ENV, "m", "ls")
+        path = cache.cache_dir / entry.key[:2] / f"{entry.key}.json"
+        path.write_text("{")
+        assert cache.get("list files", ENV, "m") is None
+
+    def test_default_location(self, isolated_cache_dir):
+        """Test that entries live in the cache directory."""
+        assert ResponseCache().cache_dir == isolated_cache_dir / "responses"
+
+    def test_entry_validation(self):
+        """Test that malformed entries are rejected."""
+        with pytest.raises(ValueError):
+            CacheEntry.from_dict({"key": "x"})
+
+
+class TestPrewarmer:
+    """Test regenerating entries from history."""
+
+    @pytest.fixture
+    def history(self, tmp_path):
+        """History with a frequent and a rare query."""
+        history = QueryHistory(tmp_path / "history.jsonl")
+        for _ in range(3):
+            history.record("list files", ENV, "m")
+        history.record("show disk usage", ENV, "m")
+        return history
+
+    def test_warms_missing_entries(self, cache, history):
+        """Test that missing entries are generated and fresh ones skipped."""
+        cache.store("show disk usage", ENV, "m", "df -h")
+        calls = []
+
+        def generate(query):
+            calls.append(query)
+            return "ls -la", None
+
+        report = Prewarmer(cache, history, ENV, "m", generate).run(limit=10)
+
+        assert calls == ["list files"]
+        assert report.warmed == ["list files"]
+        assert report.fresh == ["show disk usage"]
+        assert cache.get("list files", ENV, "m").command == "ls -la"
+
+    def test_environment_change_reissues(self, cache, history):
+        """Test that entries are regenerated for a new OS version or model."""
+        Prewarmer(cache, history, ENV, "m", lambda q: ("ls", None)).run(limit=10)
+
+        new_env = "OS: Linux 6.8, Shell: /bin/bash"
+        report = Prewarmer(cache, history, new_env, "m", lambda q: ("ls", None)).run(limit=10)
+        assert sorted(report.warmed) == ["list files", "show disk usage"]
+
+        todo, _ = Prewarmer(cache, history, new_env, "new-model", lambda q: ("ls", None)).plan(10)
+        assert len(todo) == 2
+
+    def test_failures_are_reported(self, cache, history):
+        """Test that a failed generation does not stop the run."""
+
+        def generate(query):
+            if query == "list files":
+                raise ValueError("server down")
+            return "df -h", None
+
+        report = Prewarmer(cache, history, ENV, "m", generate).run(limit=10)
+        assert report.failed == [("list files", "server down")]
+        assert report.warmed == ["show disk usage"]
+
+    def test_busy_machine_defers(self, cache, history):
+        """Test that nothing is generated while the idle check fails."""
+        report = Prewarmer(
+            cache, history, ENV, "m", lambda q: ("ls", None), idle_check=lambda: False
+        ).run(limit=10)
+        assert report.warmed == []
+        assert len(report.deferred) == 2
+
+
+class TestBundles:
+    """Test bundle export and import."""
+
+    def test_round_trip(self, tmp_path):
+        """Test that a bundle carries entries between caches."""
+        source = ResponseCache(tmp_path / "a")
+        source.store("list files", ENV, "m", "ls -la")
+        source.store("disk usage", ENV, "m", "df -h")
+        out = io.StringIO()
+        assert export_bundle(source, out) == 2
+
+        target = ResponseCache(tmp_path / "b")
+        lines = out.getvalue().splitlines() + ["not json", '{"key": "../x"}']
+        assert import_bundle(target, lines) == 2
+        assert target.get("disk usage", ENV, "m").command == "df -h"
+
+    def test_newer_entry_wins(self, tmp_path):
+        """Test that importing never replaces a newer local entry."""
+        cache = ResponseCache(tmp_path)
+        entry = cache.store("list files", ENV, "m", "ls -la")
+        older = CacheEntry(**{**entry.to_dict(), "command": "ls", "created_at": 1.0})
+        assert import_bundle(cache, [json.dumps(older.to_dict())]) == 0
+        assert cache.get("list files", ENV, "m").command == "ls -la"
+
+    def test_imports_are_untrusted_unless_asked(self, tmp_path):
+        """Test that bundle entries are confirmed before running, whatever the bundle says."""
+        entry = ResponseCache(tmp_path / "a").store("list files", ENV, "m", "ls -la")
+        line = json.dumps(entry.to_dict())
+
+        untrusted = ResponseCache(tmp_path / "b")
+        assert import_bundle(untrusted, [line]) == 1
+        assert untrusted.get("list files", ENV, "m").from_shared
+
+        trusted = ResponseCache(tmp_path / "c")
+        assert import_bundle(trusted, [line], trusted=True) == 1
+        assert not trusted.get("list files", ENV, "m").from_shared
+
+    def test_forged_key_is_skipped(self, tmp_path):
+        """Test that an entry cannot be planted under another query's key."""
+        entry = ResponseCache(tmp_path / "a").store("list files", ENV, "m", "ls -la")
+        forged = {
+            **entry.to_dict(),
+            "key": cache_key("disk usage", ENV, "m"),
+            "command": "rm -rf ~",
+        }
+        cache = ResponseCache(tmp_path / "b")
+        assert import_bundle(cache, [json.dumps(forged)]) == 0
+        assert cache.get("disk usage", ENV, "m") is None
@@ -0,0 +1,223 @@
+"""Tests for stream cassette recording and replay."""
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+from typer.testing import CliRunner
+
+from src.cassette import (
+    Cassette,
+    CassetteRecorder,
+    CassetteStream,
+    RecordingClient,
+    ReplayClient,
+    hash_messages,
+)
+from src.config import AppConfig
+from src.main import _extract_command, _strip_markdown_code_blocks, app
+
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+LIBRARY = sorted(CASSETTE_DIR.glob("*.jsonl"))
+
+runner = CliRunner()
+
+
+def library_streams():
+    """All recorded streams in the cassette library, with readable IDs."""
+    params = []
+    for path in LIBRARY:
+        for index, stream in enumerate(Cassette.load(path).streams):
+            params.append(pytest.param(stream, id=f"{path.stem}-{index}"))
+    return params
+
+
+@pytest.fixture
+def config():
+    """Minimal valid configuration."""
+    return AppConfig(api_base="http://localhost:3001/v1", model="test-model")
+
+
+class TestCassetteRecorder:
+    """Test recording streams."""
+
+    def test_round_trip(self, tmp_path):
+        """Test that recorded chunks, usage and hash load back unchanged."""
+        path = tmp_path / "out.jsonl"
+        recorder = CassetteRecorder(path)
+        messages = [{"role": "user", "content": "list files"}]
+
+        chunks = list(
+            recorder.record(
+                "m", messages, iter(["ls", " -la"]), usage=lambda: {"total_tokens": 5}
+            )
+        )
+        assert chunks == ["ls", " -la"]
+
+        stream = Cassette.load(path).streams[0]
+        assert stream.text == "ls -la"
+        assert stream.usage == {"total_tokens": 5}
+        assert stream.header["messages_hash"] == hash_messages(messages)
+        assert stream.header["query"] == "list files"
+        offsets = [offset for offset, _ in stream.chunks]
+        assert offsets == sorted(offsets)
+
+    def test_appends_streams(self, tmp_path):
+        """Test that each recording is appended as a new stream."""
+        path = tmp_path / "out.jsonl"
+        recorder = CassetteRecorder(path)
+        for text in ("first", "second"):
+            list(recorder.record("m", [], iter([text])))
+        assert [s.text for s in Cassette.load(path).streams] == ["first", "second"]
+
+    def test_interrupted_stream_is_kept(self, tmp_path):
+        """Test that a stream cut short is still written and replayable."""
+        path = tmp_path / "out.jsonl"
+
+        def failing():
+            yield "partial"
+            raise ConnectionError("dropped")
+
+        with pytest.raises(ConnectionError):
+            list(CassetteRecorder(path).record("m", [], failing()))
+
+        stream = Cassette.load(path).streams[0]
+        assert stream.text == "partial"
+        assert stream.usage is None
+
+
+class TestCassetteLoad:
+    """Test cassette parsing."""
+
+    def test_missing_file(self, tmp_path):
+        """Test that a missing file raises ValueError."""
+        with pytest.raises(ValueError, match="Cannot read cassette"):
+            Cassette.load(tmp_path / "missing.jsonl")
+
+    def test_chunk_before_header(self, tmp_path):
+        """Test that a malformed cassette is rejected."""
+        path = tmp_path / "bad.jsonl"
+        path.write_text('[0.1, "ls"]\n')
+        with pytest.raises(ValueError, match="chunk before header"):
+            Cassette.load(path)
+
+    def test_missing_end_marker(self, tmp_path):
+        """Test that a stream without an end marker is still loaded."""
+        path = tmp_path / "cut.jsonl"
+        path.write_text('{"v": 1}\n[0.2, "ls"]\n')
+        stream = Cassette.load(path).streams[0]
+        assert stream.text == "ls"
+        assert stream.duration == 0.2
+
+
+class TestReplay:
+    """Test replay timing."""
+
+    def test_instant_replay(self):
+        """Test that speed 0 ignores recorded timing."""
+        stream = CassetteStream({}, [(0.0, "a"), (5.0, "b")])
+        start = time.perf_counter()
+        assert list(stream.replay(speed=0)) == ["a", "b"]
+        assert time.perf_counter() - start < 0.5
+
+    def test_accelerated_replay_keeps_relative_timing(self):
+        """Test that accelerated replay waits for scaled offsets."""
+        stream = CassetteStream({}, [(0.0, "a"), (1.0, "b")])
+        start = time.perf_counter()
+        list(stream.replay(speed=20))
+        elapsed = time.perf_counter() - start
+        assert 0.04 <= elapsed < 0.5
+
+    def test_ttft(self):
+        """Test time to first token."""
+        assert CassetteStream({}, [(0.4, "a"), (0.5, "b")]).ttft == 0.4
+        assert CassetteStream({}, []).ttft is None
+
+
+class TestClients:
+    """Test recording and replaying through ParallaxClient."""
+
+    def test_replay_client_cycles_streams(self, config):
+        """Test that streams are served in order and cycled."""
+        cassette = Cassette(
+            [
+                CassetteStream({}, [(0.0, "one")], usage={"total_tokens": 1}),
+                CassetteStream({}, [(0.0, "two")]),
+            ]
+        )
+        client = ReplayClient(config, cassette, speed=0)
+        results = [client.generate_command("q", "sys") for _ in range(3)]
+        assert results == ["one", "two", "one"]
+        assert client.last_usage == {"total_tokens": 1}
+
+    @patch("src.client.OpenAI")
+    def test_recording_client(self, mock_openai, config, tmp_path):
+        """Test that live streams are recorded with server usage."""
+        chunk = MagicMock()
+        chunk.choices = [MagicMock()]
+        chunk.choices[0].delta.content = "ls -la"
+        chunk.usage = None
+        final = MagicMock()
+        final.choices = []
+        final.usage.prompt_tokens = 5
+        final.usage.completion_tokens = 4
+        final.usage.total_tokens = 9
+        mock_openai.return_value.chat.completions.create.return_value = iter([chunk, final])
+
+        path = tmp_path / "rec.jsonl"
+        client = RecordingClient(config, path)
+        assert client.generate_command("list files", "sys") == "ls -la"
+
+        stream = Cassette.load(path).streams[0]
+        assert stream.text == "ls -la"
+        assert stream.header["model"] == "test-model"
+        assert stream.usage == client.last_usage
+        assert stream.usage["total_tokens"] == 9
+
+    def test_gen_replay(self, config):
+        """Test that gen --replay uses the cassette instead of the server."""
+        with patch("src.main.config_manager") as mock_manager:
+            mock_manager.get.return_value = config
+            result = runner.invoke(
+                app,
+                [
+                    "gen",
+                    "list files",
+                    "--json",
+                    "--replay",
+                    str(CASSETTE_DIR / "reasoning_basic.jsonl"),
+                    "--replay-speed",
+                    "0",
+                ],
+            )
+        assert result.exit_code == 0
+        assert '"command": "ls -la"' in result.stdout
+
+    def test_gen_record_and_replay_conflict(self, tmp_path):
+        """Test that --record and --replay are mutually exclusive."""
+        result = runner.invoke(
+            app,
+            ["gen", "q", "--record", str(tmp_path / "a"), "--replay", str(tmp_path / "b")],
+        )
+        assert result.exit_code != 0
+
+
+class TestCassetteLibrary:
+    """Run extraction over the recorded reasoning-model outputs."""
+
+    def test_library_is_not_empty(self):
+        """Test that the fixture library is present."""
+        assert LIBRARY
+
+    @pytest.mark.parametrize("stream", library_streams())
+    def test_extraction(self, stream):
+        """Test that each recorded output yields the expected command and warning."""
+        expected = stream.header["expected"]
+        command, warning = _extract_command("".join(stream.replay(speed=0)))
+        assert command == expected["command"]
+        assert warning == expected["warning"]
+
+    @pytest.mark.parametrize("stream", library_streams())
+    def test_reasoning_is_stripped(self, stream):
+        """Test that no reasoning leaks into the extracted command."""
+        assert "<think>" not in _strip_markdown_code_blocks(stream.text)
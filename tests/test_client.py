@@ -1,11 +1,23 @@
 """Tests for Parallax client."""
+import json
+import socket
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
 from openai import APIConnectionError
 
-from src.client import ParallaxConnectionError, ParallaxClient
+from src.client import (
+    ParallaxConnectionError,
+    ParallaxClient,
+    ParallaxModelNotFoundError,
+    ParallaxTimeoutError,
+    candidate_temperatures,
+    closing_stream,
+)
 from src.config import AppConfig
+from src.health import FAILURE_THRESHOLD
+from src.prompts import PROMPT_LAYOUT_VERSION
 
 
 class TestParallaxClient:
@@ -77,7 +89,7 @@ class TestParallaxClient:
         assert "Is Parallax running" in str(exc_info.value)
 
     def test_generate_command_stream_includes_system_info(self, client):
-        """Test that system info is included in user message."""
+        """Test that system info follows the system prompt and the query comes last."""
         with patch.object(client.client.chat.completions, "create") as mock_create:
             mock_chunk = MagicMock()
             mock_chunk.choices = [MagicMock()]
@@ -93,8 +105,8 @@ class TestParallaxClient:
             assert len(messages) == 2
             assert messages[0]["role"] == "system"
             assert messages[1]["role"] == "user"
-            assert "macOS /bin/zsh" in messages[1]["content"]
-            assert "test query" in messages[1]["content"]
+            assert messages[0]["content"].endswith("Environment: macOS /bin/zsh")
+            assert messages[1]["content"] == "User request: test query"
 
     def test_generate_command_stream_uses_correct_model(self, client):
         """Test that correct model is used."""
@@ -111,3 +123,387 @@ class TestParallaxClient:
             assert call_args.kwargs["stream"] is True
             assert call_args.kwargs["temperature"] == 0.1
 
+
+    def test_candidate_temperatures(self):
+        """Test temperature spread for multi-candidate generation."""
+        assert candidate_temperatures(1) == [0.1]
+        temperatures = candidate_temperatures(3)
+        assert temperatures[0] == 0.1
+        assert temperatures == sorted(temperatures)
+        assert len(set(temperatures)) == 3
+
+    def test_generate_candidates(self, client):
+        """Test that one request is sent per candidate with varied temperature."""
+        with patch.object(client.client.chat.completions, "create") as mock_create:
+            def make_stream(**kwargs):
+                mock_chunk = MagicMock()
+                mock_chunk.choices = [MagicMock()]
+                mock_chunk.choices[0].delta.content = f"ls # {kwargs['temperature']}"
+                return [mock_chunk]
+
+            mock_create.side_effect = make_stream
+
+            result = client.generate_candidates("list files", "macOS /bin/zsh", 3)
+
+            assert len(result) == 3
+            assert mock_create.call_count == 3
+            temperatures = {call.kwargs["temperature"] for call in mock_create.call_args_list}
+            assert len(temperatures) == 3
+
+    def test_generate_candidates_partial_failure(self, client):
+        """Test that failed candidates are dropped when others succeed."""
+        with patch.object(client, "generate_command") as mock_generate:
+            mock_generate.side_effect = [ParallaxConnectionError(), "ls"]
+
+            result = client.generate_candidates("list files", "macOS /bin/zsh", 2)
+
+            assert result == ["ls"]
+
+    def test_generate_candidates_all_fail(self, client):
+        """Test that an error is raised when every candidate fails."""
+        with patch.object(client, "generate_command") as mock_generate:
+            mock_generate.side_effect = ParallaxConnectionError()
+
+            with pytest.raises(ParallaxConnectionError):
+                client.generate_candidates("list files", "macOS /bin/zsh", 2)
+
+    def test_repair_command_stream(self, client):
+        """Test that a repair replays the rejected command and the error."""
+        with patch.object(client.client.chat.completions, "create") as mock_create:
+            mock_chunk = MagicMock()
+            mock_chunk.choices = [MagicMock()]
+            mock_chunk.choices[0].delta.content = "ls -la"
+            mock_create.return_value = [mock_chunk]
+
+            result = list(
+                client.repair_command_stream(
+                    "list files", "macOS /bin/zsh", "ls -la |", "syntax error"
+                )
+            )
+
+            assert result == ["ls -la"]
+            messages = mock_create.call_args.kwargs["messages"]
+            assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+            assert messages[2]["content"] == "ls -la |"
+            assert "syntax error" in messages[3]["content"]
+
+    def test_few_shot_examples_follow_system_prompt(self, client):
+        """Test that selected examples become earlier turns."""
+        client.example_selector = lambda query: [("show disk space", "df -h")]
+        messages = client._build_messages("show memory", "Linux /bin/bash")
+        assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+        assert messages[1]["content"] == "User request: show disk space"
+        assert messages[2]["content"] == "df -h"
+        assert "show memory" in messages[3]["content"]
+
+    def test_stable_prefix_across_queries(self, client):
+        """Test that only the trailing messages differ between requests."""
+        client.example_selector = lambda query: [(f"like {query}", "ls")]
+        client.docs_selector = lambda query: f"help for {query}"
+        one = client._build_messages("show memory", "Linux /bin/bash")
+        two = client._build_messages("show disk", "Linux /bin/bash")
+        assert one[0] == two[0]
+        assert "Linux /bin/bash" in one[0]["content"]
+        assert one[-1]["content"].startswith("Reference for the installed tools:")
+
+    def test_docs_reference_in_user_message(self, client):
+        """Test that local reference text is added to the request, not the system prompt."""
+        client.docs_selector = lambda query: "du (--help): -h, --human-readable"
+        messages = client._build_messages("du human readable", "Linux /bin/bash")
+        assert "--human-readable" in messages[-1]["content"]
+        assert "--human-readable" not in messages[0]["content"]
+        assert messages[-1]["content"].endswith("User request: du human readable")
+
+
+class TestStreamCancellation:
+    """Test that abandoned streams stop generation on the server."""
+
+    def make_client(self, server, deadline=30.0):
+        """Create a client for the mock server."""
+        return ParallaxClient(
+            AppConfig(api_base=server.api_base, model="mock-model", request_deadline=deadline)
+        )
+
+    def test_complete_stream(self, mock_parallax_server):
+        """Test a full stream against the mock server, with usage."""
+        mock_parallax_server.tokens = 5
+        mock_parallax_server.delay = 0
+        client = self.make_client(mock_parallax_server)
+        assert client.generate_command("q", "sys") == "tok0 tok1 tok2 tok3 tok4 "
+        assert client.last_usage["completion_tokens"] == 5
+
+    def test_early_exit_stops_generation(self, mock_parallax_server):
+        """Test that leaving the stream early closes the connection."""
+        client = self.make_client(mock_parallax_server)
+        with closing_stream(client.generate_command_stream("q", "sys")) as chunks:
+            for index, _ in enumerate(chunks):
+                if index == 2:
+                    break
+
+        assert mock_parallax_server.disconnected.wait(timeout=2)
+        assert mock_parallax_server.sent < mock_parallax_server.tokens
+        assert not mock_parallax_server.finished.is_set()
+
+    def test_interrupt_stops_generation(self, mock_parallax_server):
+        """Test that Ctrl-C while consuming closes the connection."""
+        client = self.make_client(mock_parallax_server)
+        with pytest.raises(KeyboardInterrupt):
+            with closing_stream(client.generate_command_stream("q", "sys")) as chunks:
+                for index, _ in enumerate(chunks):
+                    if index == 2:
+                        raise KeyboardInterrupt
+
+        assert mock_parallax_server.disconnected.wait(timeout=2)
+        assert not mock_parallax_server.finished.is_set()
+
+    def test_deadline_cancels_request(self, mock_parallax_server):
+        """Test that the total deadline is enforced and the server stops."""
+        mock_parallax_server.delay = 0.05
+        client = self.make_client(mock_parallax_server, deadline=0.5)
+
+        start = time.monotonic()
+        with pytest.raises(ParallaxTimeoutError, match="0.5s deadline"):
+            client.generate_command("q", "sys")
+
+        assert time.monotonic() - start < 2
+        assert mock_parallax_server.disconnected.wait(timeout=2)
+        assert mock_parallax_server.sent < mock_parallax_server.tokens
+
+    def test_deadline_unblocks_stalled_stream(self, mock_parallax_server):
+        """Test that a server that stops sending mid-stream cannot hang the client."""
+        mock_parallax_server.tokens = 2
+        mock_parallax_server.delay = 5
+        client = self.make_client(mock_parallax_server, deadline=0.5)
+
+        start = time.monotonic()
+        with pytest.raises(ParallaxTimeoutError):
+            client.generate_command("q", "sys")
+        assert time.monotonic() - start < 2
+
+
+    def test_records_prefix_cache_usage(self, mock_parallax_server):
+        """Test that cached prompt tokens and time to first token are recorded."""
+        mock_parallax_server.tokens = 2
+        mock_parallax_server.delay = 0
+        mock_parallax_server.cached_tokens = 8
+        client = self.make_client(mock_parallax_server)
+        assert "".join(client.generate_command_stream("list", "Linux /bin/bash")) == "tok0 tok1 "
+        assert client.last_usage["cached_tokens"] == 8
+        assert client.last_ttft is not None
+
+        counters = client.prefix_stats.load()[str(PROMPT_LAYOUT_VERSION)]["mock-model"]
+        assert counters["requests"] == counters["prefix_hits"] == 1
+        assert counters["cached_tokens"] == 8
+
+
+class TestPrewarm:
+    """Test connecting in the background while local work runs."""
+
+    def make_client(self, server):
+        """Create a client for the mock server."""
+        server.tokens = 2
+        server.delay = 0
+        server.connect_delay = 0.3
+        return ParallaxClient(AppConfig(api_base=server.api_base, model="mock-model"))
+
+    def test_request_reuses_warm_connection(self, mock_parallax_server):
+        """Test that the request after a warm-up skips the connection setup."""
+        client = self.make_client(mock_parallax_server)
+        client.prewarm()
+        # Local work that outlasts the warm-up
+        client._prewarm[1].join(timeout=5)
+
+        start = time.perf_counter()
+        assert client.generate_command("q", "sys") == "tok0 tok1 "
+        assert time.perf_counter() - start < 0.2
+        assert mock_parallax_server.connections == 1
+
+    def test_request_waits_for_pending_warm_up(self, mock_parallax_server):
+        """Test that a request joins a warm-up in progress instead of connecting again."""
+        client = self.make_client(mock_parallax_server)
+        client.prewarm()
+        assert client.generate_command("q", "sys") == "tok0 tok1 "
+        assert mock_parallax_server.connections == 1
+
+    def test_warm_up_refreshes_model_catalog(self, mock_parallax_server):
+        """Test that the warm-up's model list is stored in the catalog."""
+        mock_parallax_server.models = ["mock-model", "a-model"]
+        client = self.make_client(mock_parallax_server)
+        client.prewarm()
+        client._prewarm[1].join(timeout=5)
+        assert client.catalog.cached(mock_parallax_server.api_base) == ["a-model", "mock-model"]
+
+    def test_cancel_then_reuse(self, mock_parallax_server):
+        """Test that a cancelled warm-up leaves the client usable."""
+        client = self.make_client(mock_parallax_server)
+        client.prewarm()
+        client.cancel_prewarm()
+        assert client.generate_command("q", "sys") == "tok0 tok1 "
+
+
+class TestStructuredOutput:
+    """Test JSON schema generation and its fallback to free text."""
+
+    def make_client(self, server):
+        """Create a client for the mock server."""
+        server.delay = 0.01
+        return ParallaxClient(AppConfig(api_base=server.api_base, model="mock-model"))
+
+    def test_stops_once_command_is_safe(self, mock_parallax_server):
+        """Test that the stream is closed as soon as the command is known to be safe."""
+        mock_parallax_server.script = [
+            '{"command": "ls', ' -la", ', '"dangerous": false, ', '"warning": "',
+            *["padding "] * 100, '"}',
+        ]
+        client = self.make_client(mock_parallax_server)
+        assert "".join(client.generate_structured_stream("q", "sys")) == "ls -la"
+        assert client.last_structured.text == "ls -la"
+        assert mock_parallax_server.last_request["response_format"]["type"] == "json_schema"
+        assert mock_parallax_server.disconnected.wait(timeout=2)
+        assert not mock_parallax_server.finished.is_set()
+
+    def test_dangerous_command(self, mock_parallax_server):
+        """Test that a flagged command keeps its warning."""
+        mock_parallax_server.script = [
+            '{"command": "rm -rf /tmp/x", "dangerous": true, ', '"warning": "Deletes x"}'
+        ]
+        client = self.make_client(mock_parallax_server)
+        text = "".join(client.generate_structured_stream("q", "sys"))
+        assert text == "rm -rf /tmp/x\n# WARNING: Deletes x"
+        assert client.last_structured.text == "# WARNING: Deletes x\nrm -rf /tmp/x"
+
+    def test_unsupported_response_format_falls_back(self, mock_parallax_server):
+        """Test that a server rejecting the schema gets the free-form request."""
+        mock_parallax_server.tokens = 2
+        mock_parallax_server.response_formats = False
+        client = self.make_client(mock_parallax_server)
+        assert "".join(client.generate_structured_stream("q", "sys")) == "tok0 tok1 "
+        assert client.last_structured is None
+        assert mock_parallax_server.requests == 2
+        assert "response_format" not in mock_parallax_server.last_request
+
+    def test_examples_in_json_form(self):
+        """Test that few-shot answers follow the structured format."""
+        client = ParallaxClient(AppConfig())
+        client.example_selector = lambda query: [("delete logs", "# WARNING: Deletes\nrm *.log")]
+        messages = client._build_messages("q", "sys", structured=True)
+        assert '"command"' in messages[0]["content"]
+        assert json.loads(messages[2]["content"]) == {
+            "command": "rm *.log", "dangerous": True, "warning": "Deletes"
+        }
+
+
+class TestFailover:
+    """Test circuit breaking and failover between endpoints."""
+
+    @pytest.fixture
+    def dead_endpoint(self):
+        """URL of a local port with nothing listening."""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        return f"http://127.0.0.1:{port}/v1"
+
+    def test_falls_back_to_alternate(self, mock_parallax_server, dead_endpoint):
+        """Test that a failed endpoint is skipped for the next one."""
+        mock_parallax_server.tokens = 2
+        mock_parallax_server.delay = 0
+        client = ParallaxClient(
+            AppConfig(
+                api_base=dead_endpoint,
+                fallback_api_bases=[mock_parallax_server.api_base],
+                model="mock-model",
+            )
+        )
+        assert client.generate_command("q", "sys") == "tok0 tok1 "
+        assert client.last_endpoint == mock_parallax_server.api_base
+        assert client.breaker.store.load(dead_endpoint).failures == 1
+
+    def test_open_breaker_fails_fast(self, dead_endpoint):
+        """Test that a known-bad endpoint is not contacted again."""
+        client = ParallaxClient(AppConfig(api_base=dead_endpoint, model="m"))
+        for _ in range(FAILURE_THRESHOLD):
+            with pytest.raises(ParallaxConnectionError):
+                client.generate_command("q", "sys")
+
+        with patch.object(client, "_stream_from") as stream_from:
+            with pytest.raises(ParallaxConnectionError, match="consecutive failures"):
+                client.generate_command("q", "sys")
+        stream_from.assert_not_called()
+
+    def test_slow_first_token_fails_over(self, mock_parallax_server, monkeypatch):
+        """Test that the adaptive timeout still bounds the wait for the first token."""
+        monkeypatch.setattr("src.health.MIN_TIMEOUT", 0.2)
+        mock_parallax_server.first_token_delay = 2
+        client = ParallaxClient(AppConfig(api_base=mock_parallax_server.api_base, model="m"))
+        for _ in range(20):
+            client.breaker.record_success(mock_parallax_server.api_base, 0.01)
+
+        start = time.monotonic()
+        with pytest.raises(ParallaxTimeoutError, match="did not respond within 0.2s"):
+            client.generate_command("q", "sys")
+        assert time.monotonic() - start < 1
+        assert client.breaker.store.load(mock_parallax_server.api_base).failures == 1
+
+    def test_held_back_headers_fail_over(self, mock_parallax_server, monkeypatch):
+        """Test that the adaptive timeout bounds a server holding its headers back."""
+        monkeypatch.setattr("src.health.MIN_TIMEOUT", 0.2)
+        mock_parallax_server.header_delay = 2
+        client = ParallaxClient(AppConfig(api_base=mock_parallax_server.api_base, model="m"))
+        for _ in range(20):
+            client.breaker.record_success(mock_parallax_server.api_base, 0.01)
+
+        start = time.monotonic()
+        with pytest.raises(ParallaxTimeoutError, match="did not respond within 0.2s"):
+            client.generate_command("q", "sys")
+        assert time.monotonic() - start < 1
+        assert client.breaker.store.load(mock_parallax_server.api_base).failures == 1
+
+    def test_slow_tokens_after_the_first(self, mock_parallax_server, monkeypatch):
+        """Test that pauses between tokens are not held to the first-token timeout."""
+        monkeypatch.setattr("src.health.MIN_TIMEOUT", 0.2)
+        mock_parallax_server.tokens = 3
+        mock_parallax_server.delay = 0.4
+        client = ParallaxClient(AppConfig(api_base=mock_parallax_server.api_base, model="m"))
+        for _ in range(20):
+            client.breaker.record_success(mock_parallax_server.api_base, 0.01)
+
+        assert client.generate_command("q", "sys") == "tok0 tok1 tok2 "
+
+    def test_probe_records_latency(self, mock_parallax_server):
+        """Test that a probe feeds the latency statistics."""
+        client = ParallaxClient(AppConfig(api_base=mock_parallax_server.api_base, model="m"))
+        latency = client.probe(mock_parallax_server.api_base)
+        assert latency > 0
+        assert len(client.breaker.store.load(mock_parallax_server.api_base).latencies) == 1
+        assert mock_parallax_server.disconnected.wait(timeout=2)
+
+
+class TestModelFallback:
+    """Test switching models when the server rejects the configured one."""
+
+    def test_switches_to_served_fallback(self, mock_parallax_server):
+        """Test that a 404 for the model refreshes the catalog and retries."""
+        mock_parallax_server.tokens = 1
+        mock_parallax_server.delay = 0
+        mock_parallax_server.models = ["mock-model"]
+        client = ParallaxClient(
+            AppConfig(
+                api_base=mock_parallax_server.api_base,
+                model="retired-model",
+                fallback_models=["missing-model", "mock-model"],
+            )
+        )
+
+        assert client.generate_command("q", "sys") == "tok0 "
+        assert client.config.model == "mock-model"
+        assert "retired-model" in client.model_notice
+
+    def test_no_fallback_raises(self, mock_parallax_server):
+        """Test that a missing model without a served fallback is reported."""
+        mock_parallax_server.models = ["mock-model"]
+        client = ParallaxClient(
+            AppConfig(api_base=mock_parallax_server.api_base, model="retired-model")
+        )
+        with pytest.raises(ParallaxModelNotFoundError, match="retired-model"):
+            client.generate_command("q", "sys")
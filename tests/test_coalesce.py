@@ -0,0 +1,153 @@
+"""Tests for coalescing identical in-flight streams."""
+import threading
+
+import pytest
+
+from src.coalesce import CoalesceStats, SingleFlight
+
+
+class GatedStream:
+    """An upstream stream that yields one chunk each time its gate is opened."""
+
+    def __init__(self, chunks):
+        """Initialize with the chunks to yield."""
+        self.chunks = chunks
+        self.calls = 0
+        self.closed = threading.Event()
+        self.gate = threading.Semaphore(0)
+
+    def start(self):
+        """Start one upstream stream."""
+        self.calls += 1
+        return self._generate()
+
+    def _generate(self):
+        """Yield the chunks as the gate allows."""
+        try:
+            for chunk in self.chunks:
+                self.gate.acquire(timeout=5)
+                yield chunk
+        finally:
+            self.closed.set()
+
+    def release_all(self):
+        """Let every chunk through."""
+        for _ in self.chunks:
+            self.gate.release()
+
+
+def consume(stream, results, index):
+    """Collect a stream into results[index], or the exception it raised."""
+    try:
+        results[index] = "".join(stream)
+    except Exception as e:
+        results[index] = e
+
+
+class TestSingleFlight:
+    """Test sharing one upstream stream among identical requests."""
+
+    def test_concurrent_requests_share_upstream(self):
+        """Test that a request joining mid-stream gets the full response from one call."""
+        flights = SingleFlight()
+        upstream = GatedStream(["ls", " -la"])
+        first = flights.stream("key", upstream.start)
+        upstream.gate.release()
+        assert next(first) == "ls"
+
+        second = flights.stream("key", upstream.start)
+        assert next(second) == "ls"
+        upstream.gate.release()
+        assert "".join(first) == " -la"
+        assert "".join(second) == " -la"
+        assert upstream.calls == 1
+        assert (flights.upstream, flights.coalesced) == (1, 1)
+
+    def test_leader_cancel_keeps_followers(self):
+        """Test that abandoning the first request does not cut off the others."""
+        flights = SingleFlight()
+        upstream = GatedStream(["a", "b", "c"])
+        leader = flights.stream("key", upstream.start)
+        upstream.gate.release()
+        assert next(leader) == "a"
+        follower = flights.stream("key", upstream.start)
+        assert next(follower) == "a"
+
+        leader.close()
+        assert not upstream.closed.is_set()
+        upstream.release_all()
+        assert "".join(follower) == "bc"
+        assert upstream.calls == 1
+
+    def test_last_subscriber_leaving_closes_upstream(self):
+        """Test that the upstream stops once nobody listens."""
+        flights = SingleFlight()
+        upstream = GatedStream(["a", "b", "c"])
+        stream = flights.stream("key", upstream.start)
+        upstream.gate.release()
+        next(stream)
+        stream.close()
+        upstream.release_all()
+        assert upstream.closed.wait(timeout=5)
+
+        # A new request starts fresh instead of joining the abandoned stream
+        again = GatedStream(["x"])
+        again.release_all()
+        assert "".join(flights.stream("key", again.start)) == "x"
+        assert flights.upstream == 2
+
+    def test_error_reaches_every_subscriber(self):
+        """Test that an upstream failure is raised in all waiting requests."""
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(timeout=5)
+            raise ConnectionError("refused")
+            yield
+
+        results = [None]
+        thread = threading.Thread(target=consume, args=(flights.stream("key", failing), results, 0))
+        thread.start()
+        assert started.wait(timeout=5)
+        threading.Timer(0.1, release.set).start()
+        with pytest.raises(ConnectionError):
+            "".join(flights.stream("key", failing))
+        thread.join(timeout=5)
+        assert isinstance(results[0], ConnectionError)
+        assert flights.coalesced == 1
+
+    def test_finished_flight_is_forgotten(self):
+        """Test that a later identical request starts a new upstream call."""
+        flights = SingleFlight()
+        for _ in range(2):
+            upstream = GatedStream(["x"])
+            upstream.release_all()
+            assert "".join(flights.stream("key", upstream.start)) == "x"
+        assert (flights.upstream, flights.coalesced) == (2, 0)
+
+    def test_different_keys_do_not_share(self):
+        """Test that only identical keys are coalesced."""
+        flights = SingleFlight()
+        one, two = GatedStream(["1"]), GatedStream(["2"])
+        one.release_all()
+        two.release_all()
+        assert "".join(flights.stream("a", one.start)) == "1"
+        assert "".join(flights.stream("b", two.start)) == "2"
+        assert flights.coalesced == 0
+
+
+class TestCoalesceStats:
+    """Test the persisted counters."""
+
+    def test_accumulates_runs(self, tmp_path):
+        """Test that counters from several runs are added up."""
+        stats = CoalesceStats(tmp_path / "stats.json")
+        assert stats.load() == {"upstream": 0, "coalesced": 0}
+        flights = SingleFlight()
+        flights.upstream, flights.coalesced = 3, 2
+        stats.record(flights)
+        stats.record(flights)
+        assert stats.load() == {"upstream": 6, "coalesced": 4}
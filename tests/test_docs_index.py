@@ -0,0 +1,170 @@
+"""Tests for the man page and --help index."""
+import os
+import time
+
+import pytest
+
+from src import docs_index
+from src.docs_index import DocsIndex, extract_doc, parse_doc, scan_path
+
+DU_HELP = """Usage: du [OPTION]... [FILE]...
+Summarize device usage of the set of FILEs, recursively for directories.
+
+  -a, --all             write counts for all files, not just directories
+      --apparent-size   print apparent sizes rather than device usage
+  -h, --human-readable  print sizes in human readable format (e.g., 1K 234M 2G)
+  -d, --max-depth=N     print the total for a directory only if it is N or fewer
+                          levels below the command line argument
+"""
+
+FIND_MAN = """FIND(1)                  General Commands Manual                 FIND(1)
+
+NAME
+       find - walk a file hierarchy
+
+SYNOPSIS
+       find [-H | -L | -P] [-EXdsx] [-f path] path ... [expression]
+
+PRIMARIES
+       -mtime n[smhdw]
+               True if the difference between the file last modification
+               time and the time find was started is n days.
+
+       -size n[ckMGTP]
+               True if the file's size, rounded up, is n units.
+"""
+
+
+def _tool(directory, name, script):
+    """Create an executable shell script."""
+    directory.mkdir(exist_ok=True)
+    path = directory / name
+    path.write_text(f"#!/bin/sh\n{script}\n")
+    path.chmod(0o755)
+    return path
+
+
+class TestParseDoc:
+    """Test extracting usage and options."""
+
+    def test_gnu_help_layout(self):
+        """Test short and long-only options and continuation lines."""
+        usage, options = parse_doc(DU_HELP)
+        assert usage == "Usage: du [OPTION]... [FILE]..."
+        assert options[1] == "--apparent-size print apparent sizes rather than device usage"
+        assert options[3].startswith("-d, --max-depth=N")
+        assert options[3].endswith("levels below the command line argument")
+        assert len(options) == 4
+
+    def test_man_page_layout(self):
+        """Test the SYNOPSIS line and multi-line option paragraphs."""
+        usage, options = parse_doc(FIND_MAN)
+        assert usage.startswith("find [-H | -L | -P]")
+        assert options == [
+            "-mtime n[smhdw] True if the difference between the file last modification "
+            "time and the time find was started is n days.",
+            "-size n[ckMGTP] True if the file's size, rounded up, is n units.",
+        ]
+
+    def test_overstrike_is_removed(self):
+        """Test that man's bold and underline formatting is stripped."""
+        _, options = parse_doc("  -\x08--\x08-a\x08al\x08ll\x08l  everything\n")
+        assert options == ["--all everything"]
+
+
+class TestExtract:
+    """Test running binaries for their --help output."""
+
+    def test_scan_path_first_directory_wins(self, tmp_path):
+        """Test PATH order and that non-executables are skipped."""
+        first = _tool(tmp_path / "a", "du", "true")
+        _tool(tmp_path / "b", "du", "true")
+        (tmp_path / "b" / "notes").write_text("not a program")
+        path_env = os.pathsep.join([str(tmp_path / "a"), str(tmp_path / "b"), "/nonexistent"])
+        assert scan_path(path_env) == {"du": str(first)}
+
+    def test_help_output(self, tmp_path):
+        """Test that --help output is parsed when there is no man page."""
+        path = _tool(tmp_path, "du", f"cat <<'EOF'\n{DU_HELP}EOF")
+        doc = extract_doc("du", str(path), use_man=False, help_anywhere=True)
+        assert doc.source == docs_index.HELP
+        assert doc.usage.startswith("Usage: du")
+        assert doc.mtime == os.stat(path).st_mtime
+
+    def test_dangerous_binaries_are_not_run(self, tmp_path):
+        """Test that binaries on the never-run list are not started."""
+        marker = tmp_path / "ran"
+        path = _tool(tmp_path, "reboot", f"touch {marker}")
+        assert extract_doc("reboot", str(path), use_man=False, help_anywhere=True).source is None
+        assert not marker.exists()
+
+    def test_binaries_outside_system_dirs_are_not_run(self, tmp_path):
+        """Test that the user's own scripts are only started when asked to."""
+        marker = tmp_path / "ran"
+        path = _tool(tmp_path, "deploy", f"touch {marker}")
+        assert extract_doc("deploy", str(path), use_man=False).source is None
+        assert not marker.exists()
+
+    def test_hung_binary_times_out(self, tmp_path, monkeypatch):
+        """Test that a binary waiting forever is killed."""
+        monkeypatch.setattr(docs_index, "EXTRACT_TIMEOUT", 0.3)
+        path = _tool(tmp_path, "hang", "sleep 30")
+        start = time.perf_counter()
+        assert extract_doc("hang", str(path), use_man=False, help_anywhere=True).source is None
+        assert time.perf_counter() - start < 5
+
+
+class TestDocsIndex:
+    """Test the incremental index and lookups."""
+
+    @pytest.fixture
+    def tools(self, tmp_path):
+        """A directory with two documented tools and one without docs."""
+        bin_dir = tmp_path / "bin"
+        _tool(bin_dir, "du", f"cat <<'EOF'\n{DU_HELP}EOF")
+        _tool(bin_dir, "mytool", "echo '  -x, --extract  extract the archive'")
+        _tool(bin_dir, "quiet", "true")
+        return bin_dir
+
+    def test_refresh_is_incremental(self, tmp_path, tools):
+        """Test that only new, changed and removed binaries are processed."""
+        index = DocsIndex(tmp_path / "docs")
+        report = index.refresh(scan_path(str(tools)), workers=2, use_man=False, help_anywhere=True)
+        assert (report.indexed, report.empty, report.unchanged) == (2, 1, 0)
+
+        index = DocsIndex(tmp_path / "docs")
+        report = index.refresh(scan_path(str(tools)), workers=2, use_man=False, help_anywhere=True)
+        assert (report.indexed, report.empty, report.unchanged) == (0, 0, 3)
+
+        mtime = os.stat(tools / "mytool").st_mtime + 10
+        os.utime(tools / "mytool", (mtime, mtime))
+        (tools / "quiet").unlink()
+        report = index.refresh(scan_path(str(tools)), workers=2, use_man=False, help_anywhere=True)
+        assert (report.indexed, report.removed, report.unchanged) == (1, 1, 1)
+        assert index.load("quiet") is None
+
+    def test_lookup(self, tmp_path, tools):
+        """Test that only relevant options of named tools are returned."""
+        index = DocsIndex(tmp_path / "docs")
+        index.refresh(scan_path(str(tools)), workers=1, use_man=False, help_anywhere=True)
+
+        text = index.lookup("du sizes in human readable form", 300)
+        lines = text.splitlines()
+        assert lines[0] == "du (--help): Usage: du [OPTION]... [FILE]..."
+        assert "--human-readable" in lines[1]
+        assert "mytool" not in text
+
+        assert index.lookup("sizes in human readable form", 300) == ""
+        assert index.lookup("quiet sizes", 300) == ""
+        assert index.lookup("du human readable sizes", 5) == ""
+        assert len(index.lookup("du sizes apparent human readable", 40).splitlines()) == 2
+
+    def test_common_words_need_command_form(self, tmp_path, tools):
+        """Test that a binary named like an everyday word is only matched as a command."""
+        _tool(tools, "watch", "echo '  -n, --interval  seconds between updates'")
+        index = DocsIndex(tmp_path / "docs")
+        index.refresh(scan_path(str(tools)), workers=1, use_man=False, help_anywhere=True)
+
+        assert index.mentioned("watch the interval of du") == ["du"]
+        assert index.mentioned("use `watch` to poll every interval") == ["watch"]
+        assert index.mentioned("watch -n 5 du") == ["watch", "du"]
@@ -0,0 +1,183 @@
+"""Tests for execution-based command equivalence."""
+import os
+
+import pytest
+
+from src.equivalence import (
+    DIFFERENT,
+    EQUIVALENT,
+    UNCHECKED,
+    UNSAFE,
+    build_fixture,
+    compare,
+    compare_many,
+    confinement_error,
+    run_in_fixture,
+    sandbox_available,
+    snapshot,
+)
+from src.evaluation import CaseResult, EvalCase, Target, TargetReport, apply_execution_checks
+
+
+class TestConfinement:
+    """Test the static check that keeps commands in their fixture."""
+
+    @pytest.mark.parametrize(
+        "command",
+        [
+            "rm -rf /",
+            "cat /etc/passwd",
+            "ls ~",
+            "echo x > $HOME/y",
+            "cd .. && ls",
+            "ls ../",
+            "sudo ls",
+            "ps aux | awk '{print $2}' | xargs kill",
+            "echo x > /tmp/file",
+        ],
+    )
+    def test_refused(self, command):
+        """Test that commands reaching outside the fixture are refused."""
+        assert confinement_error(command) is not None
+
+    @pytest.mark.parametrize(
+        "command",
+        [
+            'find . -name "*.py" -exec wc -l {} +',
+            "ls -la 2>/dev/null",
+            "grep -c ERROR logs/*.log",
+            "export PATH=$PATH:bin && pwd",
+            "ls a..b",
+        ],
+    )
+    def test_allowed(self, command):
+        """Test that ordinary commands inside the fixture may run."""
+        assert confinement_error(command) is None
+
+
+class TestFixture:
+    """Test the generated directory tree."""
+
+    def test_deterministic(self, tmp_path):
+        """Test that the same seed builds the same tree and a different seed does not."""
+        for name, seed in (("a", 1), ("b", 1), ("c", 2)):
+            (tmp_path / name).mkdir()
+            build_fixture(tmp_path / name, seed)
+        assert snapshot(tmp_path / "a") == snapshot(tmp_path / "b")
+        assert snapshot(tmp_path / "a") != snapshot(tmp_path / "c")
+        assert (tmp_path / "a" / "data" / "large.py").stat().st_size > 100 * 1024 * 1024
+
+
+class TestCompare:
+    """
+    Test judging commands by what they do.
+
+    The commands are fixed test inputs, so they may run without bubblewrap.
+    """
+
+    @pytest.mark.parametrize(
+        "generated, expected, status",
+        [
+            ("ls -a -l", ["ls -la"], EQUIVALENT),
+            ("find . -name '*.py' | xargs wc -l", ["find . -name '*.py' -exec wc -l {} +"],
+             EQUIVALENT),
+            ("find . -type f -name '*.py' -size +100M", ["find . -name '*.py' -size +100M"],
+             EQUIVALENT),
+            ("rm -rf *", ["rm -f *.tmp"], DIFFERENT),
+            ("rm -rf /", ["rm -f *.tmp"], UNSAFE),
+            ("ls", ["nosuchtool-xyz --list"], UNCHECKED),
+            ("ls -l", ["ls -la"], DIFFERENT),
+        ],
+    )
+    def test_verdicts(self, generated, expected, status):
+        """Test outputs and side effects decide equivalence, not wording."""
+        assert compare(generated, expected, unsandboxed=True).status == status
+
+    def test_any_alternative(self):
+        """Test that matching one accepted command is enough."""
+        assert compare("ls -l", ["ls -la", "ls -l"], unsandboxed=True).equivalent
+
+    def test_timeout(self):
+        """Test that a command that does not finish is killed and rejected."""
+        verdict = compare("sleep 5", ["true"], timeout=0.3, unsandboxed=True)
+        assert verdict.status == DIFFERENT
+        assert "timed out" in verdict.detail
+
+    def test_compare_many_keeps_order(self):
+        """Test that verdicts from the process pool come back in input order."""
+        pairs = [("ls -la", ["ls -la"]), ("rm -rf /", ["ls"]), ("pwd", ["ls"])] * 3
+        statuses = [v.status for v in compare_many(pairs, workers=2, unsandboxed=True)]
+        assert statuses == [EQUIVALENT, UNSAFE, DIFFERENT] * 3
+
+
+class TestWithoutSandbox:
+    """Test that nothing runs on the host unless explicitly allowed."""
+
+    @pytest.fixture(autouse=True)
+    def no_bwrap(self, monkeypatch):
+        """Pretend bubblewrap is not installed."""
+        monkeypatch.setattr("src.equivalence.shutil.which", lambda name: None)
+
+    def test_compare_is_unchecked(self, tmp_path):
+        """Test that a command getting around the lexical check is not run."""
+        marker = tmp_path / "ran"
+        verdict = compare(f"d={tmp_path}; touch $d/ran", ["true"])
+        assert verdict.status == UNCHECKED
+        assert "bwrap" in verdict.detail
+        assert not marker.exists()
+
+    def test_run_in_fixture_refuses(self):
+        """Test that running a command directly also requires the opt-in."""
+        with pytest.raises(RuntimeError):
+            run_in_fixture("true")
+        assert run_in_fixture("true", unsandboxed=True).exit_code == 0
+
+
+class TestBrokenSandbox:
+    """Test a bwrap that is installed but cannot create namespaces."""
+
+    def fake_bwrap(self, tmp_path, monkeypatch, probe_status):
+        """Put a bwrap on PATH that fails like it does in containers."""
+        script = tmp_path / "bwrap"
+        script.write_text(
+            "#!/bin/sh\n"
+            f'case "$*" in *" true") exit {probe_status};; esac\n'
+            "echo 'bwrap: No permissions to create new namespace' >&2\n"
+            "exit 1\n"
+        )
+        script.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+    def test_failing_probe_means_no_sandbox(self, tmp_path, monkeypatch):
+        """Test that commands are not compared when the sandbox cannot start."""
+        self.fake_bwrap(tmp_path, monkeypatch, probe_status=1)
+        assert not sandbox_available()
+        verdict = compare("ls", ["rm -f *.tmp"])
+        assert verdict.status == UNCHECKED
+        assert "namespaces" in verdict.detail
+
+    def test_setup_failure_is_not_an_exit_status(self, tmp_path, monkeypatch):
+        """Test that bwrap failing on a real run does not make both sides look alike."""
+        self.fake_bwrap(tmp_path, monkeypatch, probe_status=0)
+        assert sandbox_available()
+        verdict = compare("cat README.md", ['find . -name "*.tmp" -delete'])
+        assert verdict.status == UNCHECKED
+        assert "No permissions" in verdict.detail
+
+
+class TestExecutionChecks:
+    """Test re-judging benchmark answers by execution."""
+
+    def test_overrides_text_matching(self):
+        """Test that a destructive answer passing by word overlap is failed."""
+        case = EvalCase("tmp", "delete tmp files", ["rm -f *.tmp"], dangerous=True)
+        report = TargetReport(
+            Target("m", "http://e"),
+            [
+                CaseResult("tmp", "rm -f *", True, 0.1, 0.2, warning="Deletes"),
+                CaseResult("tmp", "rm -f  *.tmp", True, 0.1, 0.2, warning="Deletes"),
+            ],
+        )
+        apply_execution_checks([report], [case], workers=1, unsandboxed=True)
+        assert [r.passed for r in report.results] == [False, True]
+        assert report.results[0].verdict == DIFFERENT
@@ -0,0 +1,134 @@
+"""Tests for model accuracy and latency evaluation."""
+import json
+
+import pytest
+
+from src.config import AppConfig
+from src.evaluation import (
+    DEFAULT_DATASET,
+    CaseResult,
+    EvalCase,
+    Target,
+    TargetReport,
+    check_answer,
+    load_dataset,
+    load_jsonl_cases,
+    mark_pareto_frontier,
+    matches_expected,
+    run_matrix,
+)
+from src.main import _extract_command
+
+
+def report(model, pass_rate, latency):
+    """A report with the given pass rate (out of 4 cases) and latency."""
+    passed = round(pass_rate * 4)
+    results = [CaseResult(f"c{i}", "x", i < passed, 0.01, latency) for i in range(4)]
+    return TargetReport(Target(model, "http://e"), results)
+
+
+class TestMatching:
+    """Test answer checking."""
+
+    @pytest.mark.parametrize(
+        "actual, expected, passed",
+        [
+            ("ls  -la", "ls -la", True),
+            ("ls -la | head", "ls -la", True),
+            ("find . -type f -name '*.py' -size +100M", "find . -name '*.py' -size +100M", True),
+            ("ls -l", "find . -name x", False),
+            ("find /", "find . -name '*.py' -size +100M", False),
+        ],
+    )
+    def test_matches_expected(self, actual, expected, passed):
+        """Test exact, containing and word overlap matches."""
+        assert matches_expected(actual, expected) is passed
+
+    def test_dangerous_case_needs_warning(self):
+        """Test that a destructive answer without a warning fails."""
+        case = EvalCase("rm", "delete tmp", ["rm -f *.tmp"], dangerous=True)
+        assert check_answer(case, "rm -f *.tmp", "Deletes files")
+        assert not check_answer(case, "rm -f *.tmp", None)
+
+
+class TestDatasets:
+    """Test loading case files."""
+
+    def test_bundled_cases(self):
+        """Test that every bundled case and its alternatives are parsed."""
+        cases = load_dataset(DEFAULT_DATASET)
+        assert len(cases) == 10
+        assert cases[0].expected == ["ls -la", "ls -l"]
+        assert cases[0].name.startswith("TEST_CASES: Test Case 1")
+        deleting = cases[5]
+        assert deleting.dangerous
+        assert deleting.expected[0] == 'find . -name "*.tmp" -delete'
+
+    def test_jsonl_cases(self):
+        """Test JSON lines with single and multiple accepted commands."""
+        cases = load_jsonl_cases(
+            '{"query": "disk", "expected": "df -h"}\n\n'
+            '{"name": "rm", "query": "del", "expected": ["rm a", "rm -f a"], "dangerous": true}\n'
+        )
+        assert cases[0].expected == ["df -h"]
+        assert cases[1].dangerous and cases[1].name == "rm"
+
+    def test_invalid_jsonl(self):
+        """Test that a malformed line is reported with its number."""
+        with pytest.raises(ValueError, match="Line 2"):
+            load_jsonl_cases('{"query": "a", "expected": "b"}\n{"query": "a"}\n')
+
+
+class TestParetoFrontier:
+    """Test marking the accuracy versus latency frontier."""
+
+    def test_dominated_targets(self):
+        """Test that only targets no other beats on both axes are marked."""
+        fast = report("fast", 0.5, 0.1)
+        accurate = report("accurate", 1.0, 1.0)
+        worse = report("worse", 0.5, 0.5)
+        tied = report("tied", 0.5, 0.1)
+        mark_pareto_frontier([fast, accurate, worse, tied])
+        assert [fast.pareto, accurate.pareto, worse.pareto, tied.pareto] == [
+            True, True, False, True
+        ]
+
+    def test_failed_target_not_on_frontier(self):
+        """Test that a target whose requests all failed is never marked."""
+        failed = TargetReport(
+            Target("down", "http://e"), [CaseResult("c", "", False, None, 0.0, error="refused")]
+        )
+        mark_pareto_frontier([failed])
+        assert not failed.pareto
+        assert failed.to_dict()["latency_ms"] is None
+
+
+class TestRunMatrix:
+    """Test evaluating targets against a server."""
+
+    def test_models_on_endpoint(self, mock_parallax_server):
+        """Test timings for a served model and an error for an unserved one."""
+        mock_parallax_server.script = ["ls", " -la"]
+        mock_parallax_server.delay = 0
+        mock_parallax_server.models = ["good"]
+        cases = [EvalCase("list", "list files", ["ls -la"]), EvalCase("df", "disk", ["df -h"])]
+        targets = [Target(m, mock_parallax_server.api_base) for m in ("good", "missing")]
+
+        seen = []
+        reports = run_matrix(
+            AppConfig(fallback_models=["good"]),
+            targets,
+            cases,
+            "Linux /bin/bash",
+            _extract_command,
+            on_result=lambda target, result: seen.append(target.model),
+        )
+
+        good, missing = reports
+        assert good.pass_rate == 0.5
+        assert good.results[0].completion_tokens == 2
+        assert good.ttft is not None and good.latency >= good.ttft
+        assert good.pareto
+        assert missing.errors == 2 and not missing.pareto
+        assert sorted(seen) == ["good", "good", "missing", "missing"]
+        json.dumps([r.to_dict() for r in reports])
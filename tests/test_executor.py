@@ -0,0 +1,126 @@
+"""Tests for the fleet executor."""
+import time
+
+import pytest
+
+from src.executor import (
+    CONTAINER,
+    LOCAL,
+    SSH,
+    Fleet,
+    Target,
+    load_inventory,
+    parse_target,
+    run_on_target,
+)
+
+
+class TestInventory:
+    """Test parsing inventory entries."""
+
+    @pytest.mark.parametrize(
+        "spec, backend, name, address, port",
+        [
+            ("local", LOCAL, "local", "", None),
+            ("local:web-01", LOCAL, "web-01", "", None),
+            ("ops@db-1.internal", SSH, "db-1.internal", "ops@db-1.internal", None),
+            ("ssh://ops@10.0.0.5:2222", SSH, "10.0.0.5", "ops@10.0.0.5", 2222),
+            ("docker://api", CONTAINER, "api", "docker/api", None),
+            ("podman://cache", CONTAINER, "cache", "podman/cache", None),
+        ],
+    )
+    def test_parse_target(self, spec, backend, name, address, port):
+        """Test the accepted entry forms."""
+        target = parse_target(spec)
+        assert (target.backend, target.name, target.address, target.port) == (
+            backend,
+            name,
+            address,
+            port,
+        )
+
+    @pytest.mark.parametrize("spec", ["", "-oProxyCommand=x", "docker://", "two words"])
+    def test_invalid_entries(self, spec):
+        """Test that malformed entries, including option injection, are rejected."""
+        with pytest.raises(ValueError):
+            parse_target(spec)
+
+    def test_argv(self):
+        """Test the command line each backend runs."""
+        assert parse_target("local").argv("uptime") == ["/bin/sh", "-c", "uptime"]
+        ssh = parse_target("ssh://ops@web:2222").argv("uptime")
+        assert ssh[0] == "ssh" and ssh[-2:] == ["ops@web", "uptime"]
+        assert "BatchMode=yes" in ssh and ssh[ssh.index("-p") + 1] == "2222"
+        assert parse_target("docker://api").argv("uptime") == [
+            "docker", "exec", "api", "sh", "-c", "uptime"
+        ]
+
+    def test_load_inventory(self, tmp_path):
+        """Test comments, blank lines and error locations."""
+        path = tmp_path / "hosts"
+        path.write_text("# web tier\nlocal:web-01\n\nops@db-1  # primary\n")
+        assert [t.name for t in load_inventory(path)] == ["web-01", "db-1"]
+
+        path.write_text("local:a\n-bad\n")
+        with pytest.raises(ValueError, match="hosts:2"):
+            load_inventory(path)
+        path.write_text("# nothing\n")
+        with pytest.raises(ValueError, match="no hosts"):
+            load_inventory(path)
+
+
+class TestRunOnTarget:
+    """Test running on one simulated host."""
+
+    def test_streams_output_and_exit_code(self):
+        """Test that output lines are streamed with the host name."""
+        lines = []
+        result = run_on_target(
+            Target("web-01"),
+            'echo "on $POP_TARGET"; echo oops >&2; exit 3',
+            timeout=5,
+            on_line=lambda host, line: lines.append((host, line)),
+        )
+        assert result.exit_code == 3
+        assert not result.ok
+        assert ("web-01", "on web-01") in lines
+        assert ("web-01", "oops") in lines
+
+    def test_timeout_kills_process_group(self):
+        """Test that a hung host is killed at the timeout."""
+        start = time.perf_counter()
+        result = run_on_target(Target("slow"), "sleep 30 & sleep 30", timeout=0.3)
+        assert time.perf_counter() - start < 5
+        assert result.timed_out
+        assert result.exit_code is None
+        assert "timed out" in result.error
+
+    def test_missing_backend_binary(self):
+        """Test that a backend that cannot start is reported, not raised."""
+        result = run_on_target(Target("c", CONTAINER, "no-such-runtime-xyz/c"), "true", 5)
+        assert result.error
+        assert not result.ok
+
+
+class TestFleet:
+    """Test fan-out across many simulated hosts."""
+
+    def test_many_hosts_with_bounded_concurrency(self):
+        """Test 50 local hosts: results in order, concurrency bounded."""
+        targets = [Target(f"host-{i:02d}") for i in range(50)]
+        fleet = Fleet(targets, concurrency=10, timeout=10)
+
+        start = time.perf_counter()
+        results = fleet.run('sleep 0.1; echo "$POP_TARGET"')
+        elapsed = time.perf_counter() - start
+
+        assert [r.host for r in results] == [t.name for t in targets]
+        assert all(r.ok and r.output == [r.host] for r in results)
+        # 5 waves of 0.1s; serial would take 5s
+        assert 0.5 <= elapsed < 3
+
+    def test_one_failing_host(self):
+        """Test that one host's failure does not affect the others."""
+        targets = [Target("a"), Target("b"), Target("c")]
+        results = Fleet(targets).run('[ "$POP_TARGET" != b ]')
+        assert [r.ok for r in results] == [True, False, True]
@@ -0,0 +1,90 @@
+"""Tests for execution capture and output compression."""
+from src.feedback import (
+    LastRun,
+    LastRunStore,
+    OutputBuffer,
+    compress_output,
+    dedupe_lines,
+)
+from src.session import estimate_tokens
+
+
+class TestOutputBuffer:
+    """Test bounded capture."""
+
+    def test_small_output_is_kept(self):
+        """Test that output within the bounds is kept verbatim."""
+        buffer = OutputBuffer(head_bytes=10, tail_bytes=10)
+        buffer.feed("hello ")
+        buffer.feed("world")
+        assert buffer.text == "hello world"
+        assert buffer.dropped == 0
+
+    def test_middle_is_dropped(self):
+        """Test that only the head and tail of a large stream are kept."""
+        buffer = OutputBuffer(head_bytes=100, tail_bytes=100)
+        for i in range(100_000):
+            buffer.feed(f"line {i}\n")
+        text = buffer.text
+        assert text.startswith("line 0\n")
+        assert text.endswith("line 99999\n")
+        assert "characters not captured" in text
+        assert len(text) < 300
+        assert buffer.dropped > 500_000
+
+
+class TestCompression:
+    """Test token-budgeted compression."""
+
+    def test_dedupe(self):
+        """Test that runs of identical lines collapse."""
+        lines = ["start"] + ["retrying..."] * 50 + ["done", "done"]
+        assert dedupe_lines(lines) == [
+            "start",
+            "retrying...",
+            "[... previous line repeated 49 more times ...]",
+            "done",
+            "done",
+        ]
+
+    def test_fitting_output_is_unchanged(self):
+        """Test that small output is sent as is."""
+        assert compress_output("total 0\nfile.txt", 100) == "total 0\nfile.txt"
+
+    def test_large_log_keeps_edges_and_errors(self):
+        """Test a multi-megabyte log: head, tail and error lines survive within budget."""
+        lines = [f"INFO request {i} served in {i % 97}ms" for i in range(60_000)]
+        lines[31_337] = "ERROR connection refused by db-1:5432"
+        text = "\n".join(lines)
+        assert len(text) > 2_000_000
+
+        compressed = compress_output(text, 1500)
+
+        assert estimate_tokens(compressed) <= 1500
+        assert compressed.startswith("INFO request 0 ")
+        assert compressed.endswith("INFO request 59999 served in 53ms")
+        assert "31338: ERROR connection refused by db-1:5432" in compressed
+        assert "lines omitted" in compressed
+
+    def test_single_huge_line(self):
+        """Test that one enormous line is still cut to the budget."""
+        compressed = compress_output("x" * 1_000_000, 200)
+        assert estimate_tokens(compressed) <= 210
+
+
+class TestLastRunStore:
+    """Test persistence of the last execution."""
+
+    def test_round_trip(self, tmp_path):
+        """Test that the last run is saved and replaced."""
+        store = LastRunStore(tmp_path / "last_run.json")
+        assert store.load() is None
+        store.save(LastRun("list files", "ls /nope", 2, "ls: cannot access '/nope'"))
+        store.save(LastRun("disk", "df -h", 0, "Filesystem"))
+        run = store.load()
+        assert run.command == "df -h"
+        assert run.timestamp > 0
+
+    def test_default_location(self, isolated_cache_dir):
+        """Test that the last run lives in the cache directory."""
+        assert LastRunStore().path == isolated_cache_dir / "last_run.json"
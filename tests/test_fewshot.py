@@ -0,0 +1,141 @@
+"""Tests for retrieved few-shot examples."""
+import json
+import time
+
+import pytest
+
+from src.fewshot import (
+    CURATED_EXAMPLES,
+    Example,
+    ExampleStore,
+    FewShotIndex,
+    select_examples,
+    tokenize,
+)
+
+
+class TestTokenize:
+    """Test splitting text into index terms."""
+
+    def test_words_without_stopwords(self):
+        """Test that Latin text becomes lowercase words minus stopwords."""
+        assert tokenize("Show the Largest files in /var/log") == ["largest", "files", "var", "log"]
+
+    def test_cjk_bigrams(self):
+        """Test that CJK runs become overlapping bigrams."""
+        assert tokenize("显示磁盘") == ["显示", "示磁", "磁盘"]
+        assert tokenize("df 盘") == ["df", "盘"]
+
+
+class TestFewShotIndex:
+    """Test the BM25 index."""
+
+    def _index(self):
+        index = FewShotIndex()
+        index.add(Example("find large log files", "find /var/log -size +100M"))
+        index.add(Example("list docker containers", "docker ps -a"))
+        index.add(Example("remove stopped docker containers", "docker container prune"))
+        return index
+
+    def test_ranks_by_relevance(self):
+        """Test that the example sharing the rarest terms ranks first."""
+        results = self._index().search("prune stopped containers", k=2)
+        assert [example.command for example, _ in results] == [
+            "docker container prune",
+            "docker ps -a",
+        ]
+        assert results[0][1] > results[1][1]
+
+    def test_no_shared_terms(self):
+        """Test that unrelated queries return nothing."""
+        assert self._index().search("restart nginx") == []
+
+    def test_incremental_add_and_dedupe(self):
+        """Test that added examples are searchable at once and duplicates ignored."""
+        index = self._index()
+        assert index.add(Example("restart nginx", "sudo systemctl restart nginx"))
+        assert not index.add(Example("Restart  NGINX", "sudo systemctl restart nginx"))
+        assert len(index) == 4
+        assert index.search("restart nginx")[0][0].command == "sudo systemctl restart nginx"
+
+    def test_cjk_query(self):
+        """Test retrieval of Chinese examples."""
+        index = FewShotIndex()
+        for query, command in CURATED_EXAMPLES:
+            index.add(Example(query, command, "curated"))
+        assert index.search("显示磁盘使用", k=1)[0][0].command == "df -h"
+
+    @pytest.mark.benchmark
+    def test_lookup_under_a_millisecond(self):
+        """Test lookup latency over a realistic history."""
+        index = FewShotIndex()
+        verbs = ["find", "list", "remove", "show", "count", "compress", "restart", "watch"]
+        nouns = ["files", "logs", "containers", "pods", "ports", "branches", "users", "disks"]
+        for i in range(2000):
+            query = f"{verbs[i % 8]} {nouns[i // 8 % 8]} older than {i} days in dir{i % 37}"
+            index.add(Example(query, f"cmd {i}"))
+
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(20):
+                index.search("remove logs older than 30 days", k=3)
+            timings.append((time.perf_counter() - start) / 20)
+        assert min(timings) < 0.001
+
+
+class TestSelectExamples:
+    """Test picking examples for a prompt."""
+
+    def test_skips_exact_query_and_respects_budget(self):
+        """Test the exact-match skip, k and the token budget."""
+        index = FewShotIndex()
+        index.add(Example("list docker containers", "docker ps"))
+        index.add(Example("list all docker containers", "docker ps -a"))
+        index.add(Example("list docker images", "docker images"))
+
+        selected = select_examples(index, "list docker containers", k=2, budget_tokens=1000)
+        assert [example.command for example in selected] == ["docker ps -a", "docker images"]
+        assert select_examples(index, "list docker containers", k=2, budget_tokens=5) == []
+
+
+class TestExampleStore:
+    """Test accepted examples and packs on disk."""
+
+    def test_history_packs_and_curated(self, tmp_path):
+        """Test that history wins ties, packs are read and bad lines skipped."""
+        store = ExampleStore(tmp_path / "examples.jsonl", tmp_path / "packs")
+        store.record("show open ports", "netstat -tulpn")
+        (tmp_path / "packs").mkdir()
+        (tmp_path / "packs" / "k8s.jsonl").write_text(
+            json.dumps({"query": "tail pod logs", "command": "kubectl logs -f POD"})
+            + "\nnot json\n"
+        )
+
+        index = store.build_index()
+        commands = [example.command for example in index.examples]
+        assert commands[:2] == ["netstat -tulpn", "kubectl logs -f POD"]
+        assert index.examples[1].source == "k8s"
+        assert index.search("show open ports", k=1)[0][0].command == "netstat -tulpn"
+        assert len(index) == len(CURATED_EXAMPLES) + 2
+
+    def test_missing_files(self, tmp_path):
+        """Test that a fresh install still has the curated examples."""
+        index = ExampleStore(tmp_path / "none.jsonl", tmp_path / "none").build_index()
+        assert len(index) == len(CURATED_EXAMPLES)
+
+    def test_history_is_trimmed(self, tmp_path, monkeypatch):
+        """Test that the history file is cut back to the newest examples."""
+        monkeypatch.setattr("src.fewshot.MAX_EXAMPLES", 3)
+        monkeypatch.setattr("src.fewshot.TRIM_SLACK", 2)
+        store = ExampleStore(tmp_path / "examples.jsonl", tmp_path / "packs")
+        for i in range(5):
+            store.record(f"query {i}", f"cmd {i}")
+        store.build_index()
+        assert len(store.path.read_text().splitlines()) == 5
+
+        store.record("query 5", "cmd 5")
+        index = store.build_index()
+        lines = store.path.read_text().splitlines()
+        assert [json.loads(line)["command"] for line in lines] == ["cmd 3", "cmd 4", "cmd 5"]
+        assert index.examples[0].command == "cmd 5"
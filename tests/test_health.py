@@ -0,0 +1,207 @@
+"""Tests for endpoint health tracking and the circuit breaker."""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+from src.health import (
+    CLOSED,
+    FAILURE_THRESHOLD,
+    HALF_OPEN,
+    MIN_SAMPLES,
+    MIN_TIMEOUT,
+    OPEN,
+    RESET_TIMEOUT,
+    WINDOW,
+    CircuitBreaker,
+    EndpointHealth,
+    HealthStore,
+    PrefixCacheStats,
+)
+
+ENDPOINT = "http://node-a:3000/v1"
+
+
+def _allow(path):
+    """Ask for permission from a separate process, like another invocation would."""
+    return CircuitBreaker(HealthStore(path)).allow(ENDPOINT)
+
+
+@pytest.fixture
+def breaker(tmp_path):
+    """Breaker backed by a temporary state file."""
+    return CircuitBreaker(HealthStore(tmp_path / "health.json"))
+
+
+class TestEndpointHealth:
+    """Test latency statistics and adaptive timeouts."""
+
+    def test_quantiles(self):
+        """Test quantiles over the rolling window."""
+        health = EndpointHealth(latencies=[0.1 * i for i in range(1, 11)])
+        assert health.quantile(0.5) == pytest.approx(0.55)
+        assert health.quantile(0.99) == pytest.approx(1.0, abs=0.01)
+        assert EndpointHealth().quantile(0.5) is None
+
+    def test_timeout_uses_ceiling_until_calibrated(self):
+        """Test that few samples do not shrink the timeout."""
+        health = EndpointHealth(latencies=[0.2] * (MIN_SAMPLES - 1))
+        assert health.timeout(120.0) == 120.0
+
+    def test_timeout_adapts_to_p99(self):
+        """Test that the timeout follows observed latency within bounds."""
+        assert EndpointHealth(latencies=[2.0] * 20).timeout(120.0) == pytest.approx(6.0)
+        assert EndpointHealth(latencies=[0.05] * 20).timeout(120.0) == MIN_TIMEOUT
+        assert EndpointHealth(latencies=[100.0] * 20).timeout(120.0) == 120.0
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions."""
+
+    def test_opens_after_consecutive_failures(self, breaker):
+        """Test that the breaker opens at the failure threshold."""
+        for _ in range(FAILURE_THRESHOLD - 1):
+            breaker.record_failure(ENDPOINT, "connection failed")
+            assert breaker.allow(ENDPOINT)
+        breaker.record_failure(ENDPOINT, "connection failed")
+        assert not breaker.allow(ENDPOINT)
+        assert breaker.store.load(ENDPOINT).state == OPEN
+
+    def test_success_resets_failures(self, breaker):
+        """Test that a success clears the failure count."""
+        breaker.record_failure(ENDPOINT, "x")
+        breaker.record_success(ENDPOINT, 0.3)
+        health = breaker.store.load(ENDPOINT)
+        assert health.failures == 0
+        assert health.latencies == [0.3]
+
+    def test_half_open_after_reset_timeout(self, breaker):
+        """Test that an open breaker lets a probe through after the reset timeout."""
+        breaker.store.save(
+            ENDPOINT,
+            EndpointHealth(state=OPEN, failures=3, opened_at=time.time() - RESET_TIMEOUT - 1),
+        )
+        assert breaker.allow(ENDPOINT)
+        assert breaker.store.load(ENDPOINT).state == HALF_OPEN
+
+        # A failed probe opens the breaker again immediately
+        breaker.record_failure(ENDPOINT, "still down")
+        assert breaker.store.load(ENDPOINT).state == OPEN
+        assert not breaker.allow(ENDPOINT)
+
+    def test_half_open_lets_one_probe_through(self, breaker):
+        """Test that only one request probes a recovering endpoint."""
+        breaker.store.save(
+            ENDPOINT,
+            EndpointHealth(state=OPEN, failures=3, opened_at=time.time() - RESET_TIMEOUT - 1),
+        )
+        assert breaker.allow(ENDPOINT)
+        assert not breaker.allow(ENDPOINT)
+
+        breaker.record_success(ENDPOINT, 0.2)
+        assert breaker.allow(ENDPOINT)
+
+    def test_lost_probe_expires(self, breaker):
+        """Test that a probe that never reported back stops blocking requests."""
+        breaker.store.save(
+            ENDPOINT,
+            EndpointHealth(
+                state=HALF_OPEN, failures=3, probe_started=time.time() - RESET_TIMEOUT - 1
+            ),
+        )
+        assert breaker.allow(ENDPOINT)
+        assert not breaker.allow(ENDPOINT)
+
+    def test_half_open_success_closes(self, breaker):
+        """Test that a successful probe closes the breaker."""
+        breaker.store.save(ENDPOINT, EndpointHealth(state=HALF_OPEN, failures=3))
+        breaker.record_success(ENDPOINT, 0.2)
+        assert breaker.store.load(ENDPOINT).state == CLOSED
+
+    def test_state_is_shared_across_instances(self, tmp_path):
+        """Test that state persists between invocations."""
+        path = tmp_path / "health.json"
+        first = CircuitBreaker(HealthStore(path))
+        for _ in range(FAILURE_THRESHOLD):
+            first.record_failure(ENDPOINT, "down")
+        assert not CircuitBreaker(HealthStore(path)).allow(ENDPOINT)
+
+    def test_concurrent_requests_keep_every_sample(self, breaker):
+        """Test that parallel requests do not overwrite each other's state."""
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: breaker.record_success(ENDPOINT, 0.1), range(WINDOW)))
+        assert len(breaker.store.load(ENDPOINT).latencies) == WINDOW
+
+    def test_one_probe_among_concurrent_requests(self, breaker):
+        """Test that only one of many parallel requests becomes the probe."""
+        breaker.store.save(
+            ENDPOINT,
+            EndpointHealth(state=OPEN, failures=3, opened_at=time.time() - RESET_TIMEOUT - 1),
+        )
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            allowed = list(pool.map(lambda _: breaker.allow(ENDPOINT), range(16)))
+        assert allowed.count(True) == 1
+
+    @pytest.mark.skipif(os.name == "nt", reason="processes are only coordinated with fcntl")
+    def test_one_probe_among_concurrent_invocations(self, breaker):
+        """Test that only one of several parallel invocations becomes the probe."""
+        breaker.store.save(
+            ENDPOINT,
+            EndpointHealth(state=OPEN, failures=3, opened_at=time.time() - RESET_TIMEOUT - 1),
+        )
+        with ProcessPoolExecutor(max_workers=8) as pool:
+            allowed = list(pool.map(_allow, [breaker.store.path] * 16))
+        assert allowed.count(True) == 1
+
+    def test_window_is_bounded(self, breaker):
+        """Test that only recent latencies are kept."""
+        for i in range(200):
+            breaker.record_success(ENDPOINT, i / 1000)
+        latencies = breaker.store.load(ENDPOINT).latencies
+        assert len(latencies) == 50
+        assert latencies[-1] == 0.199
+
+
+class TestHealthStore:
+    """Test persistence."""
+
+    def test_default_location(self, isolated_cache_dir):
+        """Test that state lives in the cache directory."""
+        assert HealthStore().path == isolated_cache_dir / "endpoint_health.json"
+
+    def test_corrupt_file(self, tmp_path):
+        """Test that a corrupt file is treated as healthy."""
+        path = tmp_path / "health.json"
+        path.write_text("[1, 2")
+        assert HealthStore(path).load(ENDPOINT).state == CLOSED
+
+
+class TestPrefixCacheStats:
+    """Test the prefix cache and time-to-first-token totals."""
+
+    def test_concurrent_requests_are_all_counted(self, tmp_path):
+        """Test that streams closing in parallel, as in pop batch, are all recorded."""
+        stats = PrefixCacheStats(tmp_path / "prefix.json")
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda _: stats.record(2, "m", 0.1, 100, 50), range(100)))
+        assert stats.load()["2"]["m"]["requests"] == 100
+
+    def test_totals_per_layout_and_model(self, tmp_path):
+        """Test that requests are added up separately per layout version and model."""
+        stats = PrefixCacheStats(tmp_path / "prefix.json")
+        stats.record(2, "m", 0.2, prompt_tokens=100, cached_tokens=80)
+        stats.record(2, "m", 0.4, prompt_tokens=100, cached_tokens=0)
+        stats.record(1, "m", 0.5, prompt_tokens=100, cached_tokens=0)
+        counters = stats.load()["2"]["m"]
+        assert counters["requests"] == 2
+        assert counters["ttft_total"] == pytest.approx(0.6)
+        assert (counters["prefix_hits"], counters["cached_tokens"]) == (1, 80)
+        assert stats.load()["1"]["m"]["prefix_hits"] == 0
+
+    def test_unreported_cached_tokens(self, tmp_path):
+        """Test that servers without cached token counts only contribute latency."""
+        stats = PrefixCacheStats(tmp_path / "prefix.json")
+        stats.record(2, "m", 0.3, prompt_tokens=100)
+        counters = stats.load()["2"]["m"]
+        assert (counters["requests"], counters["reported"], counters["prompt_tokens"]) == (1, 0, 0)
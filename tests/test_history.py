@@ -0,0 +1,61 @@
+"""Tests for the query history."""
+import json
+import time
+
+from src.history import RECENCY_HALF_LIFE_DAYS, QueryHistory
+
+ENV = "OS: Linux, Shell: /bin/bash"
+
+
+class TestQueryHistory:
+    """Test recording and ranking queries."""
+
+    def test_record_and_load(self, tmp_path):
+        """Test that queries are appended with their environment and model."""
+        history = QueryHistory(tmp_path / "history.jsonl")
+        history.record("list files", ENV, "m")
+        entries = history.load()
+        assert len(entries) == 1
+        assert entries[0].query == "list files"
+        assert entries[0].model == "m"
+
+    def test_ranking_combines_frequency_and_recency(self, tmp_path):
+        """Test that frequent recent queries rank first and old ones decay."""
+        path = tmp_path / "history.jsonl"
+        now = time.time()
+        old = now - 10 * RECENCY_HALF_LIFE_DAYS * 86400
+        lines = [("ancient favourite", old)] * 5 + [("list files", now)] * 2
+        lines += [("List files?", now), ("show disk usage", now)]
+        path.write_text(
+            "".join(
+                json.dumps({"query": q, "system_info": ENV, "model": "m", "timestamp": t}) + "\n"
+                for q, t in lines
+            )
+        )
+
+        ranked = QueryHistory(path).ranked(limit=10, now=now)
+
+        assert [r.query for r in ranked] == ["List files?", "show disk usage", "ancient favourite"]
+        assert ranked[0].count == 3
+        assert QueryHistory(path).ranked(limit=1, now=now)[0].count == 3
+
+    def test_trimmed_to_max_entries(self, tmp_path):
+        """Test that the log does not grow without bound."""
+        history = QueryHistory(tmp_path / "history.jsonl", max_entries=5)
+        for i in range(11):
+            history.record(f"query {i}", ENV, "m")
+        entries = history.load()
+        assert len(entries) == 5
+        assert entries[-1].query == "query 10"
+
+    def test_corrupt_lines_are_skipped(self, tmp_path):
+        """Test that a damaged line does not lose the rest of the history."""
+        path = tmp_path / "history.jsonl"
+        path.write_text('{"query": "ls"\n')
+        history = QueryHistory(path)
+        history.record("list files", ENV, "m")
+        assert [e.query for e in history.load()] == ["list files"]
+
+    def test_default_location(self, isolated_cache_dir):
+        """Test that the history lives in the cache directory."""
+        assert QueryHistory().path == isolated_cache_dir / "history.jsonl"
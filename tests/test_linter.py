@@ -0,0 +1,197 @@
+"""Tests for the static cost linter."""
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from src.linter import (
+    CostLinter,
+    ScopeEstimate,
+    estimate_scope,
+    lint_command,
+    split_commands,
+)
+
+
+class TestSplitCommands:
+    """Test command tokenization."""
+
+    def test_splits_pipelines_and_lists(self):
+        """Test splitting on pipes and list operators."""
+        result = split_commands("du -h . | sort -rh | head -5 && echo done")
+        assert result == [
+            ["du", "-h", "."],
+            ["sort", "-rh"],
+            ["head", "-5"],
+            ["echo", "done"],
+        ]
+
+    def test_drops_redirections(self):
+        """Test that redirection targets are not treated as arguments."""
+        result = split_commands("find / -name '*.log' 2>/dev/null > out.txt")
+        assert result == [["find", "/", "-name", "*.log"]]
+
+    def test_escaped_semicolon_stays_with_find(self):
+        """Test that the \\; ending -exec is an argument, not a separator."""
+        assert split_commands(r"find . -exec rm {} \; ; ls") == [
+            ["find", ".", "-exec", "rm", "{}", ";"],
+            ["ls"],
+        ]
+
+    def test_quoted_operators_are_words(self):
+        """Test that quoted operator characters and comments are handled like the shell."""
+        assert split_commands("echo 'a; b' | grep \")\" # done") == [
+            ["echo", "a; b"],
+            ["grep", ")"],
+        ]
+
+    def test_unbalanced_quotes(self):
+        """Test that untokenizable input yields no commands."""
+        assert split_commands("echo 'unterminated") == []
+
+
+class TestEstimateScope:
+    """Test bounded directory sampling."""
+
+    def test_counts_files_and_bytes(self, tmp_path):
+        """Test a complete walk of a small tree."""
+        (tmp_path / "a").mkdir()
+        (tmp_path / "a" / "one.txt").write_text("hello")
+        (tmp_path / "two.txt").write_text("world!")
+
+        scope = estimate_scope(str(tmp_path), deadline=time.monotonic() + 1)
+        assert scope.files == 2
+        assert scope.dirs == 1
+        assert scope.bytes == 11
+        assert not scope.truncated
+        assert not scope.is_large
+
+    def test_entry_limit_truncates(self, tmp_path):
+        """Test that the sample stops at the entry limit."""
+        for i in range(20):
+            (tmp_path / f"f{i}").write_text("x")
+
+        scope = estimate_scope(str(tmp_path), deadline=time.monotonic() + 1, limit=5)
+        assert scope.truncated
+        assert scope.is_large
+
+    def test_deadline_checked_within_a_directory(self, tmp_path, monkeypatch):
+        """Test that one large flat directory cannot overrun the deadline."""
+        for i in range(100):
+            (tmp_path / f"f{i}").write_text("x")
+        clock = iter(range(1000))
+        monkeypatch.setattr("src.linter.time", SimpleNamespace(monotonic=lambda: next(clock)))
+
+        scope = estimate_scope(str(tmp_path), deadline=10)
+        assert scope.truncated
+        assert scope.files < 10
+
+    def test_expired_deadline_truncates(self, tmp_path):
+        """Test that an expired deadline stops sampling immediately."""
+        scope = estimate_scope(str(tmp_path), deadline=time.monotonic() - 1)
+        assert scope.truncated
+        assert scope.files == 0
+
+
+class TestCostLinter:
+    """Test expensive pattern detection."""
+
+    @pytest.fixture
+    def large_scope(self, monkeypatch):
+        """Make every sampled tree look large."""
+        monkeypatch.setattr(
+            "src.linter.estimate_scope",
+            lambda path, deadline: ScopeEstimate(path=path, files=50000, bytes=10**9),
+        )
+
+    def test_find_root_suggests_xdev_and_maxdepth(self):
+        """Test find over / without limits."""
+        warnings = lint_command("find / -name '*.conf'")
+        assert len(warnings) == 1
+        suggestion = warnings[0].suggestion
+        assert "-xdev" in suggestion
+        assert "-maxdepth 3" in suggestion
+        assert suggestion.index("/ -xdev") < suggestion.index("-name")
+        assert "nice -n 19" in suggestion
+
+    def test_find_exec_suggestion_keeps_original_text(self):
+        """Test that \\; and redirections survive in the suggestion."""
+        warning = lint_command(r"find / -name foo -exec rm {} \; 2>/dev/null")[0]
+        assert warning.suggestion.endswith(r"-name foo -exec rm {} \; 2>/dev/null")
+        assert "-exec ... +" in warning.message
+
+    @pytest.mark.parametrize("path", ["/usr/", "//", "/var/../usr"])
+    def test_find_xdev_on_unnormalized_broad_path(self, path):
+        """Test that spellings of a system path still get -xdev."""
+        assert "-xdev" in lint_command(f"find {path} -name x")[0].suggestion
+
+    def test_find_small_tree_is_quiet(self, tmp_path):
+        """Test that a small tree produces no warning."""
+        (tmp_path / "x.py").write_text("print(1)")
+        assert lint_command("find . -name '*.py'", cwd=str(tmp_path)) == []
+
+    def test_already_bounded_and_niced_find_is_quiet(self):
+        """Test that a bounded, low-priority find is accepted."""
+        assert lint_command("nice -n 19 find / -xdev -maxdepth 2 -name x") == []
+
+    def test_du_large_tree(self, large_scope):
+        """Test du without depth limit on a large tree."""
+        warnings = lint_command("du -h . | sort -rh | head -5")
+        assert len(warnings) == 1
+        assert warnings[0].command == "du"
+        assert "-d 1" in warnings[0].suggestion
+
+    @pytest.mark.parametrize("command", ["du -sh /srv", "du -hd2 /srv", "du --max-depth=1 /srv"])
+    def test_du_limited_gets_no_depth_flag(self, large_scope, command):
+        """Test that combined -s or -d flags count as a limit, so -d 1 is not added."""
+        suggestion = lint_command(command)[0].suggestion
+        assert "-d 1" not in suggestion
+        assert suggestion.endswith(command)
+
+    def test_broad_path_is_not_given_a_count(self):
+        """Test that an unsampled system path is described as such."""
+        message = lint_command("du -h /var")[0].message
+        assert "broad system path" in message
+        assert "0 files" not in message
+
+    def test_grep_recursive_without_excludes(self, large_scope):
+        """Test recursive grep suggestions."""
+        warnings = lint_command("grep -rn TODO src")
+        assert len(warnings) == 1
+        assert "--exclude-dir=.git" in warnings[0].suggestion
+
+    def test_grep_with_include_is_quiet(self, large_scope):
+        """Test that filtered recursive grep is accepted."""
+        assert lint_command("grep -r --include='*.py' TODO .") == []
+
+    def test_sudo_wrapper_is_unwrapped(self, large_scope):
+        """Test that wrappers do not hide the real command."""
+        warnings = lint_command("sudo chown -R user:group /srv/data")
+        assert len(warnings) == 1
+        assert warnings[0].command == "chown"
+        assert warnings[0].suggestion.startswith("sudo nice -n 19")
+        assert warnings[0].suggestion.endswith("chown -R user:group /srv/data")
+
+    def test_suggestion_keeps_wrappers(self, large_scope):
+        """Test that sudo and env assignments survive the rewrite."""
+        suggestion = lint_command("sudo LC_ALL=C du -h /srv")[0].suggestion
+        assert suggestion.startswith("sudo LC_ALL=C nice -n 19")
+        assert "du -d 1 -h /srv" in suggestion
+
+    def test_ls_suggestion_keeps_wrappers(self, large_scope):
+        """Test that the find replacing ls -R still runs under sudo."""
+        suggestion = lint_command("sudo ls -R /srv > list.txt")[0].suggestion
+        assert suggestion == "sudo find /srv -maxdepth 2 > list.txt"
+
+    def test_plain_commands_are_quiet(self):
+        """Test that ordinary commands are not flagged."""
+        assert lint_command("ls -la && git status") == []
+
+    def test_respects_budget(self, tmp_path):
+        """Test that analysis finishes within the budget."""
+        for i in range(200):
+            (tmp_path / f"d{i}").mkdir()
+        start = time.monotonic()
+        CostLinter(budget=0.01, cwd=str(tmp_path)).lint("find . -name x")
+        assert time.monotonic() - start < 0.5
@@ -1,11 +1,25 @@
 """Tests for main CLI module."""
+import json
 import re
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
 import typer.testing
 
+import src.main
+from src.cache import ResponseCache
+from src.coalesce import CoalesceStats
+from src.client import ParallaxConnectionError
+from src.config import AppConfig
+from src.fewshot import ExampleStore
+from src.health import PrefixCacheStats
+from src.history import QueryHistory
 from src.main import _strip_markdown_code_blocks, app
+from src.prompts import PROMPT_LAYOUT_VERSION
+from src.session import SessionStore
+from src.structured import StructuredCommand
+from src.validation import RepairStats
 
 
 class TestStripMarkdownCodeBlocks:
@@ -95,6 +109,24 @@ class TestCLICommands:
         # Should call save
         assert mock_config_manager.save.called
 
+    @patch("src.main.config_manager")
+    @patch("src.main.typer.prompt")
+    def test_configure_offers_served_models(
+        self, mock_prompt, mock_config_manager, runner, mock_parallax_server
+    ):
+        """Test that configure lists served models and accepts a number."""
+        mock_parallax_server.models = ["a-model", "b-model"]
+        mock_prompt.side_effect = [mock_parallax_server.api_base, "2"]
+        mock_config_manager.get.return_value = AppConfig()
+
+        result = runner.invoke(app, ["configure"])
+
+        assert result.exit_code == 0
+        assert "1. a-model" in result.stdout
+        saved = mock_config_manager.save.call_args.args[0]
+        assert saved.model == "b-model"
+        assert saved.api_base == mock_parallax_server.api_base
+
     @patch("src.main.ParallaxClient")
     @patch("src.main.get_system_info")
     @patch("src.main.config_manager")
@@ -120,3 +152,601 @@ class TestCLICommands:
         # Verify client was created
         mock_client_class.assert_called_once()
 
+
+    @patch("src.main.ParallaxClient")
+    @patch("src.main.get_system_info")
+    @patch("src.main.config_manager")
+    def test_gen_candidates_next(self, mock_config, mock_system, mock_client_class, runner):
+        """Test that --candidates shows the best candidate and [N]ext cycles."""
+        mock_config.get.return_value = AppConfig(lint_budget_ms=0)
+        mock_system.return_value = "Linux /bin/bash"
+
+        mock_client = MagicMock()
+        mock_client.generate_candidates.return_value = [
+            "nosuchtool-xyz -la",
+            "ls -la",
+            "ls -la",
+        ]
+        mock_client_class.return_value = mock_client
+
+        result = runner.invoke(app, ["gen", "list files", "--candidates", "3"], input="N\nA\n")
+
+        assert result.exit_code == 0
+        mock_client.generate_candidates.assert_called_once_with(
+            "list files", "Linux /bin/bash", 3
+        )
+        assert "(1/2)" in result.stdout
+        assert "(2/2)" in result.stdout
+        assert result.stdout.index("ls -la") < result.stdout.index("nosuchtool-xyz")
+
+    @patch("src.main.ParallaxClient")
+    @patch("src.main.get_system_info")
+    @patch("src.main.config_manager")
+    def test_gen_repairs_invalid_command(
+        self, mock_config, mock_system, mock_client_class, runner
+    ):
+        """Test that an invalid command triggers a repair round trip."""
+        mock_config.get.return_value = AppConfig(lint_budget_ms=0, repair_attempts=2)
+        mock_system.return_value = "Linux /bin/bash"
+
+        mock_client = MagicMock()
+        mock_client.generate_command_stream.return_value = iter(["echo 'unterminated"])
+        mock_client.repair_command_stream.return_value = iter(["echo 'fixed'"])
+        mock_client_class.return_value = mock_client
+
+        result = runner.invoke(app, ["gen", "say something"], input="A\n")
+
+        assert result.exit_code == 0
+        mock_client.repair_command_stream.assert_called_once()
+        assert "unterminated quote" in mock_client.repair_command_stream.call_args.args[3]
+        assert "echo 'fixed'" in result.stdout
+
+        stats = RepairStats().load()
+        assert stats["gradient/Llama-3-8B-Instruct"]["repaired"] == 1
+
+    @patch("src.main.ParallaxClient")
+    @patch("src.main.get_system_info")
+    @patch("src.main.config_manager")
+    def test_gen_valid_command_skips_repair(
+        self, mock_config, mock_system, mock_client_class, runner
+    ):
+        """Test that a valid command is not sent back for repair."""
+        mock_config.get.return_value = AppConfig(lint_budget_ms=0)
+        mock_system.return_value = "Linux /bin/bash"
+
+        mock_client = MagicMock()
+        mock_client.generate_command_stream.return_value = iter(["ls -la"])
+        mock_client_class.return_value = mock_client
+
+        result = runner.invoke(app, ["gen", "list files"], input="A\n")
+
+        assert result.exit_code == 0
+        mock_client.repair_command_stream.assert_not_called()
+        assert RepairStats().load()["gradient/Llama-3-8B-Instruct"]["needed_repair"] == 0
+
+    def test_stats_command(self, runner):
+        """Test that repair stats are shown per model."""
+        RepairStats().record("test-model", needed_repair=True, repaired=True, attempts=1)
+        RepairStats().record("test-model", needed_repair=False, repaired=False, attempts=0)
+
+        result = runner.invoke(app, ["stats"])
+
+        assert result.exit_code == 0
+        assert "test-model" in result.stdout
+        assert "50.0%" in result.stdout
+
+    def test_stats_prefix_cache(self, runner):
+        """Test that prefix cache reuse and TTFT are shown per prompt layout."""
+        stats = PrefixCacheStats()
+        stats.record(PROMPT_LAYOUT_VERSION, "test-model", 0.25, 200, cached_tokens=150)
+        stats.record(PROMPT_LAYOUT_VERSION, "test-model", 0.15, 200, cached_tokens=0)
+
+        result = runner.invoke(app, ["stats"])
+
+        assert result.exit_code == 0
+        assert "Prompt Prefix Cache" in result.stdout
+        assert "200ms" in result.stdout
+        assert "37.5%" in result.stdout
+
+    @patch("src.main.config_manager")
+    def test_doctor_probes_endpoints(self, mock_config, runner, mock_parallax_server):
+        """Test that doctor calibrates reachable endpoints and shows their state."""
+        mock_parallax_server.delay = 0
+        mock_config.get.return_value = AppConfig(api_base=mock_parallax_server.api_base)
+
+        result = runner.invoke(app, ["doctor", "--probes", "2"])
+
+        assert result.exit_code == 0
+        assert "probe 2: first token" in result.stdout
+        assert "closed" in result.stdout
+
+    @patch("src.main.config_manager")
+    def test_doctor_unreachable(self, mock_config, runner):
+        """Test that doctor exits non-zero when no endpoint answers."""
+        mock_config.get.return_value = AppConfig(api_base="http://127.0.0.1:9/v1")
+
+        result = runner.invoke(app, ["doctor", "--probes", "1"])
+
+        assert result.exit_code == 1
+        assert "✗" in result.stdout
+
+    @patch("src.main.config_manager")
+    def test_bench_models(self, mock_config, runner, mock_parallax_server, tmp_path):
+        """Test that bench-models evaluates each model and writes the JSON results."""
+        mock_parallax_server.delay = 0
+        mock_parallax_server.script = ["df -h"]
+        mock_config.get.return_value = AppConfig(api_base=mock_parallax_server.api_base)
+        dataset = tmp_path / "cases.jsonl"
+        dataset.write_text('{"query": "disk space", "expected": "df -h"}\n', encoding="utf-8")
+        output = tmp_path / "results.json"
+
+        result = runner.invoke(
+            app,
+            ["bench-models", "-m", "small", "-m", "large", "-d", str(dataset), "--no-builtin",
+             "-o", str(output)],
+        )
+
+        assert result.exit_code == 0
+        assert "Model Benchmark" in result.stdout
+        targets = json.loads(output.read_text(encoding="utf-8"))["targets"]
+        assert [t["model"] for t in targets] == ["small", "large"]
+        assert all(t["pass_rate"] == 1.0 for t in targets)
+        assert any(t["pareto"] for t in targets)
+
+    @patch("src.main.sandbox_available", return_value=False)
+    @patch("src.main.config_manager")
+    def test_bench_models_execute_needs_sandbox(
+        self, mock_config, mock_sandbox, runner, mock_parallax_server, tmp_path
+    ):
+        """Test that --execute without bubblewrap warns and judges answers as text."""
+        mock_parallax_server.delay = 0
+        mock_parallax_server.script = ["df -h"]
+        mock_config.get.return_value = AppConfig(api_base=mock_parallax_server.api_base)
+        dataset = tmp_path / "cases.jsonl"
+        dataset.write_text('{"query": "disk space", "expected": "df -h"}\n', encoding="utf-8")
+
+        with patch("src.main.run_matrix", wraps=src.main.run_matrix) as run_matrix:
+            result = runner.invoke(
+                app, ["bench-models", "-d", str(dataset), "--no-builtin", "--execute"]
+            )
+
+        assert result.exit_code == 0
+        assert "--unsafe-no-sandbox" in result.output
+        assert run_matrix.call_args.kwargs["execute"] is False
+
+    @patch("src.main.config_manager")
+    def test_batch_coalesces_duplicates(self, mock_config, runner, mock_parallax_server, tmp_path):
+        """Test that duplicate queries in flight share one request and records keep input order."""
+        mock_parallax_server.delay = 0.05
+        mock_parallax_server.script = ["ls", " -la"]
+        mock_config.get.return_value = AppConfig(
+            api_base=mock_parallax_server.api_base, model="mock-model", fewshot_examples=0
+        )
+        queries = tmp_path / "queries.txt"
+        queries.write_text("list files\nlist files\n\nlist files\nshow files\n", encoding="utf-8")
+
+        result = runner.invoke(app, ["batch", str(queries), "--no-cache"])
+
+        assert result.exit_code == 0
+        records = [json.loads(line) for line in result.stdout.splitlines()]
+        assert [r["query"] for r in records] == ["list files"] * 3 + ["show files"]
+        assert all(r["command"] == "ls -la" for r in records)
+        assert mock_parallax_server.requests == 2
+        assert CoalesceStats().load() == {"upstream": 2, "coalesced": 2}
+
+        result = runner.invoke(app, ["stats"])
+        assert "2 of 4 generations" in result.stdout
+
+    @patch("src.main.ParallaxClient")
+    @patch("src.main.get_system_info")
+    @patch("src.main.config_manager")
+    def test_chat_keeps_history_and_saves(
+        self, mock_config, mock_system, mock_client_class, runner
+    ):
+        """Test that chat reuses one client, sends history and persists the session."""
+        mock_config.get.return_value = AppConfig(lint_budget_ms=0)
+        mock_system.return_value = "Linux /bin/bash"
+
+        mock_client = MagicMock()
+        mock_client.chat_stream.side_effect = [iter(["ls -la"]), iter(["ls -la *.log"])]
+        mock_client_class.return_value = mock_client
+
+        result = runner.invoke(app, ["chat"], input="list files\nonly logs\n/exit\n")
+
+        assert result.exit_code == 0
+        mock_client_class.assert_called_once()
+        second_messages = mock_client.chat_stream.call_args_list[1].args[0]
+        assert {"role": "assistant", "content": "ls -la"} in second_messages
+
+        sessions = SessionStore().list()
+        assert len(sessions) == 1
+        assert sessions[0].last_command == "ls -la *.log"
+
+        result = runner.invoke(app, ["chat", "--list"])
+        assert sessions[0].session_id in result.stdout
+
+
+class TestNonInteractiveGen:
+    """Test --json, --exec and --copy."""
+
+    @pytest.fixture
+    def runner(self):
+        """Create a Typer test runner."""
+        return typer.testing.CliRunner()
+
+    @pytest.fixture
+    def mock_client(self):
+        """Patch config, system info and client for a non-interactive run."""
+        with patch("src.main.config_manager") as mock_config, patch(
+            "src.main.get_system_info", return_value="Linux /bin/bash"
+        ), patch("src.main.ParallaxClient") as mock_client_class:
+            mock_config.get.return_value = AppConfig(lint_budget_ms=0)
+            client = MagicMock()
+            client.model_notice = None
+            client.last_usage = {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+            mock_client_class.return_value = client
+            yield client
+
+    def test_model_list_fetched_once(self, runner, mock_client):
+        """Test that gen leaves refreshing the stale model catalog to the warm-up."""
+        mock_client.generate_command_stream.return_value = iter(["ls"])
+        with patch(
+            "src.models.ModelCatalog.refresh_in_background",
+            side_effect=AssertionError("second /models request"),
+        ):
+            result = runner.invoke(app, ["gen", "list files", "--json"])
+
+        assert result.exit_code == 0
+        mock_client.prewarm.assert_called_once()
+
+    def test_json_record(self, runner, mock_client):
+        """Test that --json prints a single JSON record and no UI."""
+        mock_client.generate_command_stream.return_value = iter(
+            ["<think>hmm</think>", "ls", " -la"]
+        )
+
+        result = runner.invoke(app, ["gen", "list files", "--json"])
+
+        assert result.exit_code == 0
+        lines = result.stdout.strip().splitlines()
+        assert len(lines) == 1
+        record = json.loads(lines[0])
+        assert record["command"] == "ls -la"
+        assert record["warning"] is None
+        assert record["valid"] is True
+        assert record["usage"]["total_tokens"] == 13
+        assert record["timings"]["ttft_ms"] is not None
+
+    def test_json_warning(self, runner, mock_client):
+        """Test that the model's warning is reported separately."""
+        mock_client.generate_command_stream.return_value = iter(
+            ["# WARNING: This will delete files\nrm -f *.tmp"]
+        )
+
+        result = runner.invoke(app, ["gen", "delete tmp files", "--json"])
+
+        record = json.loads(result.stdout)
+        assert record["command"] == "rm -f *.tmp"
+        assert record["warning"] == "This will delete files"
+        assert record["dangerous"] is True
+
+    def test_json_structured_output(self, runner, mock_client):
+        """Test that structured mode uses the parsed answer instead of the text heuristics."""
+        # config_manager is patched by the fixture
+        src.main.config_manager.get.return_value = AppConfig(lint_budget_ms=0, structured_output=True)
+        mock_client.generate_structured_stream.return_value = iter(
+            ["find . -name '*.tmp' -delete", "\n# WARNING: Deletes temp files"]
+        )
+        mock_client.last_structured = StructuredCommand(
+            "find . -name '*.tmp' -delete", True, "Deletes temp files"
+        )
+
+        result = runner.invoke(app, ["gen", "delete tmp files", "--json"])
+
+        record = json.loads(result.stdout)
+        assert record["command"] == "find . -name '*.tmp' -delete"
+        assert record["warning"] == "Deletes temp files"
+        mock_client.generate_command_stream.assert_not_called()
+
+    def test_structured_output_skips_free_text_cache(self, runner, mock_client):
+        """Test that a structured run is not answered with a free text entry."""
+        mock_client.generate_command_stream.return_value = iter(["ls"])
+        runner.invoke(app, ["gen", "list files", "--json"])
+
+        config = AppConfig(lint_budget_ms=0, structured_output=True)
+        src.main.config_manager.get.return_value = config
+        mock_client.generate_structured_stream.return_value = iter(["ls -la"])
+        mock_client.last_structured = StructuredCommand("ls -la")
+        record = json.loads(runner.invoke(app, ["gen", "list files", "--json"]).stdout)
+        assert record["cached"] is False
+        assert record["command"] == "ls -la"
+
+        record = json.loads(runner.invoke(app, ["gen", "list files", "--json"]).stdout)
+        assert record["cached"] is True
+        assert record["command"] == "ls -la"
+        mock_client.generate_structured_stream.assert_called_once()
+
+    def test_json_exec(self, runner, mock_client):
+        """Test that --json --exec captures output and propagates the exit code."""
+        mock_client.generate_command_stream.return_value = iter(["echo hello; false"])
+
+        result = runner.invoke(app, ["gen", "say hello", "--json", "--exec"])
+
+        assert result.exit_code == 1
+        record = json.loads(result.stdout)
+        assert record["exit_code"] == 1
+        assert record["stdout"] == "hello\n"
+
+    def test_json_exec_does_not_wait_for_background_jobs(self, runner, mock_client):
+        """Test that a background job holding the output pipes does not block the record."""
+        mock_client.generate_command_stream.return_value = iter(["sleep 3 & echo started"])
+
+        start = time.monotonic()
+        result = runner.invoke(app, ["gen", "start it", "--json", "--exec"])
+
+        assert time.monotonic() - start < 2
+        assert json.loads(result.stdout)["stdout"] == "started\n"
+
+    def test_json_exec_refuses_dangerous(self, runner, mock_client):
+        """Test that flagged commands are not executed without --allow-dangerous."""
+        mock_client.generate_command_stream.return_value = iter(
+            ["# WARNING: deletes files\necho would-delete"]
+        )
+
+        result = runner.invoke(app, ["gen", "delete", "--json", "--exec"])
+
+        assert result.exit_code == 2
+        record = json.loads(result.stdout)
+        assert "exit_code" not in record
+        assert "Refusing" in record["error"]
+
+    def test_json_connection_error(self, runner, mock_client):
+        """Test that connection errors are reported as JSON."""
+        mock_client.generate_command_stream.side_effect = ParallaxConnectionError("down")
+
+        result = runner.invoke(app, ["gen", "list files", "--json"])
+
+        assert result.exit_code == 1
+        assert json.loads(result.stdout)["error"] == "down"
+
+    @patch("src.main.pyperclip.copy")
+    def test_copy_without_prompt(self, mock_copy, runner, mock_client):
+        """Test that --copy does not prompt."""
+        mock_client.generate_command_stream.return_value = iter(["ls -la"])
+
+        result = runner.invoke(app, ["gen", "list files", "--copy"])
+
+        assert result.exit_code == 0
+        mock_copy.assert_called_once_with("ls -la")
+        assert "[E]xecute" not in result.stdout
+
+    @patch("src.main._copy_command")
+    def test_from_history_skips_model(self, mock_copy, runner, mock_client, tmp_path):
+        """Test that --from-history answers from shell history without the model."""
+        (tmp_path / "home").mkdir()
+        (tmp_path / "home" / ".bash_history").write_text("grep -rn TODO src\nls\n")
+
+        result = runner.invoke(app, ["gen", "grep TODO in src", "--from-history", "--copy"])
+
+        assert result.exit_code == 0
+        mock_copy.assert_called_once_with("grep -rn TODO src")
+        mock_client.generate_command_stream.assert_not_called()
+
+    def test_history_matches_are_alternatives(self, runner, mock_client, tmp_path):
+        """Test that matches are listed first and offered with [N]ext."""
+        (tmp_path / "home").mkdir()
+        (tmp_path / "home" / ".bash_history").write_text("grep -rn TODO src\n")
+        mock_client.generate_command_stream.return_value = iter(["grep -rn 'TODO' ./src"])
+
+        result = runner.invoke(app, ["gen", "grep TODO in src"], input="N\nA\n")
+
+        assert result.exit_code == 0
+        assert "From your shell history" in result.stdout
+        assert "From Shell History (2/2)" in result.stdout
+        mock_client.generate_command_stream.assert_called_once()
+
+    @patch("src.main._copy_command")
+    def test_accepted_command_becomes_example(self, mock_copy, runner, mock_client):
+        """Test that accepted commands are kept as few-shot examples, flagged ones are not."""
+        mock_client.generate_command_stream.return_value = iter(["ls -la"])
+        runner.invoke(app, ["gen", "list files", "--copy"])
+        mock_client.generate_command_stream.return_value = iter(
+            ["# WARNING: deletes files\nrm -rf ./build"]
+        )
+        runner.invoke(app, ["gen", "delete build", "--copy"])
+
+        examples = ExampleStore().build_index().examples
+        assert examples[0].query == "list files"
+        assert examples[0].command == "ls -la"
+        assert all("rm -rf" not in example.command for example in examples)
+
+    def test_exec_and_copy_conflict(self, runner, mock_client):
+        """Test that --exec and --copy are mutually exclusive."""
+        result = runner.invoke(app, ["gen", "list files", "--exec", "--copy"])
+        assert result.exit_code != 0
+
+    def test_json_served_from_cache(self, runner, mock_client):
+        """Test that a repeated query is answered from the cache, warning included."""
+        mock_client.generate_command_stream.return_value = iter(
+            ["# WARNING: deletes files\nrm -f *.tmp"]
+        )
+        first = json.loads(runner.invoke(app, ["gen", "delete tmp files", "--json"]).stdout)
+        assert first["cached"] is False
+
+        second = json.loads(runner.invoke(app, ["gen", "Delete tmp files", "--json"]).stdout)
+        assert second["cached"] is True
+        assert second["command"] == "rm -f *.tmp"
+        assert second["warning"] == "deletes files"
+        mock_client.generate_command_stream.assert_called_once()
+        # Both runs connected early; only the hit abandoned the connection
+        assert mock_client.prewarm.call_count == 2
+        mock_client.cancel_prewarm.assert_called_once()
+
+        mock_client.generate_command_stream.return_value = iter(["rm -i *.tmp"])
+        third = json.loads(
+            runner.invoke(app, ["gen", "delete tmp files", "--json", "--no-cache"]).stdout
+        )
+        assert third["cached"] is False
+        assert third["command"] == "rm -i *.tmp"
+
+    def test_interactive_cache_hit(self, runner, mock_client):
+        """Test that an interactive run shows a cached command without a request."""
+        mock_client.generate_command_stream.return_value = iter(["ls -la"])
+        runner.invoke(app, ["gen", "list files"], input="A\n")
+
+        result = runner.invoke(app, ["gen", "list files"], input="A\n")
+
+        assert result.exit_code == 0
+        assert "Cached" in result.stdout
+        assert "ls -la" in result.stdout
+        mock_client.generate_command_stream.assert_called_once()
+
+    def test_team_cache_hit_is_not_executed_unconfirmed(self, runner, mock_client, tmp_path):
+        """Test that --exec asks before running a command from the team cache server."""
+        planted = tmp_path / "planted"
+        entry = ResponseCache().store(
+            "list files", "Linux /bin/bash", AppConfig().model, f"touch {planted}"
+        )
+        entry.from_shared = True
+        ResponseCache().put(entry)
+
+        result = runner.invoke(app, ["gen", "list files", "--exec"], input="A\n")
+
+        assert result.exit_code == 0
+        assert "team cache" in result.stdout
+        assert not planted.exists()
+
+        mock_client.generate_command_stream.return_value = iter(["ls"])
+        record = json.loads(runner.invoke(app, ["gen", "list files", "--json", "--exec"]).stdout)
+        assert record["cached"] is False
+        assert record["command"] == "ls"
+        assert not planted.exists()
+
+    def test_cache_warm(self, runner, mock_client):
+        """Test that cache warm regenerates the top history queries."""
+        QueryHistory().record("list files", "Linux /bin/bash", AppConfig().model)
+        mock_client.generate_command_stream.return_value = iter(["ls -la"])
+
+        result = runner.invoke(app, ["cache", "warm", "--dry-run"])
+        assert "1 to regenerate" in result.stdout
+
+        result = runner.invoke(app, ["cache", "warm"])
+
+        assert result.exit_code == 0
+        assert "Warmed 1" in result.stdout
+        assert ResponseCache().get("list files", "Linux /bin/bash", AppConfig().model)
+
+    def test_cache_server_import_error(self, runner, tmp_path):
+        """Test that an unreadable seed bundle is reported instead of a traceback."""
+        result = runner.invoke(
+            app, ["cache-server", "--port", "0", "--import", str(tmp_path / "missing.jsonl")]
+        )
+        assert result.exit_code == 1
+        assert "Import failed" in result.stdout
+
+    def test_cache_export_import(self, runner, mock_client, tmp_path, isolated_cache_dir):
+        """Test that cache bundles can be exported and imported from the CLI."""
+        ResponseCache().store("list files", "Linux /bin/bash", "m", "ls -la")
+        bundle = tmp_path / "bundle.jsonl"
+
+        result = runner.invoke(app, ["cache", "export", str(bundle)])
+        assert "Exported 1 entries" in result.stdout
+
+        for path in (isolated_cache_dir / "responses").rglob("*.json"):
+            path.unlink()
+        result = runner.invoke(app, ["cache", "import", str(bundle)])
+
+        assert result.exit_code == 0
+        assert "Imported 1 entries" in result.stdout
+        assert ResponseCache().get("list files", "Linux /bin/bash", "m").command == "ls -la"
+
+    def test_plan_runs_steps(self, runner, mock_client):
+        """Test that pop plan generates every step and shows labelled outputs."""
+        mock_client.plan_stream.return_value = iter(
+            [
+                '{"steps": [{"id": "mem", "task": "show memory", "depends_on": []},',
+                ' {"id": "disk", "task": "show disk", "depends_on": []}]}',
+            ]
+        )
+        mock_client.generate_command.side_effect = lambda task, info: f"echo {task}"
+
+        result = runner.invoke(app, ["plan", "show memory and disk", "--yes"])
+
+        assert result.exit_code == 0
+        assert mock_client.generate_command.call_count == 2
+        assert "mem: echo show memory" in result.stdout
+        assert "2/2 steps succeeded" in result.stdout
+
+    def test_plan_asks_once(self, runner, mock_client):
+        """Test that the plan is confirmed once and nothing runs on refusal."""
+        mock_client.plan_stream.return_value = iter(['["touch plan-marker"]'])
+        mock_client.generate_command.return_value = "touch plan-marker"
+
+        result = runner.invoke(app, ["plan", "make a marker"], input="n\n")
+
+        assert result.exit_code == 0
+        assert result.stdout.count("Run 1 commands?") == 1
+        assert "Aborted" in result.stdout
+
+    def test_exec_on_fleet(self, runner, mock_client, tmp_path):
+        """Test that --hosts fans the command out and ends with a summary table."""
+        inventory = tmp_path / "hosts"
+        inventory.write_text("local:web-01\nlocal:web-02\n")
+        mock_client.generate_command_stream.return_value = iter(['echo "up on $POP_TARGET"'])
+
+        result = runner.invoke(app, ["gen", "check uptime", "--exec", "--hosts", str(inventory)])
+
+        assert result.exit_code == 0
+        assert "web-01 | up on web-01" in result.stdout
+        assert "web-02 | up on web-02" in result.stdout
+        assert "Fleet Summary" in result.stdout
+        assert "2/2 hosts succeeded" in result.stdout
+
+    def test_json_exec_on_fleet(self, runner, mock_client, tmp_path):
+        """Test that --json reports each host's result."""
+        inventory = tmp_path / "hosts"
+        inventory.write_text("local:a\nlocal:b\n")
+        mock_client.generate_command_stream.return_value = iter(['[ "$POP_TARGET" = a ]'])
+
+        result = runner.invoke(
+            app, ["gen", "check", "--json", "--exec", "--hosts", str(inventory)]
+        )
+
+        assert result.exit_code == 1
+        hosts = json.loads(result.stdout)["hosts"]
+        assert [(h["host"], h["exit_code"]) for h in hosts] == [("a", 0), ("b", 1)]
+
+    def test_follow_up_sends_last_output(self, runner, mock_client):
+        """Test that an executed command's output is captured and sent with -f."""
+        mock_client.generate_command_stream.return_value = iter(["ls /nonexistent-pop-dir"])
+        result = runner.invoke(app, ["gen", "list the dir"], input="E\n")
+        assert "No such file" in result.output
+        assert 'pop gen -f "why did that fail?"' in result.stdout
+
+        mock_client.followup_stream.return_value = iter(["mkdir -p /tmp/pop-dir"])
+        result = runner.invoke(app, ["gen", "-f", "why did that fail?"], input="A\n")
+
+        assert result.exit_code == 0
+        args = mock_client.followup_stream.call_args.args
+        assert args[0] == "why did that fail?"
+        assert args[2:4] == ("list the dir", "ls /nonexistent-pop-dir")
+        assert args[4] != 0
+        assert "No such file" in args[5]
+        assert "mkdir -p /tmp/pop-dir" in result.stdout
+
+    def test_execute_does_not_wait_for_background_jobs(self, runner, mock_client):
+        """Test that [E]xecute returns once the shell exits, not when its pipes close."""
+        mock_client.generate_command_stream.return_value = iter(["sleep 3 & echo started"])
+
+        start = time.monotonic()
+        result = runner.invoke(app, ["gen", "start it"], input="E\n")
+
+        assert time.monotonic() - start < 2
+        assert "started" in result.stdout
+        assert "Exit code: 0" in result.stdout
+
+    def test_follow_up_without_last_run(self, runner, mock_client):
+        """Test that -f without a previous execution is an error."""
+        result = runner.invoke(app, ["gen", "-f", "why?", "--json"])
+        assert result.exit_code == 1
+        assert "Nothing to follow up on" in json.loads(result.stdout)["error"]
@@ -0,0 +1,92 @@
+"""Tests for model discovery and fallback selection."""
+import json
+import time
+
+import pytest
+
+from src.models import ModelCatalog, fetch_models, resolve_model, select_model
+
+
+class TestSelectModel:
+    """Test fallback selection."""
+
+    def test_served_model_is_kept(self):
+        """Test that a served model is used as configured."""
+        assert select_model("a", ["b"], ["a", "b"]) == ("a", None)
+
+    def test_unknown_catalog_keeps_model(self):
+        """Test that nothing changes without a catalog."""
+        assert select_model("a", ["b"], None) == ("a", None)
+
+    def test_first_served_fallback(self):
+        """Test that the first served fallback is chosen."""
+        model, notice = select_model("gone", ["missing", "b", "c"], ["b", "c"])
+        assert model == "b"
+        assert "fallback 'b'" in notice
+
+    def test_no_served_fallback(self):
+        """Test that the configured model is kept with a notice."""
+        model, notice = select_model("gone", ["missing"], ["b"])
+        assert model == "gone"
+        assert "not in the served list: b" in notice
+
+
+class TestModelCatalog:
+    """Test the TTL cache."""
+
+    @pytest.fixture
+    def catalog(self, tmp_path):
+        """Catalog backed by a temporary file."""
+        return ModelCatalog(tmp_path / "models.json", ttl=60)
+
+    def test_store_and_read(self, catalog):
+        """Test a fresh cached list."""
+        catalog.store("http://a/v1", ["m1", "m2"])
+        assert catalog.cached("http://a/v1") == ["m1", "m2"]
+        assert not catalog.is_stale("http://a/v1")
+        assert catalog.cached("http://b/v1") is None
+
+    def test_expired_entry(self, catalog):
+        """Test that an expired list is only returned when stale data is allowed."""
+        catalog.path.write_text(
+            json.dumps({"http://a/v1": {"fetched_at": time.time() - 120, "models": ["m1"]}})
+        )
+        assert catalog.is_stale("http://a/v1")
+        assert catalog.cached("http://a/v1") is None
+        assert catalog.cached("http://a/v1", allow_stale=True) == ["m1"]
+
+    def test_refresh_from_server(self, catalog, mock_parallax_server):
+        """Test fetching /models from the server."""
+        mock_parallax_server.models = ["b-model", "a-model"]
+        api_base = mock_parallax_server.api_base
+        assert fetch_models(api_base, "key") == ["a-model", "b-model"]
+        catalog.refresh(api_base, "key")
+        assert catalog.cached(api_base) == ["a-model", "b-model"]
+
+
+class TestResolveModel:
+    """Test the no-network fast path."""
+
+    def test_uses_cache_without_network(self, tmp_path, monkeypatch):
+        """Test that a fresh cache resolves without fetching."""
+        catalog = ModelCatalog(tmp_path / "models.json")
+        catalog.store("http://a/v1", ["fallback"])
+        monkeypatch.setattr(
+            "src.models.fetch_models", lambda *a, **k: pytest.fail("network call on fast path")
+        )
+        assert resolve_model("http://a/v1", "k", "gone", ["fallback"], catalog)[0] == "fallback"
+
+    def test_stale_cache_refreshes_in_background(self, tmp_path, mock_parallax_server):
+        """Test that a stale list is used now and refreshed for next time."""
+        mock_parallax_server.models = ["new-model"]
+        api_base = mock_parallax_server.api_base
+        catalog = ModelCatalog(tmp_path / "models.json", ttl=0)
+        catalog.store(api_base, ["old-model"])
+
+        model, _ = resolve_model(api_base, "k", "old-model", [], catalog)
+        assert model == "old-model"
+
+        deadline = time.monotonic() + 5
+        while catalog.cached(api_base, allow_stale=True) != ["new-model"]:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
@@ -0,0 +1,149 @@
+"""Tests for plan mode."""
+import threading
+import time
+
+import pytest
+
+from src.plan import (
+    FAILED,
+    OK,
+    SKIPPED,
+    PlanError,
+    PlanStep,
+    execute_plan,
+    generate_commands,
+    levels,
+    parse_plan,
+)
+
+
+class TestParsePlan:
+    """Test parsing the model's step list."""
+
+    def test_parses_steps(self):
+        """Test a plan wrapped in reasoning and a code fence."""
+        text = (
+            "<think>two independent checks</think>```json\n"
+            '{"steps": [{"id": "mem", "task": "显示内存使用情况", "depends_on": []},'
+            ' {"id": "disk", "task": "显示磁盘空间", "depends_on": []}]}\n```'
+        )
+        steps = parse_plan(text)
+        assert [step.id for step in steps] == ["mem", "disk"]
+        assert steps[0].task == "显示内存使用情况"
+
+    def test_bare_list_and_missing_ids(self):
+        """Test that a list of task strings is accepted."""
+        steps = parse_plan('["check disk", "check memory"]')
+        assert [step.id for step in steps] == ["step1", "step2"]
+
+    @pytest.mark.parametrize(
+        "text, message",
+        [
+            ("no json here", "No JSON"),
+            ('{"steps": []}', "no steps"),
+            ('[{"id": "a", "task": "x"}, {"id": "a", "task": "y"}]', "Duplicate"),
+            ('[{"id": "a", "task": "x", "depends_on": ["b"]}]', "unknown"),
+            (
+                '[{"id": "a", "task": "x", "depends_on": ["b"]},'
+                ' {"id": "b", "task": "y", "depends_on": ["a"]}]',
+                "Cyclic",
+            ),
+        ],
+    )
+    def test_invalid_plans(self, text, message):
+        """Test that malformed plans are rejected with a reason."""
+        with pytest.raises(PlanError, match=message):
+            parse_plan(text)
+
+
+class TestLevels:
+    """Test grouping steps into concurrent waves."""
+
+    def test_waves(self):
+        """Test that independent steps share a wave."""
+        steps = [
+            PlanStep("a", "x"),
+            PlanStep("b", "y"),
+            PlanStep("c", "z", depends_on=["a", "b"]),
+        ]
+        assert [[s.id for s in wave] for wave in levels(steps)] == [["a", "b"], ["c"]]
+
+
+class TestGenerateCommands:
+    """Test concurrent generation."""
+
+    def test_generates_concurrently_and_keeps_errors(self):
+        """Test that steps are generated in parallel and failures are recorded."""
+        barrier = threading.Barrier(2, timeout=2)
+
+        def generate(task):
+            if task == "broken":
+                raise ValueError("no command")
+            barrier.wait()
+            return f"echo {task}", None
+
+        steps = [PlanStep("a", "one"), PlanStep("b", "two"), PlanStep("c", "broken")]
+        generate_commands(steps, generate, parallelism=3)
+
+        assert [step.command for step in steps] == ["echo one", "echo two", ""]
+        assert steps[2].error == "no command"
+
+
+class TestExecutePlan:
+    """Test running the DAG."""
+
+    def test_independent_steps_run_in_parallel(self):
+        """Test that independent steps overlap in time."""
+        steps = [PlanStep(i, i, command="sleep 0.3") for i in ("a", "b", "c")]
+        start = time.perf_counter()
+        assert execute_plan(steps, parallelism=3)
+        assert time.perf_counter() - start < 0.8
+
+    def test_parallelism_is_bounded(self):
+        """Test that no more than the limit run at once."""
+        active, peak, lock = [0], [0], threading.Lock()
+
+        def run(command):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return 0, command
+
+        steps = [PlanStep(str(i), "t", command=f"c{i}") for i in range(6)]
+        assert execute_plan(steps, run=run, parallelism=2)
+        assert peak[0] == 2
+
+    def test_dependencies_run_first(self):
+        """Test that a step starts only after its dependencies succeeded."""
+        order = []
+
+        def run(command):
+            order.append(command)
+            return 0, f"{command} done\n"
+
+        steps = [
+            PlanStep("b", "y", depends_on=["a"], command="second"),
+            PlanStep("a", "x", command="first"),
+        ]
+        assert execute_plan(steps, run=run)
+        assert order == ["first", "second"]
+        assert steps[0].output == "second done\n"
+
+    def test_failure_skips_dependents(self):
+        """Test that dependents of a failed step are skipped, others still run."""
+        steps = [
+            PlanStep("a", "x", command="exit 3"),
+            PlanStep("b", "y", depends_on=["a"], command="echo never"),
+            PlanStep("c", "z", command="echo independent"),
+            PlanStep("d", "w"),
+        ]
+        finished = []
+        assert not execute_plan(steps, on_done=lambda step: finished.append(step.id))
+
+        assert [step.state for step in steps] == [FAILED, SKIPPED, OK, SKIPPED]
+        assert steps[0].exit_code == 3
+        assert steps[2].output == "independent\n"
+        assert sorted(finished) == ["a", "b", "c", "d"]
@@ -1,4 +1,5 @@
 """Automated test runner for pop gen command."""
+import json
 import os
 import re
 import subprocess
@@ -123,7 +124,7 @@ def run_test_case(test_case: TestCase, timeout: int = 60) -> Tuple[bool, str]:
         env["PATH"] = f"{os.path.expanduser('~/.local/bin')}:{env.get('PATH', '')}"
 
         # Run pop gen command
-        cmd = ["pop", "gen", test_case.input_query]
+        cmd = ["pop", "gen", test_case.input_query, "--json"]
 
         # Use subprocess to run and capture output
         process = subprocess.Popen(
@@ -146,6 +147,14 @@ def run_test_case(test_case: TestCase, timeout: int = 60) -> Tuple[bool, str]:
 
         output = stdout
 
+        # Preferred: the machine-readable record printed by `pop gen --json`
+        try:
+            record = json.loads(output.strip().splitlines()[-1])
+            test_case.actual_output = record.get("command") or ""
+            return True, test_case.actual_output
+        except (ValueError, IndexError, AttributeError):
+            pass
+
         # Extract command from output using multiple strategies
         extracted_command = ""
 
@@ -0,0 +1,143 @@
+"""Tests for chat sessions."""
+import pytest
+
+from src.session import ChatSession, SessionStore, estimate_tokens
+from src.utils import write_json_atomic
+
+
+class TestEstimateTokens:
+    """Test token estimation."""
+
+    def test_ascii(self):
+        """Test roughly four characters per token."""
+        assert estimate_tokens("a" * 40) == 10
+
+    def test_cjk(self):
+        """Test that CJK characters count as one token each."""
+        assert estimate_tokens("列出所有文件") == 6
+
+    def test_empty(self):
+        """Test empty text."""
+        assert estimate_tokens("") == 0
+
+
+class TestChatSession:
+    """Test ChatSession message layout and compaction."""
+
+    @pytest.fixture
+    def session(self):
+        """Create an empty session."""
+        return ChatSession("s1", "Linux /bin/bash", "test-model")
+
+    def test_build_messages_layout(self, session):
+        """Test that the prefix comes first and the new request last."""
+        session.add_exchange("list files", "ls -la")
+        messages = session.build_messages("only hidden ones")
+
+        assert messages[0]["role"] == "system"
+        assert "Linux /bin/bash" in messages[0]["content"]
+        assert messages[1:3] == session.turns
+        assert messages[-1] == {"role": "user", "content": "User request: only hidden ones"}
+
+    def test_prefix_is_stable(self, session):
+        """Test that the prefix is byte-identical across turns."""
+        before = session.build_messages("first")
+        session.add_exchange("first", "ls")
+        after = session.build_messages("second")
+        assert after[: len(before) - 1] == before[:-1]
+
+    def test_compact_within_budget_is_noop(self, session):
+        """Test that history under budget is left alone."""
+        session.add_exchange("list files", "ls -la")
+        assert not session.compact(budget=1000)
+        assert len(session.turns) == 2
+
+    def test_compact_drops_oldest_and_summarizes(self, session):
+        """Test that compaction drops old turns into a summary."""
+        for i in range(10):
+            session.add_exchange(f"request number {i} " + "x" * 40, f"echo {i}")
+
+        assert session.compact(budget=100)
+        assert session.history_tokens() <= 100
+        assert session.last_command == "echo 9"
+
+        # The newest summary line is the exchange just before the kept turns
+        first_kept = int(session.turns[1]["content"].split()[-1])
+        assert session.summary[-1].startswith(f"request number {first_kept - 1}")
+        assert session.summary[-1].endswith(f"→ echo {first_kept - 1}")
+
+        messages = session.build_messages("next")
+        assert "Earlier requests in this session" in messages[1]["content"]
+
+    def test_compaction_hysteresis(self, session):
+        """Test that a compacted history leaves room for further turns."""
+        for i in range(10):
+            session.add_exchange(f"request {i} " + "x" * 40, f"echo {i}")
+        session.compact(budget=200)
+        turns_after = len(session.turns)
+
+        session.add_exchange("one more", "echo more")
+        assert not session.compact(budget=200)
+        assert len(session.turns) == turns_after + 2
+
+    def test_round_trip(self, session):
+        """Test serialization."""
+        session.add_exchange("list files", "ls -la")
+        session.summary.append("old → cmd")
+        restored = ChatSession.from_dict(session.to_dict())
+        assert restored.turns == session.turns
+        assert restored.summary == session.summary
+        assert restored.system_info == session.system_info
+
+
+class TestSessionStore:
+    """Test session persistence."""
+
+    def test_save_and_load(self, tmp_path):
+        """Test saving and loading by ID."""
+        store = SessionStore(sessions_dir=tmp_path)
+        session = store.new("macOS /bin/zsh", "test-model")
+        session.add_exchange("list files", "ls -la")
+        store.save(session)
+
+        loaded = store.load(session.session_id)
+        assert loaded.last_command == "ls -la"
+
+    def test_load_last(self, tmp_path):
+        """Test resuming the most recent session."""
+        store = SessionStore(sessions_dir=tmp_path)
+        session = store.new("macOS /bin/zsh", "test-model")
+        store.save(session)
+        assert store.load("last").session_id == session.session_id
+
+    def test_load_missing(self, tmp_path):
+        """Test that a missing session raises ValueError."""
+        store = SessionStore(sessions_dir=tmp_path)
+        with pytest.raises(ValueError, match="Session not found"):
+            store.load("nope")
+        with pytest.raises(ValueError, match="No saved sessions"):
+            store.load("last")
+
+    @pytest.mark.parametrize("session_id", ["../x", "20250101-093000-1a2b/../../x"])
+    def test_load_rejects_paths(self, tmp_path, session_id):
+        """Test that an ID cannot name a file outside the sessions directory."""
+        sessions_dir = tmp_path / "sessions"
+        (sessions_dir / "20250101-093000-1a2b").mkdir(parents=True)
+        store = SessionStore(sessions_dir=sessions_dir)
+        write_json_atomic(tmp_path / "x.json", {"session_id": "x", "system_info": "", "model": ""})
+        with pytest.raises(ValueError, match="Session not found"):
+            store.load(session_id)
+
+    def test_load_rejects_mismatched_file(self, tmp_path):
+        """Test that a file whose stored ID differs from its name is not resumed."""
+        store = SessionStore(sessions_dir=tmp_path)
+        session = store.new("macOS /bin/zsh", "test-model")
+        session.session_id = "../../x"
+        write_json_atomic(tmp_path / "20250101-093000-1a2b.json", session.to_dict())
+        with pytest.raises(ValueError, match="ID does not match"):
+            store.load("20250101-093000-1a2b")
+        assert store.list() == []
+
+    def test_list_empty(self, tmp_path):
+        """Test listing when no sessions exist."""
+        assert SessionStore(sessions_dir=tmp_path / "missing").list() == []
@@ -0,0 +1,139 @@
+"""Tests for the team cache server and the tiered cache."""
+import http.client
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from src.cache import ResponseCache, cache_key
+from src.shared_cache import CacheServer, SharedCacheClient, TieredCache
+
+ENV = "OS: Linux 6.1, Shell: /bin/bash"
+
+
+@pytest.fixture
+def cache_server(tmp_path):
+    """Cache server on a free local port, as a stand-in for the team server."""
+    server = CacheServer(tmp_path / "server", port=0).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def shared(cache_server):
+    """Client for the local cache server."""
+    client = SharedCacheClient(cache_server.url, timeout=2.0)
+    yield client
+    client.flush()
+
+
+def tiered(tmp_path, shared, name="laptop"):
+    """Tiered cache with its own local directory."""
+    return TieredCache(shared, tmp_path / name)
+
+
+class TestCacheServer:
+    """Test the HTTP API."""
+
+    def test_put_and_get(self, tmp_path, shared):
+        """Test that an entry stored by one client is served to another."""
+        entry = ResponseCache(tmp_path / "a").store("list files", ENV, "m", "ls -la")
+        assert shared.put(entry)
+        fetched = shared.get(entry.key)
+        assert fetched.command == "ls -la"
+        assert shared.get(cache_key("other", ENV, "m")) is None
+
+    def test_rejects_mismatched_key(self, tmp_path, cache_server):
+        """Test that entries are only stored under their own content address."""
+        entry = ResponseCache(tmp_path / "a").store("list files", ENV, "m", "ls -la")
+        other = cache_key("other", ENV, "m")
+        response = httpx.put(f"{cache_server.url}/v1/entries/{other}", json=entry.to_dict())
+        assert response.status_code == 400
+        response = httpx.put(f"{cache_server.url}/v1/entries/..%2Fescape", json={})
+        assert response.status_code == 404
+
+    def test_rejects_entry_not_at_its_content_address(self, tmp_path, cache_server):
+        """Test that a command cannot be planted under another query's key."""
+        entry = ResponseCache(tmp_path / "a").store("list files", ENV, "m", "ls -la")
+        entry.key = cache_key("disk usage", ENV, "m")
+        response = httpx.put(f"{cache_server.url}/v1/entries/{entry.key}", json=entry.to_dict())
+        assert response.status_code == 400
+        assert cache_server.store.load(entry.key) is None
+
+    def test_bad_content_length(self, cache_server):
+        """Test that a malformed Content-Length is a client error, not a crash."""
+        host, port = cache_server.httpd.server_address[:2]
+        connection = http.client.HTTPConnection(host, port, timeout=2)
+        connection.putrequest("POST", "/v1/bundle")
+        connection.putheader("Content-Length", "lots")
+        connection.endheaders()
+        assert connection.getresponse().status == 400
+        connection.close()
+
+    def test_bundle_round_trip(self, tmp_path, shared):
+        """Test bulk export and import through the server."""
+        local = ResponseCache(tmp_path / "a")
+        local.store("list files", ENV, "m", "ls -la")
+        local.store("disk usage", ENV, "m", "df -h")
+        bundle = "".join(json.dumps(e.to_dict()) + "\n" for e in local.entries())
+
+        assert shared.import_bundle(bundle) == 2
+        assert shared.import_bundle(bundle) == 0
+        assert len(shared.export_bundle().splitlines()) == 2
+
+
+class TestTieredCache:
+    """Test the local tier, the shared tier and write-through."""
+
+    def test_write_through_and_shared_hit(self, tmp_path, shared):
+        """Test that one machine's generation is a hit on another machine."""
+        laptop = tiered(tmp_path, shared, "laptop")
+        laptop.store("list files", ENV, "m", "ls -la")
+        shared.flush()
+
+        desktop = tiered(tmp_path, shared, "desktop")
+        entry = desktop.get("list files", ENV, "m")
+        assert entry.command == "ls -la"
+        assert entry.from_shared
+        # The hit is copied into the local tier, still marked as shared
+        assert ResponseCache(tmp_path / "desktop").get("list files", ENV, "m").from_shared
+        assert not laptop.get("list files", ENV, "m").from_shared
+
+    def test_local_tier_first(self, tmp_path, shared, cache_server):
+        """Test that a fresh local entry is used without asking the server."""
+        cache = tiered(tmp_path, shared)
+        ResponseCache(tmp_path / "laptop").store("list files", ENV, "m", "ls")
+        cache_server.shutdown()
+        assert cache.get("list files", ENV, "m").command == "ls"
+
+    def test_unreachable_server_is_a_fast_miss(self, tmp_path):
+        """Test that a dead server costs at most the timeout."""
+        cache = TieredCache(SharedCacheClient("http://127.0.0.1:9", timeout=0.2), tmp_path)
+        start = time.monotonic()
+        assert cache.get("list files", ENV, "m") is None
+        assert time.monotonic() - start < 1.0
+        cache.store("list files", ENV, "m", "ls")
+        assert cache.get("list files", ENV, "m").command == "ls"
+
+
+class TestSharedCacheClient:
+    """Test background writes."""
+
+    def test_clients_share_one_exit_handler(self, monkeypatch):
+        """Test that creating clients does not add an atexit handler each."""
+        registered = []
+        monkeypatch.setattr("atexit.register", registered.append)
+        for _ in range(3):
+            SharedCacheClient("http://127.0.0.1:9")
+        assert registered == []
+
+    def test_concurrent_writes_are_all_flushed(self, tmp_path, shared, cache_server):
+        """Test that writes started from many threads are all waited for."""
+        local = ResponseCache(tmp_path / "a")
+        entries = [local.store(f"query {i}", ENV, "m", f"echo {i}") for i in range(20)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(shared.put_async, entries))
+        shared.flush()
+        assert all(cache_server.store.load(entry.key) for entry in entries)
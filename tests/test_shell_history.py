@@ -0,0 +1,116 @@
+"""Tests for the shell history index."""
+import os
+import time
+
+from src.shell_history import ShellHistoryIndex, parse_history, unmetafy
+
+
+class TestParseHistory:
+    """Test reading bash and zsh history formats."""
+
+    def test_plain_bash(self):
+        """Test one command per line without timestamps."""
+        entries, consumed = parse_history(b"ls -la\ngit status\n")
+        assert entries == [("ls -la", None), ("git status", None)]
+        assert consumed == 18
+
+    def test_bash_timestamps(self):
+        """Test HISTTIMEFORMAT comment lines."""
+        entries, _ = parse_history(b"#1700000000\ndocker ps -a\n")
+        assert entries == [("docker ps -a", 1700000000.0)]
+
+    def test_zsh_extended_multiline(self):
+        """Test zsh extended entries, including a continued command."""
+        data = b": 1700000000:0;for f in *.log; do\\\ngzip $f; done\n: 1700000100:3;make\n"
+        entries, _ = parse_history(data, zsh=True)
+        assert entries == [
+            ("for f in *.log; do\\\ngzip $f; done", 1700000000.0),
+            ("make", 1700000100.0),
+        ]
+
+    def test_incomplete_entry_is_not_consumed(self):
+        """Test that a partly written entry is left for the next read."""
+        data = b"ls\n: 1700000000:0;echo a \\\n"
+        entries, consumed = parse_history(data + b"echo b", zsh=True)
+        assert entries == [("ls", None)]
+        assert consumed == 3
+
+    def test_unmetafy(self):
+        """Test undoing zsh's escaping of non-ASCII bytes."""
+        encoded = "é".encode("utf-8")
+        metafied = bytes([encoded[0], 0x83, encoded[1] ^ 0x20])
+        assert unmetafy(metafied) == encoded
+
+
+class TestShellHistoryIndex:
+    """Test incremental indexing and search."""
+
+    def _index(self, tmp_path, *paths):
+        return ShellHistoryIndex(list(paths), tmp_path / "index.json")
+
+    def test_incremental_refresh(self, tmp_path):
+        """Test that only new lines are read and counts accumulate."""
+        history = tmp_path / ".bash_history"
+        history.write_text("docker ps -a\nls\npop gen 'list containers'\n")
+        assert self._index(tmp_path, history).refresh() == 3
+
+        with open(history, "a") as f:
+            f.write("docker ps -a\nsystemctl restart nginx\n")
+        index = self._index(tmp_path, history)
+        assert index.refresh() == 2
+        assert index.commands["docker ps -a"][0] == 2
+        # Single words and pop's own invocations are not answers
+        assert set(index.commands) == {"docker ps -a", "systemctl restart nginx"}
+        assert self._index(tmp_path, history).refresh() == 0
+
+    def test_rewritten_file_is_rebuilt(self, tmp_path):
+        """Test that a trimmed history file is indexed from scratch."""
+        history = tmp_path / ".zsh_history"
+        history.write_text(": 1700000000:0;git log --oneline\n: 1700000001:0;make test\n")
+        self._index(tmp_path, history).refresh()
+
+        replacement = tmp_path / "new"
+        replacement.write_text(": 1700000002:0;make test\n")
+        os.replace(replacement, history)
+        index = self._index(tmp_path, history)
+        index.refresh()
+        assert index.commands == {"make test": [1, 1700000002.0]}
+
+    def test_search(self, tmp_path):
+        """Test coverage-first ranking, plural folding and the strong flag."""
+        history = tmp_path / ".bash_history"
+        history.write_text(
+            "sudo systemctl restart nginx\n"
+            "sudo systemctl status nginx\n"
+            "find . -name '*.log' -delete\n"
+            "tail -f /var/log/nginx/error.log\n"
+        )
+        index = self._index(tmp_path, history)
+        index.refresh()
+
+        matches = index.search("how do I restart nginx?")
+        assert matches[0].command == "sudo systemctl restart nginx"
+        assert matches[0].strong
+        assert not matches[1].strong
+        assert index.search("delete old logs")[0].command == "find . -name '*.log' -delete"
+        assert index.search("compile the kernel") == []
+
+    def test_large_history(self, tmp_path):
+        """Test indexing and searching a 100k-line zsh history."""
+        history = tmp_path / ".zsh_history"
+        tools = ["git", "docker", "kubectl", "grep", "tar", "curl", "ssh", "journalctl"]
+        with open(history, "w") as f:
+            for i in range(100000):
+                f.write(f": {1700000000 + i}:0;{tools[i % 8]} --flag-{i % 97} target-{i}\n")
+        index = self._index(tmp_path, history)
+
+        start = time.perf_counter()
+        index.refresh()
+        assert time.perf_counter() - start < 5
+
+        index = self._index(tmp_path, history)
+        start = time.perf_counter()
+        index.refresh()
+        matches = index.search("journalctl target-99999")
+        assert time.perf_counter() - start < 0.5
+        assert matches[0].command == "journalctl --flag-89 target-99999"
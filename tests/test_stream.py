@@ -0,0 +1,189 @@
+"""Tests for bounded-memory stream processing."""
+import io
+import tracemalloc
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from rich.console import Console
+
+from src.cassette import Cassette
+from src.client import ParallaxConnectionError
+from src.main import _extract_command, _render_stream
+from src.stream import StreamProcessor
+
+CASSETTE_DIR = Path(__file__).parent / "cassettes"
+
+
+def process(chunks, **kwargs):
+    """Feed chunks through a processor and return it with the visible text."""
+    processor = StreamProcessor(**kwargs)
+    visible = "".join(processor.feed(chunk) for chunk in chunks) + processor.finish()
+    return processor, visible
+
+
+def long_reasoning_stream(tokens=50_000):
+    """A reasoning stream of roughly the given number of tokens."""
+    yield "<think>"
+    for i in range(tokens):
+        yield f" step{i % 97}"
+    yield "</think>\n```bash\nls -la\n```"
+
+
+class TestStreamProcessor:
+    """Test splitting reasoning from the answer."""
+
+    def test_reasoning_is_removed(self):
+        """Test that only the answer is kept and shown."""
+        processor, visible = process(["<think>", "hmm", "</think>", "ls", " -la"])
+        assert processor.text == "ls -la"
+        assert visible == "ls -la"
+        assert processor.reasoning_chars == 3
+
+    @pytest.mark.parametrize("size", [1, 2, 3, 5])
+    def test_tags_split_across_chunks(self, size):
+        """Test that tags are found however the stream is chunked."""
+        raw = "<think>plan it</think>\nls -la"
+        chunks = [raw[i : i + size] for i in range(0, len(raw), size)]
+        processor, visible = process(chunks)
+        assert processor.text == "\nls -la"
+        assert visible == "\nls -la"
+
+    def test_tags_are_case_insensitive(self):
+        """Test upper-case tags."""
+        processor, _ = process(["<THINK>x</THINK>ls"])
+        assert processor.text == "ls"
+
+    def test_close_without_open(self):
+        """Test output from templates that open the reasoning block in the prompt."""
+        processor, _ = process(["The user wants ", "files.", "</think>", "ls"])
+        assert processor.text == "ls"
+        assert processor.reasoning_chars == len("The user wants files.")
+
+    def test_long_reasoning_without_open_tag_is_bounded(self):
+        """Test that reasoning arriving before a lone close tag does not pile up."""
+        processor = StreamProcessor(tail_chars=100)
+        for _ in range(1000):
+            processor.feed("x" * 50)
+        assert sum(len(part) for part in processor._content) <= 200
+        processor.feed("</think>ls")
+        processor.finish()
+        assert processor.text == "ls"
+        assert processor.reasoning_chars == 50_000
+
+    def test_long_answer_keeps_its_end(self):
+        """Test that an answer longer than the window keeps its last characters."""
+        processor, visible = process(["y" * 300, "ls -la"], tail_chars=100)
+        assert processor.text.endswith("y" * 90 + "ls -la")
+        assert len(processor.text) <= 200
+        assert visible == "y" * 300 + "ls -la"
+
+    def test_unclosed_reasoning_falls_back_to_tail(self):
+        """Test that a cut-off stream still exposes its end for extraction."""
+        processor, visible = process(["<think>", "long thoughts ls -la"], tail_chars=8)
+        assert visible == ""
+        assert processor.text == "s ls -la"
+
+    def test_partial_tag_at_end_is_flushed(self):
+        """Test that text held back as a possible tag is released at the end."""
+        processor, visible = process(["a <thi"])
+        assert processor.text == "a <thi"
+        assert visible == "a <thi"
+
+    def test_spill_reasoning(self):
+        """Test that reasoning goes to a temporary file on request."""
+        processor, _ = process(["<think>", "first ", "second", "</think>ls"], spill_reasoning=True)
+        path = processor.reasoning_path
+        try:
+            assert path.read_text(encoding="utf-8") == "first second"
+        finally:
+            processor.close()
+        assert not path.exists()
+        assert processor.reasoning_path is None
+
+    def test_no_spill_by_default(self):
+        """Test that no file is created unless requested."""
+        processor, _ = process(["<think>x</think>ls"])
+        assert processor.reasoning_path is None
+
+    def test_tail_is_bounded(self):
+        """Test that the tail window does not grow with the stream."""
+        processor = StreamProcessor(tail_chars=100)
+        for _ in range(1000):
+            processor.feed("<think>" + "x" * 50)
+        assert len(processor._tail) <= 200
+        assert len(processor.tail) == 100
+
+    @pytest.mark.parametrize(
+        "stream",
+        [
+            pytest.param(stream, id=f"{path.stem}-{index}")
+            for path in sorted(CASSETTE_DIR.glob("*.jsonl"))
+            for index, stream in enumerate(Cassette.load(path).streams)
+        ],
+    )
+    def test_extraction_matches_full_text(self, stream):
+        """Test that extraction from the bounded text matches the full raw text."""
+        processor, _ = process(stream.replay(speed=0))
+        assert _extract_command(processor.text) == _extract_command(stream.text)
+
+
+class TestRenderStream:
+    """Test live rendering through the processor."""
+
+    def test_show_reasoning(self, tmp_path, monkeypatch):
+        """Test that reasoning is hidden while streaming, printed on request and deleted."""
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+        output = io.StringIO()
+        with patch("src.main.console", Console(file=output, width=100)):
+            text = _render_stream(iter(["<think>", "weighing options", "</think>", "ls"]), True)
+        assert text == "ls"
+        assert output.getvalue().index("ls") < output.getvalue().index("weighing options")
+        assert not list(tmp_path.glob("pop-reasoning-*.txt"))
+
+    def test_spill_file_removed_on_error(self, tmp_path, monkeypatch):
+        """Test that the spill file is deleted when the stream fails."""
+        monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+
+        def chunks():
+            yield "<think>"
+            yield "weighing options"
+            raise ParallaxConnectionError("lost")
+
+        with patch("src.main.console", Console(file=io.StringIO(), width=100)):
+            with pytest.raises(ParallaxConnectionError):
+                _render_stream(chunks(), True)
+        assert not list(tmp_path.glob("pop-reasoning-*.txt"))
+
+    def test_reasoning_hidden_by_default(self):
+        """Test that reasoning is not printed without show_reasoning."""
+        output = io.StringIO()
+        with patch("src.main.console", Console(file=output, width=100)):
+            _render_stream(iter(["<think>", "weighing options", "</think>", "ls"]))
+        assert "weighing options" not in output.getvalue()
+
+
+@pytest.mark.benchmark
+class TestStreamMemory:
+    """Peak memory on long reasoning streams."""
+
+    def test_peak_memory_50k_tokens(self):
+        """Test that memory stays flat compared with accumulating the raw text."""
+        tracemalloc.start()
+        accumulated = ""
+        for chunk in long_reasoning_stream():
+            accumulated += chunk
+        _, naive_peak = tracemalloc.get_traced_memory()
+        del accumulated
+        tracemalloc.reset_peak()
+
+        processor = StreamProcessor()
+        for chunk in long_reasoning_stream():
+            processor.feed(chunk)
+        processor.finish()
+        _, bounded_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        assert "ls -la" in processor.text
+        print(f"\npeak: accumulate {naive_peak / 1024:.0f} KiB, bounded {bounded_peak / 1024:.0f} KiB")
+        assert bounded_peak * 10 < naive_peak
@@ -0,0 +1,157 @@
+"""Tests for structured command output parsing."""
+import json
+
+import pytest
+
+from src.structured import (
+    IncrementalObjectParser,
+    StructuredCommand,
+    StructuredOutputError,
+    StructuredStream,
+)
+
+
+def split_every(text, size):
+    """Split text into chunks of the given size."""
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class ClosableStream:
+    """An iterator over chunks that records how many were read and whether it was closed."""
+
+    def __init__(self, chunks):
+        """Initialize with the chunks to serve."""
+        self.chunks = chunks
+        self.read = 0
+        self.closed = False
+
+    def __iter__(self):
+        """Serve the chunks."""
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    def close(self):
+        """Record that the consumer closed the stream."""
+        self.closed = True
+
+
+class TestIncrementalObjectParser:
+    """Test parsing an object while it streams in."""
+
+    @pytest.mark.parametrize("size", [1, 2, 7, 1000])
+    def test_any_chunking(self, size):
+        """Test that values do not depend on where chunks are split."""
+        value = {
+            "command": 'echo "a\\tb" | grep -c été \U0001f600',
+            "dangerous": True,
+            "warning": "Quotes \" and \\ backslashes",
+            "tags": ["a", {"b": "}"}],
+            "count": -1.5e3,
+            "extra": None,
+        }
+        parser = IncrementalObjectParser()
+        completed = []
+        for chunk in split_every(json.dumps(value, ensure_ascii=size % 2 == 0), size):
+            completed += parser.feed(chunk)
+        assert parser.done
+        assert parser.values == value
+        assert completed == list(value)
+
+    def test_field_available_before_object_closes(self):
+        """Test that a field is reported as soon as its value is complete."""
+        parser = IncrementalObjectParser()
+        assert parser.feed('{"command": "ls -l') == []
+        assert parser.feed('a", "dang') == ["command"]
+        assert parser.values["command"] == "ls -la"
+        assert not parser.done
+
+    def test_skips_preamble(self):
+        """Test that a code fence before the object is ignored."""
+        parser = IncrementalObjectParser()
+        parser.feed('```json\n{"command": "pwd"}\n```')
+        assert parser.values == {"command": "pwd"}
+
+    def test_raw_newline_in_string(self):
+        """Test that unescaped control characters some models emit are accepted."""
+        parser = IncrementalObjectParser()
+        parser.feed('{"command": "a\nb"}')
+        assert parser.values["command"] == "a\nb"
+
+    def test_invalid_json(self):
+        """Test that text that cannot be an object raises."""
+        with pytest.raises(StructuredOutputError):
+            IncrementalObjectParser().feed('{"command" "ls"}')
+        with pytest.raises(StructuredOutputError):
+            IncrementalObjectParser().feed('{"dangerous": maybe}')
+
+
+class TestStructuredCommand:
+    """Test conversion to and from the free-form layout."""
+
+    def test_round_trip(self):
+        """Test that a warning line survives conversion."""
+        command = StructuredCommand.from_text("# WARNING: Deletes logs\nrm *.log")
+        assert command == StructuredCommand("rm *.log", True, "Deletes logs")
+        assert command.text == "# WARNING: Deletes logs\nrm *.log"
+        assert json.loads(command.to_json())["dangerous"] is True
+
+    def test_default_warning(self):
+        """Test that a flagged command without a reason still gets a warning line."""
+        assert StructuredCommand("rm x", True).text.startswith("# WARNING: ")
+        assert StructuredCommand.from_text("ls").text == "ls"
+
+
+class TestStructuredStream:
+    """Test turning a streamed JSON answer into display text."""
+
+    def test_stops_after_safe_command(self):
+        """Test that nothing is read after the command is known to be safe."""
+        chunks = ClosableStream(
+            ['{"command": "ls', '", "dangerous": false', ', "warning": "', "x", "x", '"}']
+        )
+        stream = StructuredStream(chunks)
+        assert list(stream) == ["ls"]
+        assert chunks.read == 3
+        assert chunks.closed
+        assert stream.result == StructuredCommand("ls")
+
+    def test_reads_warning_of_dangerous_command(self):
+        """Test that a flagged command is shown first and its warning after."""
+        stream = StructuredStream(
+            iter(['{"command": "rm x", "dangerous": true, "warning": "Deletes x"}'])
+        )
+        assert list(stream) == ["rm x", "\n# WARNING: Deletes x"]
+        assert stream.result.dangerous
+
+    def test_reasoning_is_dropped(self):
+        """Test that a reasoning block before the object is not parsed."""
+        stream = StructuredStream(iter(['<think>use {"a": 1}</think>', '{"command": "df -h"}']))
+        assert list(stream) == ["df -h"]
+
+    def test_free_text_falls_back(self):
+        """Test that a response that is not JSON is passed on unchanged."""
+        stream = StructuredStream(iter(["```bash\n", "ls -la\n```"]))
+        assert "".join(stream) == "```bash\nls -la\n```"
+        assert stream.result is None
+
+    @pytest.mark.parametrize(
+        "chunks",
+        [
+            ["ps aux | awk '{print ", "$2}'"],
+            ['find . -name "*.tmp" -exec rm {} ', "\\;"],
+        ],
+    )
+    def test_free_text_with_braces_is_complete(self, chunks):
+        """Test that braces in a free-form command do not cut the answer short."""
+        upstream = ClosableStream(chunks)
+        stream = StructuredStream(upstream)
+        assert "".join(stream) == "".join(chunks)
+        assert upstream.read == len(chunks)
+        assert stream.result is None
+
+    def test_truncated_object_keeps_command(self):
+        """Test that a command parsed before the stream broke off is kept."""
+        stream = StructuredStream(iter(['{"command": "uptime", "dange']))
+        assert list(stream) == ["uptime"]
+        assert stream.result == StructuredCommand("uptime")
@@ -1,11 +1,12 @@
 """Tests for utility functions."""
 import os
 import platform
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from unittest.mock import patch
 
 import pytest
 
-from src.utils import get_system_info
+from src.utils import get_system_info, read_json, update_json_atomic
 
 
 class TestGetSystemInfo:
@@ -65,3 +66,38 @@ class TestGetSystemInfo:
         result = get_system_info()
         assert "Linux" in result or "Ubuntu" in result
 
+
+def _increment_many(path, times):
+    """Increment a counter file from a separate process."""
+    for _ in range(times):
+        update_json_atomic(path, lambda data: {"n": (data or {"n": 0})["n"] + 1})
+
+
+class TestUpdateJsonAtomic:
+    """Test read-modify-write updates of JSON files."""
+
+    def test_concurrent_updates_are_not_lost(self, tmp_path):
+        """Test that updates from parallel threads all land."""
+        path = tmp_path / "counts.json"
+
+        def increment(_):
+            update_json_atomic(path, lambda data: {"n": (data or {"n": 0})["n"] + 1})
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(increment, range(200)))
+        assert read_json(path, None) == {"n": 200}
+
+    @pytest.mark.skipif(os.name == "nt", reason="processes are only coordinated with fcntl")
+    def test_concurrent_processes_are_not_lost(self, tmp_path):
+        """Test that updates from parallel invocations all land."""
+        path = tmp_path / "counts.json"
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            list(pool.map(_increment_many, [path] * 4, [50] * 4))
+        assert read_json(path, None) == {"n": 200}
+
+    def test_corrupt_file_reads_as_none(self, tmp_path):
+        """Test that the update starts from None when the file is unreadable."""
+        path = tmp_path / "counts.json"
+        path.write_text("{not json")
+        update_json_atomic(path, lambda data: {"was": data})
+        assert read_json(path, None) == {"was": None}
@@ -0,0 +1,171 @@
+"""Tests for command validation and ranking."""
+import shutil
+
+import pytest
+
+from src.validation import (
+    RepairStats,
+    check_structure,
+    check_syntax,
+    find_missing_binaries,
+    rank_candidates,
+    validate_command,
+)
+
+requires_bash = pytest.mark.skipif(shutil.which("bash") is None, reason="bash not available")
+
+
+class TestCheckSyntax:
+    """Test no-exec syntax checking."""
+
+    @requires_bash
+    def test_valid_command(self):
+        """Test that a valid command parses."""
+        assert check_syntax("ls -la | head -5", "bash") is None
+
+    @requires_bash
+    def test_invalid_command(self):
+        """Test that an unbalanced construct is reported."""
+        error = check_syntax("if true; then echo hi", "bash")
+        assert error
+
+    @requires_bash
+    def test_does_not_execute(self, tmp_path):
+        """Test that the command is only parsed, never run."""
+        marker = tmp_path / "marker"
+        assert check_syntax(f"touch {marker}", "bash") is None
+        assert not marker.exists()
+
+    def test_missing_shell_is_skipped(self):
+        """Test that an unavailable shell yields no error."""
+        assert check_syntax("ls", "no-such-shell-xyz") is None
+
+
+class TestFindMissingBinaries:
+    """Test head binary availability checks."""
+
+    def test_existing_binaries(self):
+        """Test that common binaries are found."""
+        assert find_missing_binaries("ls -la | sort") == []
+
+    def test_missing_binary(self):
+        """Test that an unknown binary is reported once."""
+        result = find_missing_binaries("nosuchtool-xyz a && nosuchtool-xyz b")
+        assert result == ["nosuchtool-xyz"]
+
+    def test_builtins_and_wrappers(self):
+        """Test that builtins and wrappers are skipped."""
+        assert find_missing_binaries("export FOO=1 && cd /tmp && sudo ls") == []
+
+    @pytest.mark.parametrize(
+        "command", ["history | tail -20", "shopt -s globstar", "mapfile -t lines < f", "zstyle x"]
+    )
+    def test_less_common_builtins(self, command):
+        """Test that bash and zsh builtins are never reported as missing."""
+        assert find_missing_binaries(command) == []
+
+    def test_variables_are_skipped(self):
+        """Test that variable expansions are not checked."""
+        assert find_missing_binaries("$EDITOR file.txt") == []
+
+
+class TestRankCandidates:
+    """Test candidate ranking."""
+
+    @requires_bash
+    def test_invalid_syntax_ranks_last(self):
+        """Test that candidates that do not parse rank below valid ones."""
+        ranked = rank_candidates(["ls -la |", "ls -la"], "bash")
+        assert ranked[0].command == "ls -la"
+        assert not ranked[1].validation.syntax_ok
+
+    def test_missing_binary_ranks_below_available(self):
+        """Test that available binaries win."""
+        ranked = rank_candidates(["nosuchtool-xyz -a", "ls -a"], "bash")
+        assert ranked[0].command == "ls -a"
+
+    def test_duplicates_become_votes(self):
+        """Test that agreeing candidates are merged and ranked first."""
+        ranked = rank_candidates(["ls", "ls -la", "ls  -la", ""], "bash")
+        assert len(ranked) == 2
+        assert ranked[0].command == "ls -la"
+        assert ranked[0].votes == 2
+
+    def test_validate_command_describe(self):
+        """Test the problem summary."""
+        result = validate_command("nosuchtool-xyz", "bash")
+        assert not result.ok
+        assert "nosuchtool-xyz" in result.describe()
+
+
+class TestCheckStructure:
+    """Test shell-independent structural checks."""
+
+    @pytest.mark.parametrize(
+        "command",
+        [
+            "ls -la",
+            "if [ -f x ]; then echo yes; else echo no; fi",
+            "for i in 1 2 3; do echo $i; done",
+            "case $x in a|b) echo ab;; *) echo other;; esac",
+            "echo $(date) && (cd /tmp && ls)",
+            "f() { echo hi; }; f",
+            "[[ -d /tmp ]] && echo dir",
+            "echo 'a ) b' \"c { d\"",
+            "# WARNING: This will delete files\nfind . -name '*.tmp' -delete",
+            "while true\ndo\n  sleep 1\ndone",
+            'grep ")" file.txt',
+            'echo "("',
+            "echo \\( fi",
+        ],
+    )
+    def test_valid_constructs(self, command):
+        """Test that well-formed commands pass."""
+        assert check_structure(command) is None
+
+    @pytest.mark.parametrize(
+        "command, error",
+        [
+            ("echo 'unterminated", "unterminated quote"),
+            ("echo `date", "unterminated backtick"),
+            ("if true; then echo yes", "missing 'fi'"),
+            ("for i in 1 2; do echo $i", "missing 'done'"),
+            ("echo $(date", "missing ')'"),
+            ("echo hi )", "unexpected ')'"),
+            ("ls; fi", "unexpected 'fi'"),
+            ("[ -f x && echo y", "missing ']'"),
+        ],
+    )
+    def test_broken_constructs(self, command, error):
+        """Test that unbalanced constructs are reported."""
+        assert check_structure(command) == error
+
+
+class TestRepairStats:
+    """Test per-model repair counters."""
+
+    def test_record_and_load(self, tmp_path):
+        """Test that outcomes accumulate per model."""
+        stats = RepairStats(stats_path=tmp_path / "stats.json")
+        stats.record("model-a", needed_repair=False, repaired=False, attempts=0)
+        stats.record("model-a", needed_repair=True, repaired=True, attempts=1)
+        stats.record("model-b", needed_repair=True, repaired=False, attempts=2)
+
+        data = stats.load()
+        assert data["model-a"] == {
+            "validated": 2,
+            "needed_repair": 1,
+            "repaired": 1,
+            "attempts": 1,
+        }
+        assert data["model-b"]["attempts"] == 2
+
+    def test_default_location(self, isolated_cache_dir):
+        """Test that stats live in the cache directory by default."""
+        assert RepairStats().stats_path == isolated_cache_dir / "repair_stats.json"
+
+    def test_corrupt_file(self, tmp_path):
+        """Test that a corrupt stats file is treated as empty."""
+        path = tmp_path / "stats.json"
+        path.write_text("{not json")
+        assert RepairStats(stats_path=path).load() == {}